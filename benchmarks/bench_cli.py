@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+#
+#     bench_cli.py: benchmarks for PEGS command line startup
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+import sys
+import subprocess
+
+class CLIStartup:
+    """
+    Time how long it takes for the command line to start up
+    """
+    def time_import_cli(self):
+        subprocess.check_call([sys.executable,"-c","import pegs.cli"])
+
+    def time_pegs_version(self):
+        subprocess.check_call(
+            [sys.executable,"-c",
+             "import sys; from pegs.cli import pegs; "
+             "sys.argv = ['pegs','--version']; pegs()"],
+            stdout=subprocess.DEVNULL)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+#     bench_enrichments.py: benchmarks for the enrichment calculations
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+import os
+import shutil
+import tempfile
+from pegs.pegs import calculate_enrichments
+from .common import get_dataset
+from .common import get_bedtools
+
+class CalculateEnrichmentsPeaks:
+    """
+    Time 'calculate_enrichments' as the peak set size increases
+    """
+    params = ([1000,10000,100000,1000000],)
+    param_names = ['n_peaks']
+    timeout = 3600
+
+    def setup(self,n_peaks):
+        self.bedtools_exe = get_bedtools()
+        self.data = get_dataset(n_peaks=n_peaks)
+        self.cwd = os.getcwd()
+        self.working_dir = tempfile.mkdtemp()
+        os.chdir(self.working_dir)
+
+    def teardown(self,n_peaks):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.working_dir)
+
+    def time_calculate_enrichments(self,n_peaks):
+        calculate_enrichments(self.data['genes_file'],
+                              [5000,50000],
+                              self.data['peaks'],
+                              self.data['clusters'],
+                              None,
+                              bedtools_exe=self.bedtools_exe)
+
+class CalculateEnrichmentsClusters:
+    """
+    Time 'calculate_enrichments' as the number of clusters increases
+    """
+    params = ([10,100,1000],)
+    param_names = ['n_clusters']
+    timeout = 3600
+
+    def setup(self,n_clusters):
+        self.bedtools_exe = get_bedtools()
+        self.data = get_dataset(n_clusters=n_clusters)
+        self.cwd = os.getcwd()
+        self.working_dir = tempfile.mkdtemp()
+        os.chdir(self.working_dir)
+
+    def teardown(self,n_clusters):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.working_dir)
+
+    def time_calculate_enrichments(self,n_clusters):
+        calculate_enrichments(self.data['genes_file'],
+                              [5000],
+                              self.data['peaks'],
+                              self.data['clusters'],
+                              None,
+                              bedtools_exe=self.bedtools_exe)
+
+class CalculateEnrichmentsTADs:
+    """
+    Time 'calculate_enrichments' including TADs
+    """
+    params = ([1000,100000],)
+    param_names = ['n_peaks']
+    timeout = 3600
+
+    def setup(self,n_peaks):
+        self.bedtools_exe = get_bedtools()
+        self.data = get_dataset(n_peaks=n_peaks,tads=True)
+        self.cwd = os.getcwd()
+        self.working_dir = tempfile.mkdtemp()
+        os.chdir(self.working_dir)
+
+    def teardown(self,n_peaks):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.working_dir)
+
+    def time_calculate_enrichments_with_tads(self,n_peaks):
+        calculate_enrichments(self.data['genes_file'],
+                              [5000],
+                              self.data['peaks'],
+                              self.data['clusters'],
+                              self.data['tads_file'],
+                              bedtools_exe=self.bedtools_exe)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+#     bench_outputs.py: benchmarks for the output writers
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from pegs.outputs import make_heatmap
+from pegs.outputs import make_xlsx_file
+from pegs.outputs import write_raw_data
+
+# Default distances for the output benchmarks
+DISTANCES = [5000,25000,50000,100000,150000,200000]
+
+def make_results(n_peak_sets,n_clusters,n_distances=len(DISTANCES),
+                 seed=1):
+    """
+    Generate random p-values and counts for the output writers
+
+    Returns:
+      Tuple: (peaks,clusters,pvalues,counts,tads_pvalues,tads_counts)
+    """
+    rng = np.random.RandomState(seed)
+    peaks = ["peakset%d.bed" % (i+1) for i in range(n_peak_sets)]
+    clusters = ["cluster_%d.txt" % (i+1) for i in range(n_clusters)]
+    shape = (n_peak_sets,n_distances,n_clusters)
+    pvalues = np.maximum(rng.random_sample(shape),1e-12)
+    counts = rng.randint(0,200,size=shape).astype(np.float64)
+    tads_pvalues = np.maximum(rng.random_sample(shape[::2]),1e-12)
+    tads_counts = rng.randint(0,200,size=shape[::2]).astype(np.float64)
+    return (peaks,clusters,pvalues,counts,tads_pvalues,tads_counts)
+
+class Outputs:
+    """
+    Time each of the output writers as the results size increases
+    """
+    params = ([3,10,50],[10,50])
+    param_names = ['n_peak_sets','n_clusters']
+    timeout = 1800
+
+    def setup(self,n_peak_sets,n_clusters):
+        self.peaks,self.clusters,self.pvalues,self.counts,\
+            self.tads_pvalues,self.tads_counts = \
+                make_results(n_peak_sets,n_clusters)
+        self.working_dir = tempfile.mkdtemp()
+
+    def teardown(self,n_peak_sets,n_clusters):
+        shutil.rmtree(self.working_dir)
+
+    def time_make_heatmap(self,n_peak_sets,n_clusters):
+        make_heatmap(os.path.join(self.working_dir,"heatmap.png"),
+                     self.peaks,self.clusters,DISTANCES,
+                     self.pvalues,self.counts,
+                     tads_pvalues=self.tads_pvalues,
+                     tads_counts=self.tads_counts)
+
+    def time_make_xlsx_file(self,n_peak_sets,n_clusters):
+        make_xlsx_file(os.path.join(self.working_dir,"results.xlsx"),
+                       self.peaks,self.clusters,DISTANCES,
+                       self.pvalues,self.counts,
+                       tads_pvalues=self.tads_pvalues,
+                       tads_counts=self.tads_counts)
+
+    def time_write_raw_data(self,n_peak_sets,n_clusters):
+        write_raw_data("pegs",self.peaks,self.clusters,DISTANCES,
+                       self.pvalues,self.counts,
+                       tads_pvalues=self.tads_pvalues,
+                       tads_counts=self.tads_counts,
+                       output_directory=self.working_dir)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+#     common.py: shared utilities for PEGS benchmarks
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import os
+import io
+import json
+import shutil
+import tempfile
+from pegs.utils import find_exe
+from .synthetic import make_dataset
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Location for cached synthetic datasets (can be overridden by
+# setting PEGS_BENCHMARK_DATA in the environment)
+BENCHMARK_DATA_DIR = os.environ.get(
+    "PEGS_BENCHMARK_DATA",
+    os.path.join(tempfile.gettempdir(),"pegs-benchmark-data"))
+
+#######################################################################
+# Functions
+#######################################################################
+
+def get_dataset(**kws):
+    """
+    Return a synthetic dataset, generating it if necessary
+
+    Datasets are cached on disk (keyed by the generation
+    parameters) so that large datasets are only generated
+    once across benchmark runs.
+
+    Arguments:
+      kws: keyword arguments for 'make_dataset'
+
+    Returns:
+      Dictionary: as returned by 'make_dataset'.
+    """
+    key = '_'.join(["%s%s" % (k,kws[k]) for k in sorted(kws)])
+    data_dir = os.path.join(BENCHMARK_DATA_DIR,key)
+    manifest = os.path.join(data_dir,"manifest.json")
+    if os.path.exists(manifest):
+        with io.open(manifest,'rt') as fp:
+            return json.load(fp)
+    if os.path.exists(data_dir):
+        # Incomplete dataset from a previous run
+        shutil.rmtree(data_dir)
+    dataset = make_dataset(data_dir,**kws)
+    with io.open(manifest,'wt') as fp:
+        fp.write(json.dumps(dataset))
+    return dataset
+
+def get_bedtools():
+    """
+    Return path to 'bedtools' (skips the benchmark if not found)
+    """
+    bedtools_exe = find_exe("bedtools")
+    if not bedtools_exe:
+        # asv treats NotImplementedError in setup as a skip
+        raise NotImplementedError("bedtools not found")
+    return bedtools_exe
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#
+#     scaling.py: check how PEGS run times scale with input size
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+"""
+Time PEGS over a range of input sizes and flag super-linear scaling
+
+Run from the top level of the repository using e.g.:
+
+    python -m benchmarks.scaling --max-peaks 1000000
+
+For each series, the run times are fitted to a power law
+(time ~ size^k) and the series is flagged if the exponent 'k'
+exceeds the threshold (1.2 by default). The exit status is
+non-zero if any series is flagged.
+"""
+
+#######################################################################
+# Imports
+#######################################################################
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+from pegs.pegs import calculate_enrichments
+from pegs.outputs import make_heatmap
+from pegs.outputs import make_xlsx_file
+from .common import get_dataset
+from .common import get_bedtools
+from .bench_outputs import make_results
+from .bench_outputs import DISTANCES
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Default threshold for the scaling exponent
+DEFAULT_THRESHOLD = 1.2
+
+#######################################################################
+# Functions
+#######################################################################
+
+def timed(f,*args,**kws):
+    """
+    Return the wall time (in seconds) for a function call
+    """
+    start = time.perf_counter()
+    with open(os.devnull,'wt') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            f(*args,**kws)
+    return time.perf_counter() - start
+
+def scaling_exponent(sizes,times):
+    """
+    Fit 'time ~ size^k' and return the exponent 'k'
+    """
+    return np.polyfit(np.log(sizes),np.log(times),1)[0]
+
+def sizes_up_to(start,maximum):
+    """
+    Return list of sizes increasing by factors of 10
+    """
+    sizes = []
+    size = start
+    while size <= maximum:
+        sizes.append(size)
+        size *= 10
+    return sizes
+
+def enrichments_by_peaks(sizes,bedtools_exe):
+    """
+    Time 'calculate_enrichments' for increasing peak set sizes
+    """
+    times = []
+    for n_peaks in sizes:
+        data = get_dataset(n_peaks=n_peaks)
+        times.append(timed(calculate_enrichments,
+                           data['genes_file'],[5000],
+                           data['peaks'],data['clusters'],None,
+                           bedtools_exe=bedtools_exe))
+    return times
+
+def enrichments_by_clusters(sizes,bedtools_exe):
+    """
+    Time 'calculate_enrichments' for increasing numbers of clusters
+    """
+    times = []
+    for n_clusters in sizes:
+        data = get_dataset(n_clusters=n_clusters)
+        times.append(timed(calculate_enrichments,
+                           data['genes_file'],[5000],
+                           data['peaks'],data['clusters'],None,
+                           bedtools_exe=bedtools_exe))
+    return times
+
+def outputs_by_peak_sets(sizes,working_dir):
+    """
+    Time the heatmap and XLSX writers for increasing numbers of
+    peak sets
+    """
+    heatmap_times = []
+    xlsx_times = []
+    for n_peak_sets in sizes:
+        peaks,clusters,pvalues,counts,tads_pvalues,tads_counts = \
+            make_results(n_peak_sets,10)
+        heatmap_times.append(timed(make_heatmap,
+                                   os.path.join(working_dir,"heatmap.png"),
+                                   peaks,clusters,DISTANCES,
+                                   pvalues,counts))
+        xlsx_times.append(timed(make_xlsx_file,
+                                os.path.join(working_dir,"results.xlsx"),
+                                peaks,clusters,DISTANCES,
+                                pvalues,counts))
+    return (heatmap_times,xlsx_times)
+
+def main(args=None):
+    p = argparse.ArgumentParser(
+        description="Check scaling of PEGS run times with input size")
+    p.add_argument("--max-peaks",type=int,default=100000,
+                   help="largest peak set size to test (default: "
+                   "100000; up to 10000000 for genome-scale tests)")
+    p.add_argument("--max-clusters",type=int,default=1000,
+                   help="largest number of clusters to test (default: "
+                   "1000)")
+    p.add_argument("--max-peak-sets",type=int,default=100,
+                   help="largest number of peak sets to test for the "
+                   "output writers (default: 100)")
+    p.add_argument("--threshold",type=float,default=DEFAULT_THRESHOLD,
+                   help="flag series with a scaling exponent above "
+                   "this value (default: %s)" % DEFAULT_THRESHOLD)
+    args = p.parse_args(args)
+    # Run the series
+    results = []
+    working_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(working_dir)
+    try:
+        try:
+            bedtools_exe = get_bedtools()
+        except NotImplementedError:
+            print("bedtools not found: skipping enrichment series")
+            bedtools_exe = None
+        if bedtools_exe:
+            sizes = sizes_up_to(1000,args.max_peaks)
+            results.append(("calculate_enrichments vs peaks",sizes,
+                            enrichments_by_peaks(sizes,bedtools_exe)))
+            sizes = sizes_up_to(10,args.max_clusters)
+            results.append(("calculate_enrichments vs clusters",sizes,
+                            enrichments_by_clusters(sizes,bedtools_exe)))
+        sizes = sizes_up_to(1,args.max_peak_sets)
+        heatmap_times,xlsx_times = outputs_by_peak_sets(sizes,working_dir)
+        results.append(("make_heatmap vs peak sets",sizes,heatmap_times))
+        results.append(("make_xlsx_file vs peak sets",sizes,xlsx_times))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(working_dir)
+    # Report
+    flagged = 0
+    for name,sizes,times in results:
+        print("%s:" % name)
+        for size,t in zip(sizes,times):
+            print("    %10d  %10.3fs" % (size,t))
+        if len(sizes) < 2:
+            print("    (not enough sizes to estimate scaling)")
+            continue
+        k = scaling_exponent(sizes,times)
+        status = "ok"
+        if k > args.threshold:
+            status = "SUPER-LINEAR"
+            flagged += 1
+        print("    scaling exponent %.2f: %s" % (k,status))
+    return 1 if flagged else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+#
+#     synthetic.py: generate synthetic input data for benchmarking PEGS
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import os
+import io
+import numpy as np
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Default chromosome size for synthetic genomes (~mouse chr1)
+DEFAULT_CHROM_SIZE = 195000000
+
+# Number of lines to format and write at a time
+WRITE_CHUNK_SIZE = 100000
+
+#######################################################################
+# Functions
+#######################################################################
+
+def make_genome(n_chroms=20,chrom_size=DEFAULT_CHROM_SIZE):
+    """
+    Generate chromosome names and sizes for a synthetic genome
+
+    Arguments:
+      n_chroms (int): number of chromosomes
+      chrom_size (int): size of each chromosome
+
+    Returns:
+      List: list of (chrom,size) tuples.
+    """
+    return [("chr%d" % (i+1),int(chrom_size)) for i in range(n_chroms)]
+
+def write_genome_file(genome_file,genome):
+    """
+    Write a 'genome' file (chromosome names and sizes)
+
+    Arguments:
+      genome_file (str): path to output file
+      genome (list): list of (chrom,size) tuples
+    """
+    with io.open(genome_file,'wt') as fp:
+        for chrom,size in genome:
+            fp.write(u"%s\t%d\n" % (chrom,size))
+    return genome_file
+
+def random_positions(n,genome,rng):
+    """
+    Generate random positions uniformly across a genome
+
+    Arguments:
+      n (int): number of positions to generate
+      genome (list): list of (chrom,size) tuples
+      rng (numpy.random.RandomState): random number generator
+
+    Returns:
+      Tuple: (chrom_index,position) arrays.
+    """
+    sizes = np.array([size for chrom,size in genome],dtype=np.float64)
+    chrom_index = rng.choice(len(genome),size=n,p=sizes/sizes.sum())
+    positions = (rng.random_sample(n)*sizes[chrom_index]).astype(np.int64)
+    return (chrom_index,positions)
+
+def write_bed(bed_file,genome,chrom_index,starts,ends,names=None):
+    """
+    Write BED data from arrays
+
+    Arguments:
+      bed_file (str): path to output BED file
+      genome (list): list of (chrom,size) tuples
+      chrom_index (numpy.array): index of the chromosome for
+        each interval
+      starts (numpy.array): start positions
+      ends (numpy.array): end positions
+      names (list): optional, names for each interval (written
+        to the 4th column)
+    """
+    chroms = [chrom for chrom,size in genome]
+    with io.open(bed_file,'wt') as fp:
+        for i in range(0,len(starts),WRITE_CHUNK_SIZE):
+            j = i + WRITE_CHUNK_SIZE
+            if names is None:
+                lines = ["%s\t%d\t%d\n" % (chroms[c],s,e)
+                         for c,s,e in zip(chrom_index[i:j],
+                                          starts[i:j],
+                                          ends[i:j])]
+            else:
+                lines = ["%s\t%d\t%d\t%s\n" % (chroms[c],s,e,n)
+                         for c,s,e,n in zip(chrom_index[i:j],
+                                            starts[i:j],
+                                            ends[i:j],
+                                            names[i:j])]
+            fp.write(u''.join(lines))
+    return bed_file
+
+def gene_names(n_genes):
+    """
+    Return list of synthetic gene names
+    """
+    return ["Gene%07d" % i for i in range(n_genes)]
+
+def make_gene_intervals(genes_file,n_genes,genome,seed=1):
+    """
+    Generate a synthetic gene interval (TSS) BED file
+
+    The genes are written in name order (matching the
+    built-in gene interval files).
+
+    Arguments:
+      genes_file (str): path to output BED file
+      n_genes (int): number of genes
+      genome (list): list of (chrom,size) tuples
+      seed (int): seed for the random number generator
+
+    Returns:
+      List: the gene names.
+    """
+    rng = np.random.RandomState(seed)
+    chrom_index,tss = random_positions(n_genes,genome,rng)
+    names = gene_names(n_genes)
+    write_bed(genes_file,genome,chrom_index,tss,tss+1,names=names)
+    return names
+
+def make_peak_set(peaks_file,n_peaks,genome,peak_width=500,seed=1):
+    """
+    Generate a synthetic peak set BED file
+
+    Peak widths are drawn from a Poisson distribution
+    around the specified mean width.
+
+    Arguments:
+      peaks_file (str): path to output BED file
+      n_peaks (int): number of peaks
+      genome (list): list of (chrom,size) tuples
+      peak_width (int): mean width of the peaks
+      seed (int): seed for the random number generator
+    """
+    rng = np.random.RandomState(seed)
+    chrom_index,starts = random_positions(n_peaks,genome,rng)
+    ends = starts + 1 + rng.poisson(peak_width,size=n_peaks)
+    return write_bed(peaks_file,genome,chrom_index,starts,ends)
+
+def make_clusters(clusters_dir,n_clusters,genes,cluster_size=200,
+                  seed=1):
+    """
+    Generate synthetic gene cluster files
+
+    Arguments:
+      clusters_dir (str): directory to write the cluster
+        files to (will be created if it doesn't exist)
+      n_clusters (int): number of clusters
+      genes (list): gene names to draw cluster members from
+      cluster_size (int): number of genes in each cluster
+      seed (int): seed for the random number generator
+
+    Returns:
+      List: paths to the cluster files.
+    """
+    rng = np.random.RandomState(seed)
+    if not os.path.exists(clusters_dir):
+        os.makedirs(clusters_dir)
+    cluster_size = min(cluster_size,len(genes))
+    clusters = []
+    for i in range(n_clusters):
+        cluster_file = os.path.join(clusters_dir,"cluster_%d.txt" % (i+1))
+        members = rng.choice(len(genes),size=cluster_size,replace=False)
+        with io.open(cluster_file,'wt') as fp:
+            fp.write(u''.join(["%s\n" % genes[j] for j in members]))
+        clusters.append(cluster_file)
+    return clusters
+
+def make_tads(tads_file,genome,tad_size=1000000):
+    """
+    Generate a synthetic TADs BED file
+
+    The genome is tiled with adjacent TADs of fixed size.
+
+    Arguments:
+      tads_file (str): path to output BED file
+      genome (list): list of (chrom,size) tuples
+      tad_size (int): size of each TAD
+    """
+    with io.open(tads_file,'wt') as fp:
+        for chrom,size in genome:
+            for start in range(0,size,tad_size):
+                fp.write(u"%s\t%d\t%d\n" % (chrom,start,
+                                            min(start+tad_size,size)))
+    return tads_file
+
+def make_dataset(data_dir,n_genes=20000,n_peak_sets=3,n_peaks=10000,
+                 n_clusters=10,cluster_size=200,tads=False,
+                 n_chroms=20,seed=1):
+    """
+    Generate a complete synthetic dataset for PEGS
+
+    Arguments:
+      data_dir (str): directory to write the data to (will be
+        created if it doesn't exist)
+      n_genes (int): number of genes in the gene universe
+      n_peak_sets (int): number of peak sets
+      n_peaks (int): number of peaks in each peak set
+      n_clusters (int): number of gene clusters
+      cluster_size (int): number of genes in each cluster
+      tads (bool): if True then also generate a TADs file
+      n_chroms (int): number of chromosomes in the genome
+      seed (int): seed for the random number generators
+
+    Returns:
+      Dictionary: with keys 'genes_file', 'genome_file',
+        'peaks', 'clusters' and 'tads_file' (which is None
+        if TADs weren't generated).
+    """
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    genome = make_genome(n_chroms)
+    genome_file = write_genome_file(os.path.join(data_dir,"genome.txt"),
+                                    genome)
+    genes_file = os.path.join(data_dir,"genes.bed")
+    genes = make_gene_intervals(genes_file,n_genes,genome,seed=seed)
+    peaks = []
+    for i in range(n_peak_sets):
+        peaks.append(make_peak_set(os.path.join(data_dir,
+                                                "peakset%d.bed" % (i+1)),
+                                   n_peaks,genome,seed=seed+i))
+    clusters = make_clusters(os.path.join(data_dir,"clusters"),
+                             n_clusters,genes,cluster_size=cluster_size,
+                             seed=seed)
+    if tads:
+        tads_file = make_tads(os.path.join(data_dir,"tads.bed"),genome)
+    else:
+        tads_file = None
+    return dict(genes_file=genes_file,
+                genome_file=genome_file,
+                peaks=peaks,
+                clusters=clusters,
+                tads_file=tads_file)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+#
+#     archive.py: compressed archive of intersection files
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import os
+import io
+import shutil
+import zipfile
+from collections import OrderedDict
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Key used in place of a distance for the TADs intersections
+ARCHIVE_TADS = "TADs"
+
+#######################################################################
+# Classes
+#######################################################################
+
+class IntersectionArchive:
+    """
+    Compressed, indexed archive of intersection files
+
+    The intersections for each peak set and distance (or
+    the TADs) are stored as a separate compressed member of a
+    single ZIP file, rather than as individual files. The
+    peak set and distance for each member are stored in the
+    member's comment in the ZIP central directory, which acts
+    as the index: any member can be read by its key without
+    reading or decompressing the rest of the archive.
+
+    Usage:
+
+    >>> with IntersectionArchive("intersections.zip",'w') as archive:
+    ...     archive.add("peaks1.bed",5000,["Intersection.bed"])
+    >>> archive = IntersectionArchive("intersections.zip")
+    >>> with archive.open("peaks1.bed",5000) as fp:
+    ...     data = fp.read()
+
+    Distances are integers; the TADs intersections for a peak
+    set use the key 'ARCHIVE_TADS' in place of a distance.
+    """
+    def __init__(self,archive_file,mode='r'):
+        """
+        Arguments:
+          archive_file (str): path to the archive
+          mode (str): 'r' to read an existing archive, 'w' to
+            create a new archive (replacing any existing file)
+            or 'a' to add to an existing archive
+        """
+        self.archive_file = archive_file
+        self._zip = zipfile.ZipFile(archive_file,mode,
+                                    compression=zipfile.ZIP_DEFLATED,
+                                    allowZip64=True)
+        self._members = OrderedDict()
+        for zinfo in self._zip.infolist():
+            try:
+                key = parse_archive_key(zinfo.comment)
+            except ValueError:
+                # Not an intersection file
+                continue
+            self._members[key] = zinfo
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self,key):
+        return normalise_archive_key(*key) in self._members
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+        return False
+
+    def keys(self):
+        """
+        Return the keys for the members of the archive
+
+        Returns:
+          List: tuples '(peak_set,distance)' in the order the
+            members were added.
+        """
+        return list(self._members.keys())
+
+    def member(self,peak_set,distance):
+        """
+        Return the ZipInfo for a member of the archive
+
+        Arguments:
+          peak_set (str): name of the peak set
+          distance (int): distance (or 'ARCHIVE_TADS')
+
+        Raises 'KeyError' if there's no member for the key.
+        """
+        return self._members[normalise_archive_key(peak_set,distance)]
+
+    def add(self,peak_set,distance,intersection_files,name=None):
+        """
+        Add the intersections for a peak set and distance
+
+        If there are multiple intersection files (for example,
+        one for each chromosome) then they are concatenated
+        into a single member. If the archive already has a
+        member for the key then the archive isn't changed.
+
+        Arguments:
+          peak_set (str): name of the peak set
+          distance (int): distance (or 'ARCHIVE_TADS')
+          intersection_files (list): intersection files to store
+          name (str): optional, name for the member (defaults
+            to the name of the first intersection file)
+
+        Returns:
+          ZipInfo: the member for the intersections.
+        """
+        key = normalise_archive_key(peak_set,distance)
+        if key in self._members:
+            return self._members[key]
+        if name is None:
+            name = os.path.basename(intersection_files[0])
+        zinfo = zipfile.ZipInfo(name)
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.comment = format_archive_key(*key).encode()
+        with self._zip.open(zinfo,'w',force_zip64=True) as fp:
+            for intersection_file in intersection_files:
+                with io.open(intersection_file,'rb') as fpp:
+                    shutil.copyfileobj(fpp,fp)
+        self._members[key] = zinfo
+        return zinfo
+
+    def open(self,peak_set,distance):
+        """
+        Open the intersections for a peak set and distance
+
+        Arguments:
+          peak_set (str): name of the peak set
+          distance (int): distance (or 'ARCHIVE_TADS')
+
+        Returns:
+          File: binary file-like object to read the
+            intersections from.
+        """
+        return self._zip.open(self.member(peak_set,distance))
+
+    def extract(self,peak_set,distance,output_dir):
+        """
+        Extract the intersections for a peak set and distance
+
+        Arguments:
+          peak_set (str): name of the peak set
+          distance (int): distance (or 'ARCHIVE_TADS')
+          output_dir (str): directory to write the file to
+
+        Returns:
+          String: path to the extracted file.
+        """
+        zinfo = self.member(peak_set,distance)
+        output_file = os.path.join(output_dir,
+                                   os.path.basename(zinfo.filename))
+        with self._zip.open(zinfo) as fp:
+            with io.open(output_file,'wb') as fpp:
+                shutil.copyfileobj(fp,fpp)
+        return output_file
+
+    def close(self):
+        """
+        Close the archive (writing the index, if adding members)
+        """
+        self._zip.close()
+
+#######################################################################
+# Functions
+#######################################################################
+
+def normalise_archive_key(peak_set,distance):
+    """
+    Return a key for an archive member as '(peak_set,distance)'
+
+    Distances are converted to integers, unless they are the
+    'ARCHIVE_TADS' key.
+    """
+    if str(distance) != ARCHIVE_TADS:
+        distance = int(distance)
+    else:
+        distance = ARCHIVE_TADS
+    return (str(peak_set),distance)
+
+def format_archive_key(peak_set,distance):
+    """
+    Return the text form of an archive key ('PEAK_SET<tab>DISTANCE')
+    """
+    return "%s\t%s" % (peak_set,distance)
+
+def parse_archive_key(s):
+    """
+    Return the archive key from its text form
+
+    Arguments:
+      s (str): text form of the key (as returned by
+        'format_archive_key'), either as a string or
+        as bytes
+
+    Raises 'ValueError' if the text isn't a valid key.
+    """
+    if isinstance(s,bytes):
+        s = s.decode()
+    peak_set,distance = s.split('\t')
+    return normalise_archive_key(peak_set,distance)
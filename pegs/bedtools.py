@@ -17,12 +17,52 @@ import tempfile
 import subprocess
 import logging
 
+#######################################################################
+# Classes
+#######################################################################
+
+class BedtoolsError(Exception):
+    """
+    Exception raised when 'bedtools' fails
+    """
+
 #######################################################################
 # Functions
 #######################################################################
 
+def intersect_cmd(infile_a,infile_b,report_entire_feature=False,
+                  sorted_inputs=False,genome_file=None,
+                  bedtools_exe="bedtools"):
+    """
+    Build the command line for 'bedtools intersect'
+
+    infile_a (str): path to input file 'A' (-a)
+    infile_b (str): path to input file 'B' (-b)
+    report_entire_feature (bool): (optional) if True then
+      write the original entry in 'A' for each overlap (-wa)
+    sorted_inputs (bool): (optional) if True then the inputs
+      are sorted by position, so use the memory-efficient
+      "chromsweep" algorithm (-sorted)
+    genome_file (str): (optional) genome file defining the
+      order of chromosomes in sorted inputs (-g)
+    bedtools_exe (str): 'bedtools' executable to use
+
+    Returns the command as a list.
+    """
+    cmd = [bedtools_exe,"intersect"]
+    if report_entire_feature:
+        cmd.append("-wa")
+    if sorted_inputs:
+        cmd.append("-sorted")
+        if genome_file:
+            cmd.extend(["-g",genome_file])
+    cmd.extend(["-a",infile_a,
+                "-b",infile_b])
+    return cmd
+
 def intersect(infile_a,infile_b,outfile,working_dir=None,
-              report_entire_feature=False,bedtools_exe="bedtools"):
+              report_entire_feature=False,sorted_inputs=False,
+              genome_file=None,bedtools_exe="bedtools"):
     """
     Run 'bedtools intersect'
 
@@ -33,9 +73,15 @@ def intersect(infile_a,infile_b,outfile,working_dir=None,
       'intersectBed' in (defaults to CWD)
     report_entire_feature (bool): (optional) if True then
       write the original entry in 'A' for each overlap (-wa)
+    sorted_inputs (bool): (optional) if True then the inputs
+      are sorted by position (-sorted)
+    genome_file (str): (optional) genome file defining the
+      order of chromosomes in sorted inputs (-g)
     bedtools_exe (str): 'bedtools' executable to use
 
     Returns the name of the output file.
+
+    Raises 'BedtoolsError' if the command fails.
     """
     # Working directory
     if working_dir is None:
@@ -43,14 +89,19 @@ def intersect(infile_a,infile_b,outfile,working_dir=None,
     else:
         wd = os.path.abspath(working_dir)
     # Build command
-    cmd = [bedtools_exe,"intersect"]
-    if report_entire_feature:
-        cmd.append("-wa")
-    cmd.extend(["-a",infile_a,
-                "-b",infile_b])
+    cmd = intersect_cmd(infile_a,infile_b,
+                        report_entire_feature=report_entire_feature,
+                        sorted_inputs=sorted_inputs,
+                        genome_file=genome_file,
+                        bedtools_exe=bedtools_exe)
     # Run command
     with io.open(outfile,'wt') as output:
-        exit_code = subprocess.call(cmd,cwd=wd,stdout=output)
+        proc = subprocess.run(cmd,cwd=wd,stdout=output,
+                              stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise BedtoolsError("'%s' failed (exit code %s): %s" %
+                            (' '.join(cmd),proc.returncode,
+                             proc.stderr.decode(errors='replace').strip()))
     return outfile
 
 def bedtools_version(bedtools_exe="bedtools"):
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+#
+#     checkpoint.py: checkpointing of enrichment calculations
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import os
+import io
+import json
+import logging
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Version of the checkpoint file format
+CHECKPOINT_FORMAT_VERSION = 1
+
+#######################################################################
+# Classes
+#######################################################################
+
+class CheckpointError(Exception):
+    """
+    Exception raised when a checkpoint can't be used
+    """
+
+class Checkpoint:
+    """
+    Record completed enrichment calculations to file
+
+    Each completed calculation (a "cell", identified by a
+    tuple such as '("peaks",i,j)' for peak set 'i' at
+    distance 'j', or '("tads",i)' for the TADs for peak set
+    'i') is appended to the checkpoint file as a line of
+    JSON, and flushed to disk immediately, so that the
+    results are preserved if the analysis is interrupted.
+
+    The first line of the file records a fingerprint of the
+    inputs; a checkpoint can only be resumed if the
+    fingerprint matches.
+
+    Example usage:
+
+    >>> checkpoint = Checkpoint("pegs_checkpoint.jsonl",fingerprint)
+    >>> checkpoint.open(resume=True)
+    >>> if checkpoint.get(("peaks",0,0)) is None:
+    ...     checkpoint.add(("peaks",0,0),pvalues,counts)
+    >>> checkpoint.close()
+    """
+    def __init__(self,checkpoint_file,fingerprint):
+        """
+        Arguments:
+          checkpoint_file (str): path to the checkpoint file
+          fingerprint (str): fingerprint of the inputs (e.g.
+            from 'input_fingerprint')
+        """
+        self.checkpoint_file = os.path.abspath(checkpoint_file)
+        self.fingerprint = fingerprint
+        self._cells = dict()
+        self._genes = dict()
+        self._n_overlapping = dict()
+        self._fp = None
+
+    def __len__(self):
+        return len(self._cells)
+
+    def open(self,resume=False):
+        """
+        Open the checkpoint file for recording results
+
+        If 'resume' is True and the checkpoint file already
+        exists then the previously completed cells are loaded
+        from it; otherwise any existing file is overwritten.
+
+        Arguments:
+          resume (bool): if True then load the results from
+            an existing checkpoint file
+
+        Raises 'CheckpointError' if the existing checkpoint
+        can't be resumed (for example because the inputs
+        have changed).
+        """
+        self._cells = dict()
+        self._genes = dict()
+        self._n_overlapping = dict()
+        if resume and os.path.exists(self.checkpoint_file):
+            self._load()
+        # (Re)write the file with the header and any valid
+        # cells, so any incomplete trailing line is discarded
+        tmp_file = "%s.tmp" % self.checkpoint_file
+        with io.open(tmp_file,'wt') as fp:
+            fp.write(u"%s\n" % json.dumps(
+                dict(version=CHECKPOINT_FORMAT_VERSION,
+                     fingerprint=self.fingerprint)))
+            for cell in self._cells:
+                fp.write(u"%s\n" % self._cell_record(cell))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_file,self.checkpoint_file)
+        self._fp = io.open(self.checkpoint_file,'at')
+
+    def get(self,cell):
+        """
+        Return the results for a completed cell
+
+        Arguments:
+          cell (tuple): identifier for the cell
+
+        Returns:
+          Tuple: (pvalues,counts) lists for the cell, or None
+            if the cell hasn't been completed.
+        """
+        return self._cells.get(tuple(cell))
+
+    def get_genes(self,cell):
+        """
+        Return the gene IDs recorded for a completed cell
+
+        Arguments:
+          cell (tuple): identifier for the cell
+
+        Returns:
+          List: gene IDs for the cell, or None if the cell
+            hasn't been completed or no gene IDs were recorded.
+        """
+        return self._genes.get(tuple(cell))
+
+    def get_n_overlapping(self,cell):
+        """
+        Return the number of overlapping genes for a cell
+
+        Arguments:
+          cell (tuple): identifier for the cell
+
+        Returns:
+          Integer: total number of genes overlapping the peak
+            set for the cell, or None if the cell hasn't been
+            completed or the number wasn't recorded.
+        """
+        return self._n_overlapping.get(tuple(cell))
+
+    def add(self,cell,pvalues,counts,genes=None,n_overlapping=None):
+        """
+        Record the results for a completed cell
+
+        Arguments:
+          cell (tuple): identifier for the cell
+          pvalues (iterable): p-values for each cluster
+          counts (iterable): gene counts for each cluster
+          genes (iterable): optional, IDs of the overlapping
+            genes in each cluster (see 'GeneMembership')
+          n_overlapping (int): optional, total number of genes
+            overlapping the peak set
+        """
+        cell = tuple(cell)
+        self._cells[cell] = ([float(x) for x in pvalues],
+                             [float(x) for x in counts])
+        if genes is not None:
+            self._genes[cell] = [int(x) for x in genes]
+        if n_overlapping is not None:
+            self._n_overlapping[cell] = int(n_overlapping)
+        if self._fp is not None:
+            self._fp.write(u"%s\n" % self._cell_record(cell))
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+
+    def close(self):
+        """
+        Close the checkpoint file (the file is kept)
+        """
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def remove(self):
+        """
+        Close and remove the checkpoint file
+        """
+        self.close()
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+    def _cell_record(self,cell):
+        # Internal: JSON record for a cell
+        pvalues,counts = self._cells[cell]
+        record = dict(cell=list(cell),
+                      pvalues=pvalues,
+                      counts=counts)
+        if cell in self._genes:
+            record['genes'] = self._genes[cell]
+        if cell in self._n_overlapping:
+            record['n_overlapping'] = self._n_overlapping[cell]
+        return json.dumps(record)
+
+    def _load(self):
+        # Internal: load the cells from an existing file
+        with io.open(self.checkpoint_file,'rt') as fp:
+            try:
+                header = json.loads(fp.readline())
+                version = header['version']
+                fingerprint = header['fingerprint']
+            except (ValueError,KeyError,TypeError):
+                raise CheckpointError("%s: not a valid checkpoint file" %
+                                      self.checkpoint_file)
+            if version > CHECKPOINT_FORMAT_VERSION:
+                raise CheckpointError("%s: unsupported checkpoint version "
+                                      "%s" % (self.checkpoint_file,version))
+            if fingerprint != self.fingerprint:
+                raise CheckpointError("%s: inputs have changed since the "
+                                      "checkpoint was created" %
+                                      self.checkpoint_file)
+            for lineno,line in enumerate(fp,start=2):
+                try:
+                    record = json.loads(line)
+                    cell = tuple(record['cell'])
+                    self._cells[cell] = (record['pvalues'],
+                                         record['counts'])
+                    if 'genes' in record:
+                        self._genes[cell] = record['genes']
+                    if 'n_overlapping' in record:
+                        self._n_overlapping[cell] = record['n_overlapping']
+                except (ValueError,KeyError,TypeError):
+                    # Incomplete record (e.g. if the previous run
+                    # was killed while writing it)
+                    logging.warning("%s: ignoring invalid record at "
+                                    "line %d" % (self.checkpoint_file,
+                                                 lineno))
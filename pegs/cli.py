@@ -5,7 +5,10 @@
 #
 from builtins import str
 import os
+import re
+import sys
 import argparse
+import contextlib
 import logging
 # Deal with matplotlib backend before importing seaborn
 # See https://stackoverflow.com/a/50089385/579925
@@ -14,7 +17,15 @@ matplotlib.use('Agg')
 import seaborn as sns
 import pathlib2
 from .pegs import pegs_main
+from .pegs import merge_main
+from .pegs import genes_main
+from .pegs import plot_main
+from .pegs import plan_main
+from .pegs import extract_main
 from .intervals import make_gene_interval_file
+from .profiling import PROFILE_STAGES
+from .metrics import METRICS_INTERVAL
+from .taskgraph import EXECUTORS
 from .bedtools import fetch_bedtools
 from .bedtools import bedtools_version
 from .utils import find_exe
@@ -57,45 +68,31 @@ CUBEHELIX_PALETTE_TYPES = {
     'reverse': bool,
 }
 
-def pegs():
-    # Create command line parser
-    p = argparse.ArgumentParser(description=PEGS_DESCRIPTION)
-    p.add_argument("gene_intervals",
-                   metavar="GENE_INTERVALS",
-                   help="either name of a built-in set of gene "
-                   "intervals (%s), or a BED file with gene interval "
-                   "data" %
-                   ','.join(["'%s'" % x for x in BUILTIN_GENE_INTERVALS]))
-    p.add_argument('--version',action='version',version=get_version())
-    p.add_argument("-p","--peaks",
-                   metavar="PEAK_SET_FILE",
-                   dest="peaks",
-                   action="store",
-                   required=True,
-                   nargs="+",
-                   help="one or more input peak set files (BED format)")
-    p.add_argument("-g","--genes",
-                   metavar="GENE_CLUSTER_FILE",
-                   dest="clusters",
-                   action="store",
-                   required=True,
-                   nargs="+",
-                   help="one or more input gene cluster files (one gene "
-                   "per line)")
-    p.add_argument("-t","--tads",metavar="TADS_FILE",
-                   dest="tads_file",
-                   action="store",
-                   help="BED file with topologically associating "
-                   "domains (TADs)")
-    p.add_argument("-d","--distances",
-                   metavar="DISTANCE",
-                   dest="distances",
-                   action="store",
-                   nargs="+",
-                   help="specify distance(s) to calculate enrichments "
-                   "for (if no distances are specified then the default "
-                   "set will be used i.e. %s)" %
-                   ' '.join([str(x) for x in DEFAULT_DISTANCES]))
+def parse_shard(s):
+    """
+    Convert a shard specification 'I/N' to a tuple '(I,N)'
+
+    For use as the 'type' of an argument parser option.
+    """
+    try:
+        shard,n_shards = [int(x) for x in s.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s': should be I/N" % s)
+    if n_shards < 1 or shard < 1 or shard > n_shards:
+        raise argparse.ArgumentTypeError("'%s': I should be from 1 "
+                                         "to N" % s)
+    return (shard,n_shards)
+
+def add_output_options(p):
+    """
+    Add the output options to an argument parser
+
+    Arguments:
+      p (ArgumentParser): parser to add the options to
+
+    Returns:
+      The argument group with the output options.
+    """
     output_options = p.add_argument_group("Output options")
     output_options.add_argument("--name",metavar="BASENAME",
                                 dest="name",
@@ -112,13 +109,15 @@ def pegs():
                                 "directory)")
     output_options.add_argument("-m",metavar="HEATMAP",
                                 dest="output_heatmap",
-                                action="store",
+                                action="append",
                                 default=None,
                                 help="destination for output heatmap; "
                                 "image format is implicitly determined by "
                                 "the file extension (e.g. '.png','.svg' "
                                 "etc) unless overridden by the --format "
-                                "option (default: 'BASENAME_heatmap.FORMAT')")
+                                "option (default: 'BASENAME_heatmap.FORMAT'). "
+                                "Can be specified multiple times to write "
+                                "more than one heatmap")
     output_options.add_argument("-x",metavar="XLSX",
                                 dest="output_xlsx",
                                 action="store",
@@ -126,6 +125,25 @@ def pegs():
                                 help="destination for output XLSX file "
                                 "with the raw enrichment data (default: "
                                 "'BASENAME_results.xlsx')")
+    output_options.add_argument("--html",metavar="HTML",
+                                dest="output_html",
+                                action="store",
+                                nargs="?",
+                                const="",
+                                default=None,
+                                help="also write an interactive HTML "
+                                "heatmap (which can be viewed in a web "
+                                "browser) to HTML (default: "
+                                "'BASENAME_heatmap.html')")
+    return output_options
+
+def add_heatmap_options(p):
+    """
+    Add the heatmap options to an argument parser
+
+    Arguments:
+      p (ArgumentParser): parser to add the options to
+    """
     heatmap_options = p.add_argument_group("Heatmap options")
     heatmap_options.add_argument("--format",
                                  dest="heatmap_format",
@@ -136,7 +154,10 @@ def pegs():
                                  "for the output heatmap; note that if this "
                                  "option is specified then it will override "
                                  "the format implied by the specified with "
-                                 "the -m option (default: 'png')")
+                                 "the -m option. Multiple formats can be "
+                                 "specified as a comma-separated list (e.g. "
+                                 "'png,svg,pdf'), in which case a heatmap is "
+                                 "written for each format (default: 'png')")
     heatmap_options.add_argument("--x-label",
                                  metavar="CLUSTERS_AXIS_LABEL",
                                  dest="clusters_axis_label",
@@ -151,43 +172,461 @@ def pegs():
                                  default=None,
                                  help="set a custom label for the Y "
                                  "(peak sets) axis")
-    g = heatmap_options.add_mutually_exclusive_group()
-    g.add_argument("--color",
-                   dest="heatmap_color",
-                   metavar="COLOR",
+    heatmap_options.add_argument("--color",
+                                 dest="heatmap_color",
+                                 metavar="COLOR",
+                                 action="append",
+                                 default=None,
+                                 help="specify a base color to use for the "
+                                 "heatmap. Multiple colors can be specified "
+                                 "(either as a comma-separated list, or by "
+                                 "repeating the option), in which case a "
+                                 "variant of the heatmap is written for "
+                                 "each color")
+    heatmap_options.add_argument("--heatmap-palette",
+                                 dest="heatmap_palette_options",
+                                 metavar="OPTION=VALUE",
+                                 action="append",
+                                 nargs="+",
+                                 default = None,
+                                 help="advanced option to specify custom "
+                                 "palette settings for the output heatmap "
+                                 "(e.g. 'start=0.5', 'rot=0' etc). Available "
+                                 "options are those listed in the "
+                                 "'cubehelix_palette' documentation at "
+                                 "https://seaborn.pydata.org/generated/"
+                                 "seaborn.cubehelix_palette.html. Can be "
+                                 "repeated to write a variant of the heatmap "
+                                 "for each palette")
+    heatmap_options.add_argument("--peak-sets-per-page",
+                                 dest="peak_sets_per_page",
+                                 metavar="N",
+                                 action="store",
+                                 type=int,
+                                 default=None,
+                                 help="split the heatmap into pages with "
+                                 "at most N peak sets on each page, using "
+                                 "the same colour scale for all pages (e.g. "
+                                 "'BASENAME_heatmap.page01.png' etc)")
+    heatmap_options.add_argument("--clusters-per-page",
+                                 dest="clusters_per_page",
+                                 metavar="N",
+                                 action="store",
+                                 type=int,
+                                 default=None,
+                                 help="split the heatmap into pages with "
+                                 "at most N clusters on each page (can be "
+                                 "combined with --peak-sets-per-page to "
+                                 "split into tiles)")
+
+def check_heatmap_options(p,args):
+    """
+    Check the values of the heatmap options
+
+    Arguments:
+      p (ArgumentParser): parser which will report errors
+      args (Namespace): arguments returned by the parser
+    """
+    for option,value in (("--peak-sets-per-page",args.peak_sets_per_page),
+                         ("--clusters-per-page",args.clusters_per_page)):
+        if value is not None and value < 1:
+            p.error("%s: must be 1 or greater" % option)
+
+def get_heatmap_formats(args):
+    """
+    Get the list of image formats from the parsed arguments
+
+    Arguments:
+      args (Namespace): arguments returned by the parser, which
+        must include the heatmap options
+
+    Returns:
+      List: list of image formats, or None if no formats were
+        specified.
+    """
+    if not args.heatmap_format:
+        return None
+    return [fmt.strip() for fmt in args.heatmap_format.split(',')
+            if fmt.strip()]
+
+def get_heatmap_variants(args):
+    """
+    Build the colormaps for the heatmaps from the parsed arguments
+
+    A variant is generated for each of the colors supplied
+    via the --color option and each set of options supplied
+    via --heatmap-palette.
+
+    Arguments:
+      args (Namespace): arguments returned by the parser, which
+        must include the heatmap options
+
+    Returns:
+      List: list of '(variant,cmap)' tuples, where 'variant'
+        is a name which can be used in file names; or None if
+        the default colormap should be used.
+    """
+    variants = []
+    # Variants from base colors
+    colors = []
+    for color in (args.heatmap_color or []):
+        colors.extend([c.strip() for c in color.split(',') if c.strip()])
+    for color in colors:
+        # Construct non-default colormap using the
+        # seaborn lightpalette function
+        variant = re.sub(r"[^A-Za-z0-9_\-]+","",color)
+        variants.append((variant,
+                         sns.light_palette(color=color,as_cmap=True)))
+    # Variants from palette options
+    palettes = (args.heatmap_palette_options or [])
+    for i,options in enumerate(palettes,start=1):
+        variant = ("palette%d" % i if len(palettes) > 1 else "palette")
+        variants.append((variant,make_palette_cmap(options)))
+    if not variants:
+        return None
+    return variants
+
+def make_palette_cmap(options):
+    """
+    Construct a cubehelix colormap from 'OPTION=VALUE' strings
+
+    Arguments:
+      options (list): list of 'OPTION=VALUE' strings
+
+    Returns:
+      Colormap: the new colormap.
+    """
+    # Construct non-default colormap using the
+    # options supplied by the user
+    heatmap_palette_options = {
+        'n_colors': 6,
+        'start': 0,
+        'rot': 0.4,
+        'gamma': 1.0,
+        'hue': 0.8,
+        'light': 0.85,
+        'dark': 0.15,
+        'reverse': False,
+    }
+    for o in options:
+        key,value = o.split("=")
+        if key not in heatmap_palette_options:
+            logging.warning("Unrecognised palette option: '%s'"
+                            % key)
+        else:
+            heatmap_palette_options[key] = \
+                    CUBEHELIX_PALETTE_TYPES[key](value)
+    return sns.cubehelix_palette(as_cmap=True,
+                                 **heatmap_palette_options)
+
+def pegs():
+    # Dispatch subcommands
+    if len(sys.argv) > 1 and sys.argv[1] == "merge":
+        return pegs_merge(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == "genes":
+        return pegs_genes(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == "plot":
+        return pegs_plot(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == "extract":
+        return pegs_extract(sys.argv[2:])
+    # Create command line parser
+    p = argparse.ArgumentParser(description=PEGS_DESCRIPTION)
+    p.add_argument("gene_intervals",
+                   metavar="GENE_INTERVALS",
+                   nargs="+",
+                   help="either name of a built-in set of gene "
+                   "intervals (%s), or a BED file with gene interval "
+                   "data; if more than one is supplied then the "
+                   "enrichments are calculated against each one in "
+                   "a single run, with a separate set of outputs for "
+                   "each" %
+                   ','.join(["'%s'" % x for x in BUILTIN_GENE_INTERVALS]))
+    p.add_argument('--version',action='version',version=get_version())
+    p.add_argument("-p","--peaks",
+                   metavar="PEAK_SET_FILE",
+                   dest="peaks",
+                   action="store",
+                   required=True,
+                   nargs="+",
+                   help="one or more input peak set files (BED "
+                   "format); use '-' to read a peak set from stdin")
+    p.add_argument("--peaks-group-column",
+                   metavar="N",
+                   dest="peaks_group_column",
                    action="store",
+                   type=int,
                    default=None,
-                   help="specify a base color to use for the heatmap "
-                   "(NB not compatible with --heatmap-palette)")
-    g.add_argument("--heatmap-palette",
-                   dest="heatmap_palette_options",
-                   metavar="OPTION=VALUE",
+                   help="split the intervals in the input peak set "
+                   "files into separate peak sets using the values in "
+                   "column N (e.g. a column with sample names); each "
+                   "group is treated as a peak set named after the "
+                   "group value")
+    p.add_argument("-g","--genes",
+                   metavar="GENE_CLUSTER_FILE",
+                   dest="clusters",
+                   action="store",
+                   required=True,
+                   nargs="+",
+                   help="one or more input gene cluster files (one gene "
+                   "per line)")
+    p.add_argument("-t","--tads",metavar="TADS_FILE",
+                   dest="tads_file",
+                   action="store",
+                   help="BED file with topologically associating "
+                   "domains (TADs)")
+    p.add_argument("-d","--distances",
+                   metavar="DISTANCE",
+                   dest="distances",
                    action="store",
                    nargs="+",
-                   default = None,
-                   help="advanced option to specify custom palette "
-                   "settings for the output heatmap (e.g. 'start=0.5', "
-                   "'rot=0' etc). Available options are those listed in "
-                   "the 'cubehelix_palette' documentation at "
-                   "https://seaborn.pydata.org/generated/"
-                   "seaborn.cubehelix_palette.html (NB not compatible "
-                   "with --color)")
+                   help="specify distance(s) to calculate enrichments "
+                   "for (if no distances are specified then the default "
+                   "set will be used i.e. %s)" %
+                   ' '.join([str(x) for x in DEFAULT_DISTANCES]))
+    output_options = add_output_options(p)
+    output_options.add_argument("--tsv-out",metavar="TSV",
+                                dest="tsv_out",
+                                action="store",
+                                default=None,
+                                help="write the results in long format "
+                                "(one line per peak set, distance and "
+                                "cluster) as tab-separated values to TSV; "
+                                "use '-' to write to stdout (all other "
+                                "output is then written to stderr). The "
+                                "heatmap and XLSX file are only written "
+                                "if -m or -x are also specified")
+    add_heatmap_options(p)
     advanced_options = p.add_argument_group("Advanced options")
+    advanced_options.add_argument("-j","--jobs",
+                                  metavar="N",
+                                  dest="max_jobs",
+                                  action="store",
+                                  type=int,
+                                  default=1,
+                                  help="run up to N 'bedtools' processes "
+                                  "(and write up to N outputs or heatmap "
+                                  "pages) concurrently (default: 1)")
+    advanced_options.add_argument("--executor",
+                                  dest="executor",
+                                  action="store",
+                                  choices=EXECUTORS,
+                                  default=None,
+                                  help="how to run the tasks for the "
+                                  "enrichment calculations: 'serial' "
+                                  "runs one at a time, 'threads' and "
+                                  "'processes' run up to N (set by -j) "
+                                  "at a time ('processes' also runs the "
+                                  "Python parts of the calculations on "
+                                  "multiple cores) (default: 'threads' "
+                                  "if -j is greater than 1, otherwise "
+                                  "'serial')")
+    advanced_options.add_argument("--sorted",
+                                  dest="sorted_inputs",
+                                  action="store_true",
+                                  help="sort the gene intervals, peaks "
+                                  "and TADs by position and use the "
+                                  "'bedtools' sorted (\"chromsweep\") "
+                                  "algorithm for intersections, which "
+                                  "uses less memory for large inputs "
+                                  "(NB each input is read into memory "
+                                  "once to sort it; the sorted gene "
+                                  "intervals are cached)")
+    advanced_options.add_argument("--genome",
+                                  metavar="GENOME_FILE",
+                                  dest="genome_file",
+                                  action="store",
+                                  default=None,
+                                  help="'bedtools' genome file with the "
+                                  "chromosome sizes (one chromosome "
+                                  "name and size per line); expanded "
+                                  "peaks are clipped to the ends of the "
+                                  "chromosomes, and the order of the "
+                                  "chromosomes is used when sorting "
+                                  "with --sorted")
+    advanced_options.add_argument("--split-chromosomes",
+                                  dest="split_chromosomes",
+                                  action="store_true",
+                                  help="run the intersections for each "
+                                  "chromosome as separate 'bedtools' "
+                                  "processes (use with -j so that the "
+                                  "intersections for a single large "
+                                  "peak set can run on multiple cores)")
+    advanced_options.add_argument("--merge-peaks",
+                                  dest="merge_peaks",
+                                  action="store_true",
+                                  help="merge overlapping peaks in each "
+                                  "peak set (and again after expanding "
+                                  "the peaks for each distance) before "
+                                  "running the intersections; reduces "
+                                  "the work for peak sets with many "
+                                  "overlapping peaks without changing "
+                                  "the results")
+    advanced_options.add_argument("--peak-cache",
+                                  dest="peak_cache",
+                                  action="store_true",
+                                  help="convert each peak set to a binary "
+                                  "cache of peak coordinates (stored in "
+                                  "the cache directory, so it can be "
+                                  "reused by later runs on the same "
+                                  "peak sets) and use this to generate "
+                                  "the expanded peaks for each distance")
+    advanced_options.add_argument("--cache-dir",
+                                  metavar="CACHE_DIR",
+                                  dest="cache_dir",
+                                  action="store",
+                                  default=None,
+                                  help="directory to cache the "
+                                  "position-sorted gene intervals "
+                                  "(with --sorted) and the peak set "
+                                  "coordinates (with --peak-cache) in, "
+                                  "for reuse by later runs (default: "
+                                  "'~/.pegs/cache')")
+    advanced_options.add_argument("--resume",
+                                  dest="resume",
+                                  action="store_true",
+                                  help="resume an interrupted analysis, "
+                                  "using the results from the checkpoint "
+                                  "file 'BASENAME_checkpoint.jsonl' in "
+                                  "the output directory (the inputs must "
+                                  "not have changed)")
+    advanced_options.add_argument("--shard",
+                                  metavar="I/N",
+                                  dest="shard",
+                                  action="store",
+                                  type=parse_shard,
+                                  default=None,
+                                  help="split the peak sets into N "
+                                  "contiguous slices and only calculate "
+                                  "the enrichments for slice I; the "
+                                  "partial results are written to "
+                                  "'BASENAME_shard_I_of_N.npz' and can "
+                                  "be combined using 'pegs merge'")
     advanced_options.add_argument("-k","--keep-intersection-files",
                                   dest="keep_intersection_files",
                                   action="store_true",
                                   help="keep the intermediate intersection "
                                   "files (useful for debugging)")
+    advanced_options.add_argument("--intersections-archive",
+                                  dest="intersections_archive",
+                                  action="store_true",
+                                  help="keep the intermediate intersection "
+                                  "files in a single compressed archive "
+                                  "'BASENAME_intersections.zip' (instead "
+                                  "of the 'intersection_beds' directory), "
+                                  "which can be read using 'pegs "
+                                  "extract'")
+    advanced_options.add_argument("--export-genes",
+                                  dest="export_genes",
+                                  action="store_true",
+                                  help="also write the genes in each "
+                                  "cluster which overlap each peak set at "
+                                  "each distance (and for the TADs) to "
+                                  "'BASENAME_genes.npz', which can be "
+                                  "queried using 'pegs genes'")
+    advanced_options.add_argument("--save-results",
+                                  dest="keep_results",
+                                  action="store_true",
+                                  help="also save the results to "
+                                  "'BASENAME_results.npz', from which the "
+                                  "heatmap and other outputs can be "
+                                  "regenerated using 'pegs plot'")
     advanced_options.add_argument("--dump-raw-data",
                                   dest="dump_raw_data",
                                   action="store_true",
                                   help="dump the raw data (gene counts and "
                                   "p-values) to TSV files (for debugging)")
+    advanced_options.add_argument("--profile",
+                                  dest="profile",
+                                  action="store_true",
+                                  help="record the time spent in each "
+                                  "stage of the analysis; prints a "
+                                  "summary at the end of the run and "
+                                  "writes the timings to "
+                                  "'BASENAME_profile.json'")
+    advanced_options.add_argument("--profile-stage",
+                                  dest="profile_stage",
+                                  metavar="STAGE",
+                                  action="store",
+                                  choices=PROFILE_STAGES,
+                                  default=None,
+                                  help="also collect cProfile data for "
+                                  "STAGE and write it to "
+                                  "'BASENAME_STAGE.prof' (implies "
+                                  "--profile; stages within the enrichment "
+                                  "calculations are only profiled with "
+                                  "the 'serial' executor); STAGE can be "
+                                  "one of %s" %
+                                  ', '.join(PROFILE_STAGES))
+    advanced_options.add_argument("--track-memory",
+                                  dest="track_memory",
+                                  action="store_true",
+                                  help="record the peak memory usage "
+                                  "(process RSS and Python allocations) "
+                                  "for each stage of the analysis; "
+                                  "prints a summary at the end of the "
+                                  "run and writes the data to "
+                                  "'BASENAME_memory.json' (NB this will "
+                                  "slow down the run)")
+    advanced_options.add_argument("--metrics-file",
+                                  metavar="METRICS_FILE",
+                                  dest="metrics_file",
+                                  action="store",
+                                  help="periodically write the progress "
+                                  "and throughput of the run (cells "
+                                  "completed, cells per second, time "
+                                  "spent in bedtools, bytes read and "
+                                  "current stage) to METRICS_FILE; the "
+                                  "metrics are written in the Prometheus "
+                                  "text format if METRICS_FILE ends with "
+                                  "'.prom' (e.g. for the node_exporter "
+                                  "textfile collector), otherwise as JSON")
+    advanced_options.add_argument("--metrics-interval",
+                                  metavar="SECONDS",
+                                  dest="metrics_interval",
+                                  type=float,
+                                  default=METRICS_INTERVAL,
+                                  help="interval in seconds between "
+                                  "updates of the metrics file (default: "
+                                  "%s)" % METRICS_INTERVAL)
+    advanced_options.add_argument("--plan",
+                                  dest="plan",
+                                  action="store_true",
+                                  help="don't calculate the enrichments; "
+                                  "instead scan the inputs and report "
+                                  "the estimated run time, peak memory, "
+                                  "temporary disk usage and output sizes "
+                                  "for the run (using the number of jobs "
+                                  "set by -j) along with a recommended "
+                                  "number of jobs")
+    advanced_options.add_argument("--plan-cores",
+                                  metavar="N",
+                                  dest="plan_cores",
+                                  type=int,
+                                  help="maximum number of cores to "
+                                  "consider when recommending the number "
+                                  "of jobs with --plan (default: number "
+                                  "of CPUs on this machine)")
     args = p.parse_args()
+    if args.max_jobs < 1:
+        p.error("--jobs: must be 1 or greater")
+    if args.plan_cores is not None and args.plan_cores < 1:
+        p.error("--plan-cores: must be 1 or greater")
+    if args.metrics_interval <= 0:
+        p.error("--metrics-interval: must be greater than zero")
+    check_heatmap_options(p,args)
+    if args.peaks_group_column is not None and args.peaks_group_column < 1:
+        p.error("--peaks-group-column: column must be 1 or greater")
     # Deal with peak and cluster files
     peaks = sort_files(args.peaks)
+    if peaks.count("-") > 1:
+        p.error("--peaks: '-' (stdin) can only be given once")
+    if "-" in peaks and args.plan:
+        p.error("--plan: can't read peaks from stdin")
     for f in peaks:
-       if not os.path.exists(f):
+       if f == "-":
+          # Read from stdin
+          continue
+       elif not os.path.exists(f):
           logging.fatal("Peaks file '%s' doesn't exist" % f)
           return 1
        elif os.path.isdir(f):
@@ -215,20 +654,27 @@ def pegs():
                 distances.append(int(x))
     distances = sorted(distances)
     # Check if using built-in interval data
-    gene_interval_file = args.gene_intervals
-    try:
-        gene_interval_file = BUILTIN_GENE_INTERVALS[gene_interval_file]
-        p = os.path.dirname(__file__)
-        while p != os.sep:
-            f = os.path.join(p,"pegs-%s" % get_version(),gene_interval_file)
-            if os.path.exists(f):
-                gene_interval_file = f
-                break
-            else:
-                p = os.path.dirname(p)
-    except KeyError:
-        # Not found, ignore
-        pass
+    gene_interval_files = []
+    for gene_interval_file in args.gene_intervals:
+        try:
+            gene_interval_file = BUILTIN_GENE_INTERVALS[gene_interval_file]
+            p = os.path.dirname(__file__)
+            while p != os.sep:
+                f = os.path.join(p,"pegs-%s" % get_version(),
+                                 gene_interval_file)
+                if os.path.exists(f):
+                    gene_interval_file = f
+                    break
+                else:
+                    p = os.path.dirname(p)
+        except KeyError:
+            # Not found, ignore
+            pass
+        gene_interval_files.append(gene_interval_file)
+    if len(gene_interval_files) == 1:
+        gene_interval_file = gene_interval_files[0]
+    else:
+        gene_interval_file = gene_interval_files
     # Check TADs file is actually a file
     if args.tads_file:
        if not os.path.exists(args.tads_file):
@@ -238,36 +684,67 @@ def pegs():
           logging.fatal("TADs file '%s' is a directory (must be a file)"
                         % args.tads_file)
           return 1
+    # Check genome file is actually a file
+    if args.genome_file:
+       if not os.path.exists(args.genome_file):
+          logging.fatal("Genome file '%s' doesn't exist" % args.genome_file)
+          return 1
+       elif os.path.isdir(args.genome_file):
+          logging.fatal("Genome file '%s' is a directory (must be a file)"
+                        % args.genome_file)
+          return 1
+    # Estimate the resources for the run
+    if args.plan:
+        print("%s %s\n" % (PEGS_DESCRIPTION,get_version()))
+        return plan_main(genes_file=gene_interval_file,
+                         distances=distances,
+                         peaks=peaks,
+                         clusters=clusters,
+                         tads_file=args.tads_file,
+                         max_jobs=args.max_jobs,
+                         sorted_inputs=args.sorted_inputs,
+                         genome_file=args.genome_file,
+                         peaks_group_column=args.peaks_group_column,
+                         shard=args.shard,
+                         split_chromosomes=args.split_chromosomes,
+                         peak_cache=args.peak_cache,
+                         keep_intersection_files=
+                         args.keep_intersection_files,
+                         intersections_archive=
+                         args.intersections_archive,
+                         html=args.output_html,
+                         dump_raw_data=args.dump_raw_data,
+                         export_genes=args.export_genes,
+                         keep_results=args.keep_results,
+                         max_cores=args.plan_cores)
     # Build colormap for heatmap
-    heatmap_cmap = None
-    if args.heatmap_color:
-        # Construct non-default colormap using the
-        # seaborn lightpalette function
-        heatmap_cmap = sns.light_palette(color=args.heatmap_color,
-                                         as_cmap=True)
-    elif args.heatmap_palette_options is not None:
-        # Construct non-default colormap using the
-        # options supplied by the user
-        heatmap_palette_options = {
-            'n_colors': 6,
-            'start': 0,
-            'rot': 0.4,
-            'gamma': 1.0,
-            'hue': 0.8,
-            'light': 0.85,
-            'dark': 0.15,
-            'reverse': False,
-        }
-        for o in args.heatmap_palette_options:
-            key,value = o.split("=")
-            if key not in heatmap_palette_options:
-                logging.warning("Unrecognised palette option: '%s'"
-                                % key)
-            else:
-                heatmap_palette_options[key] = \
-                        CUBEHELIX_PALETTE_TYPES[key](value)
-        heatmap_cmap = sns.cubehelix_palette(as_cmap=True,
-                                             **heatmap_palette_options)
+    heatmap_variants = get_heatmap_variants(args)
+    # Write the results to stdout, and everything else to stderr
+    tsv_out = args.tsv_out
+    if tsv_out == "-":
+        tsv_out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            return run_pegs(args,gene_interval_file,distances,peaks,
+                            clusters,heatmap_variants,tsv_out)
+    return run_pegs(args,gene_interval_file,distances,peaks,clusters,
+                    heatmap_variants,tsv_out)
+
+def run_pegs(args,gene_interval_file,distances,peaks,clusters,
+             heatmap_variants,tsv_out=None):
+    """
+    Report the PEGS banner, locate 'bedtools' and run the analysis
+
+    Arguments:
+      args (Namespace): the parsed command line arguments
+      gene_interval_file (str): gene intervals file (or list
+        of files)
+      distances (list): list of distances
+      peaks (list): list of peaks files
+      clusters (list): list of cluster files
+      heatmap_variants (list): list of heatmap variants
+      tsv_out (str): file name or stream to write the long-format
+        TSV results to (optional)
+    """
     # Report version and authors etc
     print("%s %s" % (PEGS_DESCRIPTION,get_version()))
     print("""
@@ -305,23 +782,287 @@ Authors: Mudassar Iqbal, Peter Briggs
     print("Found %s (%s)\n" % (bedtools_version(bedtools_exe),
                                bedtools_exe))
 
+    # Cache directory for sorted gene intervals
+    cache_dir = args.cache_dir
+    if cache_dir is None:
+        cache_dir = os.path.join(pegs_dir,"cache")
+
     # Calculate the enrichments
-    pegs_main(genes_file=gene_interval_file,
-              distances=distances,
-              peaks=peaks,
-              clusters=clusters,
-              tads_file=args.tads_file,
-              name=args.name,
-              heatmap=args.output_heatmap,
-              xlsx=args.output_xlsx,
-              output_directory=args.output_directory,
-              keep_intersection_files=
-              args.keep_intersection_files,
-              clusters_axis_label=args.clusters_axis_label,
-              peaksets_axis_label=args.peaksets_axis_label,
-              heatmap_cmap=heatmap_cmap,
-              heatmap_format=args.heatmap_format,
-              dump_raw_data=args.dump_raw_data)
+    return pegs_main(genes_file=gene_interval_file,
+                     distances=distances,
+                     peaks=peaks,
+                     clusters=clusters,
+                     tads_file=args.tads_file,
+                     name=args.name,
+                     heatmap=args.output_heatmap,
+                     xlsx=args.output_xlsx,
+                     html=args.output_html,
+                     output_directory=args.output_directory,
+                     keep_intersection_files=
+                     args.keep_intersection_files,
+                     clusters_axis_label=args.clusters_axis_label,
+                     peaksets_axis_label=args.peaksets_axis_label,
+                     heatmap_variants=heatmap_variants,
+                     heatmap_format=get_heatmap_formats(args),
+                     peak_sets_per_page=args.peak_sets_per_page,
+                     clusters_per_page=args.clusters_per_page,
+                     dump_raw_data=args.dump_raw_data,
+                     peaks_group_column=args.peaks_group_column,
+                     profile=args.profile,
+                     profile_stage=args.profile_stage,
+                     track_memory=args.track_memory,
+                     max_jobs=args.max_jobs,
+                     sorted_inputs=args.sorted_inputs,
+                     genome_file=args.genome_file,
+                     cache_dir=cache_dir,
+                     shard=args.shard,
+                     resume=args.resume,
+                     peak_cache=args.peak_cache,
+                     split_chromosomes=args.split_chromosomes,
+                     merge_peaks=args.merge_peaks,
+                     export_genes=args.export_genes,
+                     keep_results=args.keep_results,
+                     metrics_file=args.metrics_file,
+                     metrics_interval=args.metrics_interval,
+                     executor=args.executor,
+                     intersections_archive=args.intersections_archive,
+                     tsv_out=tsv_out)
+
+def pegs_merge(argv=None):
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        prog="pegs merge",
+        description="Combine the partial results from sharded PEGS "
+        "runs (i.e. using the --shard option) and generate the heatmap "
+        "and XLSX file for the complete analysis")
+    p.add_argument("results_files",
+                   metavar="SHARD_RESULTS_FILE",
+                   nargs="+",
+                   help="partial results files ('.npz') from each of "
+                   "the shards")
+    p.add_argument('--version',action='version',version=get_version())
+    add_output_options(p)
+    add_heatmap_options(p)
+    advanced_options = p.add_argument_group("Advanced options")
+    advanced_options.add_argument("-j","--jobs",
+                                  metavar="N",
+                                  dest="max_jobs",
+                                  action="store",
+                                  type=int,
+                                  default=1,
+                                  help="write up to N outputs (or heatmap "
+                                  "pages) concurrently (default: 1)")
+    advanced_options.add_argument("--dump-raw-data",
+                                  dest="dump_raw_data",
+                                  action="store_true",
+                                  help="dump the raw data (gene counts and "
+                                  "p-values) to TSV files (for debugging)")
+    args = p.parse_args(argv)
+    if args.max_jobs < 1:
+        p.error("--jobs: must be 1 or greater")
+    check_heatmap_options(p,args)
+    # Check the results files
+    for f in args.results_files:
+        if not os.path.isfile(f):
+            logging.fatal("Results file '%s' doesn't exist" % f)
+            return 1
+    # Build colormap for heatmap
+    heatmap_variants = get_heatmap_variants(args)
+    # Report version
+    print("%s %s\n" % (PEGS_DESCRIPTION,get_version()))
+    # Combine the results and make the outputs
+    return merge_main(args.results_files,
+                      name=args.name,
+                      heatmap=args.output_heatmap,
+                      xlsx=args.output_xlsx,
+                      html=args.output_html,
+                      output_directory=args.output_directory,
+                      clusters_axis_label=args.clusters_axis_label,
+                      peaksets_axis_label=args.peaksets_axis_label,
+                      heatmap_variants=heatmap_variants,
+                      heatmap_format=get_heatmap_formats(args),
+                      peak_sets_per_page=args.peak_sets_per_page,
+                      clusters_per_page=args.clusters_per_page,
+                      dump_raw_data=args.dump_raw_data,
+                      max_jobs=args.max_jobs)
+
+def pegs_plot(argv=None):
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        prog="pegs plot",
+        description="Regenerate the heatmap, XLSX file and other "
+        "outputs from saved PEGS results, without recalculating the "
+        "enrichments")
+    p.add_argument("results_files",
+                   metavar="RESULTS_FILE",
+                   nargs="+",
+                   help="results file ('NAME_results.npz' from the "
+                   "--save-results option, or the partial results "
+                   "files from each shard), or the p-values file "
+                   "('NAME_pval.tsv') from the --dump-raw-data option")
+    p.add_argument('--version',action='version',version=get_version())
+    add_output_options(p)
+    add_heatmap_options(p)
+    p.add_argument("--cluster-names",
+                   metavar="NAME",
+                   dest="cluster_names",
+                   nargs="+",
+                   default=None,
+                   help="names of the clusters (only used for results "
+                   "loaded from '_pval.tsv' files, which don't include "
+                   "the cluster names; default: 'cluster_1', "
+                   "'cluster_2' etc)")
+    advanced_options = p.add_argument_group("Advanced options")
+    advanced_options.add_argument("-j","--jobs",
+                                  metavar="N",
+                                  dest="max_jobs",
+                                  action="store",
+                                  type=int,
+                                  default=1,
+                                  help="write up to N outputs (or heatmap "
+                                  "pages) concurrently (default: 1)")
+    advanced_options.add_argument("--dump-raw-data",
+                                  dest="dump_raw_data",
+                                  action="store_true",
+                                  help="dump the raw data (gene counts and "
+                                  "p-values) to TSV files (for debugging)")
+    args = p.parse_args(argv)
+    if args.max_jobs < 1:
+        p.error("--jobs: must be 1 or greater")
+    check_heatmap_options(p,args)
+    # Check the results files
+    for f in args.results_files:
+        if not os.path.isfile(f):
+            logging.fatal("Results file '%s' doesn't exist" % f)
+            return 1
+    # Build colormap for heatmap
+    heatmap_variants = get_heatmap_variants(args)
+    # Report version
+    print("%s %s\n" % (PEGS_DESCRIPTION,get_version()))
+    # Load the results and make the outputs
+    return plot_main(args.results_files,
+                     name=args.name,
+                     heatmap=args.output_heatmap,
+                     xlsx=args.output_xlsx,
+                     html=args.output_html,
+                     output_directory=args.output_directory,
+                     clusters_axis_label=args.clusters_axis_label,
+                     peaksets_axis_label=args.peaksets_axis_label,
+                     heatmap_variants=heatmap_variants,
+                     heatmap_format=get_heatmap_formats(args),
+                     peak_sets_per_page=args.peak_sets_per_page,
+                     clusters_per_page=args.clusters_per_page,
+                     dump_raw_data=args.dump_raw_data,
+                     max_jobs=args.max_jobs,
+                     cluster_names=args.cluster_names)
+
+def pegs_genes(argv=None):
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        prog="pegs genes",
+        description="Report the genes in each cluster which overlap "
+        "each peak set, from the file written by the --export-genes "
+        "option of PEGS")
+    p.add_argument("genes_files",
+                   metavar="GENES_FILE",
+                   nargs="+",
+                   help="overlapping genes file ('NAME_genes.npz'; "
+                   "multiple files can be specified for sharded runs)")
+    p.add_argument('--version',action='version',version=get_version())
+    p.add_argument("-p","--peaks",
+                   metavar="PEAK_SET",
+                   dest="peak_sets",
+                   action="append",
+                   default=None,
+                   help="only report genes for PEAK_SET (can be "
+                   "specified multiple times)")
+    p.add_argument("-d","--distance",
+                   metavar="DISTANCE",
+                   dest="distances",
+                   action="append",
+                   type=int,
+                   default=None,
+                   help="only report genes for DISTANCE (can be "
+                   "specified multiple times)")
+    p.add_argument("-c","--cluster",
+                   metavar="CLUSTER",
+                   dest="clusters",
+                   action="append",
+                   default=None,
+                   help="only report genes in CLUSTER (can be "
+                   "specified multiple times)")
+    p.add_argument("--tads",
+                   action="store_true",
+                   help="report genes for the TADs overlapping each "
+                   "peak set (instead of for each distance)")
+    args = p.parse_args(argv)
+    # Check the genes files
+    for f in args.genes_files:
+        if not os.path.isfile(f):
+            logging.fatal("Genes file '%s' doesn't exist" % f)
+            return 1
+    # Report the genes
+    return genes_main(args.genes_files,
+                      peak_sets=args.peak_sets,
+                      distances=args.distances,
+                      clusters=args.clusters,
+                      tads=args.tads)
+
+def pegs_extract(argv=None):
+    # Create command line parser
+    p = argparse.ArgumentParser(
+        prog="pegs extract",
+        description="Extract intersection files from the archive "
+        "written by the --intersections-archive option of PEGS")
+    p.add_argument("archive_file",
+                   metavar="ARCHIVE",
+                   help="intersections archive "
+                   "('NAME_intersections.zip')")
+    p.add_argument('--version',action='version',version=get_version())
+    p.add_argument("-p","--peaks",
+                   metavar="PEAK_SET",
+                   dest="peak_sets",
+                   action="append",
+                   default=None,
+                   help="only extract intersections for PEAK_SET (can "
+                   "be specified multiple times)")
+    p.add_argument("-d","--distance",
+                   metavar="DISTANCE",
+                   dest="distances",
+                   action="append",
+                   type=int,
+                   default=None,
+                   help="only extract intersections for DISTANCE (can "
+                   "be specified multiple times)")
+    p.add_argument("--tads",
+                   action="store_true",
+                   help="extract the intersections for the TADs "
+                   "overlapping each peak set (instead of for each "
+                   "distance)")
+    p.add_argument("-o","--output-dir",
+                   metavar="DIR",
+                   dest="output_dir",
+                   default=None,
+                   help="extract each intersection to a separate file "
+                   "in DIR (default: write the intersections to "
+                   "stdout)")
+    p.add_argument("-l","--list",
+                   dest="list_members",
+                   action="store_true",
+                   help="list the matching intersections in the archive "
+                   "instead of extracting them")
+    args = p.parse_args(argv)
+    # Check the archive
+    if not os.path.isfile(args.archive_file):
+        logging.fatal("Archive '%s' doesn't exist" % args.archive_file)
+        return 1
+    # Extract the intersections
+    return extract_main(args.archive_file,
+                        peak_sets=args.peak_sets,
+                        distances=args.distances,
+                        tads=args.tads,
+                        output_dir=args.output_dir,
+                        list_members=args.list_members)
 
 def mk_pegs_intervals():
     # Create command line parser
@@ -336,10 +1077,17 @@ def mk_pegs_intervals():
                    help="destination for output BED file with "
                    "gene interval data (default: "
                    "'<REFGENE_FILE>_intervals.bed')")
+    p.add_argument("--sort-by-position",
+                   dest="sort_by_position",
+                   action="store_true",
+                   help="write the gene intervals in order of "
+                   "chromosome and position (default: order by gene "
+                   "name)")
     p.add_argument('--version',action='version',version=get_version())
     args = p.parse_args()
     # Report version
     print("MK_PEGS_INTERVALS %s\n" % get_version())
     # Generate the gene interval file
     make_gene_interval_file(args.refgene_file,
-                            args.gene_interval_file)
+                            args.gene_interval_file,
+                            sort_by_position=args.sort_by_position)
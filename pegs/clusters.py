@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+#
+#     clusters.py: indexing of gene clusters
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import os
+import io
+import numpy as np
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Names of the files holding each of the index arrays
+CLUSTER_INDEX_ARRAYS = ("genes","indptr","indices","sizes")
+
+#######################################################################
+# Classes
+#######################################################################
+
+class ClusterIndex:
+    """
+    Compact index of gene cluster membership
+
+    The gene names from the gene intervals file are stored
+    once as a sorted array, and the membership of each
+    cluster is stored in "compressed sparse row" form: the
+    indices (into the gene array) of the genes in cluster
+    'i' are 'indices[indptr[i]:indptr[i+1]]'. The 'sizes'
+    array holds the total number of unique genes in each
+    cluster, including any genes which aren't in the gene
+    intervals file.
+
+    The index can be saved to a directory of '.npy' files
+    and loaded back as read-only memory-mapped arrays, so
+    that multiple processes can share a single copy of the
+    data rather than each having to load the cluster files.
+
+    Example usage:
+
+    >>> index = ClusterIndex.from_files("genes.bed",clusters)
+    >>> index.save("cluster_index")
+    >>> index = ClusterIndex.load("cluster_index")
+    >>> counts = index.count_overlaps(overlapping_genes)
+    """
+    def __init__(self,genes,indptr,indices,sizes):
+        """
+        Arguments:
+          genes (numpy.array): sorted array of unique gene
+            names
+          indptr (numpy.array): offsets into 'indices' for
+            each cluster (length is number of clusters + 1)
+          indices (numpy.array): indices into 'genes' for
+            the genes in each cluster
+          sizes (numpy.array): number of unique genes in
+            each cluster
+        """
+        self.genes = genes
+        self.indptr = indptr
+        self.indices = indices
+        self.sizes = sizes
+
+    def __len__(self):
+        return len(self.sizes)
+
+    @classmethod
+    def from_files(cls,genes_file,clusters):
+        """
+        Build an index from gene intervals and cluster files
+
+        Arguments:
+          genes_file (str): path to BED file with all genes
+            (gene names in the fourth column)
+          clusters (list): cluster files (gene names in the
+            first column)
+
+        Returns:
+          ClusterIndex: the new index.
+        """
+        genes = set()
+        with io.open(genes_file,'rt') as bed:
+            for line in bed:
+                fields = line.rstrip().split('\t')
+                if len(fields) > 3:
+                    genes.add(fields[3])
+        return cls.build(genes,clusters)
+
+    @classmethod
+    def build(cls,genes,clusters):
+        """
+        Build an index from gene names and cluster files
+
+        Arguments:
+          genes (iterable): names of all the genes to index
+          clusters (list): cluster files (gene names in the
+            first column)
+
+        Returns:
+          ClusterIndex: the new index.
+        """
+        # Unique gene names
+        genes = np.array(sorted(set(genes)),dtype=str)
+        # Cluster membership
+        indptr = [0]
+        indices = []
+        sizes = []
+        for cluster_file in clusters:
+            genes_cls = read_cluster_file(cluster_file)
+            sizes.append(len(genes_cls))
+            cls_indices = lookup_genes(genes,genes_cls)
+            indices.append(np.sort(cls_indices))
+            indptr.append(indptr[-1] + len(cls_indices))
+        if indices:
+            indices = np.concatenate(indices).astype(np.int32)
+        else:
+            indices = np.zeros(0,dtype=np.int32)
+        return cls(genes,
+                   np.array(indptr,dtype=np.int64),
+                   indices,
+                   np.array(sizes,dtype=np.int64))
+
+    def save(self,index_dir):
+        """
+        Save the index arrays to '.npy' files
+
+        Arguments:
+          index_dir (str): directory to write the files to
+            (will be created if it doesn't exist)
+
+        Returns:
+          String: path to the index directory.
+        """
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        for name in CLUSTER_INDEX_ARRAYS:
+            np.save(os.path.join(index_dir,"%s.npy" % name),
+                    getattr(self,name))
+        return index_dir
+
+    @classmethod
+    def load(cls,index_dir,mmap=True):
+        """
+        Load an index saved by the 'save' method
+
+        Arguments:
+          index_dir (str): directory with the index files
+          mmap (bool): if True (the default) then the arrays
+            are memory-mapped read-only rather than being
+            read into memory
+
+        Returns:
+          ClusterIndex: the loaded index.
+        """
+        arrays = dict()
+        for name in CLUSTER_INDEX_ARRAYS:
+            npy_file = os.path.join(index_dir,"%s.npy" % name)
+            try:
+                arrays[name] = np.load(npy_file,
+                                       mmap_mode=('r' if mmap else None))
+            except ValueError:
+                # Empty arrays can't be memory-mapped
+                arrays[name] = np.load(npy_file)
+        return cls(**arrays)
+
+    def count_overlaps(self,genes):
+        """
+        Count the genes in each cluster from a set of genes
+
+        Arguments:
+          genes (iterable): gene names
+
+        Returns:
+          numpy.array: number of the genes which are in each
+            cluster.
+        """
+        mask = np.zeros(len(self.genes),dtype=np.int64)
+        mask[lookup_genes(self.genes,genes)] = 1
+        in_cluster = np.concatenate(([0],np.cumsum(mask[self.indices])))
+        return in_cluster[self.indptr[1:]] - in_cluster[self.indptr[:-1]]
+
+    def overlapping_genes(self,genes):
+        """
+        Get the genes in each cluster from a set of genes
+
+        Arguments:
+          genes (iterable): gene names
+
+        Returns:
+          Tuple: '(counts,indices)' where 'counts' is the
+            number of the genes which are in each cluster (as
+            returned by 'count_overlaps'), and 'indices' holds
+            the indices (into the gene array) of those genes,
+            grouped by cluster (i.e. the first 'counts[0]'
+            indices are for the first cluster, and so on).
+        """
+        mask = np.zeros(len(self.genes),dtype=bool)
+        mask[lookup_genes(self.genes,genes)] = True
+        in_mask = mask[self.indices]
+        in_cluster = np.concatenate(([0],np.cumsum(in_mask)))
+        counts = in_cluster[self.indptr[1:]] - in_cluster[self.indptr[:-1]]
+        return (counts,self.indices[in_mask])
+
+#######################################################################
+# Functions
+#######################################################################
+
+def read_cluster_file(cluster_file):
+    """
+    Return the set of unique gene names from a cluster file
+
+    Arguments:
+      cluster_file (str): path to the cluster file (gene names
+        in the first column)
+
+    Returns:
+      Set: the gene names.
+    """
+    return set(np.loadtxt(cluster_file,
+                          delimiter='\t',
+                          ndmin=1,
+                          usecols=[0],
+                          dtype=str))
+
+def lookup_genes(genes,names):
+    """
+    Return the indices of gene names in a sorted gene array
+
+    Names which aren't in the array are ignored.
+
+    Arguments:
+      genes (numpy.array): sorted array of gene names
+      names (iterable): gene names to look up
+
+    Returns:
+      numpy.array: indices of the names in 'genes'.
+    """
+    names = np.array(list(names),dtype=str)
+    if not len(genes) or not len(names):
+        return np.zeros(0,dtype=np.int64)
+    indices = np.searchsorted(genes,names)
+    indices[indices == len(genes)] = 0
+    return indices[genes[indices] == names]
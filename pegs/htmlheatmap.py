@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+#
+#     htmlheatmap.py: interactive HTML heatmap output
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import io
+import json
+import base64
+import numpy as np
+import seaborn as sns
+from html import escape
+from .outputs import CLUSTERS_AXIS_LABEL
+from .outputs import PEAKSETS_AXIS_LABEL
+from . import get_version
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Number of entries in the colour lookup table
+HTML_HEATMAP_LUT_SIZE = 256
+
+# Template for the HTML page (the data are substituted for
+# the '@PEGS_DATA@' placeholder)
+HTML_HEATMAP_TEMPLATE = u"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>@PEGS_TITLE@</title>
+<style>
+body { font-family: sans-serif; font-size: 13px; margin: 1em; }
+#controls { margin-bottom: 1em; }
+#controls label { margin-right: 0.8em; }
+#controls fieldset { display: inline-block; vertical-align: top;
+                     margin-right: 1em; }
+.panel { position: relative; margin-bottom: 1em; }
+.panel h3 { margin: 0.2em 0; }
+canvas { display: block; }
+#tooltip { position: fixed; display: none; pointer-events: none;
+           background: rgba(255,255,255,0.95); border: 1px solid #888;
+           padding: 4px 6px; font-size: 12px; white-space: pre; }
+#footer { color: #888; font-size: 11px; }
+</style>
+</head>
+<body>
+<h2>@PEGS_TITLE@</h2>
+<div id="controls">
+<fieldset id="distances"><legend>Distances</legend></fieldset>
+<fieldset><legend>Peak sets</legend>
+<input id="peaks_filter" type="text" size="30"
+ placeholder="filter (regular expression)">
+</fieldset>
+<fieldset><legend>Cell size</legend>
+<input id="cell_size" type="range" min="4" max="60" value="30">
+</fieldset>
+</div>
+<div class="panel"><canvas id="heatmap"></canvas></div>
+<div class="panel" id="tads_panel"><h3>TADs</h3>
+<canvas id="tads_heatmap"></canvas></div>
+<div class="panel"><canvas id="colorbar"></canvas></div>
+<div id="tooltip"></div>
+<div id="footer">Generated by PEGS @PEGS_VERSION@</div>
+<script type="application/json" id="pegs_data">@PEGS_DATA@</script>
+<script>
+(function() {
+  "use strict";
+  var data = JSON.parse(document.getElementById("pegs_data").textContent);
+  // Decode base64 little-endian float32 arrays
+  function decode(b64) {
+    if (b64 === null) return null;
+    var bin = atob(b64);
+    var view = new DataView(new ArrayBuffer(bin.length));
+    for (var i = 0; i < bin.length; i++) view.setUint8(i,bin.charCodeAt(i));
+    var n = bin.length/4;
+    var values = new Float32Array(n);
+    for (var j = 0; j < n; j++) values[j] = view.getFloat32(4*j,true);
+    return values;
+  }
+  var logp = decode(data.logp);
+  var counts = decode(data.counts);
+  var tads_logp = decode(data.tads_logp);
+  var tads_counts = decode(data.tads_counts);
+  var n_peaks = data.peaks.length;
+  var n_distances = data.distances.length;
+  var n_clusters = data.clusters.length;
+  var font = "12px sans-serif";
+  var tooltip = document.getElementById("tooltip");
+  var heatmap = document.getElementById("heatmap");
+  var tads_heatmap = document.getElementById("tads_heatmap");
+  if (tads_logp === null)
+    document.getElementById("tads_panel").style.display = "none";
+  // Colour lookup
+  function colour(value) {
+    var range = data.vmax - data.vmin;
+    var x = (range > 0) ? (value - data.vmin)/range : 0.0;
+    var i = Math.round(Math.min(Math.max(x,0.0),1.0)*(data.lut.length-1));
+    return data.lut[i];
+  }
+  function luminance(hex) {
+    var rgb = [1,3,5].map(function(i) {
+      var c = parseInt(hex.substr(i,2),16)/255.0;
+      return (c <= 0.03928) ? c/12.92 : Math.pow((c+0.055)/1.055,2.4);
+    });
+    return 0.2126*rgb[0] + 0.7152*rgb[1] + 0.0722*rgb[2];
+  }
+  // Filter controls
+  var show_distance = data.distances.map(function() { return true; });
+  var fieldset = document.getElementById("distances");
+  data.distances.forEach(function(d,j) {
+    var label = document.createElement("label");
+    var box = document.createElement("input");
+    box.type = "checkbox";
+    box.checked = true;
+    box.addEventListener("change",function() {
+      show_distance[j] = box.checked;
+      draw();
+    });
+    label.appendChild(box);
+    label.appendChild(document.createTextNode(" " + d));
+    fieldset.appendChild(label);
+  });
+  var peaks_filter = document.getElementById("peaks_filter");
+  peaks_filter.addEventListener("input",function() { draw(); });
+  var cell_size = document.getElementById("cell_size");
+  cell_size.addEventListener("input",function() { draw(); });
+  function selected_peaks() {
+    var pattern = null;
+    try {
+      pattern = new RegExp(peaks_filter.value,"i");
+    } catch (e) {
+      pattern = null;
+    }
+    var selected = [];
+    for (var i = 0; i < n_peaks; i++) {
+      if (pattern === null || pattern.test(data.peaks[i])) selected.push(i);
+    }
+    return selected;
+  }
+  function text_width(ctx,labels) {
+    ctx.font = font;
+    var width = 0;
+    labels.forEach(function(s) {
+      width = Math.max(width,ctx.measureText(String(s)).width);
+    });
+    return Math.ceil(width);
+  }
+  // Draw a heatmap panel
+  // 'rows' is a list of [label,peak index,distance index or null]
+  function draw_panel(canvas,rows,values,annotations,row_offset,
+                      x_label,y_label) {
+    var size = parseInt(cell_size.value);
+    var ctx = canvas.getContext("2d");
+    var left = text_width(ctx,rows.map(function(r) { return r[0]; })) + 30;
+    var top = 10;
+    var bottom = text_width(ctx,data.clusters) + 40;
+    canvas.width = left + n_clusters*size + 10;
+    canvas.height = top + rows.length*size + bottom;
+    ctx.font = font;
+    ctx.textBaseline = "middle";
+    rows.forEach(function(row,r) {
+      var y = top + r*size;
+      var offset = row_offset(row);
+      for (var k = 0; k < n_clusters; k++) {
+        var x = left + k*size;
+        var fill = colour(values[offset+k]);
+        ctx.fillStyle = fill;
+        ctx.fillRect(x,y,size,size);
+        ctx.strokeStyle = "lightblue";
+        ctx.strokeRect(x+0.5,y+0.5,size-1,size-1);
+        if (size >= 20) {
+          ctx.fillStyle = (luminance(fill) > 0.408) ? "#262626" : "#ffffff";
+          ctx.textAlign = "center";
+          ctx.fillText(String(annotations[offset+k]),x+size/2,y+size/2);
+        }
+      }
+      ctx.fillStyle = "#000000";
+      ctx.textAlign = "right";
+      ctx.fillText(String(row[0]),left-5,y+size/2);
+    });
+    // Cluster names
+    ctx.save();
+    ctx.textAlign = "right";
+    for (var k = 0; k < n_clusters; k++) {
+      ctx.save();
+      ctx.translate(left + k*size + size/2,top + rows.length*size + 5);
+      ctx.rotate(-Math.PI/2);
+      ctx.fillText(data.clusters[k],0,0);
+      ctx.restore();
+    }
+    ctx.restore();
+    ctx.textAlign = "center";
+    ctx.fillText(x_label,left + n_clusters*size/2,canvas.height - 10);
+    if (y_label) {
+      ctx.save();
+      ctx.translate(10,top + rows.length*size/2);
+      ctx.rotate(-Math.PI/2);
+      ctx.fillText(y_label,0,0);
+      ctx.restore();
+    }
+    canvas.pegs = { left: left, top: top, size: size, rows: rows };
+  }
+  function draw() {
+    var peaks = selected_peaks();
+    var rows = [];
+    peaks.forEach(function(i) {
+      for (var j = 0; j < n_distances; j++) {
+        if (show_distance[j])
+          rows.push([data.peaks[i] + "  " + data.distances[j],i,j]);
+      }
+    });
+    draw_panel(heatmap,rows,logp,counts,function(row) {
+      return (row[1]*n_distances + row[2])*n_clusters;
+    },data.clusters_axis_label,data.peaksets_axis_label);
+    if (tads_logp !== null) {
+      draw_panel(tads_heatmap,peaks.map(function(i) {
+        return [data.peaks[i],i,null];
+      }),tads_logp,tads_counts,function(row) {
+        return row[1]*n_clusters;
+      },data.clusters_axis_label,"");
+    }
+  }
+  // Colour bar
+  function draw_colorbar() {
+    var canvas = document.getElementById("colorbar");
+    var ctx = canvas.getContext("2d");
+    canvas.width = 400;
+    canvas.height = 45;
+    for (var i = 0; i < 300; i++) {
+      ctx.fillStyle = data.lut[Math.round(i*(data.lut.length-1)/299)];
+      ctx.fillRect(50+i,5,1,15);
+    }
+    ctx.fillStyle = "#000000";
+    ctx.font = font;
+    ctx.textAlign = "center";
+    ctx.fillText(data.vmin.toPrecision(3),50,35);
+    ctx.fillText(data.vmax.toPrecision(3),350,35);
+    ctx.fillText("-log(Pval)",200,35);
+  }
+  // Tooltips
+  function hover(canvas,values,annotations,row_offset,describe) {
+    canvas.addEventListener("mousemove",function(e) {
+      var p = canvas.pegs;
+      var rect = canvas.getBoundingClientRect();
+      var r = Math.floor((e.clientY - rect.top - p.top)/p.size);
+      var k = Math.floor((e.clientX - rect.left - p.left)/p.size);
+      if (r < 0 || r >= p.rows.length || k < 0 || k >= n_clusters) {
+        tooltip.style.display = "none";
+        return;
+      }
+      var row = p.rows[r];
+      var offset = row_offset(row) + k;
+      tooltip.textContent = describe(row) +
+        "\\nCluster: " + data.clusters[k] +
+        "\\nCount: " + annotations[offset] +
+        "\\nP-value: " + Math.pow(10,-values[offset]).toPrecision(3);
+      tooltip.style.left = (e.clientX + 12) + "px";
+      tooltip.style.top = (e.clientY + 12) + "px";
+      tooltip.style.display = "block";
+    });
+    canvas.addEventListener("mouseleave",function() {
+      tooltip.style.display = "none";
+    });
+  }
+  hover(heatmap,logp,counts,function(row) {
+    return (row[1]*n_distances + row[2])*n_clusters;
+  },function(row) {
+    return "Peak set: " + data.peaks[row[1]] +
+      "\\nDistance: " + data.distances[row[2]];
+  });
+  if (tads_logp !== null) {
+    hover(tads_heatmap,tads_logp,tads_counts,function(row) {
+      return row[1]*n_clusters;
+    },function(row) {
+      return "Peak set: " + data.peaks[row[1]] + "\\nTADs";
+    });
+  }
+  draw_colorbar();
+  draw();
+})();
+</script>
+</body>
+</html>
+"""
+
+#######################################################################
+# Functions
+#######################################################################
+
+def make_html_heatmap(html_file,results,
+                      clusters_axis_label=None,peaksets_axis_label=None,
+                      heatmap_cmap=None,title=None):
+    """
+    Generate an interactive HTML heatmap from enrichment data
+
+    The enrichment data are embedded in a single self-contained
+    HTML file as base64-encoded arrays, and the heatmap is drawn
+    in the browser on an HTML canvas (with tooltips showing the
+    values for each cell, filtering of the distances and peak
+    sets, and a separate panel for the TADs data).
+
+    Arguments:
+      html_file (str): name/path for output HTML file
+      results (EnrichmentResults): the enrichment data (the
+        TADs panel is included if the results include the
+        TADs)
+      clusters_axis_label (str): custom label for the x-axis
+      peaksets_axis_label (str): custom label for the y-axis
+      heatmap_cmap (cmap): optional, colormap to use for the
+        heatmap cells
+      title (str): optional, title for the page
+
+    Returns:
+      String: path to the HTML file.
+    """
+    # Defaults
+    if clusters_axis_label is None:
+        clusters_axis_label = CLUSTERS_AXIS_LABEL
+    if peaksets_axis_label is None:
+        peaksets_axis_label = PEAKSETS_AXIS_LABEL
+    if heatmap_cmap is None:
+        heatmap_cmap = sns.cubehelix_palette(as_cmap=True)
+    if title is None:
+        title = "PEGS enrichments"
+    pvalues,counts,tads_pvalues,tads_counts = results
+    include_tads = results.include_tads
+    # Colour scale
+    logp = -np.log10(pvalues)
+    vmin = float(np.amin(logp))
+    vmax = float(np.amax(logp))
+    if include_tads:
+        tads_logp = -np.log10(tads_pvalues)
+        vmin = min(vmin,float(np.amin(tads_logp)))
+        vmax = max(vmax,float(np.amax(tads_logp)))
+    lut = heatmap_cmap(np.linspace(0.0,1.0,HTML_HEATMAP_LUT_SIZE))
+    lut = ["#%02x%02x%02x" % tuple(int(round(c*255)) for c in rgba[:3])
+           for rgba in lut]
+    # Assemble the data
+    data = dict(peaks=results.peak_set_names,
+                clusters=results.cluster_names,
+                distances=results.distances,
+                clusters_axis_label=clusters_axis_label,
+                peaksets_axis_label=peaksets_axis_label,
+                vmin=vmin,
+                vmax=vmax,
+                lut=lut,
+                logp=encode_array(logp),
+                counts=encode_array(counts),
+                tads_logp=None,
+                tads_counts=None)
+    if include_tads:
+        data['tads_logp'] = encode_array(tads_logp)
+        data['tads_counts'] = encode_array(tads_counts)
+    # Write the HTML
+    data = json.dumps(data,separators=(',',':')).replace('</','<\\/')
+    html = HTML_HEATMAP_TEMPLATE.\
+           replace("@PEGS_TITLE@",escape(title)).\
+           replace("@PEGS_VERSION@",get_version()).\
+           replace("@PEGS_DATA@",data)
+    with io.open(html_file,'wt',encoding='utf-8') as fp:
+        fp.write(html)
+    return html_file
+
+def encode_array(a):
+    """
+    Encode an array as base64 little-endian 32-bit floats
+
+    Arguments:
+      a (numpy.array): array to encode (flattened in row
+        order)
+
+    Returns:
+      String: the base64-encoded data.
+    """
+    a = np.ascontiguousarray(a,dtype='<f4').ravel()
+    return base64.b64encode(a.tobytes()).decode('ascii')
+
+def decode_array(s,shape=None):
+    """
+    Decode an array encoded by 'encode_array'
+
+    Arguments:
+      s (str): the base64-encoded data
+      shape (tuple): optional, shape for the returned array
+
+    Returns:
+      numpy.array: the decoded array.
+    """
+    a = np.frombuffer(base64.b64decode(s),dtype='<f4')
+    if shape is not None:
+        a = a.reshape(shape)
+    return a
@@ -11,8 +11,22 @@
 from builtins import str
 import os
 import io
+import re
+import hashlib
+import tempfile
 import logging
 import numpy as np
+from collections import OrderedDict
+from .utils import sort_files
+from .utils import file_checksum
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Maximum number of lines to buffer for each peak group (or
+# chromosome) before flushing to disk
+PEAK_GROUP_BUFFER_SIZE = 10000
 
 #######################################################################
 # Functions
@@ -20,16 +34,24 @@ import numpy as np
 
 def make_gene_interval_file(refseq_file,
                             gene_interval_file=None,
-                            verbose=False):
+                            verbose=False,
+                            sort_by_position=False):
     """
     Create a gene interval BED file from refSeq data
 
+    By default the genes are written in order of gene name;
+    if 'sort_by_position' is set then they are written in
+    order of chromosome and start position instead (suitable
+    for use with 'bedtools intersect -sorted').
+
     Arguments:
       refseq_file (str): file with refSeq annotation data
       gene_interval_file (str): destination for output gene
         interval data
       verbose (bool): if True then report duplicate gene
         names
+      sort_by_position (bool): if True then sort the genes
+        by position rather than by name
     """
     gene_data = dict()
     duplicates = list()
@@ -65,17 +87,372 @@ def make_gene_interval_file(refseq_file,
         gene_interval_file = os.path.splitext(
             os.path.basename(refseq_file))[0] + "_intervals.bed"
     print("Writing gene intervals to %s..." % gene_interval_file)
+    lines = []
+    for gene_name in sorted(list(gene_data)):
+        # Look up the data for this gene
+        chrom,start,stop,strand = gene_data[gene_name]
+        # For '-' strand, flip start and stop
+        if strand == '-':
+            start = stop
+        # Build the output line
+        lines.append((chrom,
+                      max(int(start),0),
+                      max(int(start)+1,0),
+                      gene_name))
+    if sort_by_position:
+        lines = sorted(lines,key=lambda line: line[:3])
     with io.open(gene_interval_file,'wt') as bed:
-        for gene_name in sorted(list(gene_data)):
-            # Look up the data for this gene
-            chrom,start,stop,strand = gene_data[gene_name]
-            # For '-' strand, flip start and stop
-            if strand == '-':
-                start = stop
-            # Build the output line
-            line = (chrom,
-                    max(int(start),0),
-                    max(int(start)+1,0),
-                    gene_name)
+        for line in lines:
             bed.write("%s\n" % '\t'.join([str(x) for x in line]))
     print("Done")
+
+def split_peaks_by_group(peaks_files,group_column,output_dir):
+    """
+    Split peaks into separate peak sets based on a group column
+
+    Reads each of the input peak files in a single pass, and
+    partitions the intervals into peak sets according to the
+    value in the specified column (for example a sample name).
+
+    The intervals for each group are written to a BED file
+    called '<GROUP>.bed' in the output directory (with any
+    characters which are not safe for file names replaced by
+    underscores), so that the group name is used as the peak
+    set name in downstream outputs.
+
+    Blank lines, comments and 'track'/'browser' lines are
+    ignored.
+
+    Arguments:
+      peaks_files (list): list of BED files with peak data
+        (or a single BED file)
+      group_column (int): number of the column (starting
+        from 1) with the group names
+      output_dir (str): directory to write the peak set
+        files to (must already exist)
+
+    Returns:
+      List: sorted list of paths to the peak set files.
+    """
+    if isinstance(peaks_files,str):
+        peaks_files = [peaks_files]
+    if group_column < 1:
+        raise ValueError("Group column must be 1 or greater (got %s)" %
+                         group_column)
+    # Map group names to output files
+    group_files = dict()
+    buffers = dict()
+    def flush(group):
+        with io.open(group_files[group],'at') as fp:
+            fp.write(u''.join(buffers[group]))
+        buffers[group] = []
+    for peaks_file in peaks_files:
+        print("Splitting peaks from %s using column %d..." %
+              (os.path.basename(peaks_file),group_column))
+        with io.open(peaks_file,'rt') as peaks:
+            for lineno,line in enumerate(peaks,start=1):
+                if not line.strip() or \
+                   line.startswith(('#','track','browser')):
+                    continue
+                fields = line.split()
+                try:
+                    group = fields[group_column-1]
+                except IndexError:
+                    raise ValueError("%s: line %d: group column %d is "
+                                     "out of range (line only has %d "
+                                     "columns)" %
+                                     (os.path.basename(peaks_file),lineno,
+                                      group_column,len(fields)))
+                if group not in group_files:
+                    # Set up a new peak set file
+                    name = re.sub(r'[^A-Za-z0-9_.+-]','_',group)
+                    if not name.strip('.'):
+                        name = "_%s" % name
+                    group_file = os.path.join(output_dir,"%s.bed" % name)
+                    n = 1
+                    while group_file in group_files.values():
+                        n += 1
+                        group_file = os.path.join(output_dir,
+                                                  "%s_%d.bed" % (name,n))
+                    io.open(group_file,'wt').close()
+                    group_files[group] = group_file
+                    buffers[group] = []
+                buffers[group].append(u"%s\n" % '\t'.join(fields))
+                if len(buffers[group]) >= PEAK_GROUP_BUFFER_SIZE:
+                    flush(group)
+    # Write any remaining data
+    for group in group_files:
+        flush(group)
+    print("Found %d peak set groups" % len(group_files))
+    return sort_files(list(group_files.values()))
+
+def split_bed_by_chromosome(bed_file,output_dir,prefix=None):
+    """
+    Split the intervals in a BED file by chromosome
+
+    The intervals for each chromosome are written to a
+    separate BED file called '<PREFIX>.<N>.bed' in the output
+    directory (where 'N' is the index of the chromosome, in
+    order of first appearance, so that the file names are safe
+    regardless of the chromosome names). The order of the
+    intervals on each chromosome is preserved.
+
+    Blank lines, comments and 'track'/'browser' lines are
+    ignored.
+
+    Arguments:
+      bed_file (str): input BED file to split
+      output_dir (str): directory to write the output files
+        to (must already exist)
+      prefix (str): optional, prefix for the output file names
+        (defaults to the name of the BED file without the
+        extension)
+
+    Returns:
+      OrderedDict: paths to the BED files for each
+        chromosome, keyed by chromosome name.
+    """
+    if prefix is None:
+        prefix = os.path.splitext(os.path.basename(bed_file))[0]
+    chrom_files = OrderedDict()
+    buffers = dict()
+    def flush(chrom):
+        with io.open(chrom_files[chrom],'at') as fp:
+            fp.write(u''.join(buffers[chrom]))
+        buffers[chrom] = []
+    with io.open(bed_file,'rt') as bed:
+        for line in bed:
+            if not line.strip() or \
+               line.startswith(('#','track','browser')):
+                continue
+            if not line.endswith('\n'):
+                line = "%s\n" % line
+            chrom = line.split(None,1)[0]
+            if chrom not in chrom_files:
+                chrom_file = os.path.join(output_dir,"%s.%d.bed" %
+                                          (prefix,len(chrom_files)))
+                io.open(chrom_file,'wt').close()
+                chrom_files[chrom] = chrom_file
+                buffers[chrom] = []
+            buffers[chrom].append(line)
+            if len(buffers[chrom]) >= PEAK_GROUP_BUFFER_SIZE:
+                flush(chrom)
+    # Write any remaining data
+    for chrom in chrom_files:
+        flush(chrom)
+    return chrom_files
+
+def merge_bed_file(bed_file,merged_bed_file,chrom_sizes=None):
+    """
+    Sort a BED file and merge overlapping intervals
+
+    Overlapping and book-ended intervals on the same
+    chromosome are merged into a single interval (as with
+    'bedtools merge'), so that the merged intervals cover
+    exactly the same positions as the originals. Only the
+    chromosome, start and end are written.
+
+    The merged intervals are sorted by chromosome and then
+    by start position; if 'chrom_sizes' is supplied then the
+    chromosomes are ordered as they appear there (with any
+    other chromosomes at the end), otherwise they are ordered
+    lexicographically (i.e. the same order as 'sort_bed_file').
+
+    As with 'make_expanded_bed', reading stops at the first
+    blank line; comment and 'track'/'browser' lines are
+    ignored.
+
+    Arguments:
+      bed_file (str): input BED file to merge
+      merged_bed_file (str): output merged BED file
+      chrom_sizes (dict): optional, chromosome sizes from
+        'read_genome_file'
+
+    Returns:
+      Tuple: the number of intervals '(before,after)' merging.
+    """
+    # Read the intervals for each chromosome
+    starts = dict()
+    ends = dict()
+    with io.open(bed_file,'rt') as bed:
+        for line in bed:
+            if line.startswith(('#','track','browser')):
+                continue
+            fields = line.split()
+            if not fields:
+                break
+            chrom = fields[0]
+            if chrom not in starts:
+                starts[chrom] = []
+                ends[chrom] = []
+            starts[chrom].append(int(fields[1]))
+            ends[chrom].append(int(fields[2]))
+    # Order the chromosomes
+    if chrom_sizes is not None:
+        chroms = [chrom for chrom in chrom_sizes if chrom in starts]
+        chroms.extend(sorted([chrom for chrom in starts
+                              if chrom not in chrom_sizes]))
+    else:
+        chroms = sorted(starts.keys())
+    # Merge the intervals on each chromosome
+    n_intervals = 0
+    n_merged = 0
+    with io.open(merged_bed_file,'wt') as merged:
+        for chrom in chroms:
+            start = np.array(starts[chrom],dtype=np.int64)
+            end = np.array(ends[chrom],dtype=np.int64)
+            order = np.lexsort((end,start))
+            start = start[order]
+            end = end[order]
+            # A new interval begins wherever the start is past
+            # the furthest end of all the preceding intervals
+            max_end = np.maximum.accumulate(end)
+            first = np.concatenate(([0],
+                                    np.flatnonzero(start[1:] >
+                                                   max_end[:-1]) + 1))
+            start = start[first]
+            end = np.maximum.reduceat(end,first)
+            lines = np.char.add(np.char.add("%s\t" % chrom,
+                                            start.astype(str)),
+                                np.char.add("\t",end.astype(str)))
+            merged.write(u"%s\n" % '\n'.join(lines))
+            n_intervals += len(order)
+            n_merged += len(first)
+    return (n_intervals,n_merged)
+
+def read_genome_file(genome_file):
+    """
+    Read chromosome sizes from a 'bedtools' genome file
+
+    The genome file should have one line per chromosome,
+    with the chromosome name and the chromosome size (in
+    bp) separated by a tab (e.g. 'chr1<TAB>195471971').
+
+    Arguments:
+      genome_file (str): path to the genome file
+
+    Returns:
+      OrderedDict: chromosome sizes, keyed by chromosome
+        name, in the order they appear in the file.
+    """
+    chrom_sizes = OrderedDict()
+    with io.open(genome_file,'rt') as genome:
+        for lineno,line in enumerate(genome,start=1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            try:
+                chrom_sizes[fields[0]] = int(fields[1])
+            except (IndexError,ValueError):
+                raise ValueError("%s: line %d: expected chromosome name "
+                                 "and size" % (genome_file,lineno))
+    return chrom_sizes
+
+def sort_bed_file(bed_file,sorted_bed_file,chrom_sizes=None):
+    """
+    Sort the intervals in a BED file by position
+
+    The intervals are sorted by chromosome and then by start
+    and end position; if 'chrom_sizes' is supplied then the
+    chromosomes are ordered as they appear there (so that the
+    output matches the order of the associated genome file),
+    otherwise they are ordered lexicographically (i.e. as
+    'sort -k1,1 -k2,2n' would).
+
+    The fields of each interval can be separated by any
+    whitespace, and are written out separated by tabs. Blank
+    lines, comments and 'track'/'browser' lines are dropped.
+
+    All the intervals are held in memory while they are
+    sorted (so the memory needed is similar to that used by
+    'bedtools' for an unsorted intersection of the same file).
+
+    Arguments:
+      bed_file (str): input BED file to sort
+      sorted_bed_file (str): output sorted BED file
+      chrom_sizes (dict): optional, chromosome sizes from
+        'read_genome_file'
+
+    Returns:
+      String: path to the sorted BED file.
+
+    Raises 'ValueError' if a line doesn't have a valid start
+    and end position, or if 'chrom_sizes' is supplied and an
+    interval is on a chromosome that isn't listed.
+    """
+    if chrom_sizes is not None:
+        chrom_order = dict([(chrom,i) for i,chrom in enumerate(chrom_sizes)])
+    intervals = []
+    with io.open(bed_file,'rt') as bed:
+        for lineno,line in enumerate(bed,start=1):
+            if not line.strip() or \
+               line.startswith(('#','track','browser')):
+                continue
+            fields = line.split()
+            try:
+                start,end = int(fields[1]),int(fields[2])
+            except (IndexError,ValueError):
+                raise ValueError("%s: line %d: invalid interval '%s'" %
+                                 (bed_file,lineno,line.rstrip('\n')))
+            chrom = fields[0]
+            if chrom_sizes is not None:
+                try:
+                    chrom = chrom_order[chrom]
+                except KeyError:
+                    raise ValueError("%s: line %d: chromosome '%s' not "
+                                     "found in genome file" %
+                                     (bed_file,lineno,chrom))
+            intervals.append((chrom,start,end,'\t'.join(fields)))
+    intervals.sort(key=lambda interval: interval[:3])
+    with io.open(sorted_bed_file,'wt') as bed:
+        for interval in intervals:
+            bed.write(u"%s\n" % interval[3])
+    return sorted_bed_file
+
+def get_sorted_bed_file(bed_file,cache_dir,genome_file=None,
+                        chrom_sizes=None):
+    """
+    Return a cached position-sorted copy of a BED file
+
+    The sorted copy is stored under 'cache_dir' in a
+    subdirectory named using a checksum of the contents of
+    the BED file (and of the genome file, if supplied, since
+    this sets the order of the chromosomes), and keeps the
+    basename of the original file. If a sorted copy already
+    exists then it is reused rather than being regenerated.
+
+    Arguments:
+      bed_file (str): BED file to sort
+      cache_dir (str): path to the cache directory (will be
+        created if it doesn't exist)
+      genome_file (str): optional, path to a genome file
+        defining the order of chromosomes
+      chrom_sizes (dict): optional, chromosome sizes already
+        read from 'genome_file' (to avoid reading it again)
+
+    Returns:
+      String: path to the sorted BED file in the cache.
+    """
+    key = hashlib.md5(file_checksum(bed_file).encode())
+    if genome_file:
+        key.update(file_checksum(genome_file).encode())
+        if chrom_sizes is None:
+            chrom_sizes = read_genome_file(genome_file)
+    sorted_dir = os.path.join(os.path.abspath(cache_dir),
+                              "sorted",
+                              key.hexdigest())
+    sorted_bed_file = os.path.join(sorted_dir,os.path.basename(bed_file))
+    if os.path.exists(sorted_bed_file):
+        return sorted_bed_file
+    os.makedirs(sorted_dir,exist_ok=True)
+    # Write to a temporary file first, so that an incomplete file
+    # is never left in the cache
+    fd,tmp_bed_file = tempfile.mkstemp(dir=sorted_dir,suffix=".tmp")
+    os.close(fd)
+    try:
+        sort_bed_file(bed_file,tmp_bed_file,chrom_sizes=chrom_sizes)
+        os.replace(tmp_bed_file,sorted_bed_file)
+    finally:
+        if os.path.exists(tmp_bed_file):
+            os.remove(tmp_bed_file)
+    return sorted_bed_file
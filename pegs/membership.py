@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+#
+#     membership.py: export of the genes underlying enrichments
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import io
+import struct
+import zipfile
+import numpy as np
+from os.path import basename
+from os.path import splitext
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Version of the gene membership file format
+GENE_MEMBERSHIP_FORMAT_VERSION = 1
+
+# Names of the arrays holding the sparse membership data
+GENE_MEMBERSHIP_ARRAYS = ("indptr","indices","tads_indptr","tads_indices")
+
+#######################################################################
+# Classes
+#######################################################################
+
+class GeneMembership:
+    """
+    Genes in each cluster which overlap each peak set
+
+    The membership is stored in "compressed sparse row" form
+    over gene IDs (i.e. indices into the 'genes' array): each
+    row is a "cell" of the results, that is a combination of
+    peak set 'i', distance 'j' and cluster 'k', and the IDs of
+    the genes for that cell are
+    'indices[indptr[r]:indptr[r+1]]', where
+    'r = (i*n_distances + j)*n_clusters + k'. The TADs are
+    stored in the same way in 'tads_indptr' and 'tads_indices'
+    (with 'r = i*n_clusters + k').
+
+    The membership is built by adding the genes for each
+    peak set and distance (or TADs) as they are calculated:
+
+    >>> membership = GeneMembership(peaks,clusters,distances)
+    >>> membership.set_genes(cluster_index.genes)
+    >>> counts,gene_ids = cluster_index.overlapping_genes(overlaps)
+    >>> membership.add(("peaks",0,0),counts,gene_ids)
+    >>> membership.save("pegs_genes.npz")
+
+    and can then be loaded and queried:
+
+    >>> membership = GeneMembership.load("pegs_genes.npz")
+    >>> membership.cell_genes(0,0,1)
+    """
+    def __init__(self,peaks,clusters,distances,include_tads=False,
+                 first_peak_set=0,n_peak_sets=None):
+        """
+        Arguments:
+          peaks (list): BED files (or names) for the peak sets
+          clusters (list): cluster files (or names)
+          distances (list): distances the enrichments were
+            calculated at
+          include_tads (bool): if True then the membership also
+            includes the TADs
+          first_peak_set (int): index of the first peak set in
+            the complete analysis (default: 0)
+          n_peak_sets (int): total number of peak sets in the
+            complete analysis (default: number of peaks)
+        """
+        self.peaks = [basename(f) for f in peaks]
+        self.clusters = [basename(f) for f in clusters]
+        self.distances = [int(d) for d in distances]
+        self.include_tads = bool(include_tads)
+        self.first_peak_set = int(first_peak_set)
+        if n_peak_sets is None:
+            n_peak_sets = len(peaks)
+        self.n_peak_sets = int(n_peak_sets)
+        self.genes = None
+        self.indptr = None
+        self.indices = None
+        self.tads_indptr = None
+        self.tads_indices = None
+        self._cells = dict()
+
+    def set_genes(self,genes):
+        """
+        Set the gene names which the gene IDs refer to
+
+        Arguments:
+          genes (numpy.array): array of gene names
+        """
+        self.genes = np.array(genes,dtype=str)
+
+    def add(self,cell,counts,gene_ids):
+        """
+        Add the genes for a peak set and distance (or TADs)
+
+        Arguments:
+          cell (tuple): either '("peaks",i,j)' for peak set
+            'i' and distance 'j', or '("tads",i)' for the TADs
+            for peak set 'i'
+          counts (iterable): number of genes in each cluster
+          gene_ids (iterable): IDs of the genes, grouped by
+            cluster (as returned by
+            'ClusterIndex.overlapping_genes')
+        """
+        counts = np.array(counts,dtype=np.int64)
+        gene_ids = np.array(gene_ids,dtype=np.int32)
+        if len(counts) != len(self.clusters) or \
+           counts.sum() != len(gene_ids):
+            raise ValueError("%s: inconsistent gene counts" % (cell,))
+        self._cells[tuple(cell)] = (counts,gene_ids)
+
+    def build(self):
+        """
+        Assemble the sparse arrays from the added cells
+
+        Raises 'ValueError' if genes are missing for any of
+        the cells.
+        """
+        n_peaks = len(self.peaks)
+        n_distances = len(self.distances)
+        cells = [("peaks",i,j) for i in range(n_peaks)
+                 for j in range(n_distances)]
+        self.indptr,self.indices = self._build_csr(cells)
+        if self.include_tads:
+            cells = [("tads",i) for i in range(n_peaks)]
+            self.tads_indptr,self.tads_indices = self._build_csr(cells)
+
+    def save(self,membership_file):
+        """
+        Save the membership to a NumPy '.npz' file
+
+        The file is written uncompressed, so that the arrays
+        can be memory-mapped when the file is loaded.
+
+        Arguments:
+          membership_file (str): path to output '.npz' file
+
+        Returns:
+          String: path to the output file.
+        """
+        if self.indptr is None:
+            self.build()
+        data = dict(version=GENE_MEMBERSHIP_FORMAT_VERSION,
+                    genes=self.genes,
+                    peaks=np.array(self.peaks,dtype=str),
+                    clusters=np.array(self.clusters,dtype=str),
+                    distances=np.array(self.distances,dtype=np.int64),
+                    first_peak_set=self.first_peak_set,
+                    n_peak_sets=self.n_peak_sets,
+                    indptr=self.indptr,
+                    indices=self.indices)
+        if self.include_tads:
+            data['tads_indptr'] = self.tads_indptr
+            data['tads_indices'] = self.tads_indices
+        with io.open(membership_file,'wb') as fp:
+            np.savez(fp,**data)
+        return membership_file
+
+    @classmethod
+    def load(cls,membership_file,mmap=True):
+        """
+        Load a membership saved by the 'save' method
+
+        Arguments:
+          membership_file (str): path to the '.npz' file
+          mmap (bool): if True (the default) then the sparse
+            arrays are memory-mapped read-only rather than
+            being read into memory
+
+        Returns:
+          GeneMembership: the loaded membership.
+        """
+        with np.load(membership_file,allow_pickle=False) as data:
+            version = int(data['version'])
+            if version > GENE_MEMBERSHIP_FORMAT_VERSION:
+                raise ValueError("%s: unsupported gene membership file "
+                                 "version %s" % (membership_file,version))
+            membership = cls([str(x) for x in data['peaks']],
+                             [str(x) for x in data['clusters']],
+                             [int(x) for x in data['distances']],
+                             include_tads=('tads_indptr' in data),
+                             first_peak_set=int(data['first_peak_set']),
+                             n_peak_sets=int(data['n_peak_sets']))
+            membership.genes = data['genes']
+            arrays = [name for name in GENE_MEMBERSHIP_ARRAYS
+                      if name in data]
+            if not mmap:
+                for name in arrays:
+                    setattr(membership,name,data[name])
+        if mmap:
+            for name in arrays:
+                setattr(membership,name,load_npz_array(membership_file,
+                                                       name))
+        return membership
+
+    def cell_genes(self,i,j,k):
+        """
+        Return the genes for a peak set, distance and cluster
+
+        Arguments:
+          i (int): index of the peak set
+          j (int): index of the distance
+          k (int): index of the cluster
+
+        Returns:
+          List: names of the genes in cluster 'k' which
+            overlap peak set 'i' at distance 'j'.
+        """
+        r = (i*len(self.distances) + j)*len(self.clusters) + k
+        return self._row_genes(self.indptr,self.indices,r)
+
+    def tads_genes(self,i,k):
+        """
+        Return the TADs genes for a peak set and cluster
+
+        Arguments:
+          i (int): index of the peak set
+          k (int): index of the cluster
+
+        Returns:
+          List: names of the genes in cluster 'k' which are
+            in the TADs overlapping peak set 'i'.
+        """
+        if not self.include_tads:
+            raise ValueError("TADs not included in gene membership")
+        r = i*len(self.clusters) + k
+        return self._row_genes(self.tads_indptr,self.tads_indices,r)
+
+    def query(self,peak_sets=None,distances=None,clusters=None,
+              tads=False):
+        """
+        Iterate over the genes for a subset of the cells
+
+        Peak sets and clusters can be specified either by
+        file name, or by name with the file extension
+        removed.
+
+        Arguments:
+          peak_sets (list): optional, only report these peak
+            sets
+          distances (list): optional, only report these
+            distances
+          clusters (list): optional, only report these clusters
+          tads (bool): if True then report the genes for the
+            TADs rather than for the distances
+
+        Returns:
+          Generator: yields '(peak_set,distance,cluster,gene)'
+            tuples (where 'distance' is 'TADs' if 'tads' is
+            True).
+        """
+        peak_indices = select_names(self.peaks,peak_sets)
+        cluster_indices = select_names(self.clusters,clusters)
+        if tads:
+            for i in peak_indices:
+                for k in cluster_indices:
+                    for gene in self.tads_genes(i,k):
+                        yield (self.peaks[i],"TADs",self.clusters[k],gene)
+            return
+        if distances is None:
+            distance_indices = range(len(self.distances))
+        else:
+            distances = [int(d) for d in distances]
+            distance_indices = [j for j,d in enumerate(self.distances)
+                                if d in distances]
+        for i in peak_indices:
+            for j in distance_indices:
+                for k in cluster_indices:
+                    for gene in self.cell_genes(i,j,k):
+                        yield (self.peaks[i],self.distances[j],
+                               self.clusters[k],gene)
+
+    def _build_csr(self,cells):
+        # Internal: assemble CSR arrays from cells
+        lengths = []
+        gene_ids = []
+        for cell in cells:
+            try:
+                counts,ids = self._cells[cell]
+            except KeyError:
+                raise ValueError("No genes for %s" % (cell,))
+            lengths.append(counts)
+            gene_ids.append(ids)
+        if lengths:
+            lengths = np.concatenate(lengths)
+            gene_ids = np.concatenate(gene_ids)
+        else:
+            lengths = np.zeros(0,dtype=np.int64)
+            gene_ids = np.zeros(0,dtype=np.int32)
+        indptr = np.concatenate(([0],np.cumsum(lengths))).astype(np.int64)
+        return (indptr,gene_ids.astype(np.int32))
+
+    def _row_genes(self,indptr,indices,r):
+        # Internal: names of the genes in a row
+        ids = indices[indptr[r]:indptr[r+1]]
+        return [str(x) for x in self.genes[ids]]
+
+#######################################################################
+# Functions
+#######################################################################
+
+def select_names(names,selection=None):
+    """
+    Return the indices of the selected names
+
+    Names can be selected either as-is, or with the file
+    extension removed.
+
+    Arguments:
+      names (list): list of names
+      selection (list): optional, names to select (if None
+        then all the names are selected)
+
+    Returns:
+      List: indices of the selected names.
+    """
+    if selection is None:
+        return list(range(len(names)))
+    selection = set(selection)
+    return [i for i,name in enumerate(names)
+            if name in selection or splitext(name)[0] in selection]
+
+def load_npz_array(npz_file,name):
+    """
+    Memory-map an array stored in an uncompressed '.npz' file
+
+    Falls back to reading the array into memory if the array
+    was stored compressed (or can't otherwise be mapped).
+
+    Arguments:
+      npz_file (str): path to the '.npz' file
+      name (str): name of the array
+
+    Returns:
+      numpy.array: the (read-only) array.
+    """
+    with zipfile.ZipFile(npz_file) as zf:
+        info = zf.getinfo("%s.npy" % name)
+    if info.compress_type == zipfile.ZIP_STORED:
+        with io.open(npz_file,'rb') as fp:
+            # Skip the local file header to get to the data
+            fp.seek(info.header_offset)
+            header = struct.unpack("<4s5H3I2H",fp.read(30))
+            fp.seek(header[-2] + header[-1],1)
+            # Read the '.npy' header
+            version = np.lib.format.read_magic(fp)
+            if version == (1,0):
+                shape,fortran_order,dtype = \
+                    np.lib.format.read_array_header_1_0(fp)
+            else:
+                shape,fortran_order,dtype = \
+                    np.lib.format.read_array_header_2_0(fp)
+            offset = fp.tell()
+        if not dtype.hasobject and shape and all(shape):
+            return np.memmap(npz_file,dtype=dtype,mode='r',shape=shape,
+                             order=('F' if fortran_order else 'C'),
+                             offset=offset)
+    with np.load(npz_file,allow_pickle=False) as data:
+        return data[name]
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+#
+#     metrics.py: live progress and throughput metrics for PEGS
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+from collections import OrderedDict
+from . import get_version
+from .profiling import format_bytes
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Default interval (in seconds) between updates of the metrics file
+METRICS_INTERVAL = 15.0
+
+# Minimum interval (in seconds) between updates of the progress line
+PROGRESS_INTERVAL = 0.5
+
+#######################################################################
+# Functions
+#######################################################################
+
+def format_duration(seconds):
+    """
+    Return a number of seconds formatted as 'H:MM:SS'
+
+    Returns '--:--:--' if the duration is not known.
+    """
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(round(seconds))
+    return "%d:%02d:%02d" % (seconds//3600,(seconds%3600)//60,seconds%60)
+
+#######################################################################
+# Classes
+#######################################################################
+
+class Metrics:
+    """
+    Track the progress and throughput of a PEGS run
+
+    Usage:
+
+    >>> metrics = Metrics(name="pegs",metrics_file="pegs.prom")
+    >>> metrics.set_stage("intersections")
+    >>> metrics.set_total_cells(56)
+    >>> metrics.add_cells(1,bedtools_time=0.4,bytes_read=1024)
+    >>> metrics.finish()
+
+    The metrics recorded are the number of cells (that is,
+    peak set and distance combinations, plus TADs) completed,
+    the rate at which they are completed, the total time
+    spent running 'bedtools', the number of bytes of
+    intersection output read, the number of outputs written
+    and the current stage of the analysis.
+
+    If 'progress' is set then a progress line with the
+    estimated time remaining is written to 'stream' (by
+    default, the progress line is shown if standard error
+    is a terminal).
+
+    If 'metrics_file' is set then the metrics are also
+    written to that file at most every 'interval' seconds
+    (and at the end of the run). The file is written in the
+    Prometheus text format if it has a '.prom' extension (so
+    that it can be collected by the 'node_exporter' textfile
+    collector), otherwise as JSON. The file is always replaced
+    atomically, so readers never see a partial update.
+
+    Updates are only made when 'update' is called (which
+    happens whenever the metrics change); callers with long
+    waits between changes should also call 'update'
+    periodically.
+    """
+    def __init__(self,name="pegs",metrics_file=None,
+                 interval=METRICS_INTERVAL,progress=None,stream=None):
+        """
+        Arguments:
+          name (str): name of the run (used to label the
+            metrics)
+          metrics_file (str): optional, path to a file to
+            write the metrics to
+          interval (float): minimum interval in seconds between
+            updates of the metrics file
+          progress (bool): if True then show a progress line;
+            if False then don't; if None (the default) then
+            only show it if 'stream' is a terminal
+          stream (file): stream to write the progress line to
+            (default: standard error)
+        """
+        if stream is None:
+            stream = sys.stderr
+        if progress is None:
+            try:
+                progress = stream.isatty()
+            except Exception:
+                progress = False
+        self.name = name
+        self.metrics_file = metrics_file
+        self.interval = float(interval)
+        self.progress = bool(progress)
+        self.stream = stream
+        self.stage = None
+        self.total_cells = 0
+        self.cells_completed = 0
+        self.cells_skipped = 0
+        self.bedtools_time = 0.0
+        self.bytes_read = 0
+        self.total_outputs = 0
+        self.outputs_completed = 0
+        self._start = time.time()
+        self._cells_start = None
+        self._last_write = None
+        self._last_progress = None
+        self._progress_width = 0
+
+    @property
+    def enabled(self):
+        """
+        True if the metrics are being reported
+        """
+        return self.progress or bool(self.metrics_file)
+
+    @property
+    def elapsed(self):
+        """
+        Wall time (in seconds) since the metrics were created
+        """
+        return time.time() - self._start
+
+    @property
+    def cells_per_second(self):
+        """
+        Rate at which cells are being completed (or None)
+        """
+        if self._cells_start is None or not self.cells_completed:
+            return None
+        elapsed = time.time() - self._cells_start
+        if elapsed <= 0.0:
+            return None
+        return self.cells_completed/elapsed
+
+    @property
+    def eta(self):
+        """
+        Estimated time (in seconds) to complete the cells (or None)
+        """
+        remaining = self.total_cells - self.cells_skipped - \
+                    self.cells_completed
+        if remaining <= 0:
+            return 0.0
+        rate = self.cells_per_second
+        if not rate:
+            return None
+        return remaining/rate
+
+    def set_stage(self,stage):
+        """
+        Set the current stage of the run
+
+        Arguments:
+          stage (str): name of the stage
+        """
+        self.stage = stage
+        self.update(force=True)
+
+    def set_total_cells(self,n,skipped=0):
+        """
+        Set the total number of cells in the run
+
+        Arguments:
+          n (int): total number of cells
+          skipped (int): number of cells which don't need to
+            be calculated (for example because they were
+            completed by a previous run)
+        """
+        self.total_cells = int(n)
+        self.cells_skipped = int(skipped)
+        self._cells_start = time.time()
+        self.update()
+
+    def add_cells(self,n=1,bedtools_time=0.0,bytes_read=0):
+        """
+        Record completed cells
+
+        Arguments:
+          n (int): number of cells completed
+          bedtools_time (float): time (in seconds) spent
+            running 'bedtools' for the cells
+          bytes_read (int): bytes of intersection data read
+            for the cells
+        """
+        if self._cells_start is None:
+            self._cells_start = time.time()
+        self.cells_completed += n
+        self.add_bedtools_time(bedtools_time)
+        self.bytes_read += bytes_read
+        self.update()
+
+    def add_bedtools_time(self,seconds):
+        """
+        Record time spent running 'bedtools'
+
+        Arguments:
+          seconds (float): time spent (in seconds)
+        """
+        self.bedtools_time += seconds
+
+    def set_total_outputs(self,n):
+        """
+        Set the total number of outputs to write
+
+        Arguments:
+          n (int): total number of outputs
+        """
+        self.total_outputs = int(n)
+        self.outputs_completed = 0
+        self.update()
+
+    def add_outputs(self,n=1):
+        """
+        Record outputs which have been written
+
+        Arguments:
+          n (int): number of outputs written
+        """
+        self.outputs_completed += n
+        self.update()
+
+    def update(self,force=False):
+        """
+        Refresh the progress line and metrics file
+
+        The progress line and metrics file are only updated
+        if enough time has passed since they were last updated
+        (unless 'force' is True).
+
+        Arguments:
+          force (bool): if True then always update
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        if self.progress:
+            if force or self._last_progress is None or \
+               now - self._last_progress >= PROGRESS_INTERVAL:
+                self._write_progress()
+                self._last_progress = now
+        if self.metrics_file:
+            if force or self._last_write is None or \
+               now - self._last_write >= self.interval:
+                self.write(self.metrics_file)
+                self._last_write = now
+
+    def finish(self):
+        """
+        Write the final metrics and clear the progress line
+        """
+        if self.metrics_file:
+            self.write(self.metrics_file)
+        if self.progress and self._progress_width:
+            self.stream.write("\r%s\r" % (" "*self._progress_width))
+            self.stream.flush()
+            self._progress_width = 0
+
+    def progress_line(self):
+        """
+        Return the current progress as a single line of text
+        """
+        items = []
+        if self.stage:
+            items.append("[%s]" % self.stage)
+        if self.stage == "outputs":
+            items.append("%d/%d outputs" % (self.outputs_completed,
+                                            self.total_outputs))
+        else:
+            n_cells = self.total_cells - self.cells_skipped
+            rate = self.cells_per_second
+            items.append("%d/%d cells" % (self.cells_completed,n_cells))
+            if n_cells > 0:
+                items.append("(%.1f%%)" % (100.0*self.cells_completed/
+                                           n_cells))
+            items.append("%s cells/s" % ("%.2f" % rate if rate else "-"))
+            items.append("ETA %s" % format_duration(self.eta))
+            if self.bytes_read:
+                items.append("read %s" % format_bytes(self.bytes_read))
+        items.append("elapsed %s" % format_duration(self.elapsed))
+        return ' '.join(items)
+
+    def as_dict(self):
+        """
+        Return the metrics as a dictionary
+        """
+        return OrderedDict((
+            ('pegs_version',get_version()),
+            ('name',self.name),
+            ('stage',self.stage),
+            ('elapsed',self.elapsed),
+            ('total_cells',self.total_cells),
+            ('cells_skipped',self.cells_skipped),
+            ('cells_completed',self.cells_completed),
+            ('cells_per_second',self.cells_per_second),
+            ('eta',self.eta),
+            ('bedtools_time',self.bedtools_time),
+            ('bytes_read',self.bytes_read),
+            ('total_outputs',self.total_outputs),
+            ('outputs_completed',self.outputs_completed),
+            ('timestamp',time.time()),
+        ))
+
+    def as_prometheus(self):
+        """
+        Return the metrics in the Prometheus text format
+        """
+        labels = 'name="%s"' % self.name.replace('\\','\\\\').\
+                 replace('"','\\"')
+        metrics = (
+            ("pegs_elapsed_seconds","gauge",
+             "Time since the run started",self.elapsed),
+            ("pegs_cells","gauge",
+             "Total number of cells in the run",self.total_cells),
+            ("pegs_cells_skipped","gauge",
+             "Cells taken from a checkpoint",self.cells_skipped),
+            ("pegs_cells_completed_total","counter",
+             "Cells calculated so far",self.cells_completed),
+            ("pegs_cells_per_second","gauge",
+             "Rate at which cells are being calculated",
+             self.cells_per_second),
+            ("pegs_eta_seconds","gauge",
+             "Estimated time to complete the cells",self.eta),
+            ("pegs_bedtools_seconds_total","counter",
+             "Time spent running bedtools",self.bedtools_time),
+            ("pegs_bytes_read_total","counter",
+             "Bytes of intersection data read",self.bytes_read),
+            ("pegs_outputs","gauge",
+             "Total number of outputs to write",self.total_outputs),
+            ("pegs_outputs_completed_total","counter",
+             "Outputs written so far",self.outputs_completed),
+            ("pegs_last_update_timestamp_seconds","gauge",
+             "Time that the metrics were last updated",time.time()),
+        )
+        lines = []
+        for metric,metric_type,description,value in metrics:
+            if value is None:
+                continue
+            lines.append("# HELP %s %s" % (metric,description))
+            lines.append("# TYPE %s %s" % (metric,metric_type))
+            lines.append("%s{%s} %s" % (metric,labels,repr(float(value))))
+        if self.stage:
+            lines.append("# HELP pegs_stage Current stage of the run")
+            lines.append("# TYPE pegs_stage gauge")
+            lines.append('pegs_stage{%s,stage="%s"} 1' % (labels,
+                                                           self.stage))
+        return '\n'.join(lines) + '\n'
+
+    def write(self,metrics_file):
+        """
+        Write the metrics to a file
+
+        The metrics are written in the Prometheus text format
+        if the file has a '.prom' extension, otherwise as JSON.
+        The file is replaced atomically.
+
+        Arguments:
+          metrics_file (str): path to the output file
+
+        Returns:
+          String: path to the output file.
+        """
+        if metrics_file.endswith(".prom"):
+            content = self.as_prometheus()
+        else:
+            content = json.dumps(self.as_dict(),indent=2)
+        metrics_dir = os.path.dirname(os.path.abspath(metrics_file))
+        fd,tmp_file = tempfile.mkstemp(dir=metrics_dir,
+                                       prefix=".%s." %
+                                       os.path.basename(metrics_file))
+        try:
+            with io.open(fd,'wt') as fp:
+                fp.write(u"%s" % content)
+            os.chmod(tmp_file,0o644)
+            os.replace(tmp_file,metrics_file)
+        except Exception:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        return metrics_file
+
+    def _write_progress(self):
+        # Internal: overwrite the progress line
+        line = self.progress_line()
+        padding = max(0,self._progress_width - len(line))
+        self.stream.write("\r%s%s\r" % (line," "*padding))
+        self.stream.flush()
+        self._progress_width = len(line)
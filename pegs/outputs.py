@@ -36,15 +36,87 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import seaborn as sns
+from seaborn.utils import relative_luminance
 import xlsxwriter
 
 from os.path import basename
 from os.path import splitext
+from .results import EnrichmentResults
 
 #######################################################################
 # Functions
 #######################################################################
 
+def get_heatmap_outputs(name,heatmap=None,heatmap_format=None,
+                        variants=None,output_directory=None):
+    """
+    Get the output file names, colormaps and formats for heatmaps
+
+    Each of the heatmap files (either the default
+    'NAME_heatmap.FORMAT', or the files explicitly specified
+    by 'heatmap') is generated in each of the formats: if
+    more than one format is specified then the file extension
+    is replaced by the format, otherwise (as for a single
+    heatmap) the file name is used as-is.
+
+    If there is more than one colormap variant then the
+    variant name is also inserted before the extension (e.g.
+    'NAME_heatmap.VARIANT.FORMAT').
+
+    Arguments:
+      name (str): basename to use for default output files
+      heatmap (list): optional, one or more names/paths for
+        output heatmaps
+      heatmap_format (list): optional, one or more image
+        formats for the output heatmaps
+      variants (list): optional, list of '(variant,cmap)'
+        tuples for each colormap variant (where 'cmap' can be
+        None to use the default colormap)
+      output_directory (str): optional, directory to put
+        output files into (defaults to the current directory)
+
+    Returns:
+      List: list of '(heatmap_file,heatmap_cmap,heatmap_format)'
+        tuples.
+    """
+    # Output directory
+    if output_directory is None:
+        output_directory = os.getcwd()
+    # Normalise the arguments
+    if isinstance(heatmap,str):
+        heatmap = [heatmap]
+    if isinstance(heatmap_format,str):
+        heatmap_format = [heatmap_format]
+    heatmap_format = [fmt for fmt in (heatmap_format or []) if fmt]
+    if not variants:
+        variants = [(None,None)]
+    # Base names for output heatmaps
+    if heatmap:
+        heatmap_files = []
+        for f in heatmap:
+            if len(heatmap_format) > 1:
+                for fmt in heatmap_format:
+                    heatmap_files.append(("%s.%s" % (splitext(f)[0],fmt),
+                                          fmt))
+            else:
+                heatmap_files.append((f,(heatmap_format[0]
+                                         if heatmap_format else None)))
+    else:
+        heatmap_files = [("%s_heatmap.%s" % (name,fmt),fmt)
+                         for fmt in (heatmap_format or ["png"])]
+    # Add the variants
+    outputs = []
+    for f,fmt in heatmap_files:
+        f = os.path.join(output_directory,f)
+        for variant,cmap in variants:
+            if len(variants) > 1:
+                root,ext = splitext(f)
+                heatmap_file = "%s.%s%s" % (root,variant,ext)
+            else:
+                heatmap_file = f
+            outputs.append((heatmap_file,cmap,fmt))
+    return outputs
+
 def make_heatmap(heatmap_file,peaks,clusters,distances,pvalues,counts,
                  tads_pvalues=None,tads_counts=None,
                  clusters_axis_label=None,
@@ -72,6 +144,43 @@ def make_heatmap(heatmap_file,peaks,clusters,distances,pvalues,counts,
         the heatmaps
       heatmap_format (str): optional, image format for output heatmaps
     """
+    make_heatmaps([(heatmap_file,heatmap_cmap,heatmap_format)],
+                  EnrichmentResults.from_arrays(peaks,clusters,distances,
+                                                pvalues,counts,
+                                                tads_pvalues=tads_pvalues,
+                                                tads_counts=tads_counts),
+                  clusters_axis_label=clusters_axis_label,
+                  peaksets_axis_label=peaksets_axis_label)
+
+def make_heatmaps(heatmaps,results,
+                  clusters_axis_label=None,
+                  peaksets_axis_label=None,
+                  vmin=None,vmax=None):
+    """
+    Generate multiple heatmaps from enrichment data
+
+    The figure is only built once, and then the colormap is
+    changed and the figure is saved for each of the outputs
+    in turn.
+
+    Arguments:
+      heatmaps (list): list of '(heatmap_file,heatmap_cmap,
+        heatmap_format)' tuples specifying each output heatmap
+        (where 'heatmap_cmap' and 'heatmap_format' can be None
+        to use the default colormap, and the format implied by
+        the file name)
+      results (EnrichmentResults): the enrichment data (the
+        TADs heatmap is included if the results include the
+        TADs)
+      clusters_axis_label (str): custom label for the x-axis
+      peaksets_axis_label (str): custom label for the y-axis
+      vmin (float): optional, -log10(p-value) corresponding to
+        the lower end of the colour scale (defaults to the
+        minimum from the supplied data)
+      vmax (float): optional, -log10(p-value) corresponding to
+        the upper end of the colour scale (defaults to the
+        maximum from the supplied data)
+    """
     # Defaults for axis labels
     if clusters_axis_label is None:
        clusters_axis_label = CLUSTERS_AXIS_LABEL
@@ -79,31 +188,35 @@ def make_heatmap(heatmap_file,peaks,clusters,distances,pvalues,counts,
        peaksets_axis_label = PEAKSETS_AXIS_LABEL
 
     # Convenience variables
-    n_peaks = len(peaks)
-    n_clusters = len(clusters)
+    peak_set_names = results.peak_set_names
+    cluster_names = results.cluster_names
+    distances = results.distances
+    pvalues,counts,tads_pvalues,tads_counts = results
+    n_peaks = len(peak_set_names)
+    n_clusters = len(cluster_names)
     n_distances = len(distances)
-    include_tads = (tads_pvalues is not None) and \
-                   (tads_counts is not None)
+    include_tads = results.include_tads
 
     # Make '2d' versions of enrichment data for plotting heatmap
     pvalues_2d = np.zeros([n_peaks*n_distances,n_clusters])
     counts_2d = np.zeros([n_peaks*n_distances,n_clusters])
-    for i,peaks_file in enumerate(peaks):
-        for j,distance in enumerate(distances):
+    for i in range(n_peaks):
+        for j in range(n_distances):
             x = i*n_distances + j
             pvalues_2d[x,:] = pvalues[i,j,:]
             counts_2d[x,:] = counts[i,j,:]
 
     # Min/max pvalues for colorbar
-    min_pvalue = np.amin(-np.log10(pvalues_2d))
-    max_pvalue = np.amax(-np.log10(pvalues_2d))
-    if include_tads:
-        min_pvalue = min(min_pvalue,np.amin(-np.log10(tads_pvalues)))
-        max_pvalue = max(max_pvalue,np.amax(-np.log10(tads_pvalues)))
+    min_pvalue,max_pvalue = get_pvalue_range(pvalues,
+                                             (tads_pvalues if include_tads
+                                              else None))
+    if vmin is not None:
+        min_pvalue = vmin
+    if vmax is not None:
+        max_pvalue = vmax
 
     # Xlabel (cluster names)
-    xlbls = [os.path.splitext(os.path.basename(x))[0]
-             for x in clusters]
+    xlbls = cluster_names
 
     # Ylabel (interval distances repeated for each peak set)
     ylbls = [d for d in distances] * n_peaks
@@ -142,9 +255,11 @@ def make_heatmap(heatmap_file,peaks,clusters,distances,pvalues,counts,
     # Set to the size of A4 paper
     fig.set_size_inches(20.7, 20.27)
 
-    # Set up default colormap if none was supplied
+    # Default colormap
+    default_cmap = sns.cubehelix_palette(as_cmap=True)
+    heatmap_cmap = heatmaps[0][1]
     if heatmap_cmap is None:
-        heatmap_cmap = sns.cubehelix_palette(as_cmap=True)
+        heatmap_cmap = default_cmap
 
     # Plot the heatmap
     sns.heatmap(data=-np.log10(pvalues_2d),
@@ -169,14 +284,15 @@ def make_heatmap(heatmap_file,peaks,clusters,distances,pvalues,counts,
                     "label":"-log(Pval)",
                 },
                 cmap=heatmap_cmap)
+    # Keep the mesh and annotations so they can be recoloured
+    heatmap_meshes = [(ax.collections[0],list(ax.texts))]
 
     # Annotate the sets of distances in the heatmap
     # NB the coordinates are in the 'data' coordinate system
     # see https://matplotlib.org/tutorials/advanced/transforms_tutorial.html
     midpoint = n_distances/2.0
     xpos = n_clusters/10.0
-    for i,peak_file in enumerate(peaks):
-        name = splitext(basename(peak_file))[0]
+    for i,name in enumerate(peak_set_names):
         ypos = i*n_distances
         ax.text(-xpos,ypos+midpoint,
                 name,
@@ -223,8 +339,7 @@ def make_heatmap(heatmap_file,peaks,clusters,distances,pvalues,counts,
                     linewidths=0.3,
                     linecolor='lightblue',
                     xticklabels=xlbls,
-                    yticklabels=[splitext(basename(f))[0]
-                                 for f in peaks],
+                    yticklabels=peak_set_names,
                     annot=tads_counts,
                     annot_kws={
                         "size": ANNOTATION_FONT_SIZE,
@@ -241,6 +356,7 @@ def make_heatmap(heatmap_file,peaks,clusters,distances,pvalues,counts,
                         "label":"-log(Pval)",
                     },
                     cmap=heatmap_cmap)
+        heatmap_meshes.append((tads_ax.collections[0],list(tads_ax.texts)))
         tads_ax.get_yaxis().set_label_coords(-0.9,0.5)
 
         # Set the fontsize for the tick labels
@@ -260,8 +376,162 @@ def make_heatmap(heatmap_file,peaks,clusters,distances,pvalues,counts,
         ax = tads_ax
     ax.set_xlabel(clusters_axis_label,fontsize=AXIS_LABEL_FONT_SIZE)
 
-    # Save to file
-    fig.savefig(heatmap_file,format=heatmap_format)
+    # Save each output to file
+    for heatmap_file,cmap,heatmap_format in heatmaps:
+        if cmap is None:
+            cmap = default_cmap
+        if cmap is not heatmap_cmap:
+            for mesh,texts in heatmap_meshes:
+                recolour_heatmap(mesh,texts,cmap)
+            heatmap_cmap = cmap
+        fig.savefig(heatmap_file,format=heatmap_format)
+    plt.close(fig)
+
+def get_paginated_heatmaps(heatmaps,results,
+                           clusters_axis_label=None,
+                           peaksets_axis_label=None,
+                           peak_sets_per_page=None,
+                           clusters_per_page=None):
+    """
+    Set up the arguments for each page of a paginated heatmap
+
+    The peak sets and/or clusters are split into fixed-size
+    pages, and a separate heatmap file is written for each
+    page (for example 'NAME_heatmap.page01.png'; if the
+    clusters are also split then the page name includes the
+    row and column of the page, e.g. 'NAME_heatmap.r01c02.png').
+
+    All the pages share the same colour scale, so that the
+    colours can be compared between pages. Each page is
+    rendered by a separate call to 'make_heatmaps', so the
+    pages can be rendered in parallel.
+
+    Arguments:
+      heatmaps (list): list of '(heatmap_file,heatmap_cmap,
+        heatmap_format)' tuples specifying each output heatmap
+        (see 'make_heatmaps')
+      results (EnrichmentResults): the enrichment data
+      clusters_axis_label (str): custom label for the x-axis
+      peaksets_axis_label (str): custom label for the y-axis
+      peak_sets_per_page (int): maximum number of peak sets on
+        each page (default: all peak sets on one page)
+      clusters_per_page (int): maximum number of clusters on
+        each page (default: all clusters on one page)
+
+    Returns:
+      List: list of '(args,kws)' tuples, where 'args' and
+        'kws' are the positional and keyword arguments to
+        pass to 'make_heatmaps' to render each page (the
+        first positional argument is the list of heatmap
+        files for the page, and the second is the subset of
+        the results on the page).
+    """
+    # Shared colour scale
+    vmin,vmax = get_pvalue_range(results.pvalues,results.tads_pvalues)
+    # Set up the arguments for each page
+    pages = []
+    for page,peaks_slice,clusters_slice in \
+        get_heatmap_pages(len(results.peaks),len(results.clusters),
+                          peak_sets_per_page=peak_sets_per_page,
+                          clusters_per_page=clusters_per_page):
+        page_heatmaps = []
+        for heatmap_file,cmap,heatmap_format in heatmaps:
+            root,ext = splitext(heatmap_file)
+            page_heatmaps.append(("%s.%s%s" % (root,page,ext),
+                                  cmap,
+                                  heatmap_format))
+        kws = dict(clusters_axis_label=clusters_axis_label,
+                   peaksets_axis_label=peaksets_axis_label,
+                   vmin=vmin,
+                   vmax=vmax)
+        pages.append(((page_heatmaps,
+                       results.select(peak_sets=peaks_slice,
+                                      clusters=clusters_slice)),
+                      kws))
+    return pages
+
+def get_heatmap_pages(n_peaks,n_clusters,peak_sets_per_page=None,
+                      clusters_per_page=None):
+    """
+    Split a heatmap into pages
+
+    Arguments:
+      n_peaks (int): total number of peak sets
+      n_clusters (int): total number of clusters
+      peak_sets_per_page (int): maximum number of peak sets on
+        each page (default: all peak sets on one page)
+      clusters_per_page (int): maximum number of clusters on
+        each page (default: all clusters on one page)
+
+    Returns:
+      List: list of '(page,peaks_slice,clusters_slice)'
+        tuples, where 'page' is the name of the page (e.g.
+        'page01', or 'r01c02' if the clusters are also
+        split) and the slices select the peak sets and
+        clusters on that page.
+    """
+    if not peak_sets_per_page:
+        peak_sets_per_page = max(n_peaks,1)
+    if not clusters_per_page:
+        clusters_per_page = max(n_clusters,1)
+    rows = [slice(i,i+peak_sets_per_page)
+            for i in range(0,n_peaks,peak_sets_per_page)]
+    cols = [slice(j,j+clusters_per_page)
+            for j in range(0,n_clusters,clusters_per_page)]
+    width = max(2,len(str(max(len(rows),len(cols)))))
+    pages = []
+    for i,peaks_slice in enumerate(rows,start=1):
+        for j,clusters_slice in enumerate(cols,start=1):
+            if len(cols) > 1:
+                page = "r%0*dc%0*d" % (width,i,width,j)
+            else:
+                page = "page%0*d" % (width,i)
+            pages.append((page,peaks_slice,clusters_slice))
+    return pages
+
+def get_pvalue_range(pvalues,tads_pvalues=None):
+    """
+    Return the range of -log10(p-values) for the colour scale
+
+    Arguments:
+      pvalues (numpy.array): Numpy array with pvalues from
+        enrichment calculation
+      tads_pvalues (numpy.array): Numpy array with TADs pvalues
+        (None if TADs not included)
+
+    Returns:
+      Tuple: (min,max) -log10(p-values).
+    """
+    min_pvalue = np.amin(-np.log10(pvalues))
+    max_pvalue = np.amax(-np.log10(pvalues))
+    if tads_pvalues is not None:
+        min_pvalue = min(min_pvalue,np.amin(-np.log10(tads_pvalues)))
+        max_pvalue = max(max_pvalue,np.amax(-np.log10(tads_pvalues)))
+    return (min_pvalue,max_pvalue)
+
+def recolour_heatmap(mesh,annotations,cmap):
+    """
+    Change the colormap for a heatmap plotted by seaborn
+
+    Updates the colormap for the heatmap cells (and so the
+    associated colorbar), and resets the colours of the
+    annotations so they contrast with their cells (using the
+    same rule as 'seaborn.heatmap').
+
+    Arguments:
+      mesh (QuadMesh): mesh for the heatmap cells
+      annotations (list): annotation Text instances for each
+        (unmasked) cell, in row order
+      cmap (cmap): new colormap
+    """
+    mesh.set_cmap(cmap)
+    mesh.update_scalarmappable()
+    colours = [colour for m,colour in zip(mesh.get_array().flat,
+                                           mesh.get_facecolors())
+               if m is not np.ma.masked]
+    for text,colour in zip(annotations,colours):
+        lum = relative_luminance(colour)
+        text.set_color(".15" if lum > .408 else "w")
 
 def make_xlsx_file(xlsx_file,peaks,clusters,distances,pvalues,counts,
                    tads_pvalues=None,tads_counts=None):
@@ -282,14 +552,30 @@ def make_xlsx_file(xlsx_file,peaks,clusters,distances,pvalues,counts,
       tads_counts (numpy.array): Numpy array with TADs counts from
         enrichment calculation (None if TADs not included)
     """
+    write_xlsx_file(xlsx_file,
+                    EnrichmentResults.from_arrays(peaks,clusters,distances,
+                                                  pvalues,counts,
+                                                  tads_pvalues=tads_pvalues,
+                                                  tads_counts=tads_counts))
+
+def write_xlsx_file(xlsx_file,results):
+    """
+    Write an XLSX file from enrichment results
+
+    Arguments:
+      xlsx_file (str): name/path for output XLSX file
+      results (EnrichmentResults): the enrichment data (the
+        TADs data are included if the results include the
+        TADs)
+    """
     # Convenience variables
-    n_peaks = len(peaks)
-    n_clusters = len(clusters)
+    peaks = [basename(f) for f in results.peaks]
+    cluster_names = results.cluster_names
+    distances = results.distances
+    pvalues,counts,tads_pvalues,tads_counts = results
+    n_clusters = len(cluster_names)
     n_distances = len(distances)
-    include_tads = (tads_pvalues is not None) and \
-                   (tads_counts is not None)
-    cluster_names = [os.path.splitext(os.path.basename(x))[0]
-                     for x in clusters]
+    include_tads = results.include_tads
 
     # Output workbook
     xlsx_out = xlsxwriter.Workbook(xlsx_file,
@@ -304,29 +590,29 @@ def make_xlsx_file(xlsx_file,peaks,clusters,distances,pvalues,counts,
 
     # Get widths of peak set names
     width = 0
-    for peaks_file in peaks:
-        width = max(width,len(basename(peaks_file)))
+    for peak_set in peaks:
+        width = max(width,len(peak_set))
 
     # Make header rows
     for ws in (ws_common_genes,ws_p_values):
         ws.write(1,0,"Peak set")
         ws.write(1,1,"Interval")
-        for k,cluster in enumerate(clusters):
-            ws.write(1,k+2,cluster_names[k])
+        for k,cluster in enumerate(cluster_names):
+            ws.write(1,k+2,cluster)
         ws.merge_range(0,2,0,n_clusters+1,
                        "Clusters",
                        fmt_center)
 
     # Write the data
-    for i,peaks_file in enumerate(peaks):
+    for i,peak_set in enumerate(peaks):
         for j,distance in enumerate(distances):
             row = i*n_distances + j + 2
-            ws_common_genes.write(row,0,basename(peaks_file))
+            ws_common_genes.write(row,0,peak_set)
             ws_common_genes.write(row,1,distance)
-            ws_p_values.write(row,0,basename(peaks_file))
+            ws_p_values.write(row,0,peak_set)
             ws_p_values.write(row,1,distance)
-            for k,cluster in enumerate(clusters):
-                ws_common_genes.write(row,k+2,counts[i,j,k])
+            for k in range(n_clusters):
+                ws_common_genes.write(row,k+2,int(counts[i,j,k]))
                 ws_p_values.write(row,k+2,pvalues[i,j,k])
 
     # Set the column width for peak sets
@@ -340,18 +626,18 @@ def make_xlsx_file(xlsx_file,peaks,clusters,distances,pvalues,counts,
         # Make header rows
         for ws in (ws_tads_common_genes,ws_tads_p_values):
             ws.write(0,0,"Peak set")
-            for k,cluster in enumerate(clusters):
-                ws.write(1,k+1,cluster_names[k])
+            for k,cluster in enumerate(cluster_names):
+                ws.write(1,k+1,cluster)
                 ws.merge_range(0,1,0,n_clusters,
                                "Clusters",
                                fmt_center)
         # Write the data
-        for i,peaks_file in enumerate(peaks):
+        for i,peak_set in enumerate(peaks):
             row = i+1
-            ws_tads_common_genes.write(row,0,basename(peaks_file))
-            ws_tads_p_values.write(row,0,basename(peaks_file))
-            for k,cluster in enumerate(clusters):
-                ws_tads_common_genes.write(row,k+1,tads_counts[i,k])
+            ws_tads_common_genes.write(row,0,peak_set)
+            ws_tads_p_values.write(row,0,peak_set)
+            for k in range(n_clusters):
+                ws_tads_common_genes.write(row,k+1,int(tads_counts[i,k]))
                 ws_tads_p_values.write(row,k+1,tads_pvalues[i,k])
     # Set the column width for peak sets
     ws_common_genes.set_column(0,0,width*1.2)
@@ -382,6 +668,9 @@ def write_raw_data(name,peaks,clusters,distances,pvalues,counts,
         enrichment calculation (None if TADs not included)
       output_directory (str): output directory to write files to (will
         be current working directory if not supplied)
+
+    Returns:
+      List: paths to the TSV files which were written.
     """
     # Convenience variables
     include_tads = (tads_pvalues is not None) and \
@@ -395,6 +684,7 @@ def write_raw_data(name,peaks,clusters,distances,pvalues,counts,
     # Dump pvalues and gene counts
     pval_filen = os.path.join(output_directory,'%s_pval.tsv' % name)
     count_filen = os.path.join(output_directory,'%s_count.tsv' % name)
+    raw_data_files = [pval_filen,count_filen]
     with io.open(pval_filen,'wt') as fpval:
         with io.open(count_filen,'wt') as fcount:
             for i,peaks_file in enumerate(peaks):
@@ -423,3 +713,64 @@ def write_raw_data(name,peaks,clusters,distances,pvalues,counts,
                         line_count.append(int(tads_counts[i,k]))
                     fpval.write("%s\n" % '\t'.join([str(x) for x in line_pval]))
                     fcount.write("%s\n" % '\t'.join([str(x) for x in line_count]))
+        raw_data_files.extend([tads_pval_filen,tads_count_filen])
+
+    return raw_data_files
+
+def write_tsv_results(fp,results,reference=None,header=True):
+    """
+    Write the enrichment data as a long-format TSV stream
+
+    Writes one line for each peak set, distance and cluster
+    (and for each peak set and cluster for the TADs, with
+    'TADs' in place of the distance), with the columns:
+
+    PEAK_SET DISTANCE CLUSTER COUNT PVALUE
+
+    (preceded by the name of the gene reference, if one is
+    supplied). Each line is complete in itself, so the output
+    can be filtered or sorted with standard tools.
+
+    Arguments:
+      fp (File): text file-like object to write to
+      results (EnrichmentResults): the enrichment data (the
+        TADs data are included if the results include the
+        TADs)
+      reference (str): optional, name of the gene reference to
+        include as the first column
+      header (bool): if True (the default) then start with a
+        header line (prefixed with '#')
+
+    Returns:
+      Integer: number of lines of data written.
+    """
+    # Convenience variables
+    peak_set_names = [basename(x) for x in results.peaks]
+    cluster_names = results.cluster_names
+    distances = results.distances
+    pvalues,counts,tads_pvalues,tads_counts = results
+    include_tads = results.include_tads
+    prefix = ("%s\t" % reference if reference is not None else "")
+
+    # Header
+    if header:
+        fp.write("#%sPeak set\tDistance\tCluster\tCount\tP-value\n" %
+                 ("Reference\t" if reference is not None else ""))
+
+    # Data
+    nlines = 0
+    for i,peak_set in enumerate(peak_set_names):
+        for j,distance in enumerate(distances):
+            for k,cluster in enumerate(cluster_names):
+                fp.write("%s%s\t%s\t%s\t%d\t%s\n" %
+                         (prefix,peak_set,distance,cluster,
+                          int(counts[i,j,k]),pvalues[i,j,k]))
+                nlines += 1
+    if include_tads:
+        for i,peak_set in enumerate(peak_set_names):
+            for k,cluster in enumerate(cluster_names):
+                fp.write("%s%s\tTADs\t%s\t%d\t%s\n" %
+                         (prefix,peak_set,cluster,
+                          int(tads_counts[i,k]),tads_pvalues[i,k]))
+                nlines += 1
+    return nlines
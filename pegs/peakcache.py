@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+#
+#     peakcache.py: binary cache of peak set coordinates
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import os
+import io
+import shutil
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from .utils import file_checksum
+
+#######################################################################
+# Functions
+#######################################################################
+
+def cache_peaks(peaks_file,cache_dir):
+    """
+    Convert a peak set to a binary columnar cache
+
+    The start and end positions of the peaks on each
+    chromosome are stored as NumPy arrays in '.npy' files,
+    in a subdirectory of 'cache_dir' named using a checksum
+    of the contents of the peaks file; the chromosome names
+    are stored (in order of first appearance) in the file
+    'chroms.npy'. The order of the peaks on each chromosome
+    is preserved.
+
+    If the cache for the peaks file already exists then it
+    is reused rather than being regenerated.
+
+    As with 'make_expanded_bed', reading stops at the first
+    blank line; comment and 'track'/'browser' lines are
+    ignored.
+
+    Arguments:
+      peaks_file (str): BED file with the peaks
+      cache_dir (str): path to the top-level cache directory
+        (will be created if it doesn't exist)
+
+    Returns:
+      String: path to the cache for the peak set.
+    """
+    cache_dir = os.path.abspath(cache_dir)
+    peak_cache = os.path.join(cache_dir,file_checksum(peaks_file))
+    if os.path.exists(peak_cache):
+        return peak_cache
+    os.makedirs(cache_dir,exist_ok=True)
+    # Read the peak coordinates for each chromosome
+    starts = OrderedDict()
+    ends = OrderedDict()
+    with io.open(peaks_file,'rt') as bed:
+        for line in bed:
+            if line.startswith(('#','track','browser')):
+                continue
+            s = line.split()
+            if not s:
+                break
+            chrom = s[0]
+            if chrom not in starts:
+                starts[chrom] = []
+                ends[chrom] = []
+            starts[chrom].append(int(s[1]))
+            ends[chrom].append(int(s[2]))
+    # Write the arrays to a temporary directory first, so that
+    # an incomplete cache is never visible
+    tmp_cache = tempfile.mkdtemp(dir=cache_dir,prefix=".tmp.")
+    try:
+        np.save(os.path.join(tmp_cache,"chroms.npy"),
+                np.array(list(starts.keys()),dtype=str))
+        for i,chrom in enumerate(starts):
+            start = np.array(starts[chrom],dtype=np.int64)
+            end = np.array(ends[chrom],dtype=np.int64)
+            if start.min() >= np.iinfo(np.int32).min and \
+               end.max() <= np.iinfo(np.int32).max:
+                start = start.astype(np.int32)
+                end = end.astype(np.int32)
+            np.save(os.path.join(tmp_cache,"%d.start.npy" % i),start)
+            np.save(os.path.join(tmp_cache,"%d.end.npy" % i),end)
+        try:
+            os.rename(tmp_cache,peak_cache)
+        except OSError:
+            # Another process created the cache first
+            if not os.path.exists(peak_cache):
+                raise
+    finally:
+        if os.path.exists(tmp_cache):
+            shutil.rmtree(tmp_cache)
+    return peak_cache
+
+def load_cached_peaks(peak_cache):
+    """
+    Load the peak coordinates from a cache
+
+    The arrays are memory-mapped read-only.
+
+    Arguments:
+      peak_cache (str): path to the cache for a peak set (as
+        returned by 'cache_peaks')
+
+    Returns:
+      OrderedDict: tuples of '(start,end)' arrays, keyed
+        by chromosome name.
+    """
+    peaks = OrderedDict()
+    try:
+        chroms = np.load(os.path.join(peak_cache,"chroms.npy"),
+                         mmap_mode='r')
+    except ValueError:
+        # Empty arrays can't be memory-mapped
+        chroms = np.load(os.path.join(peak_cache,"chroms.npy"))
+    for i,chrom in enumerate(chroms):
+        peaks[str(chrom)] = tuple(
+            np.load(os.path.join(peak_cache,"%d.%s.npy" % (i,x)),
+                    mmap_mode='r')
+            for x in ("start","end"))
+    return peaks
+
+def write_expanded_peaks(peaks,expanded_bed_file,interval,
+                         chrom_sizes=None):
+    """
+    Write expanded peaks from cached coordinates to a BED file
+
+    Equivalent to 'make_expanded_bed' (except that only the
+    chromosome, start and end are written), but operates on
+    the arrays for each chromosome at once.
+
+    Arguments:
+      peaks (dict): tuples of '(start,end)' arrays keyed by
+        chromosome (as returned by 'load_cached_peaks')
+      expanded_bed_file (str): output expanded BED file
+      interval (int): distance to extend start and end by
+      chrom_sizes (dict): optional, chromosome sizes to clip
+        the expanded intervals to
+
+    Returns:
+      String: path to the expanded BED file.
+    """
+    with io.open(expanded_bed_file,'wt') as expanded:
+        for chrom in peaks:
+            start,end = peaks[chrom]
+            start = np.maximum(start.astype(np.int64)-interval,0)
+            end = np.maximum(end.astype(np.int64)+interval,0)
+            if chrom_sizes and chrom in chrom_sizes:
+                end = np.minimum(end,chrom_sizes[chrom])
+            lines = np.char.add(np.char.add("%s\t" % chrom,
+                                            start.astype(str)),
+                                np.char.add("\t",end.astype(str)))
+            if len(lines):
+                expanded.write(u"%s\n" % '\n'.join(lines))
+    return expanded_bed_file
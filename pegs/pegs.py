@@ -12,12 +12,15 @@ from builtins import str
 import sys
 import os
 import io
-import glob
+from collections import OrderedDict
 import numpy as np
 import subprocess
 import tempfile
 import shutil
 import logging
+import functools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
 
 from scipy.stats import hypergeom as hg
 
@@ -31,11 +34,53 @@ from os.path import splitext
 from os.path import exists
 
 from .bedtools import intersect
-from .outputs import make_heatmap
-from .outputs import make_xlsx_file
+from .bedtools import BedtoolsError
+from .outputs import make_heatmaps
+from .outputs import get_paginated_heatmaps
+from .outputs import get_heatmap_outputs
+from .outputs import write_xlsx_file
 from .outputs import write_raw_data
+from .outputs import write_tsv_results
+from .htmlheatmap import make_html_heatmap
+from .clusters import ClusterIndex
+from .archive import IntersectionArchive
+from .archive import ARCHIVE_TADS
+from .intervals import split_peaks_by_group
+from .intervals import split_bed_by_chromosome
+from .intervals import merge_bed_file
+from .peakcache import cache_peaks
+from .peakcache import load_cached_peaks
+from .peakcache import write_expanded_peaks
+from .intervals import read_genome_file
+from .intervals import sort_bed_file
+from .intervals import get_sorted_bed_file
+from .results import get_shard
+from .results import merge_results
+from .results import read_raw_data
+from .results import EnrichmentResults
+from .checkpoint import Checkpoint
+from .checkpoint import CheckpointError
+from .membership import GeneMembership
+from .profiling import Profiler
+from .profiling import peak_rss
+from .profiling import format_bytes
+from .profiling import timed_call
+from .metrics import Metrics
+from .metrics import METRICS_INTERVAL
+from .taskgraph import TaskGraph
+from .taskgraph import get_executor
+from .taskgraph import EXECUTORS
+from .plan import RunPlan
+from .plan import summarise_bed_file
+from .plan import summarise_peak_groups
+from .plan import count_cluster_genes
+from .plan import SAMPLE_SIZE
 from .utils import count_genes
 from .utils import intersection_file_basename
+from .utils import input_fingerprint
+from .utils import file_checksum
+from .utils import reference_file_name
+from .utils import copy_stream
 
 #######################################################################
 # Constants
@@ -44,19 +89,31 @@ from .utils import intersection_file_basename
 # P-value cap
 MIN_PVALUE = 1e-12
 
+# File name used for stdin/stdout
+STDIN = "-"
+
+# Name for the peak set read from stdin
+STDIN_PEAKS_FILE = "stdin.bed"
+
 #######################################################################
 # Functions
 #######################################################################
 
-def make_expanded_bed(bed_file,expanded_bed_file,interval):
+def make_expanded_bed(bed_file,expanded_bed_file,interval,
+                      chrom_sizes=None):
     """
     Extends the start and end positions by the supplied
     interval distance
 
+    If chromosome sizes are supplied then the expanded end
+    positions are also clipped to the end of the chromosome.
+
     Inputs:
     - bed_file (str): input BED file to expand
     - expanded_bed_file (str): output expanded BED file
     - interval (int): distance to extend start and end by
+    - chrom_sizes (dict): (optional) chromosome sizes to clip
+      the expanded intervals to
     """
     with io.open(bed_file,"rt") as bed:
         with io.open(expanded_bed_file,"wt") as expanded:
@@ -67,14 +124,69 @@ def make_expanded_bed(bed_file,expanded_bed_file,interval):
                     break
                 # Expand the interval
                 s[1] = str(max(int(s[1])-interval,0))
-                s[2] = str(max(int(s[2])+interval,0))
+                end = max(int(s[2])+interval,0)
+                if chrom_sizes and s[0] in chrom_sizes:
+                    end = min(end,chrom_sizes[s[0]])
+                s[2] = str(end)
                 # Reassemble the line and write out
                 expanded.write("%s\n" % '\t'.join(s))
     return expanded_bed_file
 
+def get_expanded_peaks(peaks_file,interval,output_basename,
+                       working_dir,profiler=None,peak_set=None):
+    """
+    Get BED file with peaks expanded by an interval distance
+
+    If the interval is zero (or None) then no expansion is
+    necessary and the original peaks file is returned;
+    otherwise the expanded peaks are written to the file
+    '<OUTPUT_BASENAME>_Expanded.bed' in the working directory.
+
+    peaks_file (str): BED file containing the ChIP-seq peaks
+    interval (int): distance to expand the peaks by
+    output_basename (str): base name for the expanded file
+    working_dir (str): directory to write expanded file to
+    profiler (Profiler): optional, Profiler instance to record
+      timings for each stage
+    peak_set (str): optional, name to associate the timings
+      with in the profiler
+    """
+    # Profiling
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    # Interval distance is zero so no expansion necessary
+    if not interval:
+        return peaks_file
+    # Create "expanded" BED file for use with 'intersectBed'
+    expanded_bed_file = join(working_dir,
+                             "%s_Expanded.bed" % output_basename)
+    with profiler.stage("peak_expansion",peak_set=peak_set):
+        make_expanded_bed(peaks_file,expanded_bed_file,interval)
+    return expanded_bed_file
+
+def read_intersection_genes(intersection_file):
+    """
+    Return the set of unique gene names from an intersection file
+
+    intersection_file (str): output from 'bedtools intersect'
+      with the genes file as the 'A' input
+    """
+    # Read data from intersection file to get unique list of genes
+    # (across all genome) which are overlapping with ChIPseq peaks for
+    # this interval
+    # NB lines in intersection file look like e.g.:
+    # chr13	21875265	21875266	ENSMUSG00000075032.3
+    # i.e. gene is in 4th column
+    genes = set()
+    with io.open(intersection_file,'rt') as fp:
+        for line in fp:
+            genes.add(line.rstrip().split('\t')[3])
+    return genes
+
 def get_overlapping_genes(genes_file,peaks_file,interval=None,
                           report_entire_feature=False,
-                          working_dir=None,bedtools_exe="bedtools"):
+                          working_dir=None,bedtools_exe="bedtools",
+                          profiler=None,peak_set=None):
     """
     Find genes overlapping ChIP-seq peaks
 
@@ -88,7 +200,14 @@ def get_overlapping_genes(genes_file,peaks_file,interval=None,
     with the -wa option (to report the entire feature, not just
     the overlap)
     bedtools_exe (str): 'bedtools' executable to use
+    profiler (Profiler): optional, Profiler instance to record
+      timings for each stage
+    peak_set (str): optional, name to associate the timings
+      with in the profiler
     """
+    # Profiling
+    if profiler is None:
+        profiler = Profiler(enabled=False)
     # Working directory
     if working_dir is None:
         wd = getcwd()
@@ -98,32 +217,21 @@ def get_overlapping_genes(genes_file,peaks_file,interval=None,
     output_basename = intersection_file_basename(genes_file,
                                                  peaks_file,
                                                  interval)
-    # If interval isn't explicitly set then assume zero
-    if interval is None:
-        interval = 0
     # Create "expanded" BED file for use with 'intersectBed'
-    if interval > 0:
-        expanded_bed_file = join(wd,"%s_Expanded.bed" % output_basename)
-        make_expanded_bed(peaks_file,expanded_bed_file,interval)
-    else:
-        # Interval distance is zero so no expansion necessary
-        expanded_bed_file = peaks_file
+    expanded_bed_file = get_expanded_peaks(peaks_file,interval,
+                                           output_basename,wd,
+                                           profiler=profiler,
+                                           peak_set=peak_set)
     # Intersect gene promoters
     intersection_file = join(wd,"Intersection.%s.bed" % output_basename)
-    intersect(genes_file,expanded_bed_file,intersection_file,
-              working_dir=wd,report_entire_feature=report_entire_feature,
-              bedtools_exe=bedtools_exe)
-    # Read data from intersection file to get unique list of genes
-    # (across all genome) which are overlapping with ChIPseq peaks for
-    # this interval
-    # NB lines in intersection file look like e.g.:
-    # chr13	21875265	21875266	ENSMUSG00000075032.3
-    # i.e. gene is in 4th column
-    genes = set()
-    with io.open(intersection_file,'rt') as fp:
-        for line in fp:
-            genes.add(line.rstrip().split('\t')[3])
-    return genes
+    with profiler.stage("bedtools_intersect",peak_set=peak_set):
+        intersect(genes_file,expanded_bed_file,intersection_file,
+                  working_dir=wd,
+                  report_entire_feature=report_entire_feature,
+                  bedtools_exe=bedtools_exe)
+    # Get unique list of overlapping genes
+    with profiler.stage("parse_intersection",peak_set=peak_set):
+        return read_intersection_genes(intersection_file)
 
 def get_tads_overlapping_peaks(tads_file,peaks_file,tads_subset_file,
                                working_dir=None,bedtools_exe="bedtools"):
@@ -144,9 +252,47 @@ def get_tads_overlapping_peaks(tads_file,peaks_file,tads_subset_file,
               bedtools_exe=bedtools_exe)
     return tads_subset_file
 
+def calculate_cluster_enrichments(overlap_genome,clusters,n_genes,
+                                  profiler=None,peak_set=None):
+    """
+    Calculate enrichments of a set of overlapping genes in clusters
+
+    overlap_genome (set): set of genes overlapping the peaks
+    clusters (list): cluster files, or a ClusterIndex built
+      from the cluster files
+    n_genes (int): total number of genes in the genes BED file
+    profiler (Profiler): optional, Profiler instance to record
+      timings for each stage
+    peak_set (str): optional, name to associate the timings
+      with in the profiler
+
+    Returns tuple (pvalue,counts) i.e. col1 for p-val, col2 for
+    number of genes)
+    """
+    # Profiling
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+    # Read the cluster files
+    if not isinstance(clusters,ClusterIndex):
+        with profiler.stage("load_clusters",peak_set=peak_set):
+            clusters = ClusterIndex.build(overlap_genome,clusters)
+    # Total number of overlapping genes (for set of all genes)
+    K_i = len(overlap_genome)
+    # No. of genes in each cluster (sample size)
+    n = clusters.sizes
+    # Genes from the input regions based set, which are also in
+    # each cluster
+    n_i = clusters.count_overlaps(overlap_genome)
+    # Calculate enrichments from hypergeometric function
+    with profiler.stage("hypergeometric",peak_set=peak_set):
+        pvalues = np.maximum(MIN_PVALUE,1.0 - hg.cdf(n_i-1,n_genes,n,K_i))
+    counts = n_i.astype(float)
+    return (pvalues,counts)
+
 def calculate_enrichment(genes_file,peaks_file,clusters,n_genes,working_dir,
                          distance=None,report_entire_feature=False,
-                         bedtools_exe="bedtools"):
+                         bedtools_exe="bedtools",profiler=None,
+                         peak_set=None):
     """
     Calculate enrichment for a single peak set and distance
 
@@ -159,45 +305,214 @@ def calculate_enrichment(genes_file,peaks_file,clusters,n_genes,working_dir,
     with the -wa option (to report the entire feature, not just
     the overlap)
     bedtools_exe (str): 'bedtools' executable to use
+    profiler (Profiler): optional, Profiler instance to record
+      timings for each stage
+    peak_set (str): optional, name to associate the timings
+      with in the profiler
 
     Returns tuple (pvalue,counts) i.e. col1 for p-val, col2 for
     number of genes)
     """
-    # Initialise result arrays
-    pvalues = np.zeros([len(clusters)])
-    counts = np.zeros([len(clusters)])
     # Get set of genes overlapping this peak set for this distance
     overlap_genome = get_overlapping_genes(genes_file,peaks_file,distance,
                                            working_dir=working_dir,
                                            report_entire_feature=
-                                           report_entire_feature)
-    # Find subsets of overlapping genes in each RNA-seq cluster
-    # and calculate enrichments
-    for i,cluster_file in enumerate(clusters):
-        # Read cluster file
-        genes_cls = set(np.loadtxt(cluster_file,
-                                   delimiter='\t',
-                                   ndmin=1,
-                                   usecols=[0],
-                                   dtype=np.str))
-        # No. of genes in current cluster (sample size)
-        n = len(genes_cls)
-        # Total number of overlapping genes (for set of all genes)
-        K_i = len(overlap_genome)
-        # Genes from the input regions based set, which are also in this cluster
-        n_i = len(overlap_genome.intersection(genes_cls))
-        # Calculate and store enrichment from hypergeometric function
-        pvalues[i] = max(MIN_PVALUE,1.0 - hg.cdf(n_i-1,n_genes,n,K_i))
-        counts[i] = n_i
-    return (pvalues,counts)
+                                           report_entire_feature,
+                                           bedtools_exe=bedtools_exe,
+                                           profiler=profiler,
+                                           peak_set=peak_set)
+    # Calculate enrichments in each cluster
+    return calculate_cluster_enrichments(overlap_genome,clusters,n_genes,
+                                         profiler=profiler,
+                                         peak_set=peak_set)
+
+def merge_peaks_task(peaks_file,merged_bed_file,chrom_sizes=None):
+    """
+    Merge overlapping peaks (task for 'calculate_enrichments')
+
+    peaks_file (str): BED file containing the peaks
+    merged_bed_file (str): output merged BED file
+    chrom_sizes (dict): optional, chromosome sizes (used to
+      order the chromosomes in the merged file)
+
+    Returns tuple (merged_bed_file,n_intervals,n_merged).
+    """
+    n_intervals,n_merged = merge_bed_file(peaks_file,merged_bed_file,
+                                          chrom_sizes=chrom_sizes)
+    return (merged_bed_file,n_intervals,n_merged)
+
+def expand_peaks_task(peaks_file,expanded_bed_file,interval,
+                      chrom_sizes=None,peak_cache=None):
+    """
+    Expand peaks by a distance (task for 'calculate_enrichments')
+
+    peaks_file (str): BED file containing the peaks
+    expanded_bed_file (str): output expanded BED file
+    interval (int): distance to extend start and end by
+    chrom_sizes (dict): optional, chromosome sizes to clip
+      the expanded peaks to
+    peak_cache (str): optional, path to the binary cache for
+      the peaks (if supplied then the cache is used instead
+      of reading 'peaks_file')
+
+    Returns the path to the expanded BED file.
+    """
+    if peak_cache:
+        return write_expanded_peaks(load_cached_peaks(peak_cache),
+                                    expanded_bed_file,interval,
+                                    chrom_sizes=chrom_sizes)
+    return make_expanded_bed(peaks_file,expanded_bed_file,interval,
+                             chrom_sizes=chrom_sizes)
+
+def intersect_chromosome_task(genes_file,chrom_files,chrom,outfile,
+                              **kws):
+    """
+    Intersect genes with intervals on a single chromosome (task
+    for 'calculate_enrichments')
+
+    If there are no intervals on the chromosome then an empty
+    output file is written without running 'bedtools'.
+
+    genes_file (str): BED file with the genes on the chromosome
+    chrom_files (dict): BED files for each chromosome (as
+      returned by 'split_bed_by_chromosome')
+    chrom (str): name of the chromosome
+    outfile (str): path to output file
+    kws (mapping): additional keyword arguments for 'intersect'
+
+    Returns the name of the output file.
+    """
+    if chrom not in chrom_files:
+        io.open(outfile,'wt').close()
+        return outfile
+    return intersect(genes_file,chrom_files[chrom],outfile,**kws)
+
+def count_overlapping_genes_task(intersection_files,cluster_index_dir,
+                                 n_genes,gene_ids=False,
+                                 cprofile_stage=None):
+    """
+    Calculate the enrichments for the genes in intersection
+    files (task for 'calculate_enrichments')
+
+    The cluster index is memory-mapped from 'cluster_index_dir',
+    so it's shared rather than copied when the task is run in a
+    separate process.
+
+    intersection_files (list): outputs from 'bedtools intersect'
+      with the genes file as the 'A' input (the overlapping genes
+      from all the files are combined)
+    cluster_index_dir (str): directory with the saved ClusterIndex
+    n_genes (int): total number of genes in the genes BED file
+    gene_ids (bool): if True then also return the IDs of the
+      overlapping genes in each cluster
+    cprofile_stage (str): optional, name of a stage within the
+      task to collect 'cProfile' data for (only if the task is
+      run in the calling process)
+
+    Returns tuple (pvalues,counts,n_overlapping,n_i,gene_ids,
+    bytes_read,timings), where 'n_i' and 'gene_ids' are None
+    unless 'gene_ids' is set, and 'timings' is a Profiler with
+    the timings for the stages within the task.
+    """
+    profiler = Profiler(cprofile_stage=cprofile_stage)
+    with profiler.stage("parse_intersection"):
+        overlap_genome = set()
+        bytes_read = 0
+        for intersection_file in intersection_files:
+            overlap_genome.update(read_intersection_genes(intersection_file))
+            bytes_read += os.path.getsize(intersection_file)
+    cluster_index = ClusterIndex.load(cluster_index_dir)
+    pvalues,counts = calculate_cluster_enrichments(overlap_genome,
+                                                   cluster_index,
+                                                   n_genes,
+                                                   profiler=profiler)
+    n_i = None
+    if gene_ids:
+        with profiler.stage("gene_membership"):
+            n_i,gene_ids = cluster_index.overlapping_genes(overlap_genome)
+    else:
+        gene_ids = None
+    return (pvalues,counts,len(overlap_genome),n_i,gene_ids,bytes_read,
+            profiler)
 
 def calculate_enrichments(genes_file,distances,peaks,clusters,tads_file,
                           keep_intersection_files=False,
-                          output_directory=None,bedtools_exe="bedtools"):
+                          output_directory=None,bedtools_exe="bedtools",
+                          profiler=None,max_jobs=1,sorted_inputs=False,
+                          genome_file=None,checkpoint=None,
+                          peak_cache_dir=None,gene_membership=None,
+                          split_chromosomes=False,merge_peaks=False,
+                          metrics=None,executor=None,
+                          intersections_archive=None):
     """
     Calculate enrichments for all ChIP-seq peak files and distances
 
-    genes_file (str): path to BED file with all genes
+    The calculations for all the peak set and distance
+    combinations (and for the TADs, if supplied) are built
+    into a graph of tasks (merging, caching and expanding the
+    peaks, running 'bedtools intersect', and counting the
+    overlapping genes and calculating the enrichments), which
+    is then run with up to 'max_jobs' tasks running at any one
+    time; the enrichments for each combination are calculated
+    as soon as its intersection is complete.
+
+    Tasks are identified by the content of the peaks (rather
+    than the file name) and the operations applied to them,
+    so work which is shared between combinations (for example,
+    the same peaks supplied under two different names, or the
+    same distance given twice) is only done once.
+
+    'executor' sets how the tasks are run: 'serial' (one at
+    a time), 'threads' or 'processes' (which allows the Python
+    parts of the calculations to run on multiple cores); the
+    default is 'threads' if 'max_jobs' is greater than 1,
+    otherwise 'serial'.
+
+    If 'sorted_inputs' is set then the genes, peaks and TADs
+    files must all be sorted by position (in the chromosome
+    order of the genome file, if one is supplied), and
+    'bedtools' will use its memory-efficient "chromsweep"
+    algorithm for the intersections.
+
+    If a 'checkpoint' is supplied then the results for each
+    peak set and distance combination (and for the TADs) are
+    recorded as soon as they are calculated, and any results
+    already in the checkpoint are used rather than being
+    recalculated.
+
+    If 'split_chromosomes' is set then the intersection of the
+    genes with each expanded peak set (and subset of TADs) is
+    split into a separate 'bedtools intersect' command for each
+    chromosome, which are run concurrently alongside the other
+    intersections; the overlapping genes from each chromosome
+    are then combined. This allows the intersections for a
+    single very large peak set to use multiple cores.
+
+    If 'merge_peaks' is set then overlapping peaks in each
+    peak set are merged before they are expanded, and the
+    expanded peaks are merged again for each distance; this
+    reduces the number of intervals which 'bedtools' has to
+    process without changing the results.
+
+    If 'intersections_archive' is set then the intersection
+    files are kept in a single compressed archive (with one
+    member for each peak set and distance, and for the TADs)
+    instead of being copied to the 'intersection_beds'
+    directory; if the archive already exists (for example,
+    when resuming a run) then the intersections are added to
+    it.
+
+    If 'genes_file' is a list of gene references then the
+    enrichments are calculated against each reference in
+    turn, sharing the work on the peaks (merging, caching,
+    expanding and subsetting the TADs) between all of them,
+    so that each peak set is only processed once; in this
+    case 'checkpoint', 'gene_membership' and
+    'intersections_archive' should be lists with an item (or
+    None) for each reference.
+
+    genes_file (str): path to BED file with all genes (or a
+      list of BED files, one for each gene reference)
     distances (list): list of distances to calculate enrichments at
     peaks (list): BED files containing the ChIP-seq peaks
     clusters (list): cluster files
@@ -207,100 +522,706 @@ def calculate_enrichments(genes_file,distances,peaks,clusters,tads_file,
     output_directory (str): path to output directory (only used if
        keeping intersection files)
     bedtools_exe (str): 'bedtools' executable to use
+    profiler (Profiler): optional, Profiler instance to record
+      timings for each stage
+    max_jobs (int): maximum number of tasks (including
+      'bedtools' processes) to run concurrently
+    sorted_inputs (bool): if True then the input files are
+      sorted by position
+    genome_file (str): path to genome file with chromosome
+      sizes; if supplied then expanded peaks are clipped to
+      the chromosome ends
+    checkpoint (Checkpoint): optional, Checkpoint instance to
+      record completed results to (and to get previously
+      completed results from)
+    peak_cache_dir (str): optional, if set then each peak set
+      is converted once to a binary cache in this directory,
+      which is then used to generate the expanded peaks for
+      each distance
+    gene_membership (GeneMembership): optional, GeneMembership
+      instance to record the overlapping genes in each cluster
+      for each peak set and distance (and TADs)
+    split_chromosomes (bool): if True then run the intersections
+      for each chromosome separately
+    merge_peaks (bool): if True then merge overlapping peaks
+      (both before and after they are expanded)
+    metrics (Metrics): optional, Metrics instance to report
+      the progress and throughput of the calculations to
+    executor (str): optional, how to run the tasks (one of
+      'serial', 'threads' or 'processes')
+    intersections_archive (str): optional, path to an archive
+      to keep the intersection files in
+
+    Returns an EnrichmentResults instance with the results
+    (which can also be unpacked as the tuple '(pvalues,counts,
+    tads_pvalues,tads_counts)'), or a list of EnrichmentResults
+    instances (one for each reference) if a list of gene
+    references was supplied.
     """
+    # Profiling
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    # Executor for the tasks
+    if executor is None:
+        executor = ("threads" if max_jobs > 1 else "serial")
+    if executor not in EXECUTORS:
+        raise ValueError("Unknown executor '%s'" % executor)
+
+    # 'cProfile' data can only be collected for the tasks when
+    # they're run in the calling thread
+    cprofile_stage = (profiler.cprofile_stage if executor == "serial"
+                      else None)
+
+    # Gene references (with the checkpoint, gene membership
+    # and intersections archive for each one)
+    multiple_references = isinstance(genes_file,(list,tuple))
+    if multiple_references:
+        genes_files = list(genes_file)
+        n_refs = len(genes_files)
+        checkpoints = (list(checkpoint) if checkpoint is not None
+                       else [None]*n_refs)
+        gene_memberships = (list(gene_membership)
+                            if gene_membership is not None
+                            else [None]*n_refs)
+        intersections_archives = (list(intersections_archive)
+                                  if intersections_archive
+                                  else [None]*n_refs)
+    else:
+        genes_files = [genes_file]
+        n_refs = 1
+        checkpoints = [checkpoint]
+        gene_memberships = [gene_membership]
+        intersections_archives = [intersections_archive]
+
+    # Chromosome sizes
+    if genome_file:
+        chrom_sizes = read_genome_file(genome_file)
+    else:
+        chrom_sizes = None
+
     # Temporary working directory
     working_dir = tempfile.mkdtemp(prefix="__LocalBeds.",dir=getcwd())
+    try:
+        if split_chromosomes:
+            chroms_dir = join(working_dir,"chromosomes")
+            mkdir(chroms_dir)
 
-    # Count total number of genes
-    n_genes = count_genes(genes_file)
-
-    # Convenience variables
-    n_peaks = len(peaks)
-    n_clusters = len(clusters)
-    n_distances = len(distances)
-
-    # Storage for results
-    pvalues = np.zeros([n_peaks,n_distances,n_clusters])
-    counts = np.zeros([n_peaks,n_distances,n_clusters])
-
-    # Calculate enrichments for all peaks, distances and clusters
-    for i,peaks_file in enumerate(peaks):
-        print("-- Processing peaks for %s" % basename(peaks_file))
-        for j,distance in enumerate(distances):
-            enrichment = calculate_enrichment(genes_file,peaks_file,
-                                              clusters,n_genes,
-                                              distance=distance,
-                                              working_dir=working_dir,
-                                              bedtools_exe=bedtools_exe)
-            pvalues[i,j,:] = enrichment[0][:]
-            counts[i,j,:] = enrichment[1][:]
-    print("")
+        # Set up each reference
+        n_genes = []
+        genes_checksums = []
+        cluster_index_dirs = []
+        chrom_genes = []
+        enrichments = []
+        for r,genes_file in enumerate(genes_files):
+            if multiple_references:
+                print("-- Reference %s" % basename(genes_file))
+            # Count total number of genes
+            with profiler.stage("count_genes"):
+                n_genes.append(count_genes(genes_file))
+            genes_checksums.append(file_checksum(genes_file))
+            # Index the cluster membership once for all peak sets
+            # (saved to file and memory-mapped read-only, so that
+            # the arrays can be shared rather than copied)
+            with profiler.stage("load_clusters"):
+                cluster_index_dirs.append(
+                    ClusterIndex.from_files(genes_file,clusters).save(
+                        join(working_dir,"cluster_index.%d" % r)))
+                cluster_index = ClusterIndex.load(cluster_index_dirs[r])
+            if gene_memberships[r] is not None:
+                gene_memberships[r].set_genes(cluster_index.genes)
+            # Split the genes by chromosome
+            if split_chromosomes:
+                with profiler.stage("split_chromosomes"):
+                    chrom_genes.append(split_bed_by_chromosome(
+                        genes_file,chroms_dir,prefix="genes.%d" % r))
+            # Storage for results
+            enrichments.append(EnrichmentResults(peaks,clusters,distances,
+                                                 include_tads=bool(tads_file),
+                                                 cluster_sizes=
+                                                 cluster_index.sizes,
+                                                 n_genes=n_genes[r]))
 
-    # Handle TADs
-    if tads_file:
-        # Storage for TADs enrichments
-        tads_pvalues = np.zeros([n_peaks,n_clusters])
-        tads_counts = np.zeros([n_peaks,n_clusters])
-        # Calculate enrichments for TADs
+        # Convenience variables
+        n_peaks = len(peaks)
+        n_distances = len(distances)
+
+        # Number of outstanding distances for each peak set (across
+        # all references)
+        n_remaining = [n_refs*n_distances]*n_peaks
+
+        # Get previously completed results
+        completed = set()
+        def get_completed(r,cell):
+            # Get results from the checkpoint (only if gene
+            # membership was also recorded when it's required)
+            results = checkpoints[r].get(cell)
+            if results is None or gene_memberships[r] is None:
+                return results
+            genes = checkpoints[r].get_genes(cell)
+            if genes is None:
+                return None
+            gene_memberships[r].add(cell,results[1],genes)
+            return results
+        for r in range(n_refs):
+            if checkpoints[r] is None:
+                continue
+            for i in range(n_peaks):
+                cells = [("peaks",i,j) for j in range(n_distances)]
+                if tads_file:
+                    cells.append(("tads",i))
+                for cell in cells:
+                    results = get_completed(r,cell)
+                    if results is not None:
+                        enrichments[r].set(cell,results[0],results[1],
+                                           checkpoints[r].get_n_overlapping(
+                                               cell))
+                        if cell[0] == "peaks":
+                            n_remaining[i] -= 1
+                        completed.add((r,cell))
+        if completed:
+            print("Using %d completed results from checkpoint\n" %
+                  len(completed))
+
+        # Build the graph of tasks
+        graph = TaskGraph()
+        intersect_options = dict(working_dir=working_dir,
+                                 sorted_inputs=sorted_inputs,
+                                 genome_file=genome_file,
+                                 bedtools_exe=bedtools_exe)
+        # Cells calculated by each counting task
+        cells = dict()
+        # Intersection file name and outputs for each cell
+        cell_intersections = OrderedDict()
+        # Descriptions for merging tasks
+        merge_descriptions = dict()
+
+        def add_cell(r,cell,source,infile,name,report_entire_feature=False):
+            # Add the tasks to intersect the genes for reference 'r'
+            # with 'infile' (the result of the tasks identified by
+            # 'source') and calculate the enrichments for a cell
+            peak_set = basename(peaks[cell[1]])
+            genes = ("genes",genes_checksums[r])
+            outfile = join(working_dir,"Intersection.%s.bed" % name)
+            options = dict(report_entire_feature=report_entire_feature,
+                           **intersect_options)
+            if not split_chromosomes:
+                intersections = [graph.add(("intersect",genes,source),
+                                           intersect,
+                                           args=(genes_files[r],infile,
+                                                 outfile),
+                                           kws=options,
+                                           stage="bedtools_intersect",
+                                           peak_set=peak_set)]
+            else:
+                chrom_files = graph.add(("split",source),
+                                        split_bed_by_chromosome,
+                                        args=(infile,chroms_dir),
+                                        kws=dict(prefix="%s.in" % name),
+                                        stage="split_chromosomes",
+                                        peak_set=peak_set)
+                intersections = [graph.add(("intersect",genes,source,chrom),
+                                           intersect_chromosome_task,
+                                           args=(chrom_genes[r][chrom],
+                                                 chrom_files,
+                                                 chrom,
+                                                 join(chroms_dir,
+                                                      "%s.out.%d.bed" %
+                                                      (name,n))),
+                                           kws=options,
+                                           stage="bedtools_intersect",
+                                           peak_set=peak_set)
+                                 for n,chrom in enumerate(chrom_genes[r])]
+            count = graph.add(("count",genes,source),
+                              count_overlapping_genes_task,
+                              args=(intersections,cluster_index_dirs[r],
+                                    n_genes[r]),
+                              kws=dict(gene_ids=(gene_memberships[r]
+                                                 is not None),
+                                       cprofile_stage=cprofile_stage),
+                              stage=("peak_set" if cell[0] == "peaks"
+                                     else "tads"),
+                              peak_set=peak_set)
+            cells.setdefault(count.key,[]).append((r,cell))
+            cell_intersections[(r,cell)] = (name,intersections)
+
+        def add_merge(source,infile,merged_bed_file,description,peak_set):
+            # Add the task to merge overlapping intervals
+            merged = graph.add(("merge",source),
+                               merge_peaks_task,
+                               args=(infile,merged_bed_file,chrom_sizes),
+                               stage="merge_peaks",
+                               peak_set=peak_set)
+            merge_descriptions.setdefault(merged.key,description)
+            return (merged.key,merged[0])
+
+        # Sources for the peaks in each peak set (shared by all
+        # the references)
+        sources = dict()
+        peak_checksums = dict()
         for i,peaks_file in enumerate(peaks):
-            print("-- Processing TADS for %s" % basename(peaks_file))
-            # Get the subset of TADs which overlap with these peaks
-            tads_subset = join(working_dir,
-                               "%s.%s.bed" %
-                               (splitext(basename(peaks_file))[0],
-                                splitext(basename(tads_file))[0]))
-            get_tads_overlapping_peaks(tads_file,peaks_file,tads_subset,
-                                       bedtools_exe=bedtools_exe)
-            # Calculate enrichments for the subset of TADs
-            enrichment = calculate_enrichment(genes_file,tads_subset,
-                                              clusters,n_genes,
-                                              working_dir=working_dir,
-                                              report_entire_feature=True)
-            tads_pvalues[i,:] = enrichment[0][:]
-            tads_counts[i,:] = enrichment[1][:]
+            peak_set = basename(peaks_file)
+            if n_remaining[i] == 0 and (not tads_file or
+                                        all([(r,("tads",i)) in completed
+                                             for r in range(n_refs)])):
+                print("-- Peaks for %s already completed" % peak_set)
+                continue
+            print("-- Processing peaks for %s" % peak_set)
+            # Identify the peaks by their content
+            checksum = file_checksum(peaks_file)
+            if checksum in peak_checksums:
+                print("   Same peaks as %s (calculations will be shared)" %
+                      peak_checksums[checksum])
+            else:
+                peak_checksums[checksum] = peak_set
+            source = ("peaks",checksum)
+            infile = peaks_file
+            if merge_peaks:
+                source,infile = add_merge(source,infile,
+                                          join(working_dir,"%s.%d_Merged.bed" %
+                                               (splitext(peak_set)[0],i)),
+                                          peak_set,peak_set)
+            sources[i] = (source,infile)
+            cache = None
+            if peak_cache_dir and any([distance for j,distance
+                                       in enumerate(distances)
+                                       for r in range(n_refs)
+                                       if (r,("peaks",i,j)) not in completed]):
+                cache = graph.add(("cache",source),
+                                  cache_peaks,
+                                  args=(infile,peak_cache_dir),
+                                  stage="peak_cache",
+                                  peak_set=peak_set)
+            for j,distance in enumerate(distances):
+                for r,genes_file in enumerate(genes_files):
+                    if (r,("peaks",i,j)) in completed:
+                        continue
+                    output_basename = intersection_file_basename(genes_file,
+                                                                 peaks_file,
+                                                                 distance)
+                    if not distance:
+                        # No expansion necessary
+                        add_cell(r,("peaks",i,j),source,infile,output_basename)
+                        continue
+                    expanded = graph.add(("expand",source,distance),
+                                         expand_peaks_task,
+                                         args=(infile,
+                                               join(working_dir,
+                                                    "%s_Expanded.bed" %
+                                                    output_basename),
+                                               distance),
+                                         kws=dict(chrom_sizes=chrom_sizes,
+                                                  peak_cache=cache),
+                                         stage="peak_expansion",
+                                         peak_set=peak_set)
+                    expanded_source,expanded_file = expanded.key,expanded
+                    if merge_peaks:
+                        expanded_source,expanded_file = add_merge(
+                            expanded_source,
+                            expanded_file,
+                            join(working_dir,"%s_Expanded_Merged.bed" %
+                                 output_basename),
+                            "%s expanded by %d" % (peak_set,distance),
+                            peak_set)
+                    add_cell(r,("peaks",i,j),expanded_source,expanded_file,
+                             output_basename)
         print("")
-    else:
-        tads_pvalues = None
-        tads_counts = None
-
-    # Copy the intersection files
-    if keep_intersection_files:
-        print("====Copying intersection BED files====\n")
-        intersections_dir = "intersection_beds"
-        if output_directory is not None:
-            intersections_dir = os.path.join(output_directory,
-                                             intersections_dir)
-        if not exists(intersections_dir):
-            mkdir(intersections_dir)
-        for f in glob.glob(join(working_dir,"Intersection.*.bed")):
-            ff = join(intersections_dir,basename(f))
-            shutil.copyfile(f,ff)
-
-    # Remove the working directory
-    shutil.rmtree(working_dir)
+
+        # Add the tasks to get the subsets of TADs which overlap
+        # with each set of peaks
+        if tads_file:
+            for i,peaks_file in enumerate(peaks):
+                refs = [r for r in range(n_refs)
+                        if (r,("tads",i)) not in completed]
+                if not refs:
+                    print("-- TADS for %s already completed" %
+                          basename(peaks_file))
+                    continue
+                print("-- Processing TADS for %s" % basename(peaks_file))
+                source,infile = sources[i]
+                tads_subset = join(working_dir,
+                                   "%s.%s.bed" %
+                                   (splitext(basename(peaks_file))[0],
+                                    splitext(basename(tads_file))[0]))
+                subset = graph.add(("tads_subset",source),
+                                   intersect,
+                                   args=(tads_file,infile,tads_subset),
+                                   kws=dict(report_entire_feature=True,
+                                            **intersect_options),
+                                   stage="tads_subset",
+                                   peak_set=basename(peaks_file))
+                for r in refs:
+                    add_cell(r,("tads",i),subset.key,subset,
+                             intersection_file_basename(genes_files[r],
+                                                        tads_subset),
+                             report_entire_feature=True)
+            print("")
+
+        # Collect 'cProfile' data for the tasks in the profiled
+        # stage
+        if cprofile_stage:
+            for task in graph.tasks.values():
+                if task.stage == cprofile_stage:
+                    task.func = functools.partial(profiler.cprofile_call,
+                                                  task.stage,task.func)
+        elif profiler.cprofile_stage in \
+             set([task.stage for task in graph.tasks.values()] +
+                 ["parse_intersection","hypergeometric","gene_membership"]):
+            logging.warning("cProfile data for '%s' is only collected "
+                            "with the 'serial' executor" %
+                            profiler.cprofile_stage)
+
+        # Report the tasks
+        print("Task graph: %d tasks (%d shared) using %s executor\n" %
+              (len(graph),graph.n_shared,executor))
+
+        # Progress and throughput metrics
+        if metrics is None:
+            metrics = Metrics(progress=False)
+        metrics.set_total_cells(n_refs*(n_peaks*n_distances +
+                                        (n_peaks if tads_file else 0)),
+                                skipped=len(completed))
+        metrics.set_stage("intersections")
+
+        def task_completed(task,result):
+            # Handle a completed task
+            wall,cpu = task.wall,task.cpu
+            if task.key[0] == "count":
+                # Exclude the stages within the task (which are
+                # recorded separately) from the time for the task
+                for t in result[-1].stages.values():
+                    wall -= t.wall
+                    cpu -= t.cpu
+            profiler.add(task.stage,wall,cpu,peak_set=task.peak_set)
+            if task.key[0] == "merge":
+                merged_bed_file,n_intervals,n_merged = result
+                print("   %s: merged %d intervals into %d (%.1f%% fewer)" %
+                      (merge_descriptions[task.key],n_intervals,n_merged,
+                       (100.0*(n_intervals-n_merged)/n_intervals
+                        if n_intervals else 0.0)))
+            elif task.key[0] in ("intersect","tads_subset"):
+                metrics.add_bedtools_time(task.wall)
+            elif task.key[0] == "count":
+                pvalues,counts,n_overlapping,n_i,gene_ids,bytes_read,timings = \
+                    result
+                for name in timings.stages:
+                    t = timings.stages[name]
+                    profiler.add(name,t.wall,t.cpu,peak_set=task.peak_set)
+                profiler.add_cprofile(timings)
+                for r,cell in cells[task.key]:
+                    if gene_memberships[r] is not None:
+                        gene_memberships[r].add(cell,n_i,gene_ids)
+                    if checkpoints[r] is not None:
+                        checkpoints[r].add(cell,pvalues,counts,genes=gene_ids,
+                                           n_overlapping=n_overlapping)
+                    enrichments[r].set(cell,pvalues,counts,
+                                       n_overlapping=n_overlapping)
+                    if cell[0] == "peaks":
+                        i = cell[1]
+                        n_remaining[i] -= 1
+                        if n_remaining[i] == 0 and profiler.track_memory:
+                            profiler.add_memory("peak_set",
+                                                peak_set=basename(peaks[i]))
+                            print("   Peak RSS after %s: %s" %
+                                  (basename(peaks[i]),
+                                   format_bytes(peak_rss())))
+                if task.stage == "tads":
+                    profiler.add_memory("tads",peak_set=task.peak_set)
+                metrics.add_cells(len(cells[task.key]),bytes_read=bytes_read)
+
+        # Calculate enrichments for all peaks, distances and clusters
+        # (and TADs)
+        with get_executor(executor,max_jobs) as pool:
+            results = graph.run(pool,
+                                max_workers=max_jobs,
+                                on_complete=task_completed,
+                                on_poll=(metrics.update if metrics.enabled
+                                         else None))
+        if merge_descriptions:
+            print("")
+
+        # Store the intersection files
+        for r,archive_file in enumerate(intersections_archives):
+            if not archive_file:
+                continue
+            print("====Writing intersections archive====")
+            print("%s\n" % archive_file)
+            with IntersectionArchive(archive_file,
+                                     ('a' if exists(archive_file)
+                                      else 'w')) as archive:
+                for (rr,cell),(name,intersections) in \
+                    cell_intersections.items():
+                    if rr != r:
+                        continue
+                    archive.add(basename(peaks[cell[1]]),
+                                (distances[cell[2]] if cell[0] == "peaks"
+                                 else ARCHIVE_TADS),
+                                [results[intersection.key]
+                                 for intersection in intersections],
+                                name="Intersection.%s.bed" % name)
+        if keep_intersection_files and not any(intersections_archives):
+            # Copy the intersection files
+            print("====Copying intersection BED files====\n")
+            intersections_dir = "intersection_beds"
+            if output_directory is not None:
+                intersections_dir = os.path.join(output_directory,
+                                                 intersections_dir)
+            if not exists(intersections_dir):
+                mkdir(intersections_dir)
+            for name,intersections in cell_intersections.values():
+                # Combine the intersections for each chromosome
+                # into a single file
+                ff = join(intersections_dir,"Intersection.%s.bed" % name)
+                with io.open(ff,'wb') as fp:
+                    for intersection in intersections:
+                        with io.open(results[intersection.key],
+                                     'rb') as fpp:
+                            shutil.copyfileobj(fpp,fp)
+    finally:
+        # Remove the working directory
+        shutil.rmtree(working_dir)
 
     # Return the enrichment data
-    return (pvalues,counts,tads_pvalues,tads_counts)
+    if multiple_references:
+        return enrichments
+    return enrichments[0]
+
+def make_outputs(name,results,heatmap=None,
+                 xlsx=None,html=None,output_directory=None,
+                 clusters_axis_label=None,peaksets_axis_label=None,
+                 heatmap_cmap=None,heatmap_format=None,
+                 heatmap_variants=None,peak_sets_per_page=None,
+                 clusters_per_page=None,dump_raw_data=False,
+                 profiler=None,max_jobs=1,metrics=None):
+    """
+    Write the heatmap, XLSX file and (optionally) raw data
+
+    The heatmap and XLSX file can be omitted by setting
+    'heatmap' or 'xlsx' to False.
+
+    If 'max_jobs' is greater than one then the outputs (and
+    the pages of a paginated heatmap) are written concurrently,
+    each in a separate process.
+
+    A failure writing one of the outputs is reported but
+    doesn't prevent the other outputs from being written.
+
+    Arguments:
+      name (str): basename to use for output files
+      results (EnrichmentResults): the enrichment results
+      heatmap (str): path for output heatmap image file (or a
+        list of paths, to write multiple heatmaps; False means
+        don't write a heatmap)
+      xlsx (str): path for output XLSX file with raw data
+        (False means don't write an XLSX file)
+      html (str): if set then also write an interactive HTML
+        heatmap to this path (an empty string means use the
+        default 'NAME_heatmap.html')
+      output_directory (str): directory to write output files to
+        (defaults to current directory if not specified)
+      clusters_axis_label (str): custom label for the x-axis
+      peaksets_axis_label (str): custom label for the y-axis
+      heatmap_cmap (cmap): non-default colormap to use when creating
+        the heatmaps
+      heatmap_format (str): image format for output heatmaps (or
+        a list of formats, to write a heatmap in each format)
+      heatmap_variants (list): optional, list of '(variant,cmap)'
+        tuples; if supplied then a variant of each heatmap is
+        written using each colormap (overrides 'heatmap_cmap')
+      peak_sets_per_page (int): if set then split the heatmap
+        into pages with at most this many peak sets per page
+      clusters_per_page (int): if set then split the heatmap
+        into pages with at most this many clusters per page
+      dump_raw_data (bool): if True then also save the raw
+        enrichment data to TSV files
+      profiler (Profiler): optional, Profiler instance to record
+        timings for each output
+      max_jobs (int): maximum number of outputs (or heatmap pages)
+        to write concurrently
+      metrics (Metrics): optional, Metrics instance to report
+        the progress of writing the outputs to
+
+    Returns:
+      List: descriptions of the outputs which couldn't be
+        written (empty if all the outputs were written).
+    """
+    # Profiling
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    # Progress metrics
+    if metrics is None:
+        metrics = Metrics(progress=False)
+
+    # Results
+    peaks = results.peaks
+    clusters = results.clusters
+    distances = results.distances
+    pvalues,counts,tads_pvalues,tads_counts = results
+
+    # Output directory
+    if output_directory is None:
+        output_directory = getcwd()
+    output_directory = abspath(output_directory)
+
+    # Paths, colormaps and formats for the output heatmaps
+    if heatmap_variants is None:
+        heatmap_variants = [(None,heatmap_cmap)]
+    heatmaps = get_heatmap_outputs(name,
+                                   heatmap=(heatmap if heatmap is not False
+                                            else None),
+                                   heatmap_format=heatmap_format,
+                                   variants=heatmap_variants,
+                                   output_directory=output_directory)
+
+    # Path to the output XLSX
+    if xlsx is None:
+        xlsx = "%s_results.xlsx" % name
+    if xlsx is not False:
+        xlsx = os.path.join(output_directory,xlsx)
+
+    # Path to the output HTML
+    if html is not None:
+        if not html:
+            html = "%s_heatmap.html" % name
+        html = os.path.join(output_directory,html)
+
+    # Set up the outputs
+    # Each output is a tuple '(stage,title,files,function,args,kws)'
+    # where 'stage' is the profiler stage, 'title' and 'files'
+    # are used when reporting the output, and 'function' is
+    # called with 'args' and 'kws' to write it
+    heatmap_kws = dict(clusters_axis_label=clusters_axis_label,
+                       peaksets_axis_label=peaksets_axis_label)
+    outputs = []
+    if heatmap is False:
+        pass
+    elif peak_sets_per_page or clusters_per_page:
+        for args,kws in get_paginated_heatmaps(
+                heatmaps,results,
+                peak_sets_per_page=peak_sets_per_page,
+                clusters_per_page=clusters_per_page,
+                **heatmap_kws):
+            outputs.append(("heatmap","heatmap",[h[0] for h in args[0]],
+                            make_heatmaps,args,kws))
+    else:
+        outputs.append(("heatmap","heatmap",[h[0] for h in heatmaps],
+                        make_heatmaps,
+                        (heatmaps,results),
+                        heatmap_kws))
+    if html:
+        outputs.append(("html","HTML heatmap",[html],make_html_heatmap,
+                        (html,results),
+                        dict(heatmap_cmap=heatmaps[0][1],
+                             title=name,
+                             **heatmap_kws)))
+    if xlsx is not False:
+        outputs.append(("xlsx","XLSX file",[xlsx],write_xlsx_file,
+                        (xlsx,results),
+                        dict()))
+    if dump_raw_data:
+        raw_data_files = ["pval","count"]
+        if tads_pvalues is not None and tads_counts is not None:
+            raw_data_files.extend(["tads_pval","tads_count"])
+        raw_data_files = [join(output_directory,"%s_%s.tsv" % (name,x))
+                          for x in raw_data_files]
+        outputs.append(("raw_data","raw data TSV files",raw_data_files,
+                        write_raw_data,
+                        (name,peaks,clusters,distances,pvalues,counts),
+                        dict(tads_pvalues=tads_pvalues,
+                             tads_counts=tads_counts,
+                             output_directory=output_directory)))
+
+    # Write the outputs
+    metrics.set_stage("outputs")
+    metrics.set_total_outputs(len(outputs))
+    errors = []
+    if max_jobs > 1 and len(outputs) > 1:
+        print("====Writing outputs (%d concurrent jobs)====\n" %
+              min(max_jobs,len(outputs)))
+        with ProcessPoolExecutor(max_workers=min(max_jobs,len(outputs))) \
+             as executor:
+            futures = [executor.submit(timed_call,func,*args,**kws)
+                       for stage,title,files,func,args,kws in outputs]
+            for (stage,title,files,func,args,kws),future in \
+                zip(outputs,futures):
+                try:
+                    result,wall,cpu = future.result()
+                    profiler.add(stage,wall,cpu)
+                    print("%s" % '\n'.join(files))
+                    errors.append(None)
+                except Exception as ex:
+                    errors.append(ex)
+                metrics.add_outputs(1)
+        print("")
+    else:
+        for i,(stage,title,files,func,args,kws) in enumerate(outputs):
+            if i == 0 or title != outputs[i-1][1]:
+                print("====Writing %s====" % title)
+            print("%s\n" % '\n'.join(files))
+            with profiler.stage(stage):
+                try:
+                    func(*args,**kws)
+                    errors.append(None)
+                except Exception as ex:
+                    errors.append(ex)
+            metrics.add_outputs(1)
+
+    # Report any failures
+    failed = []
+    for (stage,title,files,func,args,kws),error in zip(outputs,errors):
+        if error is not None:
+            logging.error("Failed to write %s (%s): %s" %
+                          (title,', '.join(files),error))
+            if title not in failed:
+                failed.append(title)
+    return failed
 
 def pegs_main(genes_file,distances,peaks,clusters,
-              tads_file,name,heatmap=None,xlsx=None,
+              tads_file,name,heatmap=None,xlsx=None,html=None,
               output_directory=None,
               keep_intersection_files=False,
               clusters_axis_label=None,peaksets_axis_label=None,
               heatmap_cmap=None,heatmap_format=None,
-              bedtools_exe="bedtools",dump_raw_data=False):
+              heatmap_variants=None,peak_sets_per_page=None,
+              clusters_per_page=None,
+              bedtools_exe="bedtools",dump_raw_data=False,
+              peaks_group_column=None,profile=False,
+              profile_stage=None,track_memory=False,max_jobs=1,
+              sorted_inputs=False,genome_file=None,cache_dir=None,
+              shard=None,resume=False,peak_cache=False,
+              split_chromosomes=False,merge_peaks=False,
+              export_genes=False,keep_results=False,
+              metrics_file=None,metrics_interval=None,executor=None,
+              intersections_archive=False,tsv_out=None):
     """
     Driver function for enrichment calculation
 
+    If 'genes_file' is a list of gene references then the
+    enrichments are calculated against each reference in a
+    single run (with the work on the peaks shared between the
+    references), and a separate set of outputs is written for
+    each one, with the name of the reference (the file name
+    without its extension) appended to the name of each file
+    (for example 'NAME_refGene_heatmap.png' and
+    'NAME_refGene_results.xlsx'; user-supplied file names for
+    the heatmap, XLSX and HTML files have the name inserted
+    before the extension).
+
     Arguments:
-      genes_file (str): path to BED file with all genes
+      genes_file (str): path to BED file with all genes (or a
+        list of BED files, one for each gene reference)
       distances (list): list of distances to calculate enrichments at
       peaks (list): list of BED files containing the ChIP-seq peaks
       clusters (list): list of cluster files
       tads_file (str): path to BED file with TADs
       name (str): basename to use for output files
-      heatmap (str): path for output heatmap image file
+      heatmap (str): path for output heatmap image file (or a
+        list of paths, to write multiple heatmaps)
       xlsx (str): path for output XLSX file with raw data
+      html (str): if set then also write an interactive HTML
+        heatmap to this path (an empty string means use the
+        default 'NAME_heatmap.html')
       output_directory (str): directory to write output files to
         (defaults to current directory if not specified)
       keep_intersection_files (bool): if True then keep the intermediate
@@ -309,25 +1230,208 @@ def pegs_main(genes_file,distances,peaks,clusters,
       peaksets_axis_label (str): custom label for the y-axis
       heatmap_cmap (cmap): non-default colormap to use when creating
         the heatmaps
-      heatmap_format (str): image format for output heatmaps
+      heatmap_format (str): image format for output heatmaps (or
+        a list of formats, to write a heatmap in each format)
+      heatmap_variants (list): optional, list of '(variant,cmap)'
+        tuples; if supplied then a variant of each heatmap is
+        written using each colormap (overrides 'heatmap_cmap')
+      peak_sets_per_page (int): if set then split the heatmap
+        into pages with at most this many peak sets per page
+      clusters_per_page (int): if set then split the heatmap
+        into pages with at most this many clusters per page
       bedtools_exe (str): 'bedtools' executable to use
       dump_raw_data (bool): if True then save the raw enrichment data
         to file (for debugging purposes)
+      peaks_group_column (int): if set then split the intervals in
+        the peaks files into separate peak sets using the values in
+        this column (numbered from 1)
+      profile (bool): if True then record the time spent in each
+        stage of the analysis, print a summary at the end and write
+        the timings to a JSON file in the output directory
+      profile_stage (str): if set then also collect 'cProfile' data
+        for the named stage and write it to file in the output
+        directory (implies 'profile')
+      track_memory (bool): if True then record the peak memory
+        usage for each stage of the analysis, print a summary at
+        the end and write the data to a JSON file in the output
+        directory
+      max_jobs (int): maximum number of 'bedtools' processes to
+        run concurrently (also the maximum number of outputs
+        or heatmap pages to write concurrently)
+      sorted_inputs (bool): if True then sort the genes, peaks
+        and TADs by position and use the memory-efficient
+        "chromsweep" algorithm for the intersections
+      genome_file (str): path to a genome file with chromosome
+        sizes; used to clip expanded peaks to the chromosome
+        ends, and to define the chromosome order for sorted
+        inputs
+      cache_dir (str): if set then cache the position-sorted
+        genes file in this directory, for reuse by subsequent
+        runs (only used if 'sorted_inputs' is True)
+      shard (tuple): if set then should be a tuple '(i,n)'
+        which splits the peak sets into 'n' contiguous slices
+        and only calculates the enrichments for slice 'i'
+        (numbered from 1); the partial results are written to
+        the file 'NAME_shard_I_of_N.npz' in the output directory
+        (instead of the heatmap and XLSX file) and can be
+        combined using 'merge_main'
+      resume (bool): if True then resume from the checkpoint
+        file left by a previous incomplete run with the same
+        inputs and output directory (the results are always
+        checkpointed to 'NAME_checkpoint.jsonl' in the output
+        directory while the analysis is running, or to
+        'NAME_shard_I_of_N_checkpoint.jsonl' for a shard)
+      export_genes (bool): if True then also write the genes
+        in each cluster overlapping each peak set at each
+        distance (and for the TADs) to the file
+        'NAME_genes.npz' (or 'NAME_shard_I_of_N_genes.npz'
+        for a shard) in the output directory, which can be
+        queried using 'genes_main'
+      keep_results (bool): if True then also save the results
+        to the file 'NAME_results.npz' in the output directory,
+        from which the outputs can be regenerated using
+        'plot_main' without recalculating the enrichments
+      peak_cache (bool): if True then convert each peak set
+        to a binary cache (in 'cache_dir' if set, so that it
+        can be reused by later runs) and generate the expanded
+        peaks from the cache
+      split_chromosomes (bool): if True then run the
+        intersections for each chromosome as separate
+        'bedtools' commands (so that a single large peak set
+        can use up to 'max_jobs' cores)
+      merge_peaks (bool): if True then merge overlapping
+        peaks in each peak set before running the
+        intersections (and again after expanding the peaks
+        for each distance)
+      metrics_file (str): if set then periodically write the
+        progress and throughput metrics to this file (in the
+        Prometheus text format if the file name ends with
+        '.prom', otherwise as JSON)
+      metrics_interval (float): interval in seconds between
+        updates of the metrics file
+      executor (str): how to run the tasks for the enrichment
+        calculations: 'serial', 'threads' or 'processes' (default
+        is 'threads' if 'max_jobs' is greater than 1, otherwise
+        'serial')
+      intersections_archive (bool): if True then keep the
+        intersection files in a single compressed archive
+        'NAME_intersections.zip' (or
+        'NAME_shard_I_of_N_intersections.zip' for a shard) in
+        the output directory, which can be read using
+        'extract_main' (instead of copying them to the
+        'intersection_beds' directory)
+      tsv_out (str): if set then write the results in long
+        format as tab-separated values (see 'write_tsv_results')
+        to this file ('-' means stdout, in which case all the
+        messages that would normally be written to stdout go to
+        stderr instead; a file-like object can also be supplied);
+        the heatmap and XLSX file are then only written if
+        'heatmap' or 'xlsx' are set explicitly
+
+    A peak set can be read from stdin by including '-' in
+    'peaks' (it is read once and stored in a temporary file
+    named 'stdin.bed' for the duration of the run).
+
+    Returns 1 if the enrichment calculation failed, or if any
+    of the outputs couldn't be written.
     """
-    # Path to BED with all genes
-    genes_file = abspath(genes_file)
-    print("====Genes interval file====")
-    print("%s\n" % genes_file)
-    if not exists(genes_file):
-        logging.fatal("Genes interval file not found: %s" %
-                      genes_file)
-        return
+    # Writing TSV results to stdout
+    if tsv_out == STDIN or tsv_out is sys.stdout:
+        # Send everything else to stderr so that it doesn't
+        # get mixed up with the results
+        stdout = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            return pegs_main(genes_file,distances,peaks,clusters,
+                             tads_file,name,heatmap=heatmap,xlsx=xlsx,
+                             html=html,output_directory=output_directory,
+                             keep_intersection_files=keep_intersection_files,
+                             clusters_axis_label=clusters_axis_label,
+                             peaksets_axis_label=peaksets_axis_label,
+                             heatmap_cmap=heatmap_cmap,
+                             heatmap_format=heatmap_format,
+                             heatmap_variants=heatmap_variants,
+                             peak_sets_per_page=peak_sets_per_page,
+                             clusters_per_page=clusters_per_page,
+                             bedtools_exe=bedtools_exe,
+                             dump_raw_data=dump_raw_data,
+                             peaks_group_column=peaks_group_column,
+                             profile=profile,profile_stage=profile_stage,
+                             track_memory=track_memory,max_jobs=max_jobs,
+                             sorted_inputs=sorted_inputs,
+                             genome_file=genome_file,cache_dir=cache_dir,
+                             shard=shard,resume=resume,
+                             peak_cache=peak_cache,
+                             split_chromosomes=split_chromosomes,
+                             merge_peaks=merge_peaks,
+                             export_genes=export_genes,
+                             keep_results=keep_results,
+                             metrics_file=metrics_file,
+                             metrics_interval=metrics_interval,
+                             executor=executor,
+                             intersections_archive=intersections_archive,
+                             tsv_out=stdout)
+
+    # Set up profiling
+    profile = (profile or bool(profile_stage))
+    profiler = Profiler(enabled=(profile or track_memory),
+                        cprofile_stage=profile_stage,
+                        track_memory=track_memory)
+
+    # Paths to BEDs with all genes (one for each gene reference)
+    if isinstance(genes_file,(list,tuple)):
+        genes_files = [abspath(f) for f in genes_file]
+    else:
+        genes_files = [abspath(genes_file)]
+    print("====Genes interval file%s====" %
+          ("s" if len(genes_files) > 1 else ""))
+    print("%s\n" % '\n'.join(genes_files))
+    for genes_file in genes_files:
+        if not exists(genes_file):
+            logging.fatal("Genes interval file not found: %s" %
+                          genes_file)
+            return 1
+    multiple_references = (len(genes_files) > 1)
+    if multiple_references:
+        # Names for the outputs for each reference
+        references = [splitext(basename(f))[0] for f in genes_files]
+        if len(set(references)) != len(references):
+            logging.fatal("Genes interval files must have different "
+                          "names when using multiple references")
+            return 1
+        names = ["%s_%s" % (name,reference) for reference in references]
+    else:
+        references = [None]
+        names = [name]
+
+    # Temporary directories to remove on completion
+    tmp_dirs = []
+    def remove_tmp_dirs():
+        for d in tmp_dirs:
+            shutil.rmtree(d)
+
+    # Read peaks from stdin
+    if peaks and STDIN in peaks:
+        if peaks.count(STDIN) > 1:
+            logging.fatal("Peaks can only be read from stdin once")
+            return 1
+        stdin_dir = tempfile.mkdtemp(prefix="__StdinPeaks.",dir=getcwd())
+        tmp_dirs.append(stdin_dir)
+        stdin_peaks = join(stdin_dir,STDIN_PEAKS_FILE)
+        with profiler.stage("read_stdin"):
+            nbytes = copy_stream(getattr(sys.stdin,'buffer',sys.stdin),
+                                 stdin_peaks)
+        if not nbytes:
+            logging.fatal("No peaks read from stdin")
+            remove_tmp_dirs()
+            return 1
+        peaks = [(stdin_peaks if f == STDIN else f) for f in peaks]
 
     # Report the peak files
     print("====Peaks Files====")
     if not peaks:
         logging.fatal("No peaks files supplied")
-        return
+        remove_tmp_dirs()
+        return 1
     for f in peaks:
         print("%s" % basename(f))
     print("")
@@ -336,7 +1440,8 @@ def pegs_main(genes_file,distances,peaks,clusters,
     print("====Cluster Files====")
     if not clusters:
         logging.fatal("No cluster files supplied")
-        return
+        remove_tmp_dirs()
+        return 1
     for f in clusters:
         print("%s" % basename(f))
     print("")
@@ -350,15 +1455,124 @@ def pegs_main(genes_file,distances,peaks,clusters,
         print("Not supplied")
     print("")
 
+    # Genome file (if supplied)
+    chrom_sizes = None
+    if genome_file:
+        print("====Genome file====")
+        genome_file = abspath(genome_file)
+        print("%s\n" % genome_file)
+        try:
+            chrom_sizes = read_genome_file(genome_file)
+        except Exception as ex:
+            logging.fatal("Failed to read genome file: %s" % ex)
+            remove_tmp_dirs()
+            return 1
+
     # Distances
     print("====Distances====")
     if not distances:
         logging.fatal("No distances specified")
-        return
+        remove_tmp_dirs()
+        return 1
     for d in distances:
         print("%s" % d)
     print("")
 
+    # Original input files for each reference (for checkpointing)
+    input_files = [[genes_file] + list(peaks) + list(clusters) +
+                   ([tads_file] if tads_file else [])
+                   for genes_file in genes_files]
+
+    # Split peaks into peak sets using the group column
+    if peaks_group_column:
+        print("====Splitting peaks into peak sets====")
+        peak_groups_dir = tempfile.mkdtemp(prefix="__PeakGroups.",
+                                           dir=getcwd())
+        tmp_dirs.append(peak_groups_dir)
+        try:
+            with profiler.stage("split_peaks"):
+                peaks = split_peaks_by_group(peaks,peaks_group_column,
+                                             peak_groups_dir)
+        except Exception as ex:
+            logging.fatal("Failed to split peaks: %s" % ex)
+            remove_tmp_dirs()
+            return 1
+        if not peaks:
+            logging.fatal("No peak sets found in peaks files")
+            remove_tmp_dirs()
+            return 1
+        for f in peaks:
+            print("%s" % basename(f))
+        print("")
+
+    # Select the peak sets for this shard
+    n_peak_sets = len(peaks)
+    first_peak_set = 0
+    if shard:
+        print("====Shard %d of %d====" % shard)
+        first_peak_set,last_peak_set = get_shard(n_peak_sets,*shard)
+        peaks = peaks[first_peak_set:last_peak_set]
+        if peaks:
+            print("Peak sets %d-%d of %d" % (first_peak_set+1,
+                                             last_peak_set,
+                                             n_peak_sets))
+        else:
+            print("No peak sets in this shard")
+        print("")
+
+    # Sort the inputs by position
+    if sorted_inputs:
+        print("====Sorting inputs by position====")
+        sorted_dir = tempfile.mkdtemp(prefix="__SortedInputs.",
+                                      dir=getcwd())
+        tmp_dirs.append(sorted_dir)
+        try:
+            with profiler.stage("sort_inputs"):
+                # Genes (cached between runs if possible)
+                for r,genes_file in enumerate(genes_files):
+                    if cache_dir:
+                        genes_file = get_sorted_bed_file(
+                            genes_file,cache_dir,
+                            genome_file=genome_file,
+                            chrom_sizes=chrom_sizes)
+                    else:
+                        genes_file = sort_bed_file(
+                            genes_file,
+                            join(sorted_dir,basename(genes_file)),
+                            chrom_sizes=chrom_sizes)
+                    genes_files[r] = genes_file
+                    print("Genes: %s" % genes_file)
+                # Peak sets (keeping the original file names)
+                mkdir(join(sorted_dir,"peaks"))
+                peaks = [sort_bed_file(f,
+                                       join(sorted_dir,"peaks",basename(f)),
+                                       chrom_sizes=chrom_sizes)
+                         for f in peaks]
+                print("Peaks: sorted %d peak sets" % len(peaks))
+                # TADs
+                if tads_file:
+                    mkdir(join(sorted_dir,"tads"))
+                    tads_file = sort_bed_file(
+                        tads_file,
+                        join(sorted_dir,"tads",basename(tads_file)),
+                        chrom_sizes=chrom_sizes)
+                    print("TADs: %s" % tads_file)
+        except Exception as ex:
+            logging.fatal("Failed to sort inputs: %s" % ex)
+            remove_tmp_dirs()
+            return 1
+        print("")
+
+    # Location of the peak cache
+    peak_cache_dir = None
+    if peak_cache:
+        if cache_dir:
+            peak_cache_dir = join(abspath(cache_dir),"peaks")
+        else:
+            peak_cache_dir = tempfile.mkdtemp(prefix="__PeakCache.",
+                                              dir=getcwd())
+            tmp_dirs.append(peak_cache_dir)
+
     # Output directory
     if output_directory is None:
         output_directory = getcwd()
@@ -366,50 +1580,700 @@ def pegs_main(genes_file,distances,peaks,clusters,
     if not exists(output_directory):
         mkdir(output_directory)
 
-    # Path to the output heatmap
-    if heatmap is None:
-        if not heatmap_format:
-            heatmap_format = "png"
-        heatmap = "%s_heatmap.%s" % (name,heatmap_format)
-    heatmap = os.path.join(output_directory,heatmap)
+    # Set up checkpointing (one checkpoint for each reference)
+    if shard:
+        checkpoint_name = "%s_shard_%d_of_%d" % (name,shard[0],shard[1])
+        checkpoint_names = ["%s_shard_%d_of_%d" % (n,shard[0],shard[1])
+                            for n in names]
+    else:
+        checkpoint_name = name
+        checkpoint_names = list(names)
+    checkpoint_files = [os.path.join(output_directory,
+                                     "%s_checkpoint.jsonl" % n)
+                        for n in checkpoint_names]
+    checkpoints = []
+    if resume:
+        print("====Resuming from checkpoint====")
+    for checkpoint_file,files in zip(checkpoint_files,input_files):
+        fingerprint = input_fingerprint(files,
+                                        params=dict(
+                                            distances=distances,
+                                            peaks_group_column=
+                                            peaks_group_column,
+                                            shard=shard))
+        checkpoint = Checkpoint(checkpoint_file,fingerprint)
+        if resume:
+            if exists(checkpoint_file):
+                print("%s" % checkpoint_file)
+            else:
+                print("No checkpoint found for %s (starting from the "
+                      "beginning)" % basename(checkpoint_file))
+        try:
+            checkpoint.open(resume=resume)
+        except CheckpointError as ex:
+            logging.fatal("Unable to resume: %s" % ex)
+            for checkpoint in checkpoints:
+                checkpoint.close()
+            remove_tmp_dirs()
+            return 1
+        checkpoints.append(checkpoint)
+    if resume:
+        print("")
 
-    # Path to the output XLSX
-    if xlsx is None:
-        xlsx = "%s_results.xlsx" % name
-    xlsx = os.path.join(output_directory,xlsx)
+    # Set up the archives for the intersection files
+    if intersections_archive:
+        intersections_archives = [os.path.join(output_directory,
+                                               "%s_intersections.zip" % n)
+                                  for n in checkpoint_names]
+        for archive_file in intersections_archives:
+            if not resume and exists(archive_file):
+                os.remove(archive_file)
+    else:
+        intersections_archives = [None]*len(genes_files)
+
+    # Set up export of the overlapping genes
+    if export_genes:
+        gene_memberships = [GeneMembership(peaks,clusters,distances,
+                                           include_tads=bool(tads_file),
+                                           first_peak_set=first_peak_set,
+                                           n_peak_sets=n_peak_sets)
+                            for genes_file in genes_files]
+    else:
+        gene_memberships = [None]*len(genes_files)
+
+    # Set up the long-format TSV output
+    if tsv_out is not None:
+        if not hasattr(tsv_out,'write'):
+            tsv_out = abspath(tsv_out)
+            print("====TSV output====")
+            print("%s\n" % tsv_out)
+        # Only write the heatmap and XLSX file if requested
+        if heatmap is None:
+            heatmap = False
+        if xlsx is None:
+            xlsx = False
+
+    # Set up the progress and throughput metrics
+    if metrics_file:
+        metrics_file = abspath(metrics_file)
+        print("====Metrics file====")
+        print("%s\n" % metrics_file)
+    if metrics_interval is None:
+        metrics_interval = METRICS_INTERVAL
+    metrics = Metrics(name=checkpoint_name,
+                      metrics_file=metrics_file,
+                      interval=metrics_interval)
 
     # Run the enrichment calculations
     print("====Starting analysis====")
-    pvalues,counts,tads_pvalues,tads_counts = \
-            calculate_enrichments(genes_file,distances,peaks,clusters,
-                                  tads_file,
-                                  keep_intersection_files=
-                                  keep_intersection_files,
-                                  output_directory=output_directory,
-                                  bedtools_exe=bedtools_exe)
-
-    # Plot the heatmap
-    print("====Writing heatmap====")
-    print("%s\n" % heatmap)
-    make_heatmap(heatmap,peaks,clusters,distances,
-                 pvalues,counts,tads_pvalues=tads_pvalues,
-                 tads_counts=tads_counts,
-                 clusters_axis_label=clusters_axis_label,
-                 peaksets_axis_label=peaksets_axis_label,
-                 heatmap_cmap=heatmap_cmap,
-                 heatmap_format=heatmap_format)
-
-    # Write data to spreadsheet
-    print("====Writing XLSX file====")
-    print("%s\n" % xlsx)
-    make_xlsx_file(xlsx,peaks,clusters,distances,
-                   pvalues,counts,tads_pvalues=tads_pvalues,
-                   tads_counts=tads_counts)
-
-    # Dump the 'raw' numbers for checking/debugging
-    if dump_raw_data:
-        print("====Dumping raw data to TSV files====\n")
-        write_raw_data(name,peaks,clusters,distances,
-                       pvalues,counts,tads_pvalues=tads_pvalues,
-                       tads_counts=tads_counts,
-                       output_directory=output_directory)
+    try:
+        results = calculate_enrichments((genes_files
+                                         if multiple_references
+                                         else genes_files[0]),
+                                        distances,peaks,
+                                        clusters,tads_file,
+                                        keep_intersection_files=
+                                        keep_intersection_files,
+                                        output_directory=output_directory,
+                                        bedtools_exe=bedtools_exe,
+                                        profiler=profiler,
+                                        max_jobs=max_jobs,
+                                        sorted_inputs=sorted_inputs,
+                                        genome_file=genome_file,
+                                        checkpoint=(
+                                            checkpoints
+                                            if multiple_references
+                                            else checkpoints[0]),
+                                        peak_cache_dir=peak_cache_dir,
+                                        gene_membership=(
+                                            gene_memberships
+                                            if multiple_references
+                                            else gene_memberships[0]),
+                                        split_chromosomes=
+                                        split_chromosomes,
+                                        merge_peaks=merge_peaks,
+                                        metrics=metrics,
+                                        executor=executor,
+                                        intersections_archive=(
+                                            intersections_archives
+                                            if multiple_references
+                                            else intersections_archives[0]))
+    except BedtoolsError as ex:
+        metrics.set_stage("failed")
+        metrics.finish()
+        logging.fatal("Enrichment calculation failed: %s" % ex)
+        for checkpoint_file in checkpoint_files:
+            print("Completed results are saved in %s (use --resume to "
+                  "continue)" % checkpoint_file)
+        remove_tmp_dirs()
+        return 1
+    finally:
+        for checkpoint in checkpoints:
+            checkpoint.close()
+    if not multiple_references:
+        results = [results]
+
+    # Write the outputs for each reference
+    failed = []
+    for r,reference in enumerate(references):
+        if reference:
+            print("====Outputs for %s====\n" % reference)
+
+        # Write the overlapping genes
+        if gene_memberships[r] is not None:
+            genes_file = os.path.join(output_directory,
+                                      "%s_genes.npz" % checkpoint_names[r])
+            print("====Writing overlapping genes====")
+            print("%s\n" % genes_file)
+            with profiler.stage("gene_membership"):
+                gene_memberships[r].save(genes_file)
+
+        # Write the long-format TSV results
+        if tsv_out is not None:
+            with profiler.stage("tsv_out"):
+                if hasattr(tsv_out,'write'):
+                    # Results from all references go to the
+                    # same stream
+                    write_tsv_results(tsv_out,results[r],
+                                      reference=reference,
+                                      header=(r == 0))
+                    tsv_out.flush()
+                else:
+                    tsv_file = (reference_file_name(tsv_out,reference)
+                                if reference else tsv_out)
+                    print("====Writing TSV results====")
+                    print("%s\n" % tsv_file)
+                    with io.open(tsv_file,'wt') as fp:
+                        write_tsv_results(fp,results[r])
+
+        if shard:
+            # Write the partial results for this shard
+            results_file = os.path.join(output_directory,
+                                        "%s.npz" % checkpoint_names[r])
+            print("====Writing partial results====")
+            print("%s\n" % results_file)
+            results[r].first_peak_set = first_peak_set
+            results[r].n_peak_sets = n_peak_sets
+            results[r].save(results_file)
+            continue
+
+        if keep_results:
+            # Write the results
+            results_file = os.path.join(output_directory,
+                                        "%s_results.npz" % names[r])
+            print("====Writing results====")
+            print("%s\n" % results_file)
+            results[r].save(results_file)
+        # Write the heatmap, XLSX file etc
+        if reference:
+            ref_heatmap = heatmap
+            if isinstance(heatmap,(list,tuple)):
+                ref_heatmap = [reference_file_name(h,reference)
+                               for h in heatmap]
+            elif heatmap:
+                ref_heatmap = reference_file_name(heatmap,reference)
+            ref_xlsx = (reference_file_name(xlsx,reference) if xlsx
+                        else xlsx)
+            ref_html = (reference_file_name(html,reference) if html
+                        else html)
+        else:
+            ref_heatmap,ref_xlsx,ref_html = heatmap,xlsx,html
+        for output in make_outputs(names[r],results[r],
+                                   heatmap=ref_heatmap,
+                                   xlsx=ref_xlsx,
+                                   html=ref_html,
+                                   output_directory=output_directory,
+                                   clusters_axis_label=clusters_axis_label,
+                                   peaksets_axis_label=peaksets_axis_label,
+                                   heatmap_cmap=heatmap_cmap,
+                                   heatmap_format=heatmap_format,
+                                   heatmap_variants=heatmap_variants,
+                                   peak_sets_per_page=peak_sets_per_page,
+                                   clusters_per_page=clusters_per_page,
+                                   dump_raw_data=dump_raw_data,
+                                   profiler=profiler,
+                                   max_jobs=max_jobs,
+                                   metrics=metrics):
+            failed.append("%s (%s)" % (output,reference) if reference
+                          else output)
+    if failed:
+        # Keep the checkpoints so that the outputs can be
+        # regenerated using '--resume'
+        metrics.set_stage("failed")
+        metrics.finish()
+        logging.fatal("Failed to write outputs: %s" % ', '.join(failed))
+        remove_tmp_dirs()
+        return 1
+
+    # Outputs were written successfully so the checkpoints
+    # are no longer needed
+    for checkpoint in checkpoints:
+        checkpoint.remove()
+    metrics.set_stage("finished")
+    metrics.finish()
+
+    # Remove the temporary directories
+    remove_tmp_dirs()
+
+    # Report the profiling data
+    profiler.stop()
+    if profile:
+        print("====Profile====")
+        print("%s\n" % profiler.report())
+        profile_json = os.path.join(output_directory,
+                                    "%s_profile.json" % name)
+        print("Writing profile data to %s" % profile_json)
+        profiler.write_json(profile_json)
+        if profile_stage:
+            prof_file = os.path.join(output_directory,
+                                     "%s_%s.prof" % (name,profile_stage))
+            if profiler.dump_cprofile(prof_file):
+                print("Writing cProfile data for '%s' to %s" %
+                      (profile_stage,prof_file))
+            else:
+                logging.warning("No cProfile data collected for stage "
+                                "'%s'" % profile_stage)
+        print("")
+
+    # Report the memory usage
+    if track_memory:
+        print("====Memory usage====")
+        print("%s\n" % profiler.memory_report())
+        memory_json = os.path.join(output_directory,
+                                   "%s_memory.json" % name)
+        print("Writing memory usage data to %s\n" % memory_json)
+        profiler.write_memory_json(memory_json)
+
+def plan_main(genes_file,distances,peaks,clusters,tads_file,
+              max_jobs=1,sorted_inputs=False,genome_file=None,
+              peaks_group_column=None,shard=None,
+              split_chromosomes=False,peak_cache=False,
+              keep_intersection_files=False,html=None,
+              dump_raw_data=False,export_genes=False,
+              keep_results=False,max_cores=None,
+              intersections_archive=False):
+    """
+    Driver function for estimating the resources for a run
+
+    Scans the inputs (without calculating any enrichments)
+    and reports the estimated run time, peak memory usage,
+    temporary disk usage and output sizes for the run, along
+    with a recommended number of concurrent jobs (a separate
+    plan is reported for each gene reference, if there are
+    more than one).
+
+    Arguments:
+      genes_file (str): path to BED file with all genes (or a
+        list of BED files, one for each gene reference)
+      distances (list): list of distances to calculate enrichments at
+      peaks (list): list of BED files containing the ChIP-seq peaks
+      clusters (list): list of cluster files
+      tads_file (str): path to BED file with TADs
+      max_jobs (int): number of concurrent jobs to estimate for
+      sorted_inputs (bool): if True then estimate for sorted
+        inputs
+      genome_file (str): path to a genome file with chromosome
+        sizes (used to get the size of the genome)
+      peaks_group_column (int): if set then split the intervals
+        in the peaks files into separate peak sets using the
+        values in this column (numbered from 1)
+      shard (tuple): if set then should be a tuple '(i,n)' to
+        only estimate for shard 'i' of 'n'
+      split_chromosomes (bool): if True then estimate for
+        intersections split by chromosome
+      peak_cache (bool): if True then estimate for using the
+        peak cache
+      keep_intersection_files (bool): if True then include
+        the intersection files in the outputs
+      html (str): if set then include the HTML heatmap in the
+        outputs
+      dump_raw_data (bool): if True then include the raw data
+        files in the outputs
+      export_genes (bool): if True then include the overlapping
+        genes file in the outputs
+      keep_results (bool): if True then include the saved
+        results file in the outputs
+      max_cores (int): maximum number of cores to consider
+        when recommending the number of jobs (defaults to the
+        number of CPUs on this machine)
+      intersections_archive (bool): if True then include the
+        compressed intersections archive in the outputs
+
+    Returns 1 if the inputs couldn't be scanned.
+    """
+    print("====Scanning inputs====")
+    if isinstance(genes_file,(list,tuple)):
+        genes_files = list(genes_file)
+    else:
+        genes_files = [genes_file]
+    try:
+        # Genes
+        genes = []
+        for genes_file in genes_files:
+            genes.append(summarise_bed_file(genes_file))
+            print("Genes: %s" % basename(genes_file))
+        # Peak sets
+        if peaks_group_column:
+            peak_sets = summarise_peak_groups(peaks,peaks_group_column)
+        else:
+            peak_sets = [(basename(f),summarise_bed_file(
+                f,sample_size=SAMPLE_SIZE)) for f in peaks]
+        print("Peaks: %d peak sets" % len(peak_sets))
+        if shard:
+            first_peak_set,last_peak_set = get_shard(len(peak_sets),*shard)
+            peak_sets = peak_sets[first_peak_set:last_peak_set]
+            print("Shard %d of %d: %d peak sets" % (shard[0],shard[1],
+                                                    len(peak_sets)))
+        # Clusters
+        cluster_sizes = [count_cluster_genes(f) for f in clusters]
+        print("Clusters: %d clusters" % len(cluster_sizes))
+        # TADs
+        tads = None
+        if tads_file:
+            tads = summarise_bed_file(tads_file)
+            print("TADs: %s" % basename(tads_file))
+        # Genome size
+        genome_size = None
+        if genome_file:
+            genome_size = sum(read_genome_file(genome_file).values())
+    except Exception as ex:
+        logging.fatal("Failed to scan inputs: %s" % ex)
+        return 1
+    print("")
+
+    # Estimate the resources for each reference
+    for genes_file,summary in zip(genes_files,genes):
+        plan = RunPlan(summary,peak_sets,cluster_sizes,distances,
+                       tads=tads,
+                       genome_size=genome_size,
+                       sorted_inputs=sorted_inputs,
+                       split_chromosomes=split_chromosomes,
+                       peak_cache=peak_cache,
+                       keep_intersection_files=keep_intersection_files,
+                       intersections_archive=intersections_archive,
+                       html=(html is not None),
+                       dump_raw_data=dump_raw_data,
+                       export_genes=export_genes,
+                       keep_results=keep_results)
+        if len(genes_files) > 1:
+            print("====Plan for %s====" % basename(genes_file))
+        else:
+            print("====Plan====")
+        print("%s\n" % plan.report(max_jobs=max_jobs,max_cores=max_cores))
+    print("The estimates are approximate and assume typical throughputs "
+          "for 'bedtools'\nand PEGS on a single core; check them "
+          "against a run on a representative\nsubset of the data "
+          "(for example using --profile).")
+
+def merge_main(results_files,name,heatmap=None,xlsx=None,
+               html=None,output_directory=None,clusters_axis_label=None,
+               peaksets_axis_label=None,heatmap_cmap=None,
+               heatmap_format=None,heatmap_variants=None,
+               peak_sets_per_page=None,clusters_per_page=None,
+               dump_raw_data=False,max_jobs=1):
+    """
+    Driver function for combining partial results from shards
+
+    Arguments:
+      results_files (list): list of partial results files
+        written by 'pegs_main' for each shard
+      name (str): basename to use for output files
+      heatmap (str): path for output heatmap image file (or a
+        list of paths, to write multiple heatmaps)
+      xlsx (str): path for output XLSX file with raw data
+      html (str): if set then also write an interactive HTML
+        heatmap to this path (an empty string means use the
+        default 'NAME_heatmap.html')
+      output_directory (str): directory to write output files to
+        (defaults to current directory if not specified)
+      clusters_axis_label (str): custom label for the x-axis
+      peaksets_axis_label (str): custom label for the y-axis
+      heatmap_cmap (cmap): non-default colormap to use when creating
+        the heatmaps
+      heatmap_format (str): image format for output heatmaps (or
+        a list of formats, to write a heatmap in each format)
+      heatmap_variants (list): optional, list of '(variant,cmap)'
+        tuples; if supplied then a variant of each heatmap is
+        written using each colormap (overrides 'heatmap_cmap')
+      peak_sets_per_page (int): if set then split the heatmap
+        into pages with at most this many peak sets per page
+      clusters_per_page (int): if set then split the heatmap
+        into pages with at most this many clusters per page
+      dump_raw_data (bool): if True then save the raw enrichment data
+        to file (for debugging purposes)
+      max_jobs (int): maximum number of outputs (or heatmap pages)
+        to write concurrently
+
+    Returns 1 if the partial results couldn't be combined, or
+    if any of the outputs couldn't be written.
+    """
+    for f in results_files:
+        if not f.endswith(".npz"):
+            logging.fatal("%s: not a partial results file" % f)
+            return 1
+    return plot_main(results_files,name,
+                     heatmap=heatmap,
+                     xlsx=xlsx,
+                     html=html,
+                     output_directory=output_directory,
+                     clusters_axis_label=clusters_axis_label,
+                     peaksets_axis_label=peaksets_axis_label,
+                     heatmap_cmap=heatmap_cmap,
+                     heatmap_format=heatmap_format,
+                     heatmap_variants=heatmap_variants,
+                     peak_sets_per_page=peak_sets_per_page,
+                     clusters_per_page=clusters_per_page,
+                     dump_raw_data=dump_raw_data,
+                     max_jobs=max_jobs)
+
+def plot_main(results_files,name,heatmap=None,xlsx=None,
+               html=None,output_directory=None,clusters_axis_label=None,
+               peaksets_axis_label=None,heatmap_cmap=None,
+               heatmap_format=None,heatmap_variants=None,
+               peak_sets_per_page=None,clusters_per_page=None,
+               dump_raw_data=False,max_jobs=1,cluster_names=None):
+    """
+    Driver function for generating outputs from saved results
+
+    The results can either be one or more results files
+    written by 'pegs_main' (i.e. a complete results file from
+    the 'keep_results' option, or the partial results files
+    for each shard, which are combined), or the p-values TSV
+    file written using the 'dump_raw_data' option (in which
+    case the counts and TADs TSV files are located
+    automatically).
+
+    Arguments:
+      results_files (list): list of results files
+      name (str): basename to use for output files
+      heatmap (str): path for output heatmap image file (or a
+        list of paths, to write multiple heatmaps)
+      xlsx (str): path for output XLSX file with raw data
+      html (str): if set then also write an interactive HTML
+        heatmap to this path (an empty string means use the
+        default 'NAME_heatmap.html')
+      output_directory (str): directory to write output files to
+        (defaults to current directory if not specified)
+      clusters_axis_label (str): custom label for the x-axis
+      peaksets_axis_label (str): custom label for the y-axis
+      heatmap_cmap (cmap): non-default colormap to use when creating
+        the heatmaps
+      heatmap_format (str): image format for output heatmaps (or
+        a list of formats, to write a heatmap in each format)
+      heatmap_variants (list): optional, list of '(variant,cmap)'
+        tuples; if supplied then a variant of each heatmap is
+        written using each colormap (overrides 'heatmap_cmap')
+      peak_sets_per_page (int): if set then split the heatmap
+        into pages with at most this many peak sets per page
+      clusters_per_page (int): if set then split the heatmap
+        into pages with at most this many clusters per page
+      dump_raw_data (bool): if True then save the raw enrichment data
+        to file (for debugging purposes)
+      max_jobs (int): maximum number of outputs (or heatmap pages)
+        to write concurrently
+      cluster_names (list): optional, names of the clusters
+        (only used for results from TSV files, which don't
+        include the cluster names)
+
+    Returns 1 if the results couldn't be loaded, or if any of
+    the outputs couldn't be written.
+    """
+    # Report the results files
+    print("====Results files====")
+    if not results_files:
+        logging.fatal("No results files supplied")
+        return 1
+    for f in results_files:
+        print("%s" % f)
+    print("")
+
+    # Load the results
+    try:
+        if all([f.endswith(".npz") for f in results_files]):
+            results = merge_results(results_files)
+        elif len(results_files) == 1 and \
+             results_files[0].endswith("_pval.tsv"):
+            results = read_raw_data(*get_raw_data_files(results_files[0]),
+                                    clusters=cluster_names)
+        else:
+            raise ValueError("must be '.npz' results files, or a single "
+                             "'_pval.tsv' file")
+    except Exception as ex:
+        logging.fatal("Failed to load results: %s" % ex)
+        return 1
+    print("Loaded results for %d peak sets\n" % len(results['peaks']))
+
+    # Output directory
+    if output_directory is None:
+        output_directory = getcwd()
+    output_directory = abspath(output_directory)
+    if not exists(output_directory):
+        mkdir(output_directory)
+
+    # Write the heatmap, XLSX file etc
+    failed = make_outputs(name,
+                          EnrichmentResults.from_dict(results),
+                          heatmap=heatmap,
+                          xlsx=xlsx,
+                          html=html,
+                          output_directory=output_directory,
+                          clusters_axis_label=clusters_axis_label,
+                          peaksets_axis_label=peaksets_axis_label,
+                          heatmap_cmap=heatmap_cmap,
+                          heatmap_format=heatmap_format,
+                          heatmap_variants=heatmap_variants,
+                          peak_sets_per_page=peak_sets_per_page,
+                          clusters_per_page=clusters_per_page,
+                          dump_raw_data=dump_raw_data,
+                          max_jobs=max_jobs)
+    if failed:
+        logging.fatal("Failed to write outputs: %s" % ', '.join(failed))
+        return 1
+
+def get_raw_data_files(pval_file):
+    """
+    Locate the raw data TSV files from the p-values TSV file
+
+    Arguments:
+      pval_file (str): path to the 'NAME_pval.tsv' file
+
+    Returns:
+      Tuple: paths to the p-values, counts, TADs p-values and
+        TADs counts TSV files (the TADs files are None if
+        they don't exist).
+    """
+    prefix = pval_file[:-len("_pval.tsv")]
+    count_file = "%s_count.tsv" % prefix
+    tads_pval_file = "%s_tads_pval.tsv" % prefix
+    tads_count_file = "%s_tads_count.tsv" % prefix
+    if not (exists(tads_pval_file) and exists(tads_count_file)):
+        tads_pval_file = None
+        tads_count_file = None
+    return (pval_file,count_file,tads_pval_file,tads_count_file)
+
+def genes_main(membership_files,peak_sets=None,distances=None,
+               clusters=None,tads=False,fp=None):
+    """
+    Driver function for querying the exported overlapping genes
+
+    Writes tab-separated lines with the peak set, distance
+    (or 'TADs'), cluster and gene name for each of the genes
+    matching the query.
+
+    Arguments:
+      membership_files (list): list of gene membership files
+        written by 'pegs_main' (e.g. for each shard)
+      peak_sets (list): optional, only report these peak sets
+      distances (list): optional, only report these distances
+      clusters (list): optional, only report these clusters
+      tads (bool): if True then report the genes for the TADs
+        rather than for the distances
+      fp (file): optional, stream to write the output to
+        (defaults to stdout)
+
+    Returns 1 if the query couldn't be performed.
+    """
+    if fp is None:
+        fp = sys.stdout
+    # Load the gene membership data
+    memberships = []
+    for f in membership_files:
+        try:
+            memberships.append(GeneMembership.load(f))
+        except Exception as ex:
+            logging.fatal("Failed to load gene membership from '%s': %s"
+                          % (f,ex))
+            return 1
+        if tads and not memberships[-1].include_tads:
+            logging.fatal("%s: TADs not included in gene membership" % f)
+            return 1
+    memberships = sorted(memberships,key=lambda m: m.first_peak_set)
+    # Report the genes
+    fp.write(u"#Peak set\tDistance\tCluster\tGene\n")
+    for membership in memberships:
+        for line in membership.query(peak_sets=peak_sets,
+                                     distances=distances,
+                                     clusters=clusters,
+                                     tads=tads):
+            fp.write(u"%s\n" % '\t'.join([str(x) for x in line]))
+
+def extract_main(archive_file,peak_sets=None,distances=None,tads=False,
+                 output_dir=None,list_members=False,fp=None):
+    """
+    Driver function for extracting intersections from an archive
+
+    By default the intersections matching the query are
+    written to 'fp'; if 'output_dir' is set then each one is
+    extracted to a separate file in that directory instead.
+
+    Arguments:
+      archive_file (str): intersections archive written by
+        'pegs_main'
+      peak_sets (list): optional, only extract these peak sets
+        (with or without their file extensions)
+      distances (list): optional, only extract these distances
+      tads (bool): if True then extract the intersections for
+        the TADs rather than for the distances
+      output_dir (str): optional, directory to extract the
+        intersections to
+      list_members (bool): if True then only list the peak
+        set, distance, size and name of each matching member
+      fp (file): optional, stream to write the output to
+        (defaults to stdout)
+
+    Returns 1 if the intersections couldn't be extracted.
+    """
+    if fp is None:
+        fp = sys.stdout
+    # Open the archive
+    try:
+        archive = IntersectionArchive(archive_file)
+    except Exception as ex:
+        logging.fatal("Failed to open intersections archive '%s': %s" %
+                      (archive_file,ex))
+        return 1
+    with archive:
+        # Find the matching intersections
+        keys = []
+        for peak_set,distance in archive.keys():
+            if peak_sets and peak_set not in peak_sets and \
+               splitext(peak_set)[0] not in peak_sets:
+                continue
+            if tads:
+                if distance != ARCHIVE_TADS:
+                    continue
+            elif distances and distance not in distances:
+                continue
+            keys.append((peak_set,distance))
+        if not keys:
+            logging.fatal("No matching intersections in '%s'" %
+                          archive_file)
+            return 1
+        # List the intersections
+        if list_members:
+            fp.write(u"#Peak set\tDistance\tSize\tName\n")
+            for key in keys:
+                zinfo = archive.member(*key)
+                fp.write(u"%s\t%s\t%d\t%s\n" % (key[0],key[1],
+                                                zinfo.file_size,
+                                                zinfo.filename))
+            return
+        # Extract the intersections to files
+        if output_dir:
+            if not exists(output_dir):
+                os.makedirs(output_dir)
+            for key in keys:
+                fp.write(u"%s\n" % archive.extract(key[0],key[1],
+                                                   output_dir))
+            return
+        # Write the intersections to the output stream
+        out = getattr(fp,'buffer',None)
+        for key in keys:
+            with archive.open(*key) as fpp:
+                if out is not None:
+                    fp.flush()
+                    shutil.copyfileobj(fpp,out)
+                else:
+                    fp.write(fpp.read().decode())
+        if out is not None:
+            out.flush()
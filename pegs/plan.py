@@ -0,0 +1,633 @@
+#!/usr/bin/env python
+#
+#     plan.py: estimate the resources needed for a PEGS run
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import io
+import os
+from collections import OrderedDict
+from .metrics import format_duration
+from .profiling import format_bytes
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Number of lines to sample from each peak set when estimating the
+# sizes of the intervals
+SAMPLE_SIZE = 10000
+
+# Approximate throughputs for a single core (items per second);
+# these are deliberately conservative, so that the estimates err
+# on the side of over- rather than under-estimating
+BEDTOOLS_STARTUP_TIME = 0.02
+BEDTOOLS_INTERVALS_PER_SECOND = 1.0e6
+BEDTOOLS_OVERLAPS_PER_SECOND = 1.0e6
+PARSE_LINES_PER_SECOND = 5.0e5
+EXPAND_LINES_PER_SECOND = 2.5e5
+CACHED_EXPAND_LINES_PER_SECOND = 2.0e6
+SORT_LINES_PER_SECOND = 2.5e5
+SPLIT_LINES_PER_SECOND = 5.0e5
+HYPERGEOMETRIC_TESTS_PER_SECOND = 5.0e4
+OUTPUT_VALUES_PER_SECOND = 2.0e4
+OUTPUT_STARTUP_TIME = 2.0
+
+# Approximate memory usage (bytes)
+PYTHON_BASE_MEMORY = 200*1024*1024
+BEDTOOLS_BASE_MEMORY = 10*1024*1024
+BEDTOOLS_BYTES_PER_INTERVAL = 250
+GENE_INDEX_BYTES_PER_GENE = 200
+GENE_SET_BYTES_PER_GENE = 100
+RESULTS_BYTES_PER_VALUE = 24
+
+# Approximate output sizes (bytes)
+HEATMAP_BASE_SIZE = 40*1024
+HEATMAP_BYTES_PER_VALUE = 40
+XLSX_BASE_SIZE = 10*1024
+XLSX_BYTES_PER_VALUE = 12
+HTML_BASE_SIZE = 30*1024
+HTML_BYTES_PER_VALUE = 11
+TSV_BYTES_PER_VALUE = 12
+NPZ_BYTES_PER_VALUE = 12
+GENES_BYTES_PER_GENE = 4
+
+# Approximate size of compressed intersection data, as a fraction
+# of the uncompressed size
+ARCHIVE_COMPRESSION_RATIO = 0.25
+
+# Default genome size (mouse/human, bp) if it can't be determined
+DEFAULT_GENOME_SIZE = 3.0e9
+
+#######################################################################
+# Classes
+#######################################################################
+
+class BedFileSummary:
+    """
+    Summary of the intervals in a BED file
+
+    Stores the number of intervals, the size of the file
+    (in bytes), the mean width of the intervals (in bp), and
+    the largest end position seen on each chromosome.
+    """
+    __slots__ = ('n_intervals','n_bytes','mean_width','chroms',)
+    def __init__(self,n_intervals=0,n_bytes=0,mean_width=0.0,
+                 chroms=None):
+        self.n_intervals = n_intervals
+        self.n_bytes = n_bytes
+        self.mean_width = mean_width
+        if chroms is None:
+            chroms = OrderedDict()
+        self.chroms = chroms
+    @property
+    def bytes_per_interval(self):
+        """
+        Mean number of bytes for each interval in the file
+        """
+        if not self.n_intervals:
+            return 0.0
+        return float(self.n_bytes)/self.n_intervals
+
+class RunPlan:
+    """
+    Estimate the resources needed for a PEGS run
+
+    The estimates are based on the sizes of the inputs and
+    approximate throughputs for each stage of the analysis
+    (set by the constants in this module), and are intended
+    to help with sizing jobs submitted to a compute cluster
+    rather than as accurate predictions.
+
+    The cost of each intersection is modelled from the
+    number of genes and peaks, and the number of
+    overlaps expected if the peaks (expanded by the
+    distance) were spread uniformly over the genome. The
+    'bedtools' commands run concurrently (up to the number
+    of jobs), but the expansion of the peaks, the parsing of
+    the intersections and the statistics are done in the
+    main process, which limits how much running more jobs
+    can help.
+
+    Usage:
+
+    >>> plan = RunPlan(genes,peak_sets,cluster_sizes,distances)
+    >>> print(plan.report(max_jobs=4))
+    """
+    def __init__(self,genes,peak_sets,cluster_sizes,distances,
+                 tads=None,genome_size=None,sorted_inputs=False,
+                 split_chromosomes=False,peak_cache=False,
+                 keep_intersection_files=False,html=False,
+                 dump_raw_data=False,export_genes=False,
+                 keep_results=False,intersections_archive=False):
+        """
+        Arguments:
+          genes (BedFileSummary): summary of the gene intervals
+          peak_sets (list): list of '(name,summary)' tuples
+            with a BedFileSummary for each peak set
+          cluster_sizes (list): number of genes in each cluster
+          distances (list): distances to calculate enrichments at
+          tads (BedFileSummary): optional, summary of the TADs
+          genome_size (int): optional, total size of the genome
+            (in bp); estimated from the gene intervals if not
+            supplied
+          sorted_inputs (bool): if True then estimate for
+            position-sorted inputs
+          split_chromosomes (bool): if True then estimate for
+            intersections split by chromosome
+          peak_cache (bool): if True then estimate for expanding
+            the peaks from the binary peak cache
+          keep_intersection_files (bool): if True then include
+            the intersection files in the outputs
+          html (bool): if True then include the HTML heatmap in
+            the outputs
+          dump_raw_data (bool): if True then include the raw
+            data TSV files in the outputs
+          export_genes (bool): if True then include the
+            overlapping genes file in the outputs
+          keep_results (bool): if True then include the saved
+            results file in the outputs
+          intersections_archive (bool): if True then include
+            the compressed intersections archive in the outputs
+        """
+        self.genes = genes
+        self.peak_sets = list(peak_sets)
+        self.cluster_sizes = list(cluster_sizes)
+        self.distances = list(distances)
+        self.tads = tads
+        if not genome_size:
+            genome_size = sum(genes.chroms.values())
+        if not genome_size:
+            genome_size = DEFAULT_GENOME_SIZE
+        self.genome_size = float(genome_size)
+        self.sorted_inputs = bool(sorted_inputs)
+        self.split_chromosomes = bool(split_chromosomes)
+        self.peak_cache = bool(peak_cache)
+        self.keep_intersection_files = bool(keep_intersection_files)
+        self.html = bool(html)
+        self.dump_raw_data = bool(dump_raw_data)
+        self.export_genes = bool(export_genes)
+        self.keep_results = bool(keep_results)
+        self.intersections_archive = bool(intersections_archive)
+        self._intersections = None
+
+    @property
+    def n_cells(self):
+        """
+        Number of peak set and distance combinations (and TADs)
+        """
+        n_peak_sets = len(self.peak_sets)
+        return n_peak_sets*len(self.distances) + \
+            (n_peak_sets if self.tads else 0)
+
+    @property
+    def n_values(self):
+        """
+        Number of p-values (and counts) in the results
+        """
+        return self.n_cells*len(self.cluster_sizes)
+
+    @property
+    def n_chroms(self):
+        """
+        Number of chromosomes in the gene intervals
+        """
+        return max(1,len(self.genes.chroms))
+
+    def intersections(self):
+        """
+        Return the estimated cost of each intersection
+
+        Returns:
+          List: list of '(bedtools_time,python_time,
+            bedtools_memory,overlaps,disk)' tuples for each
+            'bedtools' command (times in seconds, memory and
+            disk usage in bytes).
+        """
+        if self._intersections is not None:
+            return self._intersections
+        intersections = []
+        n_genes = self.genes.n_intervals
+        gene_width = self.genes.mean_width
+        n_clusters = len(self.cluster_sizes)
+        n_parts = (self.n_chroms if self.split_chromosomes else 1)
+        def add(n_a,n_b,bytes_a,bytes_b,overlaps,python_time):
+            # Add the cost of an intersection (split into parts
+            # for each chromosome if required)
+            bedtools_time = (n_a + n_b)/BEDTOOLS_INTERVALS_PER_SECOND + \
+                            overlaps/BEDTOOLS_OVERLAPS_PER_SECOND
+            if self.sorted_inputs:
+                memory = BEDTOOLS_BASE_MEMORY
+            else:
+                memory = BEDTOOLS_BASE_MEMORY + \
+                         n_b*BEDTOOLS_BYTES_PER_INTERVAL/n_parts
+            disk = overlaps*(bytes_a + bytes_b)
+            python_time += overlaps/PARSE_LINES_PER_SECOND
+            for part in range(n_parts):
+                intersections.append((BEDTOOLS_STARTUP_TIME +
+                                       bedtools_time/n_parts,
+                                       python_time/n_parts,
+                                       memory,
+                                       overlaps/n_parts,
+                                       disk/n_parts))
+        for name,peaks in self.peak_sets:
+            n_peaks = peaks.n_intervals
+            for distance in self.distances:
+                # Overlaps if the peaks were spread uniformly
+                # over the genome
+                width = peaks.mean_width + 2*distance + gene_width
+                overlaps = n_genes*min(n_peaks,
+                                       n_peaks*width/self.genome_size)
+                python_time = n_clusters/HYPERGEOMETRIC_TESTS_PER_SECOND
+                if distance:
+                    # Expanding the peaks
+                    if self.peak_cache:
+                        rate = CACHED_EXPAND_LINES_PER_SECOND
+                    else:
+                        rate = EXPAND_LINES_PER_SECOND
+                    python_time += n_peaks/float(rate)
+                if self.split_chromosomes:
+                    python_time += n_peaks/SPLIT_LINES_PER_SECOND
+                add(n_genes,n_peaks,
+                    self.genes.bytes_per_interval,
+                    peaks.bytes_per_interval,
+                    overlaps,python_time)
+            if self.tads:
+                # Subset of TADs overlapping the peaks, then
+                # the genes in those TADs
+                n_tads = self.tads.n_intervals
+                width = peaks.mean_width + self.tads.mean_width
+                tads_overlaps = n_tads*min(n_peaks,
+                                           n_peaks*width/self.genome_size)
+                add(n_tads,n_peaks,
+                    self.tads.bytes_per_interval,
+                    peaks.bytes_per_interval,
+                    tads_overlaps,0.0)
+                width = self.tads.mean_width + gene_width
+                overlaps = n_genes*min(n_tads,
+                                       min(n_tads,tads_overlaps)*width/
+                                       self.genome_size)
+                add(n_genes,min(n_tads,tads_overlaps),
+                    self.genes.bytes_per_interval,
+                    self.tads.bytes_per_interval,
+                    overlaps,
+                    n_clusters/HYPERGEOMETRIC_TESTS_PER_SECOND)
+        self._intersections = intersections
+        return intersections
+
+    def setup_time(self):
+        """
+        Estimated time (in seconds) to prepare the inputs
+        """
+        n_genes = self.genes.n_intervals
+        t = 2.0*n_genes/PARSE_LINES_PER_SECOND
+        t += sum(self.cluster_sizes)/PARSE_LINES_PER_SECOND
+        if self.sorted_inputs:
+            n = n_genes + sum([p.n_intervals for _,p in self.peak_sets])
+            if self.tads:
+                n += self.tads.n_intervals
+            t += n/SORT_LINES_PER_SECOND
+        if self.split_chromosomes:
+            t += n_genes/SPLIT_LINES_PER_SECOND
+        return t
+
+    def output_time(self,max_jobs=1):
+        """
+        Estimated time (in seconds) to write the outputs
+        """
+        outputs = [OUTPUT_STARTUP_TIME +
+                   self.n_values/OUTPUT_VALUES_PER_SECOND
+                   for output in self.output_sizes()
+                   if output not in ("Intersection files",)]
+        if max_jobs > 1:
+            return max(outputs + [sum(outputs)/max_jobs])
+        return sum(outputs)
+
+    def runtime(self,max_jobs=1):
+        """
+        Estimate the run time for a number of jobs
+
+        Arguments:
+          max_jobs (int): number of concurrent jobs
+
+        Returns:
+          Tuple: estimated '(wall,cpu)' times (in seconds).
+        """
+        intersections = self.intersections()
+        bedtools_time = sum([x[0] for x in intersections])
+        python_time = sum([x[1] for x in intersections])
+        longest = max([x[0] for x in intersections] + [0.0])
+        # The bedtools commands run concurrently, alongside the
+        # work in the main process (which can't overlap with
+        # bedtools when only a single job is run)
+        wall = max((bedtools_time + python_time)/max_jobs,
+                   longest,python_time)
+        setup = self.setup_time()
+        wall += setup + self.output_time(max_jobs)
+        cpu = bedtools_time + python_time + setup + self.output_time()
+        return (wall,cpu)
+
+    def peak_memory(self,max_jobs=1):
+        """
+        Estimate the peak memory usage (in bytes)
+
+        Arguments:
+          max_jobs (int): number of concurrent jobs
+        """
+        intersections = self.intersections()
+        memory = PYTHON_BASE_MEMORY
+        memory += self.genes.n_intervals*GENE_INDEX_BYTES_PER_GENE
+        memory += self.n_values*RESULTS_BYTES_PER_VALUE
+        memory += min(self.genes.n_intervals,
+                      max([x[3] for x in intersections] + [0]))*\
+                  GENE_SET_BYTES_PER_GENE
+        # Largest concurrent bedtools processes
+        bedtools_memory = sorted([x[2] for x in intersections],
+                                 reverse=True)
+        memory += sum(bedtools_memory[:max_jobs])
+        return int(memory)
+
+    def temp_disk(self):
+        """
+        Estimate the temporary disk space needed (in bytes)
+
+        The expanded peaks and intersection files are kept in
+        the working directory until the end of the run.
+        """
+        disk = sum([x[4] for x in self.intersections()])
+        n_expanded = len([d for d in self.distances if d])
+        for name,peaks in self.peak_sets:
+            disk += peaks.n_bytes*n_expanded
+            if self.sorted_inputs:
+                disk += peaks.n_bytes
+            if self.split_chromosomes:
+                disk += peaks.n_bytes*len(self.distances)
+        if self.sorted_inputs:
+            disk += self.genes.n_bytes
+            if self.tads:
+                disk += self.tads.n_bytes
+        if self.split_chromosomes:
+            disk += self.genes.n_bytes
+        return int(disk)
+
+    def output_sizes(self):
+        """
+        Estimate the sizes of the outputs (in bytes)
+
+        Returns:
+          OrderedDict: estimated size of each output.
+        """
+        n_values = self.n_values
+        outputs = OrderedDict()
+        outputs["Heatmap"] = HEATMAP_BASE_SIZE + \
+                             n_values*HEATMAP_BYTES_PER_VALUE
+        if self.html:
+            outputs["HTML heatmap"] = HTML_BASE_SIZE + \
+                                      n_values*HTML_BYTES_PER_VALUE
+        outputs["XLSX file"] = XLSX_BASE_SIZE + \
+                               2*n_values*XLSX_BYTES_PER_VALUE
+        if self.dump_raw_data:
+            outputs["Raw data TSV files"] = 2*n_values*TSV_BYTES_PER_VALUE
+        if self.keep_results:
+            outputs["Saved results"] = n_values*NPZ_BYTES_PER_VALUE
+        if self.export_genes:
+            # Fraction of the genes in each cluster which are
+            # expected to overlap the peaks in each cell
+            fraction = sum([min(1.0,x[3]/max(1,self.genes.n_intervals))
+                            for x in self.intersections()])
+            n_parts = (self.n_chroms if self.split_chromosomes else 1)
+            outputs["Overlapping genes"] = int(
+                fraction/n_parts*sum(self.cluster_sizes)*
+                GENES_BYTES_PER_GENE)
+        if self.intersections_archive:
+            outputs["Intersections archive"] = int(
+                sum([x[4] for x in self.intersections()])*
+                ARCHIVE_COMPRESSION_RATIO)
+        elif self.keep_intersection_files:
+            outputs["Intersection files"] = \
+                sum([x[4] for x in self.intersections()])
+        return outputs
+
+    def recommend_jobs(self,max_cores=None,tolerance=0.1):
+        """
+        Recommend the number of concurrent jobs
+
+        Returns the smallest number of jobs for which the
+        estimated run time is within 'tolerance' of the
+        shortest run time possible using up to 'max_cores'
+        jobs, so that extra cores aren't requested when they
+        wouldn't make the run significantly faster.
+
+        Arguments:
+          max_cores (int): maximum number of cores available
+            (defaults to the number of CPUs on this machine)
+          tolerance (float): fractional increase in run time
+            which is acceptable
+        """
+        if max_cores is None:
+            max_cores = os.cpu_count() or 1
+        max_cores = max(1,min(max_cores,len(self.intersections())))
+        wall_times = [self.runtime(j)[0] for j in range(1,max_cores+1)]
+        shortest = min(wall_times)
+        for j,wall in enumerate(wall_times,start=1):
+            if wall <= shortest*(1.0 + tolerance):
+                return j
+        return max_cores
+
+    def report(self,max_jobs=1,max_cores=None):
+        """
+        Return a report of the estimates as a string
+
+        Arguments:
+          max_jobs (int): number of concurrent jobs to
+            estimate for
+          max_cores (int): maximum number of cores to consider
+            when recommending the number of jobs
+        """
+        lines = []
+        n_peaks = [p.n_intervals for _,p in self.peak_sets]
+        lines.append("Inputs:")
+        lines.append("  Genes:           %d intervals on %d chromosomes" %
+                     (self.genes.n_intervals,len(self.genes.chroms)))
+        if n_peaks:
+            lines.append("  Peak sets:       %d (%d to %d peaks, %d in "
+                         "total)" % (len(n_peaks),min(n_peaks),
+                                     max(n_peaks),sum(n_peaks)))
+        else:
+            lines.append("  Peak sets:       0")
+        lines.append("  Clusters:        %d (%d genes in total)" %
+                     (len(self.cluster_sizes),sum(self.cluster_sizes)))
+        lines.append("  Distances:       %d (%s)" %
+                     (len(self.distances),
+                      ','.join([str(d) for d in self.distances])))
+        if self.tads:
+            lines.append("  TADs:            %d" % self.tads.n_intervals)
+        else:
+            lines.append("  TADs:            not supplied")
+        lines.append("Work:")
+        lines.append("  Results:         %d cells x %d clusters" %
+                     (self.n_cells,len(self.cluster_sizes)))
+        lines.append("  bedtools runs:   %d" % len(self.intersections()))
+        lines.append("Estimates for %d job%s (%s):" %
+                     (max_jobs,('s' if max_jobs != 1 else ''),
+                      ("sorted inputs" if self.sorted_inputs
+                       else "unsorted inputs")))
+        wall,cpu = self.runtime(max_jobs)
+        lines.append("  Run time:        %s (CPU time %s)" %
+                     (format_duration(wall),format_duration(cpu)))
+        lines.append("  Peak memory:     %s" %
+                     format_bytes(self.peak_memory(max_jobs)))
+        lines.append("  Temporary disk:  %s" %
+                     format_bytes(self.temp_disk()))
+        outputs = self.output_sizes()
+        lines.append("  Outputs:         %s" %
+                     format_bytes(sum(outputs.values())))
+        for output in outputs:
+            lines.append("    %-15s%s" % ("%s:" % output,
+                                          format_bytes(outputs[output])))
+        recommended = self.recommend_jobs(max_cores=max_cores)
+        wall,cpu = self.runtime(recommended)
+        lines.append("Recommended:       --jobs %d (run time %s, "
+                     "peak memory %s)" %
+                     (recommended,format_duration(wall),
+                      format_bytes(self.peak_memory(recommended))))
+        return '\n'.join(lines)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def count_lines(f):
+    """
+    Count the number of lines in a file
+
+    Counts the newlines in blocks of the raw data, which is
+    much faster than iterating over the lines.
+
+    Arguments:
+      f (str): path to the file
+    """
+    n = 0
+    last = b'\n'
+    with io.open(f,'rb') as fp:
+        while True:
+            block = fp.read(1024*1024)
+            if not block:
+                break
+            n += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        # Final line has no newline
+        n += 1
+    return n
+
+def summarise_bed_file(bed_file,sample_size=None):
+    """
+    Summarise the intervals in a BED file
+
+    If 'sample_size' is set then only the first
+    'sample_size' intervals are read to estimate the mean
+    width and chromosomes, and the number of intervals is
+    estimated by counting the lines in the file (so any
+    header lines are also counted); otherwise the whole file
+    is read.
+
+    Blank lines, comments and 'track'/'browser' lines are
+    ignored.
+
+    Arguments:
+      bed_file (str): path to the BED file
+      sample_size (int): optional, number of intervals to
+        sample
+
+    Returns:
+      BedFileSummary: summary of the intervals.
+    """
+    n_intervals = 0
+    total_width = 0
+    chroms = OrderedDict()
+    with io.open(bed_file,'rt') as bed:
+        for line in bed:
+            if line.startswith(('#','track','browser')):
+                continue
+            fields = line.split()
+            if not fields:
+                continue
+            chrom = fields[0]
+            start = int(fields[1])
+            end = int(fields[2])
+            total_width += end - start
+            if end > chroms.get(chrom,0):
+                chroms[chrom] = end
+            n_intervals += 1
+            if sample_size and n_intervals >= sample_size:
+                break
+    mean_width = (float(total_width)/n_intervals if n_intervals else 0.0)
+    if sample_size and n_intervals >= sample_size:
+        n_intervals = count_lines(bed_file)
+    return BedFileSummary(n_intervals=n_intervals,
+                          n_bytes=os.path.getsize(bed_file),
+                          mean_width=mean_width,
+                          chroms=chroms)
+
+def summarise_peak_groups(peaks_files,group_column):
+    """
+    Summarise the peak sets defined by a group column
+
+    Reads all the intervals (as 'split_peaks_by_group'
+    would) to get the summary for each group.
+
+    Arguments:
+      peaks_files (list): list of BED files with peak data
+      group_column (int): number of the column (starting
+        from 1) with the group names
+
+    Returns:
+      List: sorted list of '(group,summary)' tuples with a
+        BedFileSummary for each group.
+    """
+    groups = dict()
+    for peaks_file in peaks_files:
+        with io.open(peaks_file,'rt') as peaks:
+            for lineno,line in enumerate(peaks,start=1):
+                if not line.strip() or \
+                   line.startswith(('#','track','browser')):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                try:
+                    group = fields[group_column-1]
+                except IndexError:
+                    raise ValueError("%s: line %d: no column %d" %
+                                     (peaks_file,lineno,group_column))
+                if group not in groups:
+                    groups[group] = BedFileSummary()
+                summary = groups[group]
+                start = int(fields[1])
+                end = int(fields[2])
+                summary.mean_width += end - start
+                summary.n_bytes += len(line)
+                summary.n_intervals += 1
+                if end > summary.chroms.get(fields[0],0):
+                    summary.chroms[fields[0]] = end
+    for summary in groups.values():
+        summary.mean_width = float(summary.mean_width)/summary.n_intervals
+    return sorted(groups.items())
+
+def count_cluster_genes(cluster_file):
+    """
+    Count the genes in a cluster file
+
+    Arguments:
+      cluster_file (str): path to the cluster file (gene
+        names in the first column)
+    """
+    n = 0
+    with io.open(cluster_file,'rt') as fp:
+        for line in fp:
+            if line.strip():
+                n += 1
+    return n
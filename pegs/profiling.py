@@ -0,0 +1,655 @@
+#!/usr/bin/env python
+#
+#     profiling.py: timing and memory instrumentation for PEGS
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import io
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    # Not available on all platforms
+    resource = None
+from collections import OrderedDict
+from . import get_version
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Stages which are instrumented (in the order that they are
+# reported)
+PROFILE_STAGES = (
+    "count_genes",
+    "read_stdin",
+    "split_peaks",
+    "sort_inputs",
+    "peak_set",
+    "merge_peaks",
+    "peak_cache",
+    "peak_expansion",
+    "split_chromosomes",
+    "bedtools_intersect",
+    "parse_intersection",
+    "load_clusters",
+    "hypergeometric",
+    "gene_membership",
+    "tads",
+    "tads_subset",
+    "heatmap",
+    "html",
+    "xlsx",
+    "raw_data",
+    "tsv_out",
+)
+
+# Stages where a 'tracemalloc' snapshot is taken when tracking
+# memory (coarse-grained stages only, as snapshots are expensive)
+MEMORY_SNAPSHOT_STAGES = (
+    "count_genes",
+    "split_peaks",
+    "sort_inputs",
+    "peak_set",
+    "tads",
+    "heatmap",
+    "html",
+    "xlsx",
+    "raw_data",
+)
+
+# Number of allocation sites to report from each snapshot
+MEMORY_SNAPSHOT_TOP_N = 10
+
+# Clock for the CPU time used by the calling thread (so that
+# tasks running concurrently in worker threads aren't charged
+# for each other's CPU time); falls back to the process-wide
+# clock where 'thread_time' isn't available (Python 3.6)
+_cpu_time = getattr(time,"thread_time",time.process_time)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def peak_rss():
+    """
+    Return the peak resident set size (RSS) of the process in bytes
+
+    Returns None if the peak RSS can't be determined on this
+    platform.
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # Reported in bytes on macOS
+        return maxrss
+    # Reported in kilobytes on Linux
+    return maxrss*1024
+
+def current_rss():
+    """
+    Return the current resident set size (RSS) of the process in bytes
+
+    Returns None if the current RSS can't be determined on
+    this platform.
+    """
+    try:
+        with io.open("/proc/self/statm",'rt') as fp:
+            return int(fp.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+def format_bytes(n):
+    """
+    Return human-readable version of a number of bytes
+    """
+    if n is None:
+        return "n/a"
+    for units in ("B","KiB","MiB","GiB"):
+        if abs(n) < 1024.0 or units == "GiB":
+            break
+        n = n/1024.0
+    if units == "B":
+        return "%d%s" % (n,units)
+    return "%.1f%s" % (n,units)
+
+def timed_call(func,*args,**kws):
+    """
+    Call a function and return the time taken
+
+    Used to time tasks and outputs which are run in a
+    separate thread or process (so that the timings can
+    be added to the profiler in the main process).
+
+    The CPU time is for the thread which runs the
+    function, and doesn't include any time spent in
+    child processes (e.g. 'bedtools').
+
+    Arguments:
+      func (function): function to call
+      args (list): positional arguments for the function
+      kws (mapping): keyword arguments for the function
+
+    Returns:
+      Tuple: tuple '(result,wall,cpu)' with the value
+        returned by the function, and the elapsed wall and
+        CPU times (in seconds).
+    """
+    wall = time.perf_counter()
+    cpu = _cpu_time()
+    result = func(*args,**kws)
+    return (result,
+            time.perf_counter() - wall,
+            _cpu_time() - cpu)
+
+#######################################################################
+# Classes
+#######################################################################
+
+class StageTiming:
+    """
+    Accumulated timings for a single stage
+
+    Stores the total wall and CPU times (in seconds) and
+    the number of times that the stage was entered.
+    """
+    __slots__ = ('calls','wall','cpu',)
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+    def add(self,wall,cpu):
+        """
+        Add timings for a call to the stage
+        """
+        self.calls += 1
+        self.wall += wall
+        self.cpu += cpu
+    def as_dict(self):
+        """
+        Return the timings as a dictionary
+        """
+        return OrderedDict((('calls',self.calls),
+                            ('wall',self.wall),
+                            ('cpu',self.cpu)))
+
+class StageMemory:
+    """
+    Memory usage for a single stage
+
+    Stores the number of times the stage was entered, the
+    maximum process peak RSS seen at the end of the stage,
+    the largest increase in peak RSS over a single call, and
+    the largest peak of memory allocated by Python (as
+    reported by 'tracemalloc') within a single call (all
+    in bytes). Optionally also stores the largest allocation
+    sites from a 'tracemalloc' snapshot taken at the end of
+    the most recent call.
+    """
+    __slots__ = ('calls','rss_peak','rss_increase','traced_peak',
+                 'top_allocations',)
+    def __init__(self):
+        self.calls = 0
+        self.rss_peak = None
+        self.rss_increase = None
+        self.traced_peak = None
+        self.top_allocations = None
+    def add(self,rss_peak,rss_increase,traced_peak):
+        """
+        Add memory usage for a call to the stage
+        """
+        self.calls += 1
+        self.rss_peak = _max(self.rss_peak,rss_peak)
+        self.rss_increase = _max(self.rss_increase,rss_increase)
+        self.traced_peak = _max(self.traced_peak,traced_peak)
+    def as_dict(self):
+        """
+        Return the memory usage as a dictionary
+        """
+        d = OrderedDict((('calls',self.calls),
+                         ('rss_peak',self.rss_peak),
+                         ('rss_increase',self.rss_increase),
+                         ('traced_peak',self.traced_peak)))
+        if self.top_allocations is not None:
+            d['top_allocations'] = self.top_allocations
+        return d
+
+def _max(x,y):
+    # Internal: maximum of two values, either of which
+    # may be None
+    if x is None:
+        return y
+    if y is None:
+        return x
+    return max(x,y)
+
+class _StageTimer:
+    """
+    Context manager which times a single call to a stage
+    """
+    def __init__(self,profiler,name,peak_set):
+        self._profiler = profiler
+        self._name = name
+        self._peak_set = peak_set
+    def __enter__(self):
+        self._profiler._start_cprofile(self._name)
+        if self._profiler.track_memory:
+            self._profiler._start_memory()
+        self._wall = time.perf_counter()
+        self._cpu = _cpu_time()
+        return self
+    def __exit__(self,exc_type,exc_value,traceback):
+        wall = time.perf_counter() - self._wall
+        cpu = _cpu_time() - self._cpu
+        if self._profiler.track_memory:
+            self._profiler._stop_memory(self._name,self._peak_set)
+        self._profiler._stop_cprofile(self._name)
+        self._profiler.add(self._name,wall,cpu,peak_set=self._peak_set)
+        return False
+
+class _NullTimer:
+    """
+    Context manager which does nothing (used when profiling
+    is disabled)
+    """
+    def __enter__(self):
+        return self
+    def __exit__(self,exc_type,exc_value,traceback):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class Profiler:
+    """
+    Record wall and CPU time spent in stages of a PEGS run
+
+    Usage:
+
+    >>> profiler = Profiler()
+    >>> with profiler.stage("heatmap"):
+    ...     make_heatmap(...)
+    >>> profiler.report()
+
+    Timings are accumulated both for each stage overall and
+    (where a peak set is specified) for each stage within
+    each peak set.
+
+    If 'cprofile_stage' is specified then all calls to that
+    stage are also run under 'cProfile', and the resulting
+    data can be written to file using 'dump_cprofile'. Stages
+    which aren't run within 'stage' can be profiled using
+    'cprofile_call', and the data collected by another
+    profiler can be added using 'add_cprofile'.
+
+    If 'track_memory' is set then the process peak RSS and
+    the peak memory allocated by Python (using 'tracemalloc')
+    are also recorded for each stage; note that 'tracemalloc'
+    adds a significant overhead to the run time. Memory
+    usage can also be recorded for stages which aren't run
+    within 'stage' (e.g. tasks run by an executor) using
+    'add_memory'.
+
+    If the profiler is not enabled then calls to 'stage'
+    return a context manager which does nothing.
+    """
+    def __init__(self,enabled=True,cprofile_stage=None,
+                 track_memory=False):
+        """
+        Arguments:
+          enabled (bool): if False then don't record any
+            timing information
+          cprofile_stage (str): optional, name of a stage to
+            collect 'cProfile' data for
+          track_memory (bool): if True then also record the
+            memory usage for each stage
+        """
+        self.enabled = enabled
+        self.cprofile_stage = cprofile_stage
+        self.track_memory = (enabled and track_memory)
+        self.stages = OrderedDict()
+        self.peak_sets = OrderedDict()
+        self.memory = OrderedDict()
+        self.peak_sets_memory = OrderedDict()
+        self._start = time.perf_counter()
+        self._cprofile = None
+        self._cprofile_depth = 0
+        self._cprofile_data = []
+        self._memory_stack = []
+        self._rss_start = None
+        self._rss_mark = None
+        if self.track_memory:
+            self._rss_start = peak_rss()
+            self._rss_mark = self._rss_start
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def stage(self,name,peak_set=None):
+        """
+        Return a context manager to time a call to a stage
+
+        Arguments:
+          name (str): name of the stage
+          peak_set (str): optional, name of the peak set that
+            the call is associated with
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self,name,peak_set)
+
+    def add(self,name,wall,cpu,peak_set=None):
+        """
+        Add timings for a call to a stage
+
+        Arguments:
+          name (str): name of the stage
+          wall (float): elapsed wall time (seconds)
+          cpu (float): elapsed CPU time (seconds)
+          peak_set (str): optional, name of the peak set that
+            the call is associated with
+        """
+        if not self.enabled:
+            return
+        if name not in self.stages:
+            self.stages[name] = StageTiming()
+        self.stages[name].add(wall,cpu)
+        if peak_set is not None:
+            if peak_set not in self.peak_sets:
+                self.peak_sets[peak_set] = OrderedDict()
+            stages = self.peak_sets[peak_set]
+            if name not in stages:
+                stages[name] = StageTiming()
+            stages[name].add(wall,cpu)
+
+    def cprofile_call(self,name,func,*args,**kws):
+        """
+        Call a function, collecting 'cProfile' data if required
+
+        Used for stages which aren't run within 'stage' (for
+        example, tasks run by an executor in the calling
+        thread): the function is run under 'cProfile' if the
+        stage is the profiled stage. The time taken isn't
+        recorded.
+
+        Arguments:
+          name (str): name of the stage
+          func (function): function to call
+          args (list): positional arguments for the function
+          kws (mapping): keyword arguments for the function
+
+        Returns:
+          Object: the value returned by the function.
+        """
+        self._start_cprofile(name)
+        try:
+            return func(*args,**kws)
+        finally:
+            self._stop_cprofile(name)
+
+    def add_cprofile(self,profiler):
+        """
+        Add the 'cProfile' data collected by another profiler
+
+        Used to combine the data from profilers which were
+        run within tasks (the tasks must have been run in the
+        current process).
+
+        Arguments:
+          profiler (Profiler): the other profiler
+        """
+        if profiler._cprofile is not None:
+            self._cprofile_data.append(profiler._cprofile)
+
+    def add_memory(self,name,peak_set=None):
+        """
+        Record the memory usage at the end of a stage
+
+        Used for stages which aren't run within 'stage' (for
+        example, tasks which are run concurrently by an
+        executor). The increase in peak RSS and the peak
+        Python memory are measured since the previous call
+        to 'add_memory' (or the start of the profiler), and
+        only include memory used by the current process.
+
+        Arguments:
+          name (str): name of the stage
+          peak_set (str): optional, name of the peak set that
+            the stage is associated with
+        """
+        if not self.track_memory:
+            return
+        rss = peak_rss()
+        rss_increase = None
+        if rss is not None and self._rss_mark is not None:
+            rss_increase = rss - self._rss_mark
+        self._rss_mark = rss
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        if self._memory_stack:
+            self._memory_stack[-1][1] = _max(self._memory_stack[-1][1],
+                                             traced_peak)
+        if hasattr(tracemalloc,"reset_peak"):
+            tracemalloc.reset_peak()
+        self._record_memory(name,peak_set,rss,rss_increase,traced_peak)
+
+    @property
+    def elapsed(self):
+        """
+        Wall time (in seconds) since the profiler was created
+        """
+        return time.perf_counter() - self._start
+
+    def ordered_stages(self):
+        """
+        Return list of stage names in reporting order
+        """
+        stages = [s for s in PROFILE_STAGES if s in self.stages]
+        stages.extend([s for s in self.stages if s not in stages])
+        return stages
+
+    def report(self):
+        """
+        Return a summary table of the timings as a string
+        """
+        total = self.elapsed
+        lines = ["%-20s %8s %12s %12s %7s" % ("Stage","Calls",
+                                              "Wall (s)","CPU (s)",
+                                              "%Wall")]
+        lines.append("-"*len(lines[0]))
+        for name in self.ordered_stages():
+            t = self.stages[name]
+            lines.append("%-20s %8d %12.3f %12.3f %6.1f%%" %
+                         (name,t.calls,t.wall,t.cpu,
+                          (100.0*t.wall/total if total > 0.0 else 0.0)))
+        lines.append("-"*len(lines[0]))
+        lines.append("%-20s %8s %12.3f" % ("Total","",total))
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        """
+        Return the profile data as a dictionary
+        """
+        return OrderedDict((
+            ('pegs_version',get_version()),
+            ('total_wall',self.elapsed),
+            ('stages',OrderedDict(
+                [(name,self.stages[name].as_dict())
+                 for name in self.ordered_stages()])),
+            ('peak_sets',OrderedDict(
+                [(peak_set,OrderedDict(
+                    [(name,stages[name].as_dict()) for name in stages]))
+                 for peak_set,stages in self.peak_sets.items()])),
+        ))
+
+    def write_json(self,json_file):
+        """
+        Write the profile data to a JSON file
+
+        Arguments:
+          json_file (str): path to output JSON file
+        """
+        with io.open(json_file,'wt') as fp:
+            fp.write(json.dumps(self.as_dict(),indent=2))
+        return json_file
+
+    def memory_report(self):
+        """
+        Return a summary table of the memory usage as a string
+        """
+        lines = ["%-20s %8s %12s %12s %12s" % ("Stage","Calls",
+                                               "Peak RSS",
+                                               "RSS increase",
+                                               "Python peak")]
+        lines.append("-"*len(lines[0]))
+        for name in self.ordered_stages():
+            if name not in self.memory:
+                continue
+            m = self.memory[name]
+            lines.append("%-20s %8d %12s %12s %12s" %
+                         (name,m.calls,
+                          format_bytes(m.rss_peak),
+                          format_bytes(m.rss_increase),
+                          format_bytes(m.traced_peak)))
+        lines.append("-"*len(lines[0]))
+        lines.append("%-20s %8s %12s" % ("Overall","",
+                                         format_bytes(peak_rss())))
+        return '\n'.join(lines)
+
+    def memory_as_dict(self):
+        """
+        Return the memory usage data as a dictionary
+        """
+        return OrderedDict((
+            ('pegs_version',get_version()),
+            ('rss_peak',peak_rss()),
+            ('rss_at_start',self._rss_start),
+            ('rss_current',current_rss()),
+            ('stages',OrderedDict(
+                [(name,self.memory[name].as_dict())
+                 for name in self.ordered_stages()
+                 if name in self.memory])),
+            ('peak_sets',OrderedDict(
+                [(peak_set,OrderedDict(
+                    [(name,stages[name].as_dict()) for name in stages]))
+                 for peak_set,stages in self.peak_sets_memory.items()])),
+        ))
+
+    def write_memory_json(self,json_file):
+        """
+        Write the memory usage data to a JSON file
+
+        Arguments:
+          json_file (str): path to output JSON file
+        """
+        with io.open(json_file,'wt') as fp:
+            fp.write(json.dumps(self.memory_as_dict(),indent=2))
+        return json_file
+
+    def stop(self):
+        """
+        Stop any memory tracing started by the profiler
+        """
+        if self.track_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def dump_cprofile(self,prof_file):
+        """
+        Write the 'cProfile' data for the profiled stage to file
+
+        The output file can be examined using the 'pstats'
+        module (or a tool such as 'snakeviz').
+
+        Arguments:
+          prof_file (str): path to output file
+
+        Returns:
+          String: path to the output file, or None if no
+            'cProfile' data was collected.
+        """
+        data = list(self._cprofile_data)
+        if self._cprofile is not None:
+            data.insert(0,self._cprofile)
+        if not data:
+            return None
+        pstats.Stats(*data).dump_stats(prof_file)
+        return prof_file
+
+    def _start_cprofile(self,name):
+        # Internal: start collecting cProfile data if this
+        # is the profiled stage
+        if name != self.cprofile_stage:
+            return
+        if self._cprofile is None:
+            self._cprofile = cProfile.Profile()
+        if self._cprofile_depth == 0:
+            self._cprofile.enable()
+        self._cprofile_depth += 1
+
+    def _stop_cprofile(self,name):
+        # Internal: stop collecting cProfile data at the end
+        # of the profiled stage
+        if name != self.cprofile_stage:
+            return
+        self._cprofile_depth -= 1
+        if self._cprofile_depth == 0:
+            self._cprofile.disable()
+
+    def _start_memory(self):
+        # Internal: start tracking memory for a stage
+        # The peak traced memory is reset for each stage (where
+        # supported), so the peak so far is passed up to the
+        # enclosing stage first
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        if self._memory_stack:
+            self._memory_stack[-1][1] = _max(self._memory_stack[-1][1],
+                                             traced_peak)
+        if hasattr(tracemalloc,"reset_peak"):
+            tracemalloc.reset_peak()
+        self._memory_stack.append([peak_rss(),None])
+
+    def _stop_memory(self,name,peak_set):
+        # Internal: finish tracking memory for a stage
+        rss_start,traced_peak = self._memory_stack.pop()
+        traced_peak = _max(traced_peak,tracemalloc.get_traced_memory()[1])
+        if self._memory_stack:
+            self._memory_stack[-1][1] = _max(self._memory_stack[-1][1],
+                                             traced_peak)
+        rss = peak_rss()
+        rss_increase = None
+        if rss is not None and rss_start is not None:
+            rss_increase = rss - rss_start
+        self._record_memory(name,peak_set,rss,rss_increase,traced_peak)
+
+    def _record_memory(self,name,peak_set,rss,rss_increase,traced_peak):
+        # Internal: record the memory usage for a call to a stage
+        if name not in self.memory:
+            self.memory[name] = StageMemory()
+        self.memory[name].add(rss,rss_increase,traced_peak)
+        if name in MEMORY_SNAPSHOT_STAGES:
+            # Record the largest allocations still held at the
+            # end of the stage
+            stats = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False,tracemalloc.__file__),)
+            ).statistics('lineno')[:MEMORY_SNAPSHOT_TOP_N]
+            self.memory[name].top_allocations = [
+                OrderedDict((('location',"%s:%s" % (st.traceback[0].filename,
+                                                    st.traceback[0].lineno)),
+                             ('size',st.size),
+                             ('count',st.count)))
+                for st in stats]
+        if peak_set is not None:
+            if peak_set not in self.peak_sets_memory:
+                self.peak_sets_memory[peak_set] = OrderedDict()
+            stages = self.peak_sets_memory[peak_set]
+            if name not in stages:
+                stages[name] = StageMemory()
+            stages[name].add(rss,rss_increase,traced_peak)
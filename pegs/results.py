@@ -0,0 +1,711 @@
+#!/usr/bin/env python
+#
+#     results.py: saving and loading enrichment results
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import io
+import numpy as np
+from os.path import basename
+from os.path import splitext
+from .membership import select_names
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Version of the results file format
+RESULTS_FORMAT_VERSION = 1
+
+#######################################################################
+# Classes
+#######################################################################
+
+class EnrichmentResults:
+    """
+    Enrichment results for peak sets, distances and clusters
+
+    Holds the p-values and gene counts for each "cell" of the
+    analysis (i.e. each combination of peak set 'i', distance
+    'j' and cluster 'k', plus each peak set and cluster for
+    the TADs), along with the denominators used in the
+    hypergeometric test: the total number of genes, the number
+    of genes in each cluster, and the number of genes which
+    overlap each peak set at each distance (or for the TADs).
+
+    The gene counts are stored as unsigned 32-bit integers;
+    the p-values are stored as 64-bit floats, as they are
+    reported at full precision in the outputs. The number of
+    overlapping genes is -1 for cells where it isn't known
+    (for example, results restored from an older checkpoint).
+
+    The results can be unpacked as a tuple of arrays:
+
+    >>> pvalues,counts,tads_pvalues,tads_counts = results
+
+    (the TADs arrays are None if the TADs aren't included).
+    """
+    __slots__ = ('peaks',
+                 'clusters',
+                 'distances',
+                 'pvalues',
+                 'counts',
+                 'n_overlapping',
+                 'tads_pvalues',
+                 'tads_counts',
+                 'tads_n_overlapping',
+                 'cluster_sizes',
+                 'n_genes',
+                 'first_peak_set',
+                 'n_peak_sets',)
+
+    def __init__(self,peaks,clusters,distances,include_tads=False,
+                 cluster_sizes=None,n_genes=None,first_peak_set=0,
+                 n_peak_sets=None):
+        """
+        Arguments:
+          peaks (list): BED files (or names) for the peak sets
+          clusters (list): cluster files (or names)
+          distances (list): distances the enrichments were
+            calculated at
+          include_tads (bool): if True then the results also
+            include the TADs
+          cluster_sizes (iterable): optional, number of genes
+            in each cluster
+          n_genes (int): optional, total number of genes
+          first_peak_set (int): index of the first peak set in
+            the complete analysis (default: 0)
+          n_peak_sets (int): total number of peak sets in the
+            complete analysis (default: number of peaks)
+        """
+        self.peaks = list(peaks)
+        self.clusters = list(clusters)
+        self.distances = [int(d) for d in distances]
+        n_peaks = len(self.peaks)
+        n_distances = len(self.distances)
+        n_clusters = len(self.clusters)
+        self.pvalues = np.zeros([n_peaks,n_distances,n_clusters],
+                                dtype=np.float64)
+        self.counts = np.zeros([n_peaks,n_distances,n_clusters],
+                               dtype=np.uint32)
+        self.n_overlapping = np.full([n_peaks,n_distances],-1,
+                                     dtype=np.int32)
+        if include_tads:
+            self.tads_pvalues = np.zeros([n_peaks,n_clusters],
+                                         dtype=np.float64)
+            self.tads_counts = np.zeros([n_peaks,n_clusters],
+                                        dtype=np.uint32)
+            self.tads_n_overlapping = np.full(n_peaks,-1,dtype=np.int32)
+        else:
+            self.tads_pvalues = None
+            self.tads_counts = None
+            self.tads_n_overlapping = None
+        if cluster_sizes is not None:
+            cluster_sizes = np.array(cluster_sizes,dtype=np.uint32)
+        self.cluster_sizes = cluster_sizes
+        self.n_genes = n_genes
+        self.first_peak_set = int(first_peak_set)
+        if n_peak_sets is None:
+            n_peak_sets = n_peaks
+        self.n_peak_sets = int(n_peak_sets)
+
+    def __iter__(self):
+        return iter((self.pvalues,
+                     self.counts,
+                     self.tads_pvalues,
+                     self.tads_counts))
+
+    @property
+    def include_tads(self):
+        """
+        True if the results include the TADs
+        """
+        return (self.tads_pvalues is not None)
+
+    @property
+    def peak_set_names(self):
+        """
+        Names of the peak sets (without leading directories
+        or file extensions)
+        """
+        return [splitext(basename(f))[0] for f in self.peaks]
+
+    @property
+    def cluster_names(self):
+        """
+        Names of the clusters (without leading directories
+        or file extensions)
+        """
+        return [splitext(basename(f))[0] for f in self.clusters]
+
+    @property
+    def nbytes(self):
+        """
+        Total size (in bytes) of the result arrays
+        """
+        return sum([getattr(self,name).nbytes
+                    for name in ('pvalues','counts','n_overlapping',
+                                 'tads_pvalues','tads_counts',
+                                 'tads_n_overlapping','cluster_sizes')
+                    if getattr(self,name) is not None])
+
+    def set(self,cell,pvalues,counts,n_overlapping=None):
+        """
+        Store the results for a cell
+
+        Arguments:
+          cell (tuple): either '("peaks",i,j)' for peak set
+            'i' and distance 'j', or '("tads",i)' for the TADs
+            for peak set 'i'
+          pvalues (iterable): p-values for each cluster
+          counts (iterable): gene counts for each cluster
+          n_overlapping (int): optional, number of genes
+            overlapping the peak set
+        """
+        if n_overlapping is None:
+            n_overlapping = -1
+        if cell[0] == "peaks":
+            i,j = cell[1:]
+            self.pvalues[i,j,:] = pvalues
+            self.counts[i,j,:] = counts
+            self.n_overlapping[i,j] = n_overlapping
+        elif cell[0] == "tads":
+            i = cell[1]
+            self.tads_pvalues[i,:] = pvalues
+            self.tads_counts[i,:] = counts
+            self.tads_n_overlapping[i] = n_overlapping
+        else:
+            raise KeyError("%s: unrecognised cell" % (cell,))
+
+    def select(self,peak_sets=None,clusters=None):
+        """
+        Return a subset of the results
+
+        Peak sets and clusters can be selected either by a
+        slice, a list of indices, or a list of names (either
+        the file names, or with the file extension removed).
+
+        Arguments:
+          peak_sets (object): optional, the peak sets to
+            select (default: all peak sets)
+          clusters (object): optional, the clusters to select
+            (default: all clusters)
+
+        Returns:
+          EnrichmentResults: new instance with the selected
+            results.
+        """
+        peaks_index = get_selection(self.peaks,peak_sets)
+        clusters_index = get_selection(self.clusters,clusters)
+        peaks = np.array(self.peaks,dtype=object)[peaks_index]
+        clusters = np.array(self.clusters,dtype=object)[clusters_index]
+        cluster_sizes = self.cluster_sizes
+        if cluster_sizes is not None:
+            cluster_sizes = cluster_sizes[clusters_index]
+        results = EnrichmentResults(peaks,clusters,self.distances,
+                                    include_tads=self.include_tads,
+                                    cluster_sizes=cluster_sizes,
+                                    n_genes=self.n_genes)
+        results.pvalues[...] = self.pvalues[peaks_index][:,:,clusters_index]
+        results.counts[...] = self.counts[peaks_index][:,:,clusters_index]
+        results.n_overlapping[...] = self.n_overlapping[peaks_index]
+        if self.include_tads:
+            results.tads_pvalues[...] = \
+                self.tads_pvalues[peaks_index][:,clusters_index]
+            results.tads_counts[...] = \
+                self.tads_counts[peaks_index][:,clusters_index]
+            results.tads_n_overlapping[...] = \
+                self.tads_n_overlapping[peaks_index]
+        return results
+
+    def as_dict(self):
+        """
+        Return the results as a dictionary
+
+        Returns:
+          Dictionary: the results, in the same format as
+            returned by 'load_results'.
+        """
+        return dict(peaks=[basename(f) for f in self.peaks],
+                    clusters=[basename(f) for f in self.clusters],
+                    distances=list(self.distances),
+                    pvalues=self.pvalues,
+                    counts=self.counts,
+                    n_overlapping=self.n_overlapping,
+                    tads_pvalues=self.tads_pvalues,
+                    tads_counts=self.tads_counts,
+                    tads_n_overlapping=self.tads_n_overlapping,
+                    cluster_sizes=self.cluster_sizes,
+                    n_genes=self.n_genes,
+                    first_peak_set=self.first_peak_set,
+                    n_peak_sets=self.n_peak_sets)
+
+    @classmethod
+    def from_dict(cls,results):
+        """
+        Create a new instance from a dictionary of results
+
+        Arguments:
+          results (dict): results in the format returned by
+            'load_results' (or 'merge_results' and
+            'read_raw_data')
+
+        Returns:
+          EnrichmentResults: new instance with the results.
+        """
+        enrichments = cls.from_arrays(results['peaks'],
+                                      results['clusters'],
+                                      results['distances'],
+                                      results['pvalues'],
+                                      results['counts'],
+                                      tads_pvalues=results['tads_pvalues'],
+                                      tads_counts=results['tads_counts'],
+                                      cluster_sizes=
+                                      results.get('cluster_sizes'),
+                                      n_genes=results.get('n_genes'),
+                                      first_peak_set=
+                                      results['first_peak_set'],
+                                      n_peak_sets=results['n_peak_sets'])
+        if results.get('n_overlapping') is not None:
+            enrichments.n_overlapping[...] = results['n_overlapping']
+        if enrichments.include_tads and \
+           results.get('tads_n_overlapping') is not None:
+            enrichments.tads_n_overlapping[...] = \
+                results['tads_n_overlapping']
+        return enrichments
+
+    @classmethod
+    def from_arrays(cls,peaks,clusters,distances,pvalues,counts,
+                    tads_pvalues=None,tads_counts=None,**kws):
+        """
+        Create a new instance from arrays of p-values and counts
+
+        Arguments:
+          peaks (list): BED files (or names) for the peak sets
+          clusters (list): cluster files (or names)
+          distances (list): distances the enrichments were
+            calculated at
+          pvalues (numpy.array): p-values for each peak set,
+            distance and cluster
+          counts (numpy.array): gene counts for each peak set,
+            distance and cluster
+          tads_pvalues (numpy.array): TADs p-values for each
+            peak set and cluster (None if TADs not included)
+          tads_counts (numpy.array): TADs gene counts for each
+            peak set and cluster (None if TADs not included)
+          kws (mapping): additional keyword arguments are
+            passed to the constructor
+
+        Returns:
+          EnrichmentResults: new instance with the results.
+        """
+        include_tads = (tads_pvalues is not None and
+                        tads_counts is not None)
+        enrichments = cls(peaks,clusters,distances,
+                          include_tads=include_tads,**kws)
+        enrichments.pvalues[...] = pvalues
+        enrichments.counts[...] = counts
+        if include_tads:
+            enrichments.tads_pvalues[...] = tads_pvalues
+            enrichments.tads_counts[...] = tads_counts
+        return enrichments
+
+    def save(self,results_file):
+        """
+        Save the results to a NumPy '.npz' file
+
+        Arguments:
+          results_file (str): path to output '.npz' file
+
+        Returns:
+          String: path to the output file.
+        """
+        return save_results(results_file,
+                            self.peaks,
+                            self.clusters,
+                            self.distances,
+                            self.pvalues,
+                            self.counts,
+                            tads_pvalues=self.tads_pvalues,
+                            tads_counts=self.tads_counts,
+                            n_overlapping=self.n_overlapping,
+                            tads_n_overlapping=self.tads_n_overlapping,
+                            cluster_sizes=self.cluster_sizes,
+                            n_genes=self.n_genes,
+                            first_peak_set=self.first_peak_set,
+                            n_peak_sets=self.n_peak_sets)
+
+#######################################################################
+# Functions
+#######################################################################
+
+def get_shard(n_peak_sets,shard,n_shards):
+    """
+    Return the slice of peak sets to process for a shard
+
+    The peak sets are divided into 'n_shards' contiguous
+    slices which differ in size by at most one peak set.
+
+    Arguments:
+      n_peak_sets (int): total number of peak sets
+      shard (int): shard number (starting from 1)
+      n_shards (int): total number of shards
+
+    Returns:
+      Tuple: (start,end) indices of the peak sets for the
+        shard (i.e. peak sets 'start' to 'end-1').
+    """
+    if n_shards < 1 or shard < 1 or shard > n_shards:
+        raise ValueError("Invalid shard %s/%s" % (shard,n_shards))
+    start = ((shard-1)*n_peak_sets)//n_shards
+    end = (shard*n_peak_sets)//n_shards
+    return (start,end)
+
+def get_selection(names,selection=None):
+    """
+    Return an index for selecting items from a list of names
+
+    Arguments:
+      names (list): list of names
+      selection (object): either a slice, a list of integer
+        indices, or a list of names (matched against the base
+        names with or without the file extension, as for
+        'select_names'); if None then all the names are
+        selected
+
+    Returns:
+      Object: either a slice or a list of indices.
+    """
+    if selection is None:
+        return slice(None)
+    if isinstance(selection,slice):
+        return selection
+    selection = list(selection)
+    if all([isinstance(x,(int,np.integer)) for x in selection]):
+        return [int(x) for x in selection]
+    return select_names([basename(name) for name in names],selection)
+
+def save_results(results_file,peaks,clusters,distances,pvalues,counts,
+                 tads_pvalues=None,tads_counts=None,n_overlapping=None,
+                 tads_n_overlapping=None,cluster_sizes=None,n_genes=None,
+                 first_peak_set=0,n_peak_sets=None):
+    """
+    Save enrichment results to a NumPy '.npz' file
+
+    The results can either be complete (i.e. for all the peak
+    sets in an analysis) or partial (i.e. for a contiguous
+    subset of the peak sets, as generated by a shard of the
+    analysis); in the latter case 'first_peak_set' and
+    'n_peak_sets' record where the subset fits into the
+    complete analysis, so that the partial results can be
+    combined using 'merge_results'.
+
+    Only the base names of the peak and cluster files are
+    stored.
+
+    Arguments:
+      results_file (str): path to output '.npz' file
+      peaks (list): BED files containing the ChIP-seq peaks
+      clusters (list): cluster files
+      distances (list): distances the enrichments were
+        calculated at
+      pvalues (numpy.array): p-values from enrichment
+        calculation
+      counts (numpy.array): gene counts from enrichment
+        calculation
+      tads_pvalues (numpy.array): TADs p-values from
+        enrichment calculation (None if TADs not included)
+      tads_counts (numpy.array): TADs gene counts from
+        enrichment calculation (None if TADs not included)
+      n_overlapping (numpy.array): optional, number of genes
+        overlapping each peak set at each distance
+      tads_n_overlapping (numpy.array): optional, number of
+        genes overlapping the TADs for each peak set
+      cluster_sizes (numpy.array): optional, number of genes
+        in each cluster
+      n_genes (int): optional, total number of genes
+      first_peak_set (int): index of the first peak set in
+        the complete analysis (default: 0)
+      n_peak_sets (int): total number of peak sets in the
+        complete analysis (default: number of peaks)
+    """
+    if n_peak_sets is None:
+        n_peak_sets = len(peaks)
+    data = dict(version=RESULTS_FORMAT_VERSION,
+                peaks=np.array([basename(f) for f in peaks],dtype=str),
+                clusters=np.array([basename(f) for f in clusters],
+                                  dtype=str),
+                distances=np.array(distances,dtype=np.int64),
+                pvalues=pvalues,
+                counts=counts,
+                first_peak_set=first_peak_set,
+                n_peak_sets=n_peak_sets)
+    if tads_pvalues is not None and tads_counts is not None:
+        data['tads_pvalues'] = tads_pvalues
+        data['tads_counts'] = tads_counts
+        if tads_n_overlapping is not None:
+            data['tads_n_overlapping'] = np.array(tads_n_overlapping,
+                                                  dtype=np.int32)
+    if n_overlapping is not None:
+        data['n_overlapping'] = np.array(n_overlapping,dtype=np.int32)
+    if cluster_sizes is not None:
+        data['cluster_sizes'] = np.array(cluster_sizes,dtype=np.uint32)
+    if n_genes is not None:
+        data['n_genes'] = n_genes
+    with io.open(results_file,'wb') as fp:
+        np.savez(fp,**data)
+    return results_file
+
+def load_results(results_file):
+    """
+    Load enrichment results from a NumPy '.npz' file
+
+    Arguments:
+      results_file (str): path to '.npz' file written by
+        'save_results'
+
+    Returns:
+      Dictionary: with keys 'peaks', 'clusters', 'distances',
+        'pvalues', 'counts', 'n_overlapping', 'tads_pvalues',
+        'tads_counts', 'tads_n_overlapping' (the TADs data are
+        None if not present), 'cluster_sizes', 'n_genes' (None
+        if not recorded), 'first_peak_set' and 'n_peak_sets'.
+        The number of overlapping genes is -1 where it wasn't
+        recorded.
+    """
+    with np.load(results_file,allow_pickle=False) as data:
+        version = int(data['version'])
+        if version > RESULTS_FORMAT_VERSION:
+            raise ValueError("%s: unsupported results file version %s" %
+                             (results_file,version))
+        n_peaks = len(data['peaks'])
+        n_distances = len(data['distances'])
+        n_clusters = len(data['clusters'])
+        results = dict(
+            peaks=[str(x) for x in data['peaks']],
+            clusters=[str(x) for x in data['clusters']],
+            distances=[int(x) for x in data['distances']],
+            pvalues=data['pvalues'].reshape(n_peaks,n_distances,n_clusters),
+            counts=data['counts'].reshape(n_peaks,n_distances,n_clusters),
+            n_overlapping=np.full([n_peaks,n_distances],-1,dtype=np.int32),
+            tads_pvalues=None,
+            tads_counts=None,
+            tads_n_overlapping=None,
+            cluster_sizes=None,
+            n_genes=None,
+            first_peak_set=int(data['first_peak_set']),
+            n_peak_sets=int(data['n_peak_sets']))
+        if 'n_overlapping' in data:
+            results['n_overlapping'] = \
+                data['n_overlapping'].reshape(n_peaks,n_distances)
+        if 'tads_pvalues' in data:
+            results['tads_pvalues'] = \
+                data['tads_pvalues'].reshape(n_peaks,n_clusters)
+            results['tads_counts'] = \
+                data['tads_counts'].reshape(n_peaks,n_clusters)
+            results['tads_n_overlapping'] = np.full(n_peaks,-1,
+                                                    dtype=np.int32)
+            if 'tads_n_overlapping' in data:
+                results['tads_n_overlapping'] = \
+                    data['tads_n_overlapping'].reshape(n_peaks)
+        if 'cluster_sizes' in data:
+            results['cluster_sizes'] = \
+                data['cluster_sizes'].reshape(n_clusters)
+        if 'n_genes' in data:
+            results['n_genes'] = int(data['n_genes'])
+    return results
+
+def merge_results(results_files):
+    """
+    Combine partial enrichment results into complete results
+
+    The partial results (e.g. from separate shards of an
+    analysis) are put back into the original order of the
+    peak sets; they must all have the same clusters,
+    distances, cluster sizes, total number of genes and total
+    number of peak sets, and together must cover each peak
+    set exactly once.
+
+    Arguments:
+      results_files (list): paths to '.npz' files written
+        by 'save_results'
+
+    Returns:
+      Dictionary: the combined results, in the same format
+        as returned by 'load_results'.
+
+    Raises 'ValueError' if the partial results are
+    inconsistent or incomplete.
+    """
+    if not results_files:
+        raise ValueError("No results files supplied")
+    parts = [(load_results(f),f) for f in results_files]
+    parts = sorted(parts,key=lambda part: part[0]['first_peak_set'])
+    first,first_file = parts[0]
+    include_tads = (first['tads_pvalues'] is not None)
+    # Check the partial results are consistent
+    for part,results_file in parts[1:]:
+        for item in ('clusters','distances','n_peak_sets',
+                     'cluster_sizes','n_genes'):
+            if not _same(part[item],first[item]):
+                raise ValueError("%s: %s don't match %s" %
+                                 (results_file,item.replace('_',' '),
+                                  first_file))
+        if (part['tads_pvalues'] is not None) != include_tads:
+            raise ValueError("%s: TADs data %s in %s" %
+                             (results_file,
+                              ("missing" if include_tads else
+                               "not present"),
+                              first_file))
+    # Check that all the peak sets are present exactly once
+    next_peak_set = 0
+    for part,results_file in parts:
+        if part['first_peak_set'] != next_peak_set:
+            if part['first_peak_set'] < next_peak_set:
+                raise ValueError("%s: peak sets overlap with other "
+                                 "results" % results_file)
+            raise ValueError("Missing results for peak sets %d-%d" %
+                             (next_peak_set+1,part['first_peak_set']))
+        next_peak_set += len(part['peaks'])
+    if next_peak_set != first['n_peak_sets']:
+        raise ValueError("Missing results for peak sets %d-%d" %
+                         (next_peak_set+1,first['n_peak_sets']))
+    # Combine the data
+    merged = dict(peaks=[],
+                  clusters=first['clusters'],
+                  distances=first['distances'],
+                  cluster_sizes=first['cluster_sizes'],
+                  n_genes=first['n_genes'],
+                  first_peak_set=0,
+                  n_peak_sets=first['n_peak_sets'])
+    for part,results_file in parts:
+        merged['peaks'].extend(part['peaks'])
+    for item in ('pvalues','counts','n_overlapping',
+                 'tads_pvalues','tads_counts','tads_n_overlapping'):
+        if item.startswith('tads_') and not include_tads:
+            merged[item] = None
+        else:
+            merged[item] = np.concatenate([part[item]
+                                           for part,f in parts])
+    return merged
+
+def _same(x,y):
+    # Internal: check if two items from results are the same
+    # (either of which may be None or an array)
+    if x is None or y is None:
+        return (x is None and y is None)
+    return np.array_equal(x,y)
+
+def read_raw_data(pval_file,count_file,tads_pval_file=None,
+                  tads_count_file=None,clusters=None):
+    """
+    Read enrichment results from raw data TSV files
+
+    Reads the p-values and gene counts from the TSV files
+    written by 'write_raw_data' (i.e. via the
+    '--dump-raw-data' option).
+
+    As the TSV files don't include the names of the clusters,
+    these should be supplied via the 'clusters' argument;
+    otherwise the clusters are named 'cluster_1', 'cluster_2'
+    etc.
+
+    Arguments:
+      pval_file (str): path to the p-values TSV file
+      count_file (str): path to the gene counts TSV file
+      tads_pval_file (str): optional, path to the TADs
+        p-values TSV file
+      tads_count_file (str): optional, path to the TADs gene
+        counts TSV file
+      clusters (list): optional, names of the clusters (or
+        cluster files)
+
+    Returns:
+      Dictionary: the results, in the same format as returned
+        by 'load_results'.
+
+    Raises 'ValueError' if the files are inconsistent.
+    """
+    # Read the p-values and counts
+    peaks = []
+    distances = []
+    data = dict()
+    for item,tsv_file in (('pvalues',pval_file),('counts',count_file)):
+        rows = []
+        with io.open(tsv_file,'rt') as fp:
+            for line in fp:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 2:
+                    continue
+                rows.append((fields[0],int(fields[1]),
+                             [float(x) for x in fields[2:]]))
+        if not rows:
+            raise ValueError("%s: no data" % tsv_file)
+        if item == 'pvalues':
+            for peak_set,distance,values in rows:
+                if peak_set not in peaks:
+                    peaks.append(peak_set)
+                if distance not in distances:
+                    distances.append(distance)
+        expected = [(peak_set,distance) for peak_set in peaks
+                    for distance in distances]
+        if [row[:2] for row in rows] != expected:
+            raise ValueError("%s: peak sets and distances don't match "
+                             "%s" % (tsv_file,pval_file))
+        values = [row[2] for row in rows]
+        if len(set([len(x) for x in values])) > 1:
+            raise ValueError("%s: inconsistent number of clusters" %
+                             tsv_file)
+        data[item] = np.array(values,dtype=float).reshape(
+            len(peaks),len(distances),-1)
+    n_clusters = data['pvalues'].shape[2]
+    if data['counts'].shape[2] != n_clusters:
+        raise ValueError("%s: number of clusters doesn't match %s" %
+                         (count_file,pval_file))
+    # Read the TADs data
+    for item,tsv_file in (('tads_pvalues',tads_pval_file),
+                          ('tads_counts',tads_count_file)):
+        if tads_pval_file is None or tads_count_file is None:
+            data[item] = None
+            continue
+        rows = []
+        with io.open(tsv_file,'rt') as fp:
+            for line in fp:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 2:
+                    continue
+                rows.append((fields[0],[float(x) for x in fields[1:]]))
+        if [row[0] for row in rows] != peaks:
+            raise ValueError("%s: peak sets don't match %s" %
+                             (tsv_file,pval_file))
+        if any([len(row[1]) != n_clusters for row in rows]):
+            raise ValueError("%s: number of clusters doesn't match %s" %
+                             (tsv_file,pval_file))
+        data[item] = np.array([row[1] for row in rows],dtype=float)
+    # Cluster names
+    if clusters is None:
+        clusters = ["cluster_%d" % (k+1) for k in range(n_clusters)]
+    elif len(clusters) != n_clusters:
+        raise ValueError("%s: number of clusters (%d) doesn't match "
+                         "number of cluster names (%d)" %
+                         (pval_file,n_clusters,len(clusters)))
+    return dict(peaks=peaks,
+                clusters=[basename(f) for f in clusters],
+                distances=distances,
+                pvalues=data['pvalues'],
+                counts=data['counts'],
+                n_overlapping=np.full([len(peaks),len(distances)],-1,
+                                      dtype=np.int32),
+                tads_pvalues=data['tads_pvalues'],
+                tads_counts=data['tads_counts'],
+                tads_n_overlapping=(np.full(len(peaks),-1,dtype=np.int32)
+                                    if data['tads_pvalues'] is not None
+                                    else None),
+                cluster_sizes=None,
+                n_genes=None,
+                first_peak_set=0,
+                n_peak_sets=len(peaks))
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+#
+#     taskgraph.py: run a graph of dependent tasks with pluggable executors
+#     Copyright (C) University of Manchester 2026 Mudassar Iqbal, Peter Briggs
+#
+
+#######################################################################
+# Imports
+#######################################################################
+
+import heapq
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+from .profiling import timed_call
+
+#######################################################################
+# Constants
+#######################################################################
+
+# Names of the available executors
+EXECUTORS = ("serial","threads","processes")
+
+#######################################################################
+# Classes
+#######################################################################
+
+class TaskRef:
+    """
+    Reference to the result of a task in a TaskGraph
+
+    When a TaskRef appears in the arguments of another task
+    it is replaced by the result of the referenced task (or
+    by 'result[item]', if 'item' is set) before that task is
+    run, and makes the task depend on the referenced task.
+    """
+    __slots__ = ('key','item',)
+    def __init__(self,key,item=None):
+        self.key = key
+        self.item = item
+    def __getitem__(self,item):
+        return TaskRef(self.key,item)
+    def __repr__(self):
+        return "TaskRef(%r)" % (self.key,)
+
+class Task:
+    """
+    A single task in a TaskGraph
+
+    Stores the function to call and its arguments, the keys
+    of the tasks it depends on, the profiler stage and peak
+    set to record its timings against, and (once the task
+    has been run) the wall and CPU times it took.
+    """
+    __slots__ = ('key','func','args','kws','deps','stage','peak_set',
+                 'order','wall','cpu',)
+    def __init__(self,key,func,args,kws,deps,stage=None,peak_set=None,
+                 order=0):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kws = kws
+        self.deps = deps
+        self.stage = stage
+        self.peak_set = peak_set
+        self.order = order
+        self.wall = None
+        self.cpu = None
+
+class SerialExecutor:
+    """
+    Executor which runs each task as soon as it's submitted
+
+    Implements the same 'submit' and 'shutdown' interface as
+    the executors in 'concurrent.futures', but runs the tasks
+    in the calling thread.
+    """
+    def __init__(self,max_workers=1):
+        self._max_workers = 1
+    def submit(self,fn,*args,**kws):
+        future = Future()
+        try:
+            future.set_result(fn(*args,**kws))
+        except Exception as ex:
+            future.set_exception(ex)
+        return future
+    def shutdown(self,wait=True):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.shutdown()
+        return False
+
+class TaskGraph:
+    """
+    Graph of tasks keyed by their content
+
+    Each task is added with a key which identifies the work
+    that it does (for example, the checksum of an input file
+    and the parameters applied to it); adding a task with a
+    key which is already in the graph doesn't add a new task
+    but returns a reference to the existing one, so work
+    which is shared between several results is only done
+    once.
+
+    Tasks can depend on other tasks, either by including a
+    TaskRef in their arguments (in which case the result of
+    the other task is substituted) or by listing them in
+    'deps'. The graph is run by submitting each task to an
+    executor as soon as all the tasks it depends on have
+    completed.
+
+    Usage:
+
+    >>> graph = TaskGraph()
+    >>> expanded = graph.add(("expand",checksum,5000),
+    ...                      make_expanded_bed,
+    ...                      args=(peaks_file,expanded_file,5000))
+    >>> graph.add(("intersect",expanded.key),intersect,
+    ...           args=(genes_file,expanded,intersection_file))
+    >>> results = graph.run(get_executor("threads",4))
+    """
+    def __init__(self):
+        self.tasks = OrderedDict()
+        self.n_shared = 0
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __contains__(self,key):
+        return key in self.tasks
+
+    def add(self,key,func,args=(),kws=None,deps=None,stage=None,
+            peak_set=None):
+        """
+        Add a task to the graph
+
+        If a task with the same key is already in the graph
+        then no new task is added.
+
+        Arguments:
+          key (tuple): key identifying the work done by the task
+          func (function): function to call to run the task
+            (must be picklable if the graph is run using
+            processes)
+          args (list): positional arguments for the function
+          kws (mapping): keyword arguments for the function
+          deps (list): optional, TaskRefs or keys of additional
+            tasks which must complete before this task is run
+          stage (str): optional, name of the profiler stage to
+            record the timings for the task against
+          peak_set (str): optional, name of the peak set to
+            record the timings for the task against
+
+        Returns:
+          TaskRef: reference to the task's result.
+        """
+        if key in self.tasks:
+            self.n_shared += 1
+            return TaskRef(key)
+        args = tuple(args)
+        if kws is None:
+            kws = dict()
+        dependencies = []
+        for ref in _find_refs((args,kws)):
+            dependencies.append(ref.key)
+        for dep in (deps if deps else []):
+            dependencies.append(dep.key if isinstance(dep,TaskRef) else dep)
+        for dep in dependencies:
+            if dep not in self.tasks:
+                raise KeyError("%s: unknown dependency %s" % (key,dep))
+        self.tasks[key] = Task(key,func,args,kws,
+                               list(OrderedDict.fromkeys(dependencies)),
+                               stage=stage,peak_set=peak_set,
+                               order=len(self.tasks))
+        return TaskRef(key)
+
+    def run(self,executor=None,max_workers=None,on_complete=None,
+            on_poll=None,poll_interval=1.0):
+        """
+        Run all the tasks in the graph
+
+        Tasks are submitted to the executor when all of their
+        dependencies have completed; where several tasks are
+        ready, the one added to the graph first is submitted
+        first, and at most 'max_workers' tasks are submitted
+        at a time (so that the tasks for each result are
+        completed as early as possible).
+
+        If a task raises an exception then no more tasks are
+        submitted, and the exception is raised once the
+        running tasks have finished.
+
+        Arguments:
+          executor (Executor): optional, executor to run the
+            tasks with (default: run each task in turn in
+            the calling thread)
+          max_workers (int): optional, maximum number of tasks
+            to submit at a time (defaults to the number of
+            workers for the executor)
+          on_complete (function): optional, function to call
+            in the calling thread with each completed Task
+            and its result
+          on_poll (function): optional, function to call
+            periodically while tasks are running
+          poll_interval (float): optional, maximum interval
+            in seconds between calls to 'on_poll'
+
+        Returns:
+          Dictionary: the result of each task, keyed by the
+            task key.
+        """
+        if executor is None:
+            executor = SerialExecutor()
+        if max_workers is None:
+            max_workers = getattr(executor,"_max_workers",1)
+        max_workers = max(1,int(max_workers))
+        results = dict()
+        waiting = dict()
+        dependants = dict()
+        ready = []
+        for key,task in self.tasks.items():
+            waiting[key] = set(task.deps)
+            for dep in task.deps:
+                dependants.setdefault(dep,[]).append(key)
+            if not task.deps:
+                heapq.heappush(ready,(task.order,key))
+        running = dict()
+        try:
+            while ready or running:
+                # Submit ready tasks until all workers are busy
+                while ready and len(running) < max_workers:
+                    task = self.tasks[heapq.heappop(ready)[1]]
+                    args = _resolve_refs(task.args,results)
+                    kws = _resolve_refs(task.kws,results)
+                    running[executor.submit(timed_call,task.func,
+                                            *args,**kws)] = task
+                # Wait for at least one task to finish
+                done,_ = wait(list(running),
+                              timeout=(poll_interval if on_poll else None),
+                              return_when=FIRST_COMPLETED)
+                for future in sorted(done,key=lambda f: running[f].order):
+                    task = running.pop(future)
+                    result,task.wall,task.cpu = future.result()
+                    results[task.key] = result
+                    if on_complete:
+                        on_complete(task,result)
+                    for key in dependants.get(task.key,[]):
+                        waiting[key].discard(task.key)
+                        if not waiting[key]:
+                            heapq.heappush(ready,(self.tasks[key].order,
+                                                  key))
+                if on_poll:
+                    on_poll()
+        except BaseException:
+            # Don't start any more tasks, and wait for the
+            # running tasks to finish
+            for future in running:
+                future.cancel()
+            wait(list(running))
+            raise
+        return results
+
+#######################################################################
+# Functions
+#######################################################################
+
+def get_executor(executor="serial",max_workers=1):
+    """
+    Return an executor for running a TaskGraph
+
+    Arguments:
+      executor (str): one of 'serial' (run each task in turn
+        in the calling thread), 'threads' (run tasks in a pool
+        of threads, which suits tasks which mostly run external
+        programs) or 'processes' (run tasks in a pool of
+        processes, so that Python code can use multiple cores)
+      max_workers (int): number of threads or processes
+
+    Returns:
+      Executor: the executor (which can be used as a context
+        manager, to shut it down when finished).
+    """
+    if executor == "serial":
+        return SerialExecutor()
+    elif executor == "threads":
+        return ThreadPoolExecutor(max_workers=max(1,max_workers))
+    elif executor == "processes":
+        return ProcessPoolExecutor(max_workers=max(1,max_workers))
+    raise ValueError("Unknown executor '%s' (expected one of: %s)" %
+                     (executor,', '.join(EXECUTORS)))
+
+def _find_refs(obj):
+    # Internal: yield the TaskRefs in (nested) arguments
+    if isinstance(obj,TaskRef):
+        yield obj
+    elif isinstance(obj,(list,tuple)):
+        for x in obj:
+            for ref in _find_refs(x):
+                yield ref
+    elif isinstance(obj,dict):
+        for x in obj.values():
+            for ref in _find_refs(x):
+                yield ref
+
+def _resolve_refs(obj,results):
+    # Internal: replace the TaskRefs in (nested) arguments
+    # with the results of the referenced tasks
+    if isinstance(obj,TaskRef):
+        result = results[obj.key]
+        if obj.item is not None:
+            result = result[obj.item]
+        return result
+    elif isinstance(obj,list):
+        return [_resolve_refs(x,results) for x in obj]
+    elif isinstance(obj,tuple):
+        return tuple([_resolve_refs(x,results) for x in obj])
+    elif isinstance(obj,dict):
+        return obj.__class__((k,_resolve_refs(v,results))
+                             for k,v in obj.items())
+    return obj
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import zipfile
+import io
+import os
+from pegs.archive import IntersectionArchive
+from pegs.archive import ARCHIVE_TADS
+from pegs.archive import format_archive_key
+from pegs.archive import parse_archive_key
+
+class TestIntersectionArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.archive_file = os.path.join(self.test_dir,"intersections.zip")
+        self.intersection_files = []
+        for i,data in enumerate((u"chr1\t100\t101\tGene1\n",
+                                 u"chr2\t200\t201\tGene2\n")):
+            intersection_file = os.path.join(self.test_dir,
+                                             "Intersection.%d.bed" % i)
+            with io.open(intersection_file,'wt') as fp:
+                fp.write(data)
+            self.intersection_files.append(intersection_file)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_intersection_archive_add_and_read(self):
+        """
+        IntersectionArchive: add and read intersections by key
+        """
+        with IntersectionArchive(self.archive_file,'w') as archive:
+            archive.add("peaks1.bed",5000,self.intersection_files,
+                        name="Intersection.genes.peaks1.5000.bed")
+            archive.add("peaks1.bed",ARCHIVE_TADS,
+                        self.intersection_files[:1])
+        self.assertTrue(zipfile.is_zipfile(self.archive_file))
+        archive = IntersectionArchive(self.archive_file)
+        self.assertEqual(len(archive),2)
+        self.assertEqual(archive.keys(),[("peaks1.bed",5000),
+                                         ("peaks1.bed","TADs")])
+        self.assertTrue(("peaks1.bed","5000") in archive)
+        self.assertFalse(("peaks2.bed",5000) in archive)
+        with archive.open("peaks1.bed",5000) as fp:
+            self.assertEqual(fp.read(),
+                             b"chr1\t100\t101\tGene1\n"
+                             b"chr2\t200\t201\tGene2\n")
+        self.assertEqual(archive.member("peaks1.bed","TADs").filename,
+                         "Intersection.0.bed")
+        self.assertRaises(KeyError,archive.open,"peaks1.bed",0)
+        archive.close()
+
+    def test_intersection_archive_append(self):
+        """
+        IntersectionArchive: add intersections to existing archive
+        """
+        with IntersectionArchive(self.archive_file,'w') as archive:
+            archive.add("peaks1.bed",5000,self.intersection_files[:1])
+        with IntersectionArchive(self.archive_file,'a') as archive:
+            # Existing members aren't replaced
+            archive.add("peaks1.bed",5000,self.intersection_files[1:])
+            archive.add("peaks2.bed",5000,self.intersection_files[1:])
+        with IntersectionArchive(self.archive_file) as archive:
+            self.assertEqual(archive.keys(),[("peaks1.bed",5000),
+                                             ("peaks2.bed",5000)])
+            with archive.open("peaks1.bed",5000) as fp:
+                self.assertEqual(fp.read(),b"chr1\t100\t101\tGene1\n")
+
+    def test_intersection_archive_extract(self):
+        """
+        IntersectionArchive: extract intersections to a file
+        """
+        with IntersectionArchive(self.archive_file,'w') as archive:
+            archive.add("peaks1.bed",0,self.intersection_files[1:])
+        output_dir = os.path.join(self.test_dir,"extracted")
+        os.mkdir(output_dir)
+        with IntersectionArchive(self.archive_file) as archive:
+            output_file = archive.extract("peaks1.bed",0,output_dir)
+        self.assertEqual(output_file,os.path.join(output_dir,
+                                                  "Intersection.1.bed"))
+        with io.open(output_file,'rt') as fp:
+            self.assertEqual(fp.read(),u"chr2\t200\t201\tGene2\n")
+
+class TestArchiveKeys(unittest.TestCase):
+
+    def test_format_and_parse_archive_key(self):
+        """
+        format_archive_key/parse_archive_key: round trip keys
+        """
+        self.assertEqual(format_archive_key("peaks1.bed",5000),
+                         "peaks1.bed\t5000")
+        self.assertEqual(parse_archive_key(b"peaks1.bed\t5000"),
+                         ("peaks1.bed",5000))
+        self.assertEqual(parse_archive_key("peaks1.bed\tTADs"),
+                         ("peaks1.bed","TADs"))
+        self.assertRaises(ValueError,parse_archive_key,"")
+        self.assertRaises(ValueError,parse_archive_key,"peaks1.bed\tall")
@@ -6,6 +6,8 @@ import os
 import shutil
 
 from pegs.bedtools import intersect
+from pegs.bedtools import intersect_cmd
+from pegs.bedtools import BedtoolsError
 from pegs.bedtools import bedtools_version
 from pegs.bedtools import fetch_bedtools
 
@@ -89,6 +91,97 @@ print("wa:%s" % args.wa)
                 else:
                     self.fail("Bad output")
 
+    def test_intersect_raises_exception_on_failure(self):
+        """
+        intersect: raise exception if 'bedtools intersect' fails
+        """
+        self.bedtools_exe = os.path.join(self.test_dir,"bedtools")
+        with open(self.bedtools_exe,'wt') as fp:
+            fp.write("""#!/bin/sh
+exit 1
+""")
+        os.chmod(self.bedtools_exe,0o755)
+        outfile = os.path.join(self.test_dir,"out.txt")
+        self.assertRaises(BedtoolsError,
+                          intersect,
+                          "/data/infile_a",
+                          "/data/infile_b",
+                          outfile,
+                          working_dir=self.test_dir,
+                          bedtools_exe=self.bedtools_exe)
+
+class TestIntersectCmd(unittest.TestCase):
+    def test_intersect_cmd(self):
+        """
+        intersect_cmd: build 'bedtools intersect' command line
+        """
+        self.assertEqual(intersect_cmd("a.bed","b.bed"),
+                         ["bedtools","intersect",
+                          "-a","a.bed","-b","b.bed"])
+        self.assertEqual(intersect_cmd("a.bed","b.bed",
+                                       report_entire_feature=True,
+                                       bedtools_exe="/opt/bedtools"),
+                         ["/opt/bedtools","intersect","-wa",
+                          "-a","a.bed","-b","b.bed"])
+    def test_intersect_cmd_sorted_inputs(self):
+        """
+        intersect_cmd: build command line for sorted inputs
+        """
+        self.assertEqual(intersect_cmd("a.bed","b.bed",
+                                       sorted_inputs=True),
+                         ["bedtools","intersect","-sorted",
+                          "-a","a.bed","-b","b.bed"])
+        self.assertEqual(intersect_cmd("a.bed","b.bed",
+                                       sorted_inputs=True,
+                                       genome_file="mm10.genome"),
+                         ["bedtools","intersect","-sorted",
+                          "-g","mm10.genome",
+                          "-a","a.bed","-b","b.bed"])
+
+class TestIntersectFailure(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+    def _make_bedtools_exe(self):
+        # Fake bedtools which echoes its inputs, and fails
+        # if the 'A' input is called 'fail'
+        self.bedtools_exe = os.path.join(self.test_dir,"bedtools")
+        with open(self.bedtools_exe,'wt') as fp:
+            fp.write("""#!/usr/bin/env python
+import sys
+from argparse import ArgumentParser
+p = ArgumentParser()
+s = p.add_subparsers()
+intersect = s.add_parser("intersect")
+intersect.add_argument("-wa",action='store_true')
+intersect.add_argument("-a",action='store')
+intersect.add_argument("-b",action='store')
+args = p.parse_args()
+if args.a == "fail":
+    sys.stderr.write("Failed!\\n")
+    sys.exit(1)
+print("%s:%s:%s" % (args.a,args.b,args.wa))
+""")
+        os.chmod(self.bedtools_exe,0o755)
+    def test_intersect_raises_exception_on_failure(self):
+        """
+        intersect: raise exception including error output on failure
+        """
+        self._make_bedtools_exe()
+        outfile = os.path.join(self.test_dir,"out.txt")
+        intersect("a","b",outfile,
+                  working_dir=self.test_dir,
+                  bedtools_exe=self.bedtools_exe)
+        with open(outfile,'rt') as fp:
+            self.assertEqual(fp.read(),"a:b:False\n")
+        with self.assertRaises(BedtoolsError) as cm:
+            intersect("fail","b",outfile,
+                      working_dir=self.test_dir,
+                      bedtools_exe=self.bedtools_exe)
+        self.assertTrue("Failed!" in str(cm.exception))
+
 class TestBedtoolsVersion(unittest.TestCase):
     def setUp(self):
         self.test_dir = tempfile.mkdtemp()
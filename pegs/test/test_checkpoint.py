@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import os
+import io
+from pegs.checkpoint import Checkpoint
+from pegs.checkpoint import CheckpointError
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestCheckpoint')
+        self.checkpoint_file = os.path.join(self.dirn,
+                                            "pegs_checkpoint.jsonl")
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_checkpoint_add_and_resume(self):
+        """
+        Checkpoint: record results and resume from file
+        """
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open()
+        self.assertEqual(len(checkpoint),0)
+        self.assertEqual(checkpoint.get(("peaks",0,0)),None)
+        checkpoint.add(("peaks",0,0),[0.1,1e-12],[1.0,2.0])
+        checkpoint.add(("tads",0),[0.123456789012345],[3.0])
+        checkpoint.close()
+        self.assertTrue(os.path.exists(self.checkpoint_file))
+        # Resume
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open(resume=True)
+        self.assertEqual(len(checkpoint),2)
+        self.assertEqual(checkpoint.get(("peaks",0,0)),
+                         ([0.1,1e-12],[1.0,2.0]))
+        self.assertEqual(checkpoint.get(("tads",0)),
+                         ([0.123456789012345],[3.0]))
+        self.assertEqual(checkpoint.get(("peaks",0,1)),None)
+        checkpoint.remove()
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_checkpoint_add_and_resume_with_genes(self):
+        """
+        Checkpoint: record results with gene IDs and resume from file
+        """
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open()
+        checkpoint.add(("peaks",0,0),[0.1,0.2],[1.0,2.0],genes=[4,1,3])
+        checkpoint.add(("peaks",0,1),[0.1,0.2],[0.0,0.0])
+        self.assertEqual(checkpoint.get_genes(("peaks",0,0)),[4,1,3])
+        checkpoint.close()
+        # Resume
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open(resume=True)
+        self.assertEqual(checkpoint.get(("peaks",0,0)),
+                         ([0.1,0.2],[1.0,2.0]))
+        self.assertEqual(checkpoint.get_genes(("peaks",0,0)),[4,1,3])
+        self.assertEqual(checkpoint.get_genes(("peaks",0,1)),None)
+        self.assertEqual(checkpoint.get_genes(("peaks",1,0)),None)
+        checkpoint.remove()
+
+    def test_checkpoint_add_and_resume_with_n_overlapping(self):
+        """
+        Checkpoint: record and resume number of overlapping genes
+        """
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open()
+        checkpoint.add(("peaks",0,0),[0.1,0.2],[1.0,2.0],n_overlapping=5)
+        checkpoint.add(("tads",0),[0.1,0.2],[0.0,0.0])
+        self.assertEqual(checkpoint.get_n_overlapping(("peaks",0,0)),5)
+        checkpoint.close()
+        # Resume
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open(resume=True)
+        self.assertEqual(checkpoint.get_n_overlapping(("peaks",0,0)),5)
+        self.assertEqual(checkpoint.get_n_overlapping(("tads",0)),None)
+        self.assertEqual(checkpoint.get_n_overlapping(("peaks",1,0)),None)
+        checkpoint.remove()
+
+    def test_checkpoint_no_resume_discards_results(self):
+        """
+        Checkpoint: existing results are discarded if not resuming
+        """
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open()
+        checkpoint.add(("peaks",0,0),[0.1],[1.0])
+        checkpoint.close()
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open()
+        self.assertEqual(len(checkpoint),0)
+        checkpoint.close()
+
+    def test_checkpoint_inputs_changed(self):
+        """
+        Checkpoint: raise exception if fingerprint doesn't match
+        """
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open()
+        checkpoint.close()
+        checkpoint = Checkpoint(self.checkpoint_file,"def456")
+        self.assertRaises(CheckpointError,
+                          checkpoint.open,
+                          resume=True)
+
+    def test_checkpoint_ignore_incomplete_record(self):
+        """
+        Checkpoint: ignore incomplete record at end of file
+        """
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open()
+        checkpoint.add(("peaks",0,0),[0.1],[1.0])
+        checkpoint.close()
+        with io.open(self.checkpoint_file,'at') as fp:
+            fp.write(u'{"cell": ["peaks", 0, 1], "pval')
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open(resume=True)
+        self.assertEqual(len(checkpoint),1)
+        checkpoint.add(("peaks",0,1),[0.2],[2.0])
+        checkpoint.close()
+        # Check the file can be resumed again
+        checkpoint = Checkpoint(self.checkpoint_file,"abc123")
+        checkpoint.open(resume=True)
+        self.assertEqual(len(checkpoint),2)
+        checkpoint.close()
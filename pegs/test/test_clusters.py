@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import numpy as np
+from pegs.clusters import ClusterIndex
+from pegs.clusters import read_cluster_file
+from pegs.clusters import lookup_genes
+
+class TestClusterIndex(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestClusterIndex')
+        # Create test inputs
+        self.genes_file = os.path.join(self.dirn,"genes.bed")
+        with io.open(self.genes_file,'wt') as fp:
+            fp.write(u"""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        self.clusters = []
+        for i,genes in enumerate((("1500015O10Rik",),
+                                  ("Dnah7c","Gm15179","Unknown1"),
+                                  ("Unknown2",))):
+            cluster_file = os.path.join(self.dirn,"cluster_%d.txt" % i)
+            with io.open(cluster_file,'wt') as fp:
+                for gene in genes:
+                    fp.write(u"%s\n" % gene)
+            self.clusters.append(cluster_file)
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_cluster_index_from_files(self):
+        """
+        ClusterIndex: build index from gene and cluster files
+        """
+        index = ClusterIndex.from_files(self.genes_file,self.clusters)
+        self.assertEqual(len(index),3)
+        self.assertEqual(list(index.genes),
+                         ["1500015O10Rik","Adhfe1","Dnah7c",
+                          "Gm15179","Mroh3"])
+        self.assertEqual(list(index.indptr),[0,1,3,3])
+        self.assertEqual(list(index.indices),[0,2,3])
+        # Sizes include genes not in the gene intervals
+        self.assertEqual(list(index.sizes),[1,3,1])
+
+    def test_cluster_index_count_overlaps(self):
+        """
+        ClusterIndex: count overlapping genes in each cluster
+        """
+        index = ClusterIndex.from_files(self.genes_file,self.clusters)
+        self.assertEqual(list(index.count_overlaps(
+            set(("Dnah7c","Gm15179","Mroh3")))),[0,2,0])
+        self.assertEqual(list(index.count_overlaps(
+            set(("1500015O10Rik","Gm15179","Unknown1")))),[1,1,0])
+        self.assertEqual(list(index.count_overlaps(set())),[0,0,0])
+
+    def test_cluster_index_overlapping_genes(self):
+        """
+        ClusterIndex: get overlapping genes in each cluster
+        """
+        index = ClusterIndex.from_files(self.genes_file,self.clusters)
+        counts,gene_ids = index.overlapping_genes(
+            set(("1500015O10Rik","Gm15179","Dnah7c","Mroh3")))
+        self.assertEqual(list(counts),[1,2,0])
+        self.assertEqual(list(index.genes[gene_ids]),
+                         ["1500015O10Rik","Dnah7c","Gm15179"])
+        counts,gene_ids = index.overlapping_genes(set())
+        self.assertEqual(list(counts),[0,0,0])
+        self.assertEqual(len(gene_ids),0)
+
+    def test_cluster_index_save_and_load(self):
+        """
+        ClusterIndex: save and load memory-mapped index
+        """
+        index_dir = os.path.join(self.dirn,"index")
+        ClusterIndex.from_files(self.genes_file,self.clusters).save(
+            index_dir)
+        index = ClusterIndex.load(index_dir)
+        self.assertTrue(isinstance(index.indices,np.memmap))
+        self.assertFalse(index.indices.flags.writeable)
+        self.assertEqual(list(index.sizes),[1,3,1])
+        self.assertEqual(list(index.count_overlaps(
+            set(("Dnah7c","Gm15179","Mroh3")))),[0,2,0])
+
+    def test_cluster_index_save_and_load_empty(self):
+        """
+        ClusterIndex: save and load index with no cluster genes
+        """
+        index_dir = os.path.join(self.dirn,"index")
+        ClusterIndex.build([],self.clusters[2:]).save(index_dir)
+        index = ClusterIndex.load(index_dir)
+        self.assertEqual(list(index.sizes),[1])
+        self.assertEqual(list(index.count_overlaps(set(("Mroh3",)))),[0])
+
+class TestReadClusterFile(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestReadClusterFile')
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_read_cluster_file(self):
+        """
+        read_cluster_file: get unique genes from first column
+        """
+        cluster_file = os.path.join(self.dirn,"cluster.txt")
+        with io.open(cluster_file,'wt') as fp:
+            fp.write(u"""Dnah7c	1.2
+Gm15179	3.4
+Dnah7c	5.6
+""")
+        self.assertEqual(read_cluster_file(cluster_file),
+                         set(("Dnah7c","Gm15179")))
+
+class TestLookupGenes(unittest.TestCase):
+
+    def test_lookup_genes(self):
+        """
+        lookup_genes: get indices of genes in sorted array
+        """
+        genes = np.array(["Adhfe1","Dnah7c","Mroh3"])
+        self.assertEqual(sorted(lookup_genes(genes,["Mroh3","Adhfe1",
+                                                    "Zzz","Aaa"])),
+                         [0,2])
+        self.assertEqual(list(lookup_genes(genes,[])),[])
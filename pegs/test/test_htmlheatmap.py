@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import io
+import os
+import re
+import json
+import shutil
+import numpy as np
+
+from pegs.results import EnrichmentResults
+from pegs.htmlheatmap import make_html_heatmap
+from pegs.htmlheatmap import encode_array
+from pegs.htmlheatmap import decode_array
+
+class TestMakeHtmlHeatmap(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.peaks = [os.path.join(self.test_dir,"peaks%d.bed" % i)
+                      for i in range(2)]
+        self.clusters = [os.path.join(self.test_dir,"cluster_%d.txt" % i)
+                         for i in range(3)]
+        self.distances = [5000000,10000000]
+        self.pvalues = np.array([[[0.9,0.3,0.5],[0.9,0.3,0.5]],
+                                 [[1.0,0.1,0.5],[0.9,0.3,0.5]]])
+        self.counts = np.array([[[1.0,2.0,1.0],[1.0,2.0,1.0]],
+                                [[0.0,2.0,1.0],[1.0,2.0,1.0]]])
+        self.pvalues_tads = np.array([[0.7,0.7,0.2],[1.0,0.4,0.2]])
+        self.counts_tads = np.array([[1.0,1.0,1.0],[0.0,1.0,1.0]])
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+    def _read_data(self,html_file):
+        # Extract the embedded data from the HTML file
+        with io.open(html_file,'rt',encoding='utf-8') as fp:
+            html = fp.read()
+        data = re.search(r'<script type="application/json" '
+                         r'id="pegs_data">(.*?)</script>',
+                         html,re.DOTALL).group(1)
+        return json.loads(data)
+    def test_make_html_heatmap(self):
+        """
+        make_html_heatmap: generates HTML heatmap
+        """
+        html_file = os.path.join(self.test_dir,"pegs_heatmap.html")
+        results = EnrichmentResults.from_arrays(self.peaks,
+                                                self.clusters,
+                                                self.distances,
+                                                self.pvalues,
+                                                self.counts)
+        self.assertEqual(make_html_heatmap(html_file,results),html_file)
+        data = self._read_data(html_file)
+        self.assertEqual(data['peaks'],["peaks0","peaks1"])
+        self.assertEqual(data['clusters'],
+                         ["cluster_0","cluster_1","cluster_2"])
+        self.assertEqual(data['distances'],self.distances)
+        self.assertTrue(np.allclose(decode_array(data['logp'],(2,2,3)),
+                                    -np.log10(self.pvalues)))
+        self.assertTrue(np.array_equal(decode_array(data['counts'],(2,2,3)),
+                                       self.counts))
+        self.assertEqual(data['tads_logp'],None)
+        self.assertEqual(data['tads_counts'],None)
+        self.assertAlmostEqual(data['vmin'],0.0)
+        self.assertAlmostEqual(data['vmax'],1.0)
+        self.assertEqual(len(data['lut']),256)
+    def test_make_html_heatmap_with_tads(self):
+        """
+        make_html_heatmap: generates HTML heatmap including TADs data
+        """
+        html_file = os.path.join(self.test_dir,"pegs_heatmap.html")
+        results = EnrichmentResults.from_arrays(
+            self.peaks,
+            self.clusters,
+            self.distances,
+            self.pvalues,
+            self.counts,
+            tads_pvalues=self.pvalues_tads,
+            tads_counts=self.counts_tads)
+        make_html_heatmap(html_file,results)
+        data = self._read_data(html_file)
+        self.assertTrue(np.allclose(decode_array(data['tads_logp'],(2,3)),
+                                    -np.log10(self.pvalues_tads)))
+        self.assertTrue(np.array_equal(decode_array(data['tads_counts'],
+                                                    (2,3)),
+                                       self.counts_tads))
+    def test_make_html_heatmap_escapes_labels(self):
+        """
+        make_html_heatmap: handles labels which could close the script
+        """
+        html_file = os.path.join(self.test_dir,"pegs_heatmap.html")
+        results = EnrichmentResults.from_arrays(self.peaks,
+                                                self.clusters,
+                                                self.distances,
+                                                self.pvalues,
+                                                self.counts)
+        make_html_heatmap(html_file,
+                          results,
+                          clusters_axis_label="</script>",
+                          title="<b>test</b>")
+        data = self._read_data(html_file)
+        self.assertEqual(data['clusters_axis_label'],"</script>")
+        with io.open(html_file,'rt',encoding='utf-8') as fp:
+            self.assertTrue("<title>&lt;b&gt;test&lt;/b&gt;</title>"
+                            in fp.read())
+
+class TestEncodeArray(unittest.TestCase):
+    def test_encode_and_decode_array(self):
+        """
+        encode_array: round trip via decode_array
+        """
+        a = np.array([[0.5,1.0,2.0],[3.0,4.0,1.0e-3]])
+        self.assertTrue(np.allclose(decode_array(encode_array(a),(2,3)),a))
+        self.assertEqual(decode_array(encode_array(a)).dtype,
+                         np.dtype('<f4'))
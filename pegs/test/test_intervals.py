@@ -6,6 +6,12 @@ import shutil
 import os
 import io
 from pegs.intervals import make_gene_interval_file
+from pegs.intervals import split_peaks_by_group
+from pegs.intervals import split_bed_by_chromosome
+from pegs.intervals import merge_bed_file
+from pegs.intervals import read_genome_file
+from pegs.intervals import sort_bed_file
+from pegs.intervals import get_sorted_bed_file
 
 class TestMakeGeneIntervalFile(unittest.TestCase):
 
@@ -47,4 +53,403 @@ class TestMakeGeneIntervalFile(unittest.TestCase):
 chr1	134235457	134235458	Adora1
 chr1	33669794	33669795	Prim2
 chr1	9299877	9299878	Sntg1
+""")
+
+    def test_make_gene_interval_file_sort_by_position(self):
+        """
+        make_gene_interval_file: creates file sorted by position
+        """
+        # Create test input
+        test_input_file = os.path.join(self.dirn,"refGene.txt")
+        with io.open(test_input_file,'wt') as fp:
+            fp.write(u"""#bin	name	chrom	strand	txStart	txEnd	cdsStart	cdsEnd	exonCount	exonStarts	exonEnds	score	name2	cdsStartStat	cdsEndStat	exonFrames
+0	NM_001291930	chr1	-	134199214	134235457	134202950	134203505	2	134199214,134235227,	134203590,134235457,	0	Adora1	cmpl	cmpl	0,-1,
+1	NM_008922	chr1	-	33453807	33669794	33454085	33669011	14	33453807,33464052,	33454304,33464121,	0	Prim2	cmpl	cmpl	0,0,
+1	NM_001290392	chr1	-	8359738	9299877	8363474	8583258	18	8359738,8414202,	8363633,8414313,	0	Sntg1	cmpl	cmpl	0,0,
+1	NM_175642	chr1	-	25067475	25829707	25068167	25826760	31	25067475,25074684,	25068356,25074789,	0	Adgrb3	cmpl	cmpl	0,0,
+""")
+        # Run the file generation
+        make_gene_interval_file(test_input_file,sort_by_position=True)
+        # Check the contents of the output file
+        test_output_file =  os.path.join(self.dirn,"refGene_intervals.bed")
+        self.assertEqual(io.open(test_output_file,'rt').read(),
+                         u"""chr1	9299877	9299878	Sntg1
+chr1	25829707	25829708	Adgrb3
+chr1	33669794	33669795	Prim2
+chr1	134235457	134235458	Adora1
+""")
+
+class TestSplitPeaksByGroup(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestSplitPeaksByGroup')
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_split_peaks_by_group(self):
+        """
+        split_peaks_by_group: split peaks into peak sets
+        """
+        # Create test input
+        peaks_file = os.path.join(self.dirn,"peaks.bed")
+        with io.open(peaks_file,'wt') as fp:
+            fp.write(u"""track name=all_samples
+chr1	39756959	39757488	sample_2
+chr1	40278922	40279363	sample_10
+chr1	49032761	49033125	sample_2
+
+chr1	73362131	73362563	sample_1
+""")
+        output_dir = os.path.join(self.dirn,"groups")
+        os.mkdir(output_dir)
+        # Split the peaks
+        peaks = split_peaks_by_group(peaks_file,4,output_dir)
+        self.assertEqual(peaks,
+                         [os.path.join(output_dir,"sample_1.bed"),
+                          os.path.join(output_dir,"sample_2.bed"),
+                          os.path.join(output_dir,"sample_10.bed")])
+        # Check the contents of the peak set files
+        self.assertEqual(io.open(peaks[0],'rt').read(),
+                         u"chr1	73362131	73362563	sample_1\n")
+        self.assertEqual(io.open(peaks[1],'rt').read(),
+                         u"""chr1	39756959	39757488	sample_2
+chr1	49032761	49033125	sample_2
+""")
+        self.assertEqual(io.open(peaks[2],'rt').read(),
+                         u"chr1	40278922	40279363	sample_10\n")
+
+    def test_split_peaks_by_group_multiple_files(self):
+        """
+        split_peaks_by_group: combine groups from multiple files
+        """
+        # Create test inputs
+        peaks_file1 = os.path.join(self.dirn,"peaks1.bed")
+        with io.open(peaks_file1,'wt') as fp:
+            fp.write(u"""chr1	39756959	39757488	A
+chr1	40278922	40279363	B/1
+""")
+        peaks_file2 = os.path.join(self.dirn,"peaks2.bed")
+        with io.open(peaks_file2,'wt') as fp:
+            fp.write(u"""chr2	49032761	49033125	A
+""")
+        output_dir = os.path.join(self.dirn,"groups")
+        os.mkdir(output_dir)
+        # Split the peaks
+        peaks = split_peaks_by_group([peaks_file1,peaks_file2],4,
+                                     output_dir)
+        self.assertEqual(peaks,
+                         [os.path.join(output_dir,"A.bed"),
+                          os.path.join(output_dir,"B_1.bed")])
+        self.assertEqual(io.open(peaks[0],'rt').read(),
+                         u"""chr1	39756959	39757488	A
+chr2	49032761	49033125	A
+""")
+
+    def test_split_peaks_by_group_missing_column(self):
+        """
+        split_peaks_by_group: raise exception for missing column
+        """
+        # Create test input
+        peaks_file = os.path.join(self.dirn,"peaks.bed")
+        with io.open(peaks_file,'wt') as fp:
+            fp.write(u"""chr1	39756959	39757488
+""")
+        self.assertRaises(ValueError,
+                          split_peaks_by_group,
+                          peaks_file,4,self.dirn)
+
+    def test_split_peaks_by_group_space_delimited(self):
+        """
+        split_peaks_by_group: handle space-delimited peaks
+        """
+        # Create test input
+        peaks_file = os.path.join(self.dirn,"peaks.bed")
+        with io.open(peaks_file,'wt') as fp:
+            fp.write(u"""chr1 39756959 39757488 A
+chr1  40278922 40279363 B
+chr2	49032761	49033125 A
+""")
+        output_dir = os.path.join(self.dirn,"groups")
+        os.mkdir(output_dir)
+        # Split the peaks
+        peaks = split_peaks_by_group(peaks_file,4,output_dir)
+        self.assertEqual(peaks,
+                         [os.path.join(output_dir,"A.bed"),
+                          os.path.join(output_dir,"B.bed")])
+        self.assertEqual(io.open(peaks[0],'rt').read(),
+                         u"""chr1	39756959	39757488	A
+chr2	49032761	49033125	A
+""")
+
+class TestSplitBedByChromosome(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestSplitBedByChromosome')
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_split_bed_by_chromosome(self):
+        """
+        split_bed_by_chromosome: split intervals by chromosome
+        """
+        bed_file = os.path.join(self.dirn,"peaks.bed")
+        with open(bed_file,'wt') as fp:
+            fp.write("""track name=peaks
+chr2	300	400
+chr1	100	200
+# Comment
+chr2	100	200
+chrUn_JH584304	10	20
+
+chr1	50	60""")
+        output_dir = os.path.join(self.dirn,"chroms")
+        os.mkdir(output_dir)
+        chrom_files = split_bed_by_chromosome(bed_file,output_dir)
+        self.assertEqual(list(chrom_files.keys()),
+                         ["chr2","chr1","chrUn_JH584304"])
+        self.assertEqual(list(chrom_files.values()),
+                         [os.path.join(output_dir,"peaks.%d.bed" % i)
+                          for i in range(3)])
+        for chrom,expected in (("chr2","chr2\t300\t400\n"
+                                "chr2\t100\t200\n"),
+                               ("chr1","chr1\t100\t200\n"
+                                "chr1\t50\t60\n"),
+                               ("chrUn_JH584304",
+                                "chrUn_JH584304\t10\t20\n")):
+            with open(chrom_files[chrom],'rt') as fp:
+                self.assertEqual(fp.read(),expected)
+
+    def test_split_bed_by_chromosome_with_prefix(self):
+        """
+        split_bed_by_chromosome: use prefix for output files
+        """
+        bed_file = os.path.join(self.dirn,"peaks.bed")
+        with open(bed_file,'wt') as fp:
+            fp.write("chr1\t100\t200\n")
+        chrom_files = split_bed_by_chromosome(bed_file,self.dirn,
+                                              prefix="test")
+        self.assertEqual(dict(chrom_files),
+                         { "chr1": os.path.join(self.dirn,"test.0.bed") })
+
+class TestReadGenomeFile(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestReadGenomeFile')
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_read_genome_file(self):
+        """
+        read_genome_file: read chromosome sizes in file order
+        """
+        genome_file = os.path.join(self.dirn,"mm10.genome")
+        with io.open(genome_file,'wt') as fp:
+            fp.write(u"""chr2	182113224
+chr10	130694993
+chr1	195471971
+""")
+        chrom_sizes = read_genome_file(genome_file)
+        self.assertEqual(list(chrom_sizes.keys()),["chr2","chr10","chr1"])
+        self.assertEqual(chrom_sizes["chr10"],130694993)
+
+    def test_read_genome_file_bad_line(self):
+        """
+        read_genome_file: raise exception for invalid line
+        """
+        genome_file = os.path.join(self.dirn,"mm10.genome")
+        with io.open(genome_file,'wt') as fp:
+            fp.write(u"""chr2	182113224
+chr10
+""")
+        self.assertRaises(ValueError,read_genome_file,genome_file)
+
+class TestSortBedFile(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestSortBedFile')
+        # Create test input
+        self.bed_file = os.path.join(self.dirn,"peaks.bed")
+        with io.open(self.bed_file,'wt') as fp:
+            fp.write(u"""track name=peaks
+chr2	49032761	49033125	peak1
+chr10	40278922	40279363	peak2
+chr2	39756959	39757488	peak3
+
+chr1	73362131	73362563	peak4
+""")
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_sort_bed_file(self):
+        """
+        sort_bed_file: sort intervals by chromosome and position
+        """
+        sorted_bed_file = os.path.join(self.dirn,"sorted.bed")
+        self.assertEqual(sort_bed_file(self.bed_file,sorted_bed_file),
+                         sorted_bed_file)
+        self.assertEqual(io.open(sorted_bed_file,'rt').read(),
+                         u"""chr1	73362131	73362563	peak4
+chr10	40278922	40279363	peak2
+chr2	39756959	39757488	peak3
+chr2	49032761	49033125	peak1
+""")
+
+    def test_sort_bed_file_with_genome(self):
+        """
+        sort_bed_file: sort intervals using genome chromosome order
+        """
+        sorted_bed_file = os.path.join(self.dirn,"sorted.bed")
+        chrom_sizes = { "chr1": 195471971,
+                        "chr2": 182113224,
+                        "chr10": 130694993 }
+        sort_bed_file(self.bed_file,sorted_bed_file,
+                      chrom_sizes=chrom_sizes)
+        self.assertEqual(io.open(sorted_bed_file,'rt').read(),
+                         u"""chr1	73362131	73362563	peak4
+chr2	39756959	39757488	peak3
+chr2	49032761	49033125	peak1
+chr10	40278922	40279363	peak2
+""")
+
+    def test_sort_bed_file_space_delimited(self):
+        """
+        sort_bed_file: handle intervals separated by spaces
+        """
+        bed_file = os.path.join(self.dirn,"spaces.bed")
+        with io.open(bed_file,'wt') as fp:
+            fp.write(u"chr2 49032761  49033125 peak1\n"
+                     u"chr1\t73362131 73362563\tpeak4\n")
+        sorted_bed_file = os.path.join(self.dirn,"sorted.bed")
+        sort_bed_file(bed_file,sorted_bed_file)
+        self.assertEqual(io.open(sorted_bed_file,'rt').read(),
+                         u"chr1\t73362131\t73362563\tpeak4\n"
+                         u"chr2\t49032761\t49033125\tpeak1\n")
+        # Invalid interval
+        with io.open(bed_file,'wt') as fp:
+            fp.write(u"chr2 49032761\n")
+        self.assertRaises(ValueError,
+                          sort_bed_file,
+                          bed_file,sorted_bed_file)
+
+    def test_sort_bed_file_missing_chromosome(self):
+        """
+        sort_bed_file: raise exception for chromosome not in genome
+        """
+        sorted_bed_file = os.path.join(self.dirn,"sorted.bed")
+        chrom_sizes = { "chr1": 195471971,
+                        "chr2": 182113224 }
+        self.assertRaises(ValueError,
+                          sort_bed_file,
+                          self.bed_file,sorted_bed_file,
+                          chrom_sizes=chrom_sizes)
+
+class TestGetSortedBedFile(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestGetSortedBedFile')
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_get_sorted_bed_file(self):
+        """
+        get_sorted_bed_file: create and reuse cached sorted file
+        """
+        genes_file = os.path.join(self.dirn,"genes.bed")
+        with io.open(genes_file,'wt') as fp:
+            fp.write(u"""chr2	182113224	182113225	Gene1
+chr1	195471971	195471972	Gene2
+""")
+        cache_dir = os.path.join(self.dirn,"cache")
+        sorted_genes_file = get_sorted_bed_file(genes_file,cache_dir)
+        self.assertTrue(sorted_genes_file.startswith(cache_dir))
+        self.assertEqual(os.path.basename(sorted_genes_file),"genes.bed")
+        self.assertEqual(io.open(sorted_genes_file,'rt').read(),
+                         u"""chr1	195471971	195471972	Gene2
+chr2	182113224	182113225	Gene1
+""")
+        # Cached file is reused
+        mtime = os.path.getmtime(sorted_genes_file)
+        self.assertEqual(get_sorted_bed_file(genes_file,cache_dir),
+                         sorted_genes_file)
+        self.assertEqual(os.path.getmtime(sorted_genes_file),mtime)
+        # Different genome file gives a different cached file
+        genome_file = os.path.join(self.dirn,"test.genome")
+        with io.open(genome_file,'wt') as fp:
+            fp.write(u"""chr2	182113225
+chr1	195471972
+""")
+        sorted_genes_file2 = get_sorted_bed_file(genes_file,cache_dir,
+                                                 genome_file=genome_file)
+        self.assertNotEqual(sorted_genes_file2,sorted_genes_file)
+        self.assertEqual(io.open(sorted_genes_file2,'rt').read(),
+                         u"""chr2	182113224	182113225	Gene1
+chr1	195471971	195471972	Gene2
+""")
+
+class TestMergeBedFile(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestMergeBedFile')
+        # Create BED file
+        self.bed_file = os.path.join(self.dirn,"peaks.bed")
+        with io.open(self.bed_file,'wt') as fp:
+            fp.write(u"""track name=peaks
+chr2	500	600	peak1
+chr1	300	400	peak2
+chr1	100	200	peak3
+chr1	150	250	peak4
+chr1	250	300	peak5
+chr2	100	1000	peak6
+chr10	100	200	peak7
+
+chr3	100	200	peak8
+""")
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_merge_bed_file(self):
+        """
+        merge_bed_file: merge overlapping and book-ended intervals
+        """
+        merged_bed_file = os.path.join(self.dirn,"merged.bed")
+        self.assertEqual(merge_bed_file(self.bed_file,merged_bed_file),
+                         (7,3))
+        self.assertEqual(io.open(merged_bed_file,'rt').read(),
+                         u"""chr1	100	400
+chr10	100	200
+chr2	100	1000
+""")
+
+    def test_merge_bed_file_with_genome(self):
+        """
+        merge_bed_file: order chromosomes using chromosome sizes
+        """
+        merged_bed_file = os.path.join(self.dirn,"merged.bed")
+        chrom_sizes = { "chr2": 182113224,
+                        "chr1": 195471971 }
+        self.assertEqual(merge_bed_file(self.bed_file,merged_bed_file,
+                                        chrom_sizes=chrom_sizes),
+                         (7,3))
+        self.assertEqual(io.open(merged_bed_file,'rt').read(),
+                         u"""chr2	100	1000
+chr1	100	400
+chr10	100	200
 """)
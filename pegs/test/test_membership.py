@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import numpy as np
+from pegs.membership import GeneMembership
+from pegs.membership import select_names
+from pegs.membership import load_npz_array
+
+class TestGeneMembership(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestGeneMembership')
+        self.genes = ["1500015O10Rik","Adhfe1","Dnah7c","Gm15179","Mroh3"]
+        self.peaks = ["/data/peaks0.bed","/data/peaks1.bed"]
+        self.clusters = ["/data/cluster_0.txt","/data/cluster_1.txt"]
+        self.distances = [5000000,10000000]
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def _make_membership(self,include_tads=True):
+        # Build a membership for the test data
+        membership = GeneMembership(self.peaks,self.clusters,
+                                    self.distances,
+                                    include_tads=include_tads)
+        membership.set_genes(self.genes)
+        membership.add(("peaks",0,0),[1,2],[0,2,3])
+        membership.add(("peaks",0,1),[1,2],[0,2,3])
+        membership.add(("peaks",1,0),[0,2],[2,3])
+        membership.add(("peaks",1,1),[1,1],[0,3])
+        if include_tads:
+            membership.add(("tads",0),[1,1],[0,2])
+            membership.add(("tads",1),[0,0],[])
+        return membership
+
+    def test_gene_membership_build(self):
+        """
+        GeneMembership: build sparse arrays from cells
+        """
+        membership = self._make_membership()
+        membership.build()
+        self.assertEqual(list(membership.indptr),[0,1,3,4,6,6,8,9,10])
+        self.assertEqual(list(membership.indices),[0,2,3,0,2,3,2,3,0,3])
+        self.assertEqual(list(membership.tads_indptr),[0,1,2,2,2])
+        self.assertEqual(list(membership.tads_indices),[0,2])
+        self.assertEqual(membership.cell_genes(0,0,1),["Dnah7c","Gm15179"])
+        self.assertEqual(membership.cell_genes(1,0,0),[])
+        self.assertEqual(membership.cell_genes(1,1,1),["Gm15179"])
+        self.assertEqual(membership.tads_genes(0,1),["Dnah7c"])
+
+    def test_gene_membership_missing_cell(self):
+        """
+        GeneMembership: raise exception if genes are missing for a cell
+        """
+        membership = GeneMembership(self.peaks,self.clusters,
+                                    self.distances)
+        membership.set_genes(self.genes)
+        membership.add(("peaks",0,0),[1,2],[0,2,3])
+        self.assertRaises(ValueError,membership.build)
+
+    def test_gene_membership_inconsistent_counts(self):
+        """
+        GeneMembership: raise exception if counts don't match genes
+        """
+        membership = GeneMembership(self.peaks,self.clusters,
+                                    self.distances)
+        self.assertRaises(ValueError,membership.add,
+                          ("peaks",0,0),[1,2],[0,2])
+        self.assertRaises(ValueError,membership.add,
+                          ("peaks",0,0),[3],[0,2,3])
+
+    def test_gene_membership_save_and_load(self):
+        """
+        GeneMembership: save to file and load (memory-mapped)
+        """
+        membership_file = os.path.join(self.dirn,"genes.npz")
+        self._make_membership().save(membership_file)
+        for mmap in (True,False):
+            membership = GeneMembership.load(membership_file,mmap=mmap)
+            self.assertEqual(membership.peaks,["peaks0.bed","peaks1.bed"])
+            self.assertEqual(membership.clusters,
+                             ["cluster_0.txt","cluster_1.txt"])
+            self.assertEqual(membership.distances,self.distances)
+            self.assertTrue(membership.include_tads)
+            self.assertEqual(membership.first_peak_set,0)
+            self.assertEqual(membership.n_peak_sets,2)
+            if mmap:
+                self.assertTrue(isinstance(membership.indices,np.memmap))
+            self.assertEqual(membership.cell_genes(0,1,1),
+                             ["Dnah7c","Gm15179"])
+            self.assertEqual(membership.tads_genes(0,0),["1500015O10Rik"])
+            del(membership)
+
+    def test_gene_membership_query(self):
+        """
+        GeneMembership: query genes for subsets of cells
+        """
+        membership = self._make_membership()
+        membership.build()
+        self.assertEqual(list(membership.query(peak_sets=["peaks1"],
+                                               distances=[10000000])),
+                         [("peaks1.bed",10000000,"cluster_0.txt",
+                           "1500015O10Rik"),
+                          ("peaks1.bed",10000000,"cluster_1.txt",
+                           "Gm15179")])
+        self.assertEqual(list(membership.query(clusters=["cluster_0.txt"],
+                                               distances=[5000000])),
+                         [("peaks0.bed",5000000,"cluster_0.txt",
+                           "1500015O10Rik")])
+        self.assertEqual(list(membership.query(tads=True)),
+                         [("peaks0.bed","TADs","cluster_0.txt",
+                           "1500015O10Rik"),
+                          ("peaks0.bed","TADs","cluster_1.txt",
+                           "Dnah7c")])
+        self.assertEqual(len(list(membership.query())),10)
+
+    def test_gene_membership_no_tads(self):
+        """
+        GeneMembership: raise exception querying TADs if not included
+        """
+        membership_file = os.path.join(self.dirn,"genes.npz")
+        self._make_membership(include_tads=False).save(membership_file)
+        membership = GeneMembership.load(membership_file)
+        self.assertFalse(membership.include_tads)
+        self.assertRaises(ValueError,membership.tads_genes,0,0)
+        del(membership)
+
+class TestSelectNames(unittest.TestCase):
+
+    def test_select_names(self):
+        """
+        select_names: select names with or without extensions
+        """
+        names = ["peaks0.bed","peaks1.bed","peaks2.bed"]
+        self.assertEqual(select_names(names),[0,1,2])
+        self.assertEqual(select_names(names,["peaks2","peaks0.bed"]),[0,2])
+        self.assertEqual(select_names(names,["peaks3"]),[])
+
+class TestLoadNpzArray(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestLoadNpzArray')
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_load_npz_array(self):
+        """
+        load_npz_array: memory-map arrays from uncompressed file
+        """
+        npz_file = os.path.join(self.dirn,"test.npz")
+        a = np.arange(10,dtype=np.int32)
+        b = np.array([[1.5,2.5],[3.5,4.5]])
+        with io.open(npz_file,'wb') as fp:
+            np.savez(fp,a=a,b=b,empty=np.zeros(0))
+        x = load_npz_array(npz_file,"a")
+        self.assertTrue(isinstance(x,np.memmap))
+        self.assertTrue(np.array_equal(x,a))
+        y = load_npz_array(npz_file,"b")
+        self.assertTrue(isinstance(y,np.memmap))
+        self.assertTrue(np.array_equal(y,b))
+        self.assertEqual(len(load_npz_array(npz_file,"empty")),0)
+        del(x,y)
+
+    def test_load_npz_array_compressed(self):
+        """
+        load_npz_array: read arrays from compressed file
+        """
+        npz_file = os.path.join(self.dirn,"test.npz")
+        a = np.arange(10,dtype=np.int32)
+        with io.open(npz_file,'wb') as fp:
+            np.savez_compressed(fp,a=a)
+        x = load_npz_array(npz_file,"a")
+        self.assertFalse(isinstance(x,np.memmap))
+        self.assertTrue(np.array_equal(x,a))
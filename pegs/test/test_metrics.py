@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import json
+import io
+import os
+from pegs.metrics import Metrics
+from pegs.metrics import format_duration
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_metrics_records_progress(self):
+        """
+        Metrics: records cells, bedtools time and bytes read
+        """
+        metrics = Metrics(progress=False)
+        self.assertFalse(metrics.enabled)
+        metrics.set_stage("intersections")
+        metrics.set_total_cells(10,skipped=2)
+        self.assertEqual(metrics.cells_per_second,None)
+        self.assertEqual(metrics.eta,None)
+        metrics.add_bedtools_time(0.5)
+        metrics.add_cells(1,bedtools_time=0.25,bytes_read=100)
+        metrics.add_cells(3,bytes_read=50)
+        self.assertEqual(metrics.stage,"intersections")
+        self.assertEqual(metrics.cells_completed,4)
+        self.assertEqual(metrics.bedtools_time,0.75)
+        self.assertEqual(metrics.bytes_read,150)
+        self.assertTrue(metrics.cells_per_second > 0.0)
+        self.assertTrue(metrics.eta > 0.0)
+        metrics.add_cells(4)
+        self.assertEqual(metrics.eta,0.0)
+
+    def test_metrics_progress_line(self):
+        """
+        Metrics: writes progress line to stream
+        """
+        stream = io.StringIO()
+        metrics = Metrics(progress=True,stream=stream)
+        self.assertTrue(metrics.enabled)
+        metrics.set_stage("intersections")
+        metrics.set_total_cells(4)
+        metrics.add_cells(1,bytes_read=2048)
+        metrics.update(force=True)
+        line = stream.getvalue().split('\r')[-2]
+        self.assertTrue(line.startswith("[intersections] 1/4 cells (25.0%)"))
+        self.assertTrue("ETA " in line)
+        self.assertTrue("read 2.0KiB" in line)
+        metrics.set_stage("outputs")
+        metrics.set_total_outputs(3)
+        metrics.add_outputs(1)
+        self.assertTrue(metrics.progress_line().startswith(
+            "[outputs] 1/3 outputs"))
+        metrics.finish()
+        self.assertEqual(stream.getvalue().split('\r')[-2].strip(),"")
+
+    def test_metrics_no_progress_line_for_non_tty(self):
+        """
+        Metrics: don't show progress line if stream isn't a terminal
+        """
+        stream = io.StringIO()
+        metrics = Metrics(stream=stream)
+        self.assertFalse(metrics.progress)
+        metrics.set_total_cells(4)
+        metrics.add_cells(1)
+        metrics.finish()
+        self.assertEqual(stream.getvalue(),"")
+
+    def test_metrics_write_json(self):
+        """
+        Metrics: writes metrics file as JSON
+        """
+        metrics_file = os.path.join(self.test_dir,"pegs_metrics.json")
+        metrics = Metrics(name="test",metrics_file=metrics_file,
+                          progress=False)
+        self.assertTrue(metrics.enabled)
+        metrics.set_stage("intersections")
+        self.assertTrue(os.path.exists(metrics_file))
+        metrics.set_total_cells(6)
+        metrics.add_cells(2,bedtools_time=1.5,bytes_read=10)
+        metrics.finish()
+        with io.open(metrics_file,'rt') as fp:
+            data = json.load(fp)
+        self.assertEqual(data['name'],"test")
+        self.assertEqual(data['stage'],"intersections")
+        self.assertEqual(data['total_cells'],6)
+        self.assertEqual(data['cells_completed'],2)
+        self.assertEqual(data['bedtools_time'],1.5)
+        self.assertEqual(data['bytes_read'],10)
+        self.assertEqual(os.listdir(self.test_dir),["pegs_metrics.json"])
+
+    def test_metrics_write_prometheus(self):
+        """
+        Metrics: writes metrics file in Prometheus text format
+        """
+        metrics_file = os.path.join(self.test_dir,"pegs.prom")
+        metrics = Metrics(name="test",metrics_file=metrics_file,
+                          progress=False)
+        metrics.set_stage("intersections")
+        metrics.set_total_cells(6)
+        metrics.add_cells(2,bytes_read=10)
+        metrics.finish()
+        with io.open(metrics_file,'rt') as fp:
+            lines = fp.read().split('\n')
+        self.assertTrue('pegs_cells{name="test"} 6.0' in lines)
+        self.assertTrue('pegs_cells_completed_total{name="test"} 2.0'
+                        in lines)
+        self.assertTrue('pegs_bytes_read_total{name="test"} 10.0' in lines)
+        self.assertTrue('pegs_stage{name="test",stage="intersections"} 1'
+                        in lines)
+        self.assertTrue("# TYPE pegs_cells_completed_total counter"
+                        in lines)
+
+    def test_metrics_file_update_interval(self):
+        """
+        Metrics: only rewrites metrics file after update interval
+        """
+        metrics_file = os.path.join(self.test_dir,"pegs_metrics.json")
+        metrics = Metrics(metrics_file=metrics_file,interval=3600.0,
+                          progress=False)
+        metrics.set_total_cells(6)
+        metrics.add_cells(1)
+        with io.open(metrics_file,'rt') as fp:
+            self.assertEqual(json.load(fp)['cells_completed'],0)
+        metrics.finish()
+        with io.open(metrics_file,'rt') as fp:
+            self.assertEqual(json.load(fp)['cells_completed'],1)
+
+class TestFormatDuration(unittest.TestCase):
+
+    def test_format_duration(self):
+        """
+        format_duration: formats durations as H:MM:SS
+        """
+        self.assertEqual(format_duration(None),"--:--:--")
+        self.assertEqual(format_duration(0),"0:00:00")
+        self.assertEqual(format_duration(61.4),"0:01:01")
+        self.assertEqual(format_duration(3*3600+59),"3:00:59")
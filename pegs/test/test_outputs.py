@@ -1,13 +1,23 @@
 #!/usr/bin/env python
 
 import unittest
+import io
 import tempfile
 import os
 import shutil
 import numpy as np
+import seaborn as sns
+from matplotlib.image import imread
 
+from pegs.outputs import get_heatmap_outputs
 from pegs.outputs import make_heatmap
+from pegs.outputs import make_heatmaps
+from pegs.outputs import get_paginated_heatmaps
+from pegs.outputs import get_heatmap_pages
 from pegs.outputs import make_xlsx_file
+from pegs.outputs import write_xlsx_file
+from pegs.outputs import write_tsv_results
+from pegs.results import EnrichmentResults
 
 class TestMakeHeatmap(unittest.TestCase):
     def setUp(self):
@@ -70,6 +80,247 @@ class TestMakeHeatmap(unittest.TestCase):
                      tads_counts=counts_tads)
         self.assertTrue(os.path.exists(heatmap_file))
 
+class TestMakeHeatmaps(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.peaks = [os.path.join(self.test_dir,"peaks%d.bed" % i)
+                      for i in range(2)]
+        self.clusters = [os.path.join(self.test_dir,"cluster_%d.txt" % i)
+                         for i in range(2)]
+        self.distances = [5000000,10000000]
+        self.pvalues = np.array([[[0.9,0.3],[0.9,0.3]],
+                                 [[1.0,0.1],[0.9,0.3]]])
+        self.counts = np.array([[[1.0,2.0],[1.0,2.0]],
+                                [[0.0,2.0],[1.0,2.0]]])
+        self.pvalues_tads = np.array([[0.7,0.7],[1.0,0.4]])
+        self.counts_tads = np.array([[1.0,1.0],[0.0,1.0]])
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+    def test_make_heatmaps_multiple_formats_and_colormaps(self):
+        """
+        make_heatmaps: generates heatmaps in multiple formats and colormaps
+        """
+        heatmaps = []
+        for fmt in ("png","svg","pdf"):
+            for variant,cmap in (("default",None),
+                                 ("red",sns.light_palette(
+                                     color="red",as_cmap=True))):
+                heatmaps.append((os.path.join(self.test_dir,
+                                              "pegs_heatmap.%s.%s" %
+                                              (variant,fmt)),
+                                 cmap,
+                                 fmt))
+        make_heatmaps(heatmaps,
+                      EnrichmentResults.from_arrays(
+                          self.peaks,self.clusters,self.distances,
+                          self.pvalues,self.counts,
+                          tads_pvalues=self.pvalues_tads,
+                          tads_counts=self.counts_tads))
+        for heatmap_file,cmap,fmt in heatmaps:
+            self.assertTrue(os.path.exists(heatmap_file))
+    def test_make_heatmaps_matches_make_heatmap(self):
+        """
+        make_heatmaps: recoloured heatmap matches a heatmap plotted directly
+        """
+        cmap = sns.light_palette(color="red",as_cmap=True)
+        heatmaps = [(os.path.join(self.test_dir,"default.png"),None,None),
+                    (os.path.join(self.test_dir,"red.png"),cmap,None)]
+        make_heatmaps(heatmaps,
+                      EnrichmentResults.from_arrays(
+                          self.peaks,self.clusters,self.distances,
+                          self.pvalues,self.counts,
+                          tads_pvalues=self.pvalues_tads,
+                          tads_counts=self.counts_tads))
+        heatmap_file = os.path.join(self.test_dir,"red_direct.png")
+        make_heatmap(heatmap_file,
+                     self.peaks,self.clusters,self.distances,
+                     self.pvalues,self.counts,
+                     tads_pvalues=self.pvalues_tads,
+                     tads_counts=self.counts_tads,
+                     heatmap_cmap=cmap)
+        self.assertTrue(np.array_equal(imread(heatmaps[1][0]),
+                                       imread(heatmap_file)))
+        self.assertFalse(np.array_equal(imread(heatmaps[0][0]),
+                                        imread(heatmap_file)))
+
+class TestGetPaginatedHeatmaps(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.peaks = [os.path.join(self.test_dir,"peaks%d.bed" % i)
+                      for i in range(3)]
+        self.clusters = [os.path.join(self.test_dir,"cluster_%d.txt" % i)
+                         for i in range(3)]
+        self.distances = [5000000,10000000]
+        self.pvalues = np.array([[[0.9,0.3,0.5],[0.9,0.3,0.5]],
+                                 [[1.0,0.1,0.5],[0.9,0.3,0.5]],
+                                 [[0.2,0.3,0.4],[0.5,0.6,0.7]]])
+        self.counts = np.array([[[1.0,2.0,1.0],[1.0,2.0,1.0]],
+                                [[0.0,2.0,1.0],[1.0,2.0,1.0]],
+                                [[3.0,2.0,1.0],[1.0,2.0,1.0]]])
+        self.pvalues_tads = np.array([[0.7,0.7,0.2],
+                                      [1.0,0.4,0.2],
+                                      [0.5,0.5,0.5]])
+        self.counts_tads = np.array([[1.0,1.0,1.0],
+                                     [0.0,1.0,1.0],
+                                     [1.0,1.0,1.0]])
+        self.results = EnrichmentResults.from_arrays(
+            self.peaks,self.clusters,self.distances,
+            self.pvalues,self.counts,
+            tads_pvalues=self.pvalues_tads,
+            tads_counts=self.counts_tads)
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+    def test_get_paginated_heatmaps_peak_sets(self):
+        """
+        get_paginated_heatmaps: split peak sets over pages
+        """
+        heatmap_file = os.path.join(self.test_dir,"pegs_heatmap.png")
+        pages = get_paginated_heatmaps([(heatmap_file,None,None)],
+                                       self.results,
+                                       peak_sets_per_page=2)
+        self.assertEqual([args[0] for args,kws in pages],
+                         [[(os.path.join(self.test_dir,
+                                         "pegs_heatmap.page01.png"),
+                            None,None)],
+                          [(os.path.join(self.test_dir,
+                                         "pegs_heatmap.page02.png"),
+                            None,None)]])
+        self.assertEqual([args[1].peak_set_names for args,kws in pages],
+                         [["peaks0","peaks1"],["peaks2"]])
+        self.assertTrue(np.array_equal(pages[1][0][1].tads_pvalues,
+                                       self.pvalues_tads[2:]))
+        for args,kws in pages:
+            make_heatmaps(*args,**kws)
+            self.assertTrue(os.path.exists(args[0][0][0]))
+    def test_get_paginated_heatmaps_tiles(self):
+        """
+        get_paginated_heatmaps: split peak sets and clusters into tiles
+        """
+        heatmap_file = os.path.join(self.test_dir,"pegs_heatmap.pdf")
+        pages = get_paginated_heatmaps([(heatmap_file,None,None)],
+                                       self.results,
+                                       peak_sets_per_page=2,
+                                       clusters_per_page=2)
+        self.assertEqual([args[0][0][0] for args,kws in pages],
+                         [os.path.join(self.test_dir,
+                                       "pegs_heatmap.%s.pdf" % t)
+                          for t in ("r01c01","r01c02","r02c01","r02c02")])
+        self.assertEqual([args[1].cluster_names for args,kws in pages],
+                         [["cluster_0","cluster_1"],["cluster_2"],
+                          ["cluster_0","cluster_1"],["cluster_2"]])
+        self.assertTrue(np.array_equal(pages[3][0][1].pvalues,
+                                       self.pvalues[2:,:,2:]))
+    def test_get_paginated_heatmaps_shared_colour_scale(self):
+        """
+        get_paginated_heatmaps: pages use the same colour scale
+        """
+        # Page with the last peak set only should match a heatmap
+        # plotted directly using the colour scale for all the data
+        results = EnrichmentResults.from_arrays(self.peaks,self.clusters,
+                                                self.distances,
+                                                self.pvalues,self.counts)
+        heatmap_file = os.path.join(self.test_dir,"pegs_heatmap.png")
+        pages = get_paginated_heatmaps([(heatmap_file,None,None)],
+                                       results,
+                                       peak_sets_per_page=2)
+        for args,kws in pages:
+            self.assertEqual(kws['vmin'],-np.log10(1.0))
+            self.assertEqual(kws['vmax'],-np.log10(0.1))
+        make_heatmaps(*pages[1][0],**pages[1][1])
+        direct_file = os.path.join(self.test_dir,"direct.png")
+        make_heatmaps([(direct_file,None,None)],
+                      EnrichmentResults.from_arrays(
+                          self.peaks[2:],self.clusters,self.distances,
+                          self.pvalues[2:],self.counts[2:]),
+                      vmin=-np.log10(1.0),
+                      vmax=-np.log10(0.1))
+        self.assertTrue(np.array_equal(
+            imread(os.path.join(self.test_dir,"pegs_heatmap.page02.png")),
+            imread(direct_file)))
+
+class TestGetHeatmapPages(unittest.TestCase):
+    def test_get_heatmap_pages_single_page(self):
+        """
+        get_heatmap_pages: no pagination
+        """
+        self.assertEqual(get_heatmap_pages(3,4),
+                         [("page01",slice(0,3),slice(0,4))])
+    def test_get_heatmap_pages_peak_sets(self):
+        """
+        get_heatmap_pages: paginate peak sets
+        """
+        self.assertEqual(get_heatmap_pages(5,4,peak_sets_per_page=2),
+                         [("page01",slice(0,2),slice(0,4)),
+                          ("page02",slice(2,4),slice(0,4)),
+                          ("page03",slice(4,6),slice(0,4))])
+    def test_get_heatmap_pages_tiles(self):
+        """
+        get_heatmap_pages: paginate peak sets and clusters
+        """
+        self.assertEqual(get_heatmap_pages(3,4,peak_sets_per_page=2,
+                                           clusters_per_page=3),
+                         [("r01c01",slice(0,2),slice(0,3)),
+                          ("r01c02",slice(0,2),slice(3,6)),
+                          ("r02c01",slice(2,4),slice(0,3)),
+                          ("r02c02",slice(2,4),slice(3,6))])
+
+class TestGetHeatmapOutputs(unittest.TestCase):
+    def test_get_heatmap_outputs_default(self):
+        """
+        get_heatmap_outputs: default heatmap file
+        """
+        self.assertEqual(get_heatmap_outputs("pegs",
+                                             output_directory="/out"),
+                         [("/out/pegs_heatmap.png",None,"png")])
+    def test_get_heatmap_outputs_explicit_file(self):
+        """
+        get_heatmap_outputs: explicitly specified heatmap file
+        """
+        self.assertEqual(get_heatmap_outputs("pegs",
+                                             heatmap="results.svg",
+                                             output_directory="/out"),
+                         [("/out/results.svg",None,None)])
+        self.assertEqual(get_heatmap_outputs("pegs",
+                                             heatmap="results.png",
+                                             heatmap_format="svg",
+                                             output_directory="/out"),
+                         [("/out/results.png",None,"svg")])
+    def test_get_heatmap_outputs_multiple_formats(self):
+        """
+        get_heatmap_outputs: multiple formats
+        """
+        self.assertEqual(get_heatmap_outputs("pegs",
+                                             heatmap_format=["png","svg"],
+                                             output_directory="/out"),
+                         [("/out/pegs_heatmap.png",None,"png"),
+                          ("/out/pegs_heatmap.svg",None,"svg")])
+        self.assertEqual(get_heatmap_outputs("pegs",
+                                             heatmap=["results.png"],
+                                             heatmap_format=["png","pdf"],
+                                             output_directory="/out"),
+                         [("/out/results.png",None,"png"),
+                          ("/out/results.pdf",None,"pdf")])
+    def test_get_heatmap_outputs_multiple_variants(self):
+        """
+        get_heatmap_outputs: multiple colormap variants
+        """
+        self.assertEqual(get_heatmap_outputs("pegs",
+                                             heatmap_format=["png","svg"],
+                                             variants=[("red","cmap1"),
+                                                       ("blue","cmap2")],
+                                             output_directory="/out"),
+                         [("/out/pegs_heatmap.red.png","cmap1","png"),
+                          ("/out/pegs_heatmap.blue.png","cmap2","png"),
+                          ("/out/pegs_heatmap.red.svg","cmap1","svg"),
+                          ("/out/pegs_heatmap.blue.svg","cmap2","svg")])
+        # Single variant doesn't change the file name
+        self.assertEqual(get_heatmap_outputs("pegs",
+                                             variants=[("red","cmap1")],
+                                             output_directory="/out"),
+                         [("/out/pegs_heatmap.png","cmap1","png")])
+
 class TestMakeXlsxFile(unittest.TestCase):
     def setUp(self):
         self.test_dir = tempfile.mkdtemp()
@@ -130,5 +381,88 @@ class TestMakeXlsxFile(unittest.TestCase):
                        tads_pvalues=pvalues_tads,
                        tads_counts=counts_tads)
         self.assertTrue(os.path.exists(xlsx_file))
+    def test_write_xlsx_file(self):
+        """
+        write_xlsx_file: generates XLSX file from EnrichmentResults
+        """
+        peaks = []
+        for i in range(2):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            peaks.append(peaks_file)
+        clusters = []
+        for i in range(2):
+            cluster_file = os.path.join(self.test_dir,
+                                        "cluster_%d.txt" % i)
+            clusters.append(cluster_file)
+        distances = [5000000,10000000]
+        pvalues = np.array([[[0.9,0.3],[0.9,0.3]],
+                            [[1.0,0.1],[0.9,0.3]]])
+        counts = np.array([[[1.0,2.0],[1.0,2.0]],
+                           [[0.0,2.0],[1.0,2.0]]])
+        pvalues_tads = np.array([[0.7,0.7],[1.0,0.4]])
+        counts_tads = np.array([[1.0,1.0],[0.0,1.0]])
+        xlsx_file = os.path.join(self.test_dir,
+                                 "pegs_test_result.xlsx")
+        write_xlsx_file(xlsx_file,
+                        EnrichmentResults.from_arrays(
+                            peaks,clusters,distances,
+                            pvalues,counts,
+                            tads_pvalues=pvalues_tads,
+                            tads_counts=counts_tads))
+        self.assertTrue(os.path.exists(xlsx_file))
 
         
+
+class TestWriteTsvResults(unittest.TestCase):
+    def test_write_tsv_results(self):
+        """
+        write_tsv_results: writes long-format TSV data
+        """
+        peaks = ["/data/peaks0.bed","/data/peaks1.bed"]
+        clusters = ["/data/cluster_0.txt","/data/cluster_1.txt"]
+        distances = [5000000,10000000]
+        pvalues = np.array([[[0.9,0.3],[0.9,0.3]],
+                            [[1.0,0.1],[0.9,0.3]]])
+        counts = np.array([[[1.0,2.0],[1.0,2.0]],
+                           [[0.0,2.0],[1.0,2.0]]])
+        fp = io.StringIO()
+        results = EnrichmentResults.from_arrays(peaks,clusters,distances,
+                                                pvalues,counts)
+        self.assertEqual(write_tsv_results(fp,results),8)
+        self.assertEqual(fp.getvalue(),
+                         """#Peak set	Distance	Cluster	Count	P-value
+peaks0.bed	5000000	cluster_0	1	0.9
+peaks0.bed	5000000	cluster_1	2	0.3
+peaks0.bed	10000000	cluster_0	1	0.9
+peaks0.bed	10000000	cluster_1	2	0.3
+peaks1.bed	5000000	cluster_0	0	1.0
+peaks1.bed	5000000	cluster_1	2	0.1
+peaks1.bed	10000000	cluster_0	1	0.9
+peaks1.bed	10000000	cluster_1	2	0.3
+""")
+    def test_write_tsv_results_with_tads_and_reference(self):
+        """
+        write_tsv_results: writes TADs data and reference name
+        """
+        peaks = ["/data/peaks0.bed"]
+        clusters = ["/data/cluster_0.txt","/data/cluster_1.txt"]
+        distances = [5000000]
+        pvalues = np.array([[[0.9,0.3]]])
+        counts = np.array([[[1.0,2.0]]])
+        pvalues_tads = np.array([[0.7,0.4]])
+        counts_tads = np.array([[1.0,3.0]])
+        fp = io.StringIO()
+        results = EnrichmentResults.from_arrays(peaks,clusters,distances,
+                                                pvalues,counts,
+                                                tads_pvalues=pvalues_tads,
+                                                tads_counts=counts_tads)
+        self.assertEqual(write_tsv_results(fp,results,
+                                           reference="mm10",
+                                           header=False),4)
+        self.assertEqual(fp.getvalue(),
+                         """mm10	peaks0.bed	5000000	cluster_0	1	0.9
+mm10	peaks0.bed	5000000	cluster_1	2	0.3
+mm10	peaks0.bed	TADs	cluster_0	1	0.7
+mm10	peaks0.bed	TADs	cluster_1	3	0.4
+""")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import os
+import io
+import numpy as np
+from pegs.peakcache import cache_peaks
+from pegs.peakcache import load_cached_peaks
+from pegs.peakcache import write_expanded_peaks
+
+class TestPeakCache(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestPeakCache')
+        # Create test input
+        self.peaks_file = os.path.join(self.dirn,"peaks.bed")
+        with io.open(self.peaks_file,'wt') as fp:
+            fp.write(u"""track name=peaks
+chr2	49032761	49033125	peak1
+chr1	5000	6000	peak2
+chr2	39756959	39757488	peak3
+chr1	195465000	195470000	peak4
+""")
+        self.cache_dir = os.path.join(self.dirn,"cache")
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_cache_peaks(self):
+        """
+        cache_peaks: create and reuse binary peak cache
+        """
+        peak_cache = cache_peaks(self.peaks_file,self.cache_dir)
+        self.assertEqual(os.path.dirname(peak_cache),self.cache_dir)
+        self.assertEqual(sorted(os.listdir(peak_cache)),
+                         ["0.end.npy","0.start.npy",
+                          "1.end.npy","1.start.npy",
+                          "chroms.npy"])
+        # Cache is reused
+        mtime = os.path.getmtime(os.path.join(peak_cache,"chroms.npy"))
+        self.assertEqual(cache_peaks(self.peaks_file,self.cache_dir),
+                         peak_cache)
+        self.assertEqual(os.path.getmtime(os.path.join(peak_cache,
+                                                       "chroms.npy")),
+                         mtime)
+
+    def test_load_cached_peaks(self):
+        """
+        load_cached_peaks: load memory-mapped peak coordinates
+        """
+        peaks = load_cached_peaks(cache_peaks(self.peaks_file,
+                                              self.cache_dir))
+        self.assertEqual(list(peaks.keys()),["chr2","chr1"])
+        start,end = peaks["chr2"]
+        self.assertTrue(isinstance(start,np.memmap))
+        self.assertEqual(start.dtype,np.int32)
+        self.assertEqual(list(start),[49032761,39756959])
+        self.assertEqual(list(end),[49033125,39757488])
+        start,end = peaks["chr1"]
+        self.assertEqual(list(start),[5000,195465000])
+        self.assertEqual(list(end),[6000,195470000])
+
+    def test_write_expanded_peaks(self):
+        """
+        write_expanded_peaks: write expanded peaks from cache
+        """
+        peaks = load_cached_peaks(cache_peaks(self.peaks_file,
+                                              self.cache_dir))
+        expanded_file = os.path.join(self.dirn,"expanded.bed")
+        write_expanded_peaks(peaks,expanded_file,10000,
+                             chrom_sizes={ "chr1": 195471971 })
+        self.assertEqual(io.open(expanded_file,'rt').read(),
+                         u"""chr2	49022761	49043125
+chr2	39746959	39767488
+chr1	0	16000
+chr1	195455000	195471971
+""")
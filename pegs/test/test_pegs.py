@@ -1,9 +1,14 @@
 #!/usr/bin/env python
 
 import unittest
+import sys
 import tempfile
 import os
 import shutil
+import io
+import glob
+import json
+import pstats
 import numpy as np
 import atexit
 
@@ -12,7 +17,19 @@ from pegs.pegs import get_overlapping_genes
 from pegs.pegs import get_tads_overlapping_peaks
 from pegs.pegs import calculate_enrichment
 from pegs.pegs import calculate_enrichments
+from pegs.pegs import make_outputs
 from pegs.pegs import pegs_main
+from pegs.pegs import merge_main
+from pegs.pegs import plot_main
+from pegs.pegs import genes_main
+from pegs.pegs import plan_main
+from pegs.pegs import extract_main
+from pegs.checkpoint import Checkpoint
+from pegs.membership import GeneMembership
+from pegs.profiling import Profiler
+from pegs.metrics import Metrics
+from pegs.results import EnrichmentResults
+from pegs.results import load_results
 from pegs.utils import find_exe
 from pegs.bedtools import fetch_bedtools
 
@@ -91,6 +108,27 @@ chr1	73362131	73362563
 chr1	40268922	40289363
 chr1	49022761	49043125
 chr1	73352131	73372563
+"""
+        self.assertEqual(open(expanded_file,'rt').read(),
+                         expected_bed_data)
+    def test_make_expanded_bed_clip_to_chrom_sizes(self):
+        """
+        make_expanded_bed: clip expanded intervals to chromosome ends
+        """
+        bed_file = os.path.join(self.test_dir,"in.bed")
+        with open(bed_file,'wt') as fp:
+            fp.write("""chr1	5000	6000
+chr1	195465000	195470000
+chr2	1000	2000
+""")
+        expanded_file = os.path.join(self.test_dir,"out.bed")
+        make_expanded_bed(bed_file,
+                          expanded_file,
+                          10000,
+                          chrom_sizes={ "chr1": 195471971 })
+        expected_bed_data = """chr1	0	16000
+chr1	195455000	195471971
+chr2	0	12000
 """
         self.assertEqual(open(expanded_file,'rt').read(),
                          expected_bed_data)
@@ -322,6 +360,48 @@ chr1	85758348	85758667
         # No TADs
         self.assertEqual(tads_pvalues,None)
         self.assertEqual(tads_counts,None)
+    def test_calculate_enrichments_denominators(self):
+        """
+        calculate_enrichments: results include the denominators
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_file = os.path.join(self.test_dir,"peaks0.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""")
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        distances = [5000000,40000000]
+        results = calculate_enrichments(genes_file,
+                                        distances,
+                                        [peaks_file],
+                                        clusters,
+                                        None)
+        self.assertEqual(results.peak_set_names,["peaks0"])
+        self.assertEqual(results.cluster_names,["cluster_0","cluster_1"])
+        self.assertEqual(results.counts.dtype,np.uint32)
+        self.assertEqual(results.n_genes,5)
+        self.assertEqual(list(results.cluster_sizes),[1,2])
+        self.assertEqual(list(results.n_overlapping[0]),[3,4])
     def test_calculate_enrichments_with_tads(self):
         """
         calculate_enrichments: include TADs
@@ -396,20 +476,183 @@ chr1	136212828	146212829	TAD4
         # if actual and expected counts are exactly equal
         self.assertTrue((counts == expected_counts).all())
         self.assertTrue((tads_counts == expected_counts_tads).all())
-
-class TestPegsMain(unittest.TestCase):
-    def setUp(self):
-        ensure_bedtools()
-        if not find_exe("bedtools"):
-            self.skipTest("bedtools not found")
-        self.test_dir = tempfile.mkdtemp()
-    def tearDown(self):
-        if os.path.exists(self.test_dir):
-            shutil.rmtree(self.test_dir)
-        restore_path()
-    def test_pegs_main(self):
+    def test_calculate_enrichments_split_chromosomes(self):
         """
-        pegs_main: generates heatmap and XLSX files
+        calculate_enrichments: split intersections by chromosome
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr2	75375015	75375016	Gm15179
+chr2	136212828	136212829	Mroh3
+chr3	1000	2000	Ttn
+""")
+        peaks_data = (
+"""chr1	39756959	39757488
+chr2	40278922	40279363
+chr1	49032761	49033125
+chr2	73362131	73362563
+""",
+"""chr1	51097395	51097632
+chr2	73090044	73090401
+chr2	83125057	83125411
+chrX	85758348	85758667
+""",
+        )
+        peaks = []
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik","Mroh3"),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        tads_file = os.path.join(self.test_dir,"tads.txt")
+        with open(tads_file,'wt') as fp:
+            fp.write("""chr1	36425517	46425518	TAD1
+chr2	75375015	85375016	TAD2
+chr2	136212828	146212829	TAD3
+""")
+        distances = [5000000,10000000]
+        expected = calculate_enrichments(genes_file,
+                                         distances,
+                                         peaks,
+                                         clusters,
+                                         tads_file)
+        # Split the intersections by chromosome
+        output_dir = os.path.join(self.test_dir,"split")
+        os.mkdir(output_dir)
+        gene_membership = GeneMembership(peaks,clusters,distances,
+                                         include_tads=True)
+        results = calculate_enrichments(genes_file,
+                                        distances,
+                                        peaks,
+                                        clusters,
+                                        tads_file,
+                                        max_jobs=4,
+                                        split_chromosomes=True,
+                                        keep_intersection_files=True,
+                                        output_directory=output_dir,
+                                        gene_membership=gene_membership)
+        for actual,expected_data in zip(results,expected):
+            self.assertTrue(np.array_equal(actual,expected_data))
+        self.assertTrue(np.array_equal(results.n_overlapping,
+                                       expected.n_overlapping))
+        self.assertTrue(np.array_equal(results.tads_n_overlapping,
+                                       expected.tads_n_overlapping))
+        # Intersection files for each chromosome are combined
+        intersection_files = glob.glob(os.path.join(output_dir,
+                                                    "intersection_beds",
+                                                    "Intersection.*.bed"))
+        self.assertEqual(len(intersection_files),6)
+        # Overlapping genes are combined from each chromosome
+        gene_membership.build()
+        self.assertEqual(sorted(gene_membership.cell_genes(0,1,0)),
+                         ["1500015O10Rik"])
+        self.assertEqual(sorted(gene_membership.cell_genes(0,1,1)),
+                         ["Dnah7c","Gm15179"])
+    def test_calculate_enrichments_merge_peaks(self):
+        """
+        calculate_enrichments: merge overlapping peaks
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	39757000	39757001	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr2	75375015	75375016	Gm15179
+chr2	136212828	136212829	Mroh3
+""")
+        peaks_data = (
+"""chr1	39756959	39757488
+chr2	40278922	40279363
+chr1	39757400	39757900
+chr1	49032761	49033125
+chr1	49033125	49033500
+chr2	73362131	73362563
+""",
+"""chr1	51097395	51097632
+chr2	73090044	73090401
+chr2	83125057	83125411
+chr2	73090300	73090500
+chrX	85758348	85758667
+""",
+        )
+        peaks = []
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik","Mroh3"),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        tads_file = os.path.join(self.test_dir,"tads.txt")
+        with open(tads_file,'wt') as fp:
+            fp.write("""chr1	36425517	46425518	TAD1
+chr2	75375015	85375016	TAD2
+chr2	136212828	146212829	TAD3
+""")
+        distances = [0,5000000,10000000]
+        results = dict()
+        for merge_peaks in (False,True):
+            output_dir = os.path.join(self.test_dir,
+                                      "merged" if merge_peaks
+                                      else "unmerged")
+            os.mkdir(output_dir)
+            results[merge_peaks] = calculate_enrichments(
+                genes_file,
+                distances,
+                peaks,
+                clusters,
+                tads_file,
+                merge_peaks=merge_peaks,
+                keep_intersection_files=True,
+                output_directory=output_dir)
+        # Merging doesn't change the results
+        for actual,expected_data in zip(results[True],results[False]):
+            self.assertTrue(np.array_equal(actual,expected_data))
+        self.assertTrue(np.array_equal(results[True].n_overlapping,
+                                       results[False].n_overlapping))
+        self.assertTrue(np.array_equal(results[True].tads_n_overlapping,
+                                       results[False].tads_n_overlapping))
+        self.assertEqual(results[True].n_overlapping[0,0],1)
+        # Intersection files are named for the original peak sets
+        intersection_files = dict()
+        for merge_peaks in (False,True):
+            intersection_files[merge_peaks] = sorted(
+                [os.path.basename(f) for f in glob.glob(
+                    os.path.join(self.test_dir,
+                                 "merged" if merge_peaks else "unmerged",
+                                 "intersection_beds",
+                                 "Intersection.*.bed"))])
+        self.assertEqual(len(intersection_files[True]),8)
+        self.assertEqual(intersection_files[True],
+                         intersection_files[False])
+    def test_calculate_enrichments_concurrent_jobs(self):
+        """
+        calculate_enrichments: run bedtools jobs concurrently
         """
         genes_file = os.path.join(self.test_dir,"genes.bed")
         with open(genes_file,'wt') as fp:
@@ -419,7 +662,6 @@ chr1	46425517	46425518	Dnah7c
 chr1	75375015	75375016	Gm15179
 chr1	136212828	136212829	Mroh3
 """)
-        ngenes = 5
         peaks_data = (
 """chr1	39756959	39757488
 chr1	40278922	40279363
@@ -433,10 +675,8 @@ chr1	85758348	85758667
 """,
         )
         peaks = []
-        peaks_dir = os.path.join(self.test_dir,"peaks")
-        os.mkdir(peaks_dir)
         for i,peakset in enumerate(peaks_data):
-            peaks_file = os.path.join(peaks_dir,
+            peaks_file = os.path.join(self.test_dir,
                                       "peaks%d.bed" % i)
             with open(peaks_file,'wt') as fp:
                 fp.write(peakset)
@@ -460,17 +700,1395 @@ chr1	75375015	85375016	TAD3
 chr1	136212828	146212829	TAD4
 """)
         distances = [5000000,10000000]
-        pegs_main(genes_file,
-                  distances,
-                  peaks,
-                  clusters,
-                  tads_file,
-                  "pegs_test",
-                  output_directory=self.test_dir)
-        # Check output files exist
-        self.assertTrue(os.path.exists(
-            os.path.join(self.test_dir,"pegs_test_heatmap.png")
-        ))
-        self.assertTrue(os.path.exists(
-            os.path.join(self.test_dir,"pegs_test_results.xlsx")
-        ))
+        pvalues,counts,tads_pvalues,tads_counts = \
+            calculate_enrichments(genes_file,
+                                  distances,
+                                  peaks,
+                                  clusters,
+                                  tads_file,
+                                  max_jobs=4)
+        expected_pvalues = np.array([[[0.6,0.3],[0.6,0.3]],
+                                     [[1.0,0.1],[0.6,0.3]]])
+        expected_counts = np.array([[[1.0,2.0],[1.0,2.0]],
+                                    [[0.0,2.0],[1.0,2.0]]])
+        expected_pvalues_tads = np.array([[0.4,0.7],
+                                          [1.0,0.4]])
+        expected_counts_tads = np.array([[1.0,1.0],
+                                          [0.0,1.0]])
+        self.assertTrue(np.allclose(pvalues,expected_pvalues))
+        self.assertTrue(np.allclose(tads_pvalues,expected_pvalues_tads))
+        self.assertTrue((counts == expected_counts).all())
+        self.assertTrue((tads_counts == expected_counts_tads).all())
+
+    def test_calculate_enrichments_executors(self):
+        """
+        calculate_enrichments: same results from all executors
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr2	75375015	75375016	Gm15179
+chr2	136212828	136212829	Mroh3
+""")
+        peaks_data = (
+"""chr1	39756959	39757488
+chr2	40278922	40279363
+chr1	49032761	49033125
+chr2	73362131	73362563
+""",
+"""chr1	51097395	51097632
+chr2	73090044	73090401
+chr2	83125057	83125411
+chr2	85758348	85758667
+""",
+        )
+        peaks = []
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        # Same peaks as the first peak set under another name
+        peaks_copy = os.path.join(self.test_dir,"copy.bed")
+        shutil.copyfile(peaks[0],peaks_copy)
+        peaks.append(peaks_copy)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik","Mroh3"),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        tads_file = os.path.join(self.test_dir,"tads.txt")
+        with open(tads_file,'wt') as fp:
+            fp.write("""chr1	36425517	46425518	TAD1
+chr2	75375015	85375016	TAD2
+chr2	136212828	146212829	TAD3
+""")
+        distances = [0,5000000,10000000,5000000]
+        results = dict()
+        for executor in ("serial","threads","processes"):
+            output_dir = os.path.join(self.test_dir,executor)
+            os.mkdir(output_dir)
+            results[executor] = calculate_enrichments(
+                genes_file,
+                distances,
+                peaks,
+                clusters,
+                tads_file,
+                max_jobs=(1 if executor == "serial" else 4),
+                split_chromosomes=(executor == "processes"),
+                keep_intersection_files=True,
+                output_directory=output_dir,
+                executor=executor)
+            # Intersection files are kept for every cell
+            intersection_files = glob.glob(os.path.join(
+                output_dir,"intersection_beds","Intersection.*.bed"))
+            self.assertEqual(len(intersection_files),12)
+        expected = results["serial"]
+        for executor in ("threads","processes"):
+            for actual,expected_data in zip(results[executor],expected):
+                self.assertTrue(np.array_equal(actual,expected_data))
+            self.assertTrue(np.array_equal(results[executor].n_overlapping,
+                                           expected.n_overlapping))
+        # Duplicated peak sets and distances share results
+        pvalues,counts,tads_pvalues,tads_counts = expected
+        self.assertTrue(np.array_equal(counts[2],counts[0]))
+        self.assertTrue(np.array_equal(counts[:,3],counts[:,1]))
+        self.assertTrue(np.array_equal(tads_counts[2],tads_counts[0]))
+        self.assertFalse(np.array_equal(counts[1],counts[0]))
+        self.assertTrue(np.array_equal(counts[0],
+                                       np.array([[0.0,0.0],
+                                                 [1.0,2.0],
+                                                 [1.0,2.0],
+                                                 [1.0,2.0]])))
+    def test_calculate_enrichments_multiple_references(self):
+        """
+        calculate_enrichments: calculate for multiple references
+        """
+        genes_data = (
+"""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr2	75375015	75375016	Gm15179
+chr2	136212828	136212829	Mroh3
+""",
+"""chr1	43730601	43730602	1500015O10Rik
+chr2	75375015	75375016	Gm15179
+chr2	136212828	136212829	Mroh3
+""",
+        )
+        genes_files = []
+        for i,genes in enumerate(genes_data):
+            genes_file = os.path.join(self.test_dir,"genes%d.bed" % i)
+            with open(genes_file,'wt') as fp:
+                fp.write(genes)
+            genes_files.append(genes_file)
+        peaks_data = (
+"""chr1	39756959	39757488
+chr2	40278922	40279363
+chr1	49032761	49033125
+chr2	73362131	73362563
+""",
+"""chr1	51097395	51097632
+chr2	73090044	73090401
+chr2	83125057	83125411
+chr2	85758348	85758667
+""",
+        )
+        peaks = []
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik","Mroh3"),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        tads_file = os.path.join(self.test_dir,"tads.txt")
+        with open(tads_file,'wt') as fp:
+            fp.write("""chr1	36425517	46425518	TAD1
+chr2	75375015	85375016	TAD2
+chr2	136212828	146212829	TAD3
+""")
+        distances = [5000000,10000000]
+        # Results for each reference on its own
+        expected = [calculate_enrichments(genes_file,
+                                          distances,
+                                          peaks,
+                                          clusters,
+                                          tads_file)
+                    for genes_file in genes_files]
+        # Results for all references together
+        for split_chromosomes in (False,True):
+            results = calculate_enrichments(genes_files,
+                                            distances,
+                                            peaks,
+                                            clusters,
+                                            tads_file,
+                                            max_jobs=2,
+                                            split_chromosomes=
+                                            split_chromosomes)
+            self.assertEqual(len(results),2)
+            for actual,expected_results in zip(results,expected):
+                self.assertEqual(actual.n_genes,expected_results.n_genes)
+                for actual_data,expected_data in zip(actual,
+                                                     expected_results):
+                    self.assertTrue(np.array_equal(actual_data,
+                                                   expected_data))
+        # Results differ between the references
+        self.assertEqual([r.n_genes for r in results],[5,3])
+        self.assertFalse(np.array_equal(results[0].counts,
+                                        results[1].counts))
+    def test_calculate_enrichments_with_peak_cache(self):
+        """
+        calculate_enrichments: use binary peak cache
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_data = (
+"""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""",
+"""chr1	51097395	51097632
+chr1	73090044	73090401
+chr1	83125057	83125411
+chr1	85758348	85758667
+""",
+        )
+        peaks = []
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        distances = [5000000,10000000]
+        peak_cache_dir = os.path.join(self.test_dir,"cache")
+        pvalues,counts,tads_pvalues,tads_counts = \
+            calculate_enrichments(genes_file,
+                                  distances,
+                                  peaks,
+                                  clusters,
+                                  None,
+                                  peak_cache_dir=peak_cache_dir)
+        expected_pvalues = np.array([[[0.6,0.3],[0.6,0.3]],
+                                     [[1.0,0.1],[0.6,0.3]]])
+        expected_counts = np.array([[[1.0,2.0],[1.0,2.0]],
+                                    [[0.0,2.0],[1.0,2.0]]])
+        self.assertTrue(np.allclose(pvalues,expected_pvalues))
+        self.assertTrue((counts == expected_counts).all())
+        self.assertEqual(len(os.listdir(peak_cache_dir)),2)
+    def test_calculate_enrichments_with_checkpoint(self):
+        """
+        calculate_enrichments: use and update checkpoint
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_file = os.path.join(self.test_dir,"peaks0.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""")
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        distances = [5000000,10000000]
+        # Checkpoint with (dummy) results for the first distance
+        checkpoint_file = os.path.join(self.test_dir,"checkpoint.jsonl")
+        checkpoint = Checkpoint(checkpoint_file,"abc123")
+        checkpoint.open()
+        checkpoint.add(("peaks",0,0),[0.5,0.25],[7.0,8.0])
+        metrics = Metrics(progress=False)
+        pvalues,counts,tads_pvalues,tads_counts = \
+            calculate_enrichments(genes_file,
+                                  distances,
+                                  [peaks_file],
+                                  clusters,
+                                  None,
+                                  checkpoint=checkpoint,
+                                  metrics=metrics)
+        checkpoint.close()
+        # Check the progress metrics
+        self.assertEqual(metrics.total_cells,2)
+        self.assertEqual(metrics.cells_skipped,1)
+        self.assertEqual(metrics.cells_completed,1)
+        self.assertTrue(metrics.bytes_read > 0)
+        expected_pvalues = np.array([[[0.5,0.25],[0.6,0.3]]])
+        expected_counts = np.array([[[7.0,8.0],[1.0,2.0]]])
+        self.assertTrue(np.allclose(pvalues,expected_pvalues))
+        self.assertTrue((counts == expected_counts).all())
+        # Check the new result was added to the checkpoint
+        checkpoint = Checkpoint(checkpoint_file,"abc123")
+        checkpoint.open(resume=True)
+        self.assertEqual(len(checkpoint),2)
+        self.assertEqual(checkpoint.get(("peaks",0,1))[1],[1.0,2.0])
+        checkpoint.close()
+
+    def test_calculate_enrichments_with_checkpoint_and_genes(self):
+        """
+        calculate_enrichments: use checkpoint when exporting genes
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_file = os.path.join(self.test_dir,"peaks0.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""")
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        distances = [5000000,10000000,20000000]
+        # Checkpoint with (dummy) results for the first two
+        # distances, only one of which includes the genes
+        checkpoint_file = os.path.join(self.test_dir,"checkpoint.jsonl")
+        checkpoint = Checkpoint(checkpoint_file,"abc123")
+        checkpoint.open()
+        checkpoint.add(("peaks",0,0),[0.5,0.25],[0.0,1.0],genes=[3])
+        checkpoint.add(("peaks",0,1),[0.5,0.25],[7.0,8.0])
+        gene_membership = GeneMembership([peaks_file],clusters,distances)
+        pvalues,counts,tads_pvalues,tads_counts = \
+            calculate_enrichments(genes_file,
+                                  distances,
+                                  [peaks_file],
+                                  clusters,
+                                  None,
+                                  checkpoint=checkpoint,
+                                  gene_membership=gene_membership)
+        checkpoint.close()
+        # Results without genes in the checkpoint are recalculated
+        expected_pvalues = np.array([[[0.5,0.25],[0.6,0.3],[0.6,0.3]]])
+        expected_counts = np.array([[[0.0,1.0],[1.0,2.0],[1.0,2.0]]])
+        self.assertTrue(np.allclose(pvalues,expected_pvalues))
+        self.assertTrue((counts == expected_counts).all())
+        gene_membership.build()
+        self.assertEqual(gene_membership.cell_genes(0,0,1),["Gm15179"])
+        self.assertEqual(gene_membership.cell_genes(0,1,0),
+                         ["1500015O10Rik"])
+        self.assertEqual(gene_membership.cell_genes(0,2,1),
+                         ["Dnah7c","Gm15179"])
+    def test_calculate_enrichments_removes_working_dir_on_error(self):
+        """
+        calculate_enrichments: remove working directory on error
+        """
+        peaks_file = os.path.join(self.test_dir,"peaks.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("chr1\t39756959\t39757488\n")
+        cluster_file = os.path.join(self.test_dir,"cluster.txt")
+        with open(cluster_file,'wt') as fp:
+            fp.write("Dnah7c\n")
+        cwd = os.getcwd()
+        os.chdir(self.test_dir)
+        try:
+            self.assertRaises(Exception,
+                              calculate_enrichments,
+                              os.path.join(self.test_dir,"missing.bed"),
+                              [5000000],
+                              [peaks_file],
+                              [cluster_file],
+                              None)
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(glob.glob(os.path.join(self.test_dir,
+                                                "__LocalBeds.*")),[])
+
+class TestMakeOutputs(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.results = EnrichmentResults(
+            ["peaks%d.bed" % i for i in range(3)],
+            ["cluster_%d.txt" % i for i in range(2)],
+            [5000000,10000000],
+            include_tads=True)
+        self.results.pvalues[...] = np.random.random_sample([3,2,2])
+        self.results.counts[...] = np.random.randint(0,10,[3,2,2])
+        self.results.tads_pvalues[...] = np.random.random_sample([3,2])
+        self.results.tads_counts[...] = np.random.randint(0,10,[3,2])
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+    def _make_outputs(self,**kws):
+        return make_outputs("pegs_test",
+                            self.results,
+                            html="",
+                            output_directory=self.test_dir,
+                            dump_raw_data=True,
+                            **kws)
+    def _check_outputs(self,expected):
+        self.assertEqual(sorted(os.listdir(self.test_dir)),
+                         sorted(expected))
+    def test_make_outputs(self):
+        """
+        make_outputs: write all outputs
+        """
+        profiler = Profiler()
+        self.assertEqual(self._make_outputs(profiler=profiler),[])
+        self._check_outputs(["pegs_test_heatmap.png",
+                             "pegs_test_heatmap.html",
+                             "pegs_test_results.xlsx",
+                             "pegs_test_pval.tsv",
+                             "pegs_test_count.tsv",
+                             "pegs_test_tads_pval.tsv",
+                             "pegs_test_tads_count.tsv"])
+        for stage in ("heatmap","html","xlsx","raw_data"):
+            self.assertEqual(profiler.stages[stage].calls,1)
+    def test_make_outputs_concurrently(self):
+        """
+        make_outputs: write outputs (and heatmap pages) concurrently
+        """
+        profiler = Profiler()
+        self.assertEqual(self._make_outputs(peak_sets_per_page=2,
+                                            max_jobs=4,
+                                            profiler=profiler),[])
+        self._check_outputs(["pegs_test_heatmap.page01.png",
+                             "pegs_test_heatmap.page02.png",
+                             "pegs_test_heatmap.html",
+                             "pegs_test_results.xlsx",
+                             "pegs_test_pval.tsv",
+                             "pegs_test_count.tsv",
+                             "pegs_test_tads_pval.tsv",
+                             "pegs_test_tads_count.tsv"])
+        self.assertEqual(profiler.stages["heatmap"].calls,2)
+        for stage in ("html","xlsx","raw_data"):
+            self.assertEqual(profiler.stages[stage].calls,1)
+    def test_make_outputs_reports_failures(self):
+        """
+        make_outputs: failure of one output doesn't affect the others
+        """
+        for max_jobs in (1,4):
+            xlsx = os.path.join("missing","pegs_test_results.xlsx")
+            self.assertEqual(self._make_outputs(xlsx=xlsx,
+                                                max_jobs=max_jobs),
+                             ["XLSX file"])
+            self._check_outputs(["pegs_test_heatmap.png",
+                                 "pegs_test_heatmap.html",
+                                 "pegs_test_pval.tsv",
+                                 "pegs_test_count.tsv",
+                                 "pegs_test_tads_pval.tsv",
+                                 "pegs_test_tads_count.tsv"])
+            for f in os.listdir(self.test_dir):
+                os.remove(os.path.join(self.test_dir,f))
+
+class TestPegsMain(unittest.TestCase):
+    def setUp(self):
+        ensure_bedtools()
+        if not find_exe("bedtools"):
+            self.skipTest("bedtools not found")
+        self.test_dir = tempfile.mkdtemp()
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+        restore_path()
+    def test_pegs_main(self):
+        """
+        pegs_main: generates heatmap and XLSX files
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        ngenes = 5
+        peaks_data = (
+"""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""",
+"""chr1	51097395	51097632
+chr1	73090044	73090401
+chr1	83125057	83125411
+chr1	85758348	85758667
+""",
+        )
+        peaks = []
+        peaks_dir = os.path.join(self.test_dir,"peaks")
+        os.mkdir(peaks_dir)
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(peaks_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        tads_file = os.path.join(self.test_dir,"tads.txt")
+        with open(tads_file,'wt') as fp:
+            fp.write("""chr1	23730601	26730602	TAD1
+chr1	36425517	46425518	TAD2
+chr1	75375015	85375016	TAD3
+chr1	136212828	146212829	TAD4
+""")
+        distances = [5000000,10000000]
+        pegs_main(genes_file,
+                  distances,
+                  peaks,
+                  clusters,
+                  tads_file,
+                  "pegs_test",
+                  output_directory=self.test_dir)
+        # Check output files exist
+        self.assertTrue(os.path.exists(
+            os.path.join(self.test_dir,"pegs_test_heatmap.png")
+        ))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.test_dir,"pegs_test_results.xlsx")
+        ))
+        # Check the checkpoint file was removed
+        self.assertFalse(os.path.exists(
+            os.path.join(self.test_dir,"pegs_test_checkpoint.jsonl")
+        ))
+    def test_pegs_main_metrics_file(self):
+        """
+        pegs_main: writes metrics file
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_file = os.path.join(self.test_dir,"peaks0.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""")
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        tads_file = os.path.join(self.test_dir,"tads.txt")
+        with open(tads_file,'wt') as fp:
+            fp.write("""chr1	36425517	46425518	TAD1
+chr1	75375015	85375016	TAD2
+""")
+        metrics_file = os.path.join(self.test_dir,"pegs_test.prom")
+        pegs_main(genes_file,
+                  [5000000,10000000],
+                  [peaks_file],
+                  clusters,
+                  tads_file,
+                  "pegs_test",
+                  output_directory=self.test_dir,
+                  metrics_file=metrics_file)
+        with open(metrics_file,'rt') as fp:
+            metrics = fp.read().split('\n')
+        self.assertTrue('pegs_cells{name="pegs_test"} 3.0' in metrics)
+        self.assertTrue('pegs_cells_completed_total{name="pegs_test"} 3.0'
+                        in metrics)
+        self.assertTrue('pegs_outputs_completed_total{name="pegs_test"} 2.0'
+                        in metrics)
+        self.assertTrue('pegs_stage{name="pegs_test",stage="finished"} 1'
+                        in metrics)
+    def test_pegs_main_profile_task_stages(self):
+        """
+        pegs_main: writes cProfile data for task stages
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_file = os.path.join(self.test_dir,"peaks0.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""")
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        for stage in ("bedtools_intersect","hypergeometric","peak_set"):
+            pegs_main(genes_file,
+                      [5000000,10000000],
+                      [peaks_file],
+                      clusters,
+                      None,
+                      "pegs_test",
+                      output_directory=self.test_dir,
+                      profile_stage=stage)
+            prof_file = os.path.join(self.test_dir,
+                                     "pegs_test_%s.prof" % stage)
+            self.assertTrue(os.path.exists(prof_file))
+            self.assertTrue(pstats.Stats(prof_file).total_calls > 0)
+        # Stage timings don't overlap (so don't add up to more
+        # than the total time)
+        with open(os.path.join(self.test_dir,
+                               "pegs_test_profile.json"),'rt') as fp:
+            profile = json.load(fp)
+        total = sum([profile["stages"][s]["wall"]
+                     for s in profile["stages"]])
+        self.assertTrue(total <= profile["total_wall"])
+    def test_plan_main(self):
+        """
+        plan_main: estimates resources without running analysis
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+""")
+        peaks_file = os.path.join(self.test_dir,"peaks0.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("""chr1	39756959	39757488
+chr1	40278922	40279363
+""")
+        cluster_file = os.path.join(self.test_dir,"cluster_0.txt")
+        with open(cluster_file,'wt') as fp:
+            fp.write("Dnah7c\n")
+        contents = sorted(os.listdir(self.test_dir))
+        self.assertEqual(plan_main(genes_file,
+                                   [5000000,10000000],
+                                   [peaks_file],
+                                   [cluster_file],
+                                   None,
+                                   max_jobs=2),None)
+        self.assertEqual(sorted(os.listdir(self.test_dir)),contents)
+        # Missing file
+        self.assertEqual(plan_main(genes_file,
+                                   [5000000,10000000],
+                                   [os.path.join(self.test_dir,
+                                                 "missing.bed")],
+                                   [cluster_file],
+                                   None),1)
+    def test_pegs_main_export_genes_and_genes_main(self):
+        """
+        pegs_main/genes_main: export and query overlapping genes
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_data = (
+"""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""",
+"""chr1	51097395	51097632
+chr1	73090044	73090401
+chr1	83125057	83125411
+chr1	85758348	85758667
+""",
+        )
+        peaks = []
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        tads_file = os.path.join(self.test_dir,"tads.txt")
+        with open(tads_file,'wt') as fp:
+            fp.write("""chr1	23730601	26730602	TAD1
+chr1	36425517	46425518	TAD2
+chr1	75375015	85375016	TAD3
+chr1	136212828	146212829	TAD4
+""")
+        distances = [5000000,10000000]
+        output_dir = os.path.join(self.test_dir,"output")
+        pegs_main(genes_file,
+                  distances,
+                  peaks,
+                  clusters,
+                  tads_file,
+                  "pegs_test",
+                  output_directory=output_dir,
+                  export_genes=True)
+        genes_npz = os.path.join(output_dir,"pegs_test_genes.npz")
+        self.assertTrue(os.path.exists(genes_npz))
+        # Query the genes for one peak set and distance
+        fp = io.StringIO()
+        genes_main([genes_npz],
+                   peak_sets=["peaks1"],
+                   distances=[5000000],
+                   fp=fp)
+        self.assertEqual(fp.getvalue(),
+                         "#Peak set\tDistance\tCluster\tGene\n"
+                         "peaks1.bed\t5000000\tcluster_1.txt\tDnah7c\n"
+                         "peaks1.bed\t5000000\tcluster_1.txt\tGm15179\n")
+        # Query the TADs genes
+        fp = io.StringIO()
+        genes_main([genes_npz],
+                   peak_sets=["peaks0.bed"],
+                   tads=True,
+                   fp=fp)
+        self.assertEqual(fp.getvalue(),
+                         "#Peak set\tDistance\tCluster\tGene\n"
+                         "peaks0.bed\tTADs\tcluster_0.txt\t"
+                         "1500015O10Rik\n"
+                         "peaks0.bed\tTADs\tcluster_1.txt\tDnah7c\n")
+    def test_pegs_main_intersections_archive_and_extract_main(self):
+        """
+        pegs_main/extract_main: archive and extract intersections
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_data = (
+"""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""",
+"""chr1	51097395	51097632
+chr1	73090044	73090401
+chr1	83125057	83125411
+chr1	85758348	85758667
+""",
+        )
+        peaks = []
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        tads_file = os.path.join(self.test_dir,"tads.txt")
+        with open(tads_file,'wt') as fp:
+            fp.write("""chr1	23730601	26730602	TAD1
+chr1	36425517	46425518	TAD2
+chr1	75375015	85375016	TAD3
+chr1	136212828	146212829	TAD4
+""")
+        distances = [5000000,10000000]
+        output_dir = os.path.join(self.test_dir,"output")
+        pegs_main(genes_file,
+                  distances,
+                  peaks,
+                  clusters,
+                  tads_file,
+                  "pegs_test",
+                  output_directory=output_dir,
+                  intersections_archive=True)
+        archive_file = os.path.join(output_dir,
+                                    "pegs_test_intersections.zip")
+        self.assertTrue(os.path.exists(archive_file))
+        self.assertFalse(os.path.exists(
+            os.path.join(output_dir,"intersection_beds")))
+        # List the intersections
+        fp = io.StringIO()
+        extract_main(archive_file,list_members=True,fp=fp)
+        listing = [line.split('\t') for line in
+                   fp.getvalue().rstrip('\n').split('\n')]
+        self.assertEqual(len(listing),7)
+        self.assertEqual([line[:2] for line in listing[1:]],
+                         [["peaks0.bed","5000000"],
+                          ["peaks0.bed","10000000"],
+                          ["peaks1.bed","5000000"],
+                          ["peaks1.bed","10000000"],
+                          ["peaks0.bed","TADs"],
+                          ["peaks1.bed","TADs"]])
+        # Extract one peak set and distance
+        fp = io.StringIO()
+        extract_main(archive_file,
+                     peak_sets=["peaks1"],
+                     distances=[5000000],
+                     fp=fp)
+        self.assertEqual(sorted([line.split('\t')[3] for line in
+                                 fp.getvalue().rstrip('\n').split('\n')]),
+                         ["Dnah7c","Gm15179"])
+        # Extract the TADs intersections to files
+        extract_dir = os.path.join(self.test_dir,"extracted")
+        fp = io.StringIO()
+        extract_main(archive_file,tads=True,output_dir=extract_dir,fp=fp)
+        self.assertEqual(sorted(os.listdir(extract_dir)),
+                         ["Intersection.genes.peaks0.tads.bed",
+                          "Intersection.genes.peaks1.tads.bed"])
+        # No matching intersections
+        self.assertEqual(extract_main(archive_file,
+                                      distances=[1000],
+                                      fp=io.StringIO()),1)
+    def test_pegs_main_multiple_references(self):
+        """
+        pegs_main: write outputs for multiple references
+        """
+        genes_data = (
+"""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""",
+"""chr1	43730601	43730602	1500015O10Rik
+chr1	75375015	75375016	Gm15179
+""",
+        )
+        genes_files = []
+        for genes,name in zip(genes_data,("refA","refB")):
+            genes_file = os.path.join(self.test_dir,"%s.bed" % name)
+            with open(genes_file,'wt') as fp:
+                fp.write(genes)
+            genes_files.append(genes_file)
+        peaks_file = os.path.join(self.test_dir,"peaks.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	73362131	73362563
+""")
+        cluster_file = os.path.join(self.test_dir,"cluster.txt")
+        with open(cluster_file,'wt') as fp:
+            fp.write("1500015O10Rik\nGm15179\n")
+        output_dir = os.path.join(self.test_dir,"output")
+        pegs_main(genes_files,
+                  [5000000,10000000],
+                  [peaks_file],
+                  [cluster_file],
+                  None,
+                  "pegs_test",
+                  xlsx="results.xlsx",
+                  output_directory=output_dir,
+                  keep_results=True,
+                  intersections_archive=True)
+        self.assertEqual(sorted(os.listdir(output_dir)),
+                         ["pegs_test_refA_heatmap.png",
+                          "pegs_test_refA_intersections.zip",
+                          "pegs_test_refA_results.npz",
+                          "pegs_test_refB_heatmap.png",
+                          "pegs_test_refB_intersections.zip",
+                          "pegs_test_refB_results.npz",
+                          "results_refA.xlsx",
+                          "results_refB.xlsx"])
+        results = [load_results(os.path.join(output_dir,
+                                             "pegs_test_%s_results.npz" %
+                                             name))
+                   for name in ("refA","refB")]
+        self.assertTrue(np.array_equal(results[0]['counts'],
+                                       results[1]['counts']))
+        self.assertFalse(np.array_equal(results[0]['pvalues'],
+                                        results[1]['pvalues']))
+        # References must have different names
+        self.assertEqual(pegs_main([genes_files[0],genes_files[0]],
+                                   [5000000],
+                                   [peaks_file],
+                                   [cluster_file],
+                                   None,
+                                   "pegs_test",
+                                   output_directory=output_dir),1)
+    def test_pegs_main_missing_inputs(self):
+        """
+        pegs_main: return 1 if inputs are missing
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("chr1\t9547947\t9547948\tAdhfe1\n")
+        peaks_file = os.path.join(self.test_dir,"peaks.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("chr1\t9547900\t9547999\n")
+        cluster_file = os.path.join(self.test_dir,"cluster.txt")
+        with open(cluster_file,'wt') as fp:
+            fp.write("Adhfe1\n")
+        output_dir = os.path.join(self.test_dir,"output")
+        # Genes file not found
+        self.assertEqual(pegs_main(os.path.join(self.test_dir,
+                                                "missing.bed"),
+                                   [5000],
+                                   [peaks_file],
+                                   [cluster_file],
+                                   None,
+                                   "pegs_test",
+                                   output_directory=output_dir),1)
+        # No peaks, clusters or distances
+        for distances,peaks,clusters in (([5000],[],[cluster_file]),
+                                         ([5000],None,[cluster_file]),
+                                         ([5000],[peaks_file],[]),
+                                         ([],[peaks_file],[cluster_file])):
+            self.assertEqual(pegs_main(genes_file,
+                                       distances,
+                                       peaks,
+                                       clusters,
+                                       None,
+                                       "pegs_test",
+                                       output_directory=output_dir),1)
+        self.assertFalse(os.path.exists(output_dir))
+    def test_pegs_main_stdin_peaks_and_tsv_out(self):
+        """
+        pegs_main: read peaks from stdin and write TSV results
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_data = b"""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	73362131	73362563
+"""
+        cluster_file = os.path.join(self.test_dir,"cluster.txt")
+        with open(cluster_file,'wt') as fp:
+            fp.write("1500015O10Rik\nGm15179\n")
+        output_dir = os.path.join(self.test_dir,"output")
+        # Write the results to a stream
+        tsv_out = io.StringIO()
+        stdin = sys.stdin
+        try:
+            sys.stdin = io.TextIOWrapper(io.BytesIO(peaks_data))
+            self.assertEqual(pegs_main(genes_file,
+                                       [5000000,10000000],
+                                       ["-"],
+                                       [cluster_file],
+                                       None,
+                                       "pegs_test",
+                                       output_directory=output_dir,
+                                       tsv_out=tsv_out),None)
+        finally:
+            sys.stdin = stdin
+        lines = [line.split('\t') for line in
+                 tsv_out.getvalue().rstrip('\n').split('\n')]
+        self.assertEqual(lines[0],["#Peak set","Distance","Cluster",
+                                   "Count","P-value"])
+        self.assertEqual([line[:4] for line in lines[1:]],
+                         [["stdin.bed","5000000","cluster","2"],
+                          ["stdin.bed","10000000","cluster","2"]])
+        self.assertAlmostEqual(float(lines[1][4]),0.1)
+        self.assertAlmostEqual(float(lines[2][4]),0.3)
+        # No heatmap or XLSX file
+        self.assertEqual(os.listdir(output_dir),[])
+        self.assertEqual(glob.glob(os.path.join(os.getcwd(),
+                                                "__StdinPeaks.*")),[])
+        # Stored peaks are removed if the run stops early
+        try:
+            sys.stdin = io.TextIOWrapper(io.BytesIO(peaks_data))
+            pegs_main(genes_file,
+                      [],
+                      ["-"],
+                      [cluster_file],
+                      None,
+                      "pegs_test",
+                      output_directory=output_dir,
+                      tsv_out=io.StringIO())
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(glob.glob(os.path.join(os.getcwd(),
+                                                "__StdinPeaks.*")),[])
+        # Write the results to a file, along with the XLSX file
+        peaks_file = os.path.join(self.test_dir,"peaks.bed")
+        with open(peaks_file,'wb') as fp:
+            fp.write(peaks_data)
+        tsv_file = os.path.join(self.test_dir,"results.tsv")
+        pegs_main(genes_file,
+                  [5000000,10000000],
+                  [peaks_file],
+                  [cluster_file],
+                  None,
+                  "pegs_test",
+                  xlsx="pegs_test.xlsx",
+                  output_directory=output_dir,
+                  tsv_out=tsv_file)
+        self.assertEqual(os.listdir(output_dir),["pegs_test.xlsx"])
+        with open(tsv_file,'rt') as fp:
+            self.assertEqual(fp.read(),
+                             tsv_out.getvalue().replace("stdin.bed",
+                                                        "peaks.bed"))
+        # Write the results to stdout (other messages go to stderr)
+        stdout = sys.stdout
+        stderr = sys.stderr
+        try:
+            sys.stdout = io.StringIO()
+            sys.stderr = io.StringIO()
+            pegs_main(genes_file,
+                      [5000000,10000000],
+                      [peaks_file],
+                      [cluster_file],
+                      None,
+                      "pegs_test",
+                      output_directory=output_dir,
+                      tsv_out="-")
+            tsv_stdout = sys.stdout.getvalue()
+            tsv_stderr = sys.stderr.getvalue()
+        finally:
+            sys.stdout = stdout
+            sys.stderr = stderr
+        self.assertEqual(tsv_stdout,
+                         tsv_out.getvalue().replace("stdin.bed",
+                                                    "peaks.bed"))
+        self.assertTrue("====Peaks Files====" in tsv_stderr)
+    def test_pegs_main_with_peaks_group_column(self):
+        """
+        pegs_main: split peaks into peak sets using group column
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_file = os.path.join(self.test_dir,"peaks.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("""chr1	39756959	39757488	peaks0
+chr1	40278922	40279363	peaks0
+chr1	51097395	51097632	peaks1
+chr1	73090044	73090401	peaks1
+chr1	49032761	49033125	peaks0
+chr1	73362131	73362563	peaks0
+chr1	83125057	83125411	peaks1
+chr1	85758348	85758667	peaks1
+""")
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        distances = [5000000,10000000]
+        pegs_main(genes_file,
+                  distances,
+                  [peaks_file],
+                  clusters,
+                  None,
+                  "pegs_test",
+                  output_directory=self.test_dir,
+                  dump_raw_data=True,
+                  peaks_group_column=4)
+        # Check output files exist
+        for f in ("pegs_test_heatmap.png",
+                  "pegs_test_results.xlsx",
+                  "pegs_test_count.tsv",
+                  "pegs_test_pval.tsv",):
+            self.assertTrue(os.path.exists(os.path.join(self.test_dir,f)),
+                            "Missing %s" % f)
+        # Check the peak sets in the raw data
+        with open(os.path.join(self.test_dir,"pegs_test_count.tsv"),
+                  'rt') as fp:
+            self.assertEqual(fp.read(),
+                             "peaks0.bed\t5000000\t1\t2\n"
+                             "peaks0.bed\t10000000\t1\t2\n"
+                             "peaks1.bed\t5000000\t0\t2\n"
+                             "peaks1.bed\t10000000\t1\t2\n")
+        # Out-of-range group column is an error
+        self.assertEqual(pegs_main(genes_file,
+                                   distances,
+                                   [peaks_file],
+                                   clusters,
+                                   None,
+                                   "pegs_test",
+                                   output_directory=self.test_dir,
+                                   peaks_group_column=8),1)
+    def test_pegs_main_sorted_inputs(self):
+        """
+        pegs_main: sort inputs by position and use genome file
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	75375015	75375016	Gm15179
+chr1	9547947	9547948	Adhfe1
+chr1	136212828	136212829	Mroh3
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+""")
+        peaks_data = (
+"""chr1	73362131	73362563
+chr1	39756959	39757488
+chr1	49032761	49033125
+chr1	40278922	40279363
+""",
+"""chr1	85758348	85758667
+chr1	51097395	51097632
+chr1	83125057	83125411
+chr1	73090044	73090401
+""",
+        )
+        peaks = []
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        tads_file = os.path.join(self.test_dir,"tads.txt")
+        with open(tads_file,'wt') as fp:
+            fp.write("""chr1	136212828	146212829	TAD4
+chr1	36425517	46425518	TAD2
+chr1	23730601	26730602	TAD1
+chr1	75375015	85375016	TAD3
+""")
+        genome_file = os.path.join(self.test_dir,"test.genome")
+        with open(genome_file,'wt') as fp:
+            fp.write("chr1\t195471971\n")
+        cache_dir = os.path.join(self.test_dir,"cache")
+        distances = [5000000,10000000]
+        pegs_main(genes_file,
+                  distances,
+                  peaks,
+                  clusters,
+                  tads_file,
+                  "pegs_test",
+                  output_directory=self.test_dir,
+                  dump_raw_data=True,
+                  sorted_inputs=True,
+                  genome_file=genome_file,
+                  cache_dir=cache_dir)
+        # Check the raw data
+        with open(os.path.join(self.test_dir,"pegs_test_count.tsv"),
+                  'rt') as fp:
+            self.assertEqual(fp.read(),
+                             "peaks0.bed\t5000000\t1\t2\n"
+                             "peaks0.bed\t10000000\t1\t2\n"
+                             "peaks1.bed\t5000000\t0\t2\n"
+                             "peaks1.bed\t10000000\t1\t2\n")
+        with open(os.path.join(self.test_dir,"pegs_test_tads_count.tsv"),
+                  'rt') as fp:
+            self.assertEqual(fp.read(),
+                             "peaks0.bed\t1\t1\n"
+                             "peaks1.bed\t0\t1\n")
+        # Check the sorted genes were cached
+        cached_genes = glob.glob(os.path.join(cache_dir,"sorted","*",
+                                              "genes.bed"))
+        self.assertEqual(len(cached_genes),1)
+        # Invalid genome file is an error
+        with open(genome_file,'wt') as fp:
+            fp.write("chr1\tunknown\n")
+        self.assertEqual(pegs_main(genes_file,
+                                   distances,
+                                   peaks,
+                                   clusters,
+                                   tads_file,
+                                   "pegs_test",
+                                   output_directory=self.test_dir,
+                                   genome_file=genome_file),1)
+    def test_pegs_main_shards_and_merge_main(self):
+        """
+        pegs_main/merge_main: run shards and combine the results
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_data = (
+"""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""",
+"""chr1	51097395	51097632
+chr1	73090044	73090401
+chr1	83125057	83125411
+chr1	85758348	85758667
+""",
+        )
+        peaks = []
+        for i,peakset in enumerate(peaks_data):
+            peaks_file = os.path.join(self.test_dir,
+                                      "peaks%d.bed" % i)
+            with open(peaks_file,'wt') as fp:
+                fp.write(peakset)
+            peaks.append(peaks_file)
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        distances = [5000000,10000000]
+        # Run each shard
+        shards_dir = os.path.join(self.test_dir,"shards")
+        for i in (1,2):
+            pegs_main(genes_file,
+                      distances,
+                      peaks,
+                      clusters,
+                      None,
+                      "pegs_test",
+                      output_directory=shards_dir,
+                      shard=(i,2))
+        self.assertEqual(sorted(os.listdir(shards_dir)),
+                         ["pegs_test_shard_1_of_2.npz",
+                          "pegs_test_shard_2_of_2.npz"])
+        # Combine the results
+        merge_main([os.path.join(shards_dir,f)
+                    for f in ("pegs_test_shard_2_of_2.npz",
+                              "pegs_test_shard_1_of_2.npz")],
+                   "pegs_test",
+                   output_directory=self.test_dir,
+                   dump_raw_data=True)
+        # Check output files exist
+        for f in ("pegs_test_heatmap.png",
+                  "pegs_test_results.xlsx",
+                  "pegs_test_count.tsv",
+                  "pegs_test_pval.tsv",):
+            self.assertTrue(os.path.exists(os.path.join(self.test_dir,f)),
+                            "Missing %s" % f)
+        # Check the raw data
+        with open(os.path.join(self.test_dir,"pegs_test_count.tsv"),
+                  'rt') as fp:
+            self.assertEqual(fp.read(),
+                             "peaks0.bed\t5000000\t1\t2\n"
+                             "peaks0.bed\t10000000\t1\t2\n"
+                             "peaks1.bed\t5000000\t0\t2\n"
+                             "peaks1.bed\t10000000\t1\t2\n")
+    def test_pegs_main_keep_results_and_plot_main(self):
+        """
+        pegs_main/plot_main: save results and regenerate the outputs
+        """
+        genes_file = os.path.join(self.test_dir,"genes.bed")
+        with open(genes_file,'wt') as fp:
+            fp.write("""chr1	9547947	9547948	Adhfe1
+chr1	43730601	43730602	1500015O10Rik
+chr1	46425517	46425518	Dnah7c
+chr1	75375015	75375016	Gm15179
+chr1	136212828	136212829	Mroh3
+""")
+        peaks_file = os.path.join(self.test_dir,"peaks0.bed")
+        with open(peaks_file,'wt') as fp:
+            fp.write("""chr1	39756959	39757488
+chr1	40278922	40279363
+chr1	49032761	49033125
+chr1	73362131	73362563
+""")
+        cluster_dir = os.path.join(self.test_dir,"clusters")
+        clusters = []
+        os.mkdir(cluster_dir)
+        for i,gene_cluster in enumerate((("1500015O10Rik",),
+                                         ("Dnah7c","Gm15179",))):
+            cluster_file = os.path.join(cluster_dir,
+                                        "cluster_%d.txt" % i)
+            with open(cluster_file,'wt') as fp:
+                for gene in gene_cluster:
+                    fp.write("%s\n" % gene)
+            clusters.append(cluster_file)
+        distances = [5000000,10000000]
+        # Run the analysis and save the results
+        run_dir = os.path.join(self.test_dir,"run")
+        pegs_main(genes_file,
+                  distances,
+                  [peaks_file],
+                  clusters,
+                  None,
+                  "pegs_test",
+                  output_directory=run_dir,
+                  dump_raw_data=True,
+                  keep_results=True)
+        self.assertTrue(os.path.exists(os.path.join(run_dir,
+                                                    "pegs_test_results.npz")))
+        with open(os.path.join(run_dir,"pegs_test_count.tsv"),'rt') as fp:
+            expected_counts = fp.read()
+        # Regenerate the outputs from the saved results
+        for results_file in ("pegs_test_results.npz",
+                             "pegs_test_pval.tsv"):
+            plot_dir = os.path.join(self.test_dir,
+                                    "plot_%s" % results_file.split('.')[-1])
+            self.assertEqual(plot_main([os.path.join(run_dir,results_file)],
+                                       "replot",
+                                       heatmap_format="pdf",
+                                       output_directory=plot_dir,
+                                       dump_raw_data=True,
+                                       cluster_names=["c0","c1"]),
+                             None)
+            for f in ("replot_heatmap.pdf",
+                      "replot_results.xlsx",
+                      "replot_count.tsv",
+                      "replot_pval.tsv",):
+                self.assertTrue(os.path.exists(os.path.join(plot_dir,f)),
+                                "Missing %s" % f)
+            with open(os.path.join(plot_dir,"replot_count.tsv"),'rt') as fp:
+                self.assertEqual(fp.read(),expected_counts)
+        # Unrecognised results file
+        self.assertEqual(plot_main([os.path.join(run_dir,
+                                                 "pegs_test_count.tsv")],
+                                   "replot",
+                                   output_directory=plot_dir),1)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import io
+import os
+from pegs.plan import BedFileSummary
+from pegs.plan import RunPlan
+from pegs.plan import count_lines
+from pegs.plan import summarise_bed_file
+from pegs.plan import summarise_peak_groups
+from pegs.plan import count_cluster_genes
+
+class TestRunPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.genes = BedFileSummary(n_intervals=20000,
+                                    n_bytes=600000,
+                                    mean_width=1,
+                                    chroms={ "chr1": 1.5e9,
+                                             "chr2": 1.5e9 })
+        self.peak_sets = [("peaks%d.bed" % i,
+                           BedFileSummary(n_intervals=n,
+                                          n_bytes=30*n,
+                                          mean_width=500))
+                          for i,n in enumerate((1000,100000,1000000))]
+        self.cluster_sizes = [100,200,300]
+        self.distances = [5000,25000,50000]
+        self.tads = BedFileSummary(n_intervals=2000,n_bytes=60000,
+                                   mean_width=1.0e6)
+
+    def test_run_plan_work(self):
+        """
+        RunPlan: counts cells and bedtools runs
+        """
+        plan = RunPlan(self.genes,self.peak_sets,self.cluster_sizes,
+                       self.distances)
+        self.assertEqual(plan.n_cells,9)
+        self.assertEqual(plan.n_values,27)
+        self.assertEqual(len(plan.intersections()),9)
+        plan = RunPlan(self.genes,self.peak_sets,self.cluster_sizes,
+                       self.distances,tads=self.tads)
+        self.assertEqual(plan.n_cells,12)
+        self.assertEqual(len(plan.intersections()),15)
+        plan = RunPlan(self.genes,self.peak_sets,self.cluster_sizes,
+                       self.distances,split_chromosomes=True)
+        self.assertEqual(len(plan.intersections()),18)
+
+    def test_run_plan_estimates(self):
+        """
+        RunPlan: estimates scale with the number of jobs
+        """
+        plan = RunPlan(self.genes,self.peak_sets,self.cluster_sizes,
+                       self.distances,tads=self.tads)
+        wall1,cpu1 = plan.runtime(1)
+        wall4,cpu4 = plan.runtime(4)
+        self.assertTrue(wall4 < wall1)
+        self.assertTrue(wall1 <= cpu1)
+        self.assertTrue(plan.peak_memory(4) > plan.peak_memory(1))
+        self.assertTrue(plan.temp_disk() > 0)
+        # Sorted inputs need less memory for bedtools
+        sorted_plan = RunPlan(self.genes,self.peak_sets,self.cluster_sizes,
+                              self.distances,tads=self.tads,
+                              sorted_inputs=True)
+        self.assertTrue(sorted_plan.peak_memory(4) < plan.peak_memory(4))
+
+    def test_run_plan_output_sizes(self):
+        """
+        RunPlan: estimates sizes for the selected outputs
+        """
+        plan = RunPlan(self.genes,self.peak_sets,self.cluster_sizes,
+                       self.distances)
+        self.assertEqual(list(plan.output_sizes().keys()),
+                         ["Heatmap","XLSX file"])
+        plan = RunPlan(self.genes,self.peak_sets,self.cluster_sizes,
+                       self.distances,html=True,dump_raw_data=True,
+                       keep_results=True,export_genes=True,
+                       keep_intersection_files=True)
+        self.assertEqual(list(plan.output_sizes().keys()),
+                         ["Heatmap","HTML heatmap","XLSX file",
+                          "Raw data TSV files","Saved results",
+                          "Overlapping genes","Intersection files"])
+        archive_plan = RunPlan(self.genes,self.peak_sets,
+                               self.cluster_sizes,self.distances,
+                               keep_intersection_files=True,
+                               intersections_archive=True)
+        self.assertTrue(archive_plan.output_sizes()["Intersections archive"]
+                        < plan.output_sizes()["Intersection files"])
+
+    def test_run_plan_recommend_jobs(self):
+        """
+        RunPlan: recommends number of jobs
+        """
+        plan = RunPlan(self.genes,self.peak_sets,self.cluster_sizes,
+                       self.distances,tads=self.tads)
+        self.assertEqual(plan.recommend_jobs(max_cores=1),1)
+        n_jobs = plan.recommend_jobs(max_cores=64)
+        self.assertTrue(1 <= n_jobs <= len(plan.intersections()))
+        # Not much faster with the maximum number of cores
+        self.assertTrue(plan.runtime(n_jobs)[0] <=
+                        1.1*plan.runtime(len(plan.intersections()))[0])
+        # Using fewer jobs would be significantly slower
+        if n_jobs > 1:
+            self.assertTrue(plan.runtime(n_jobs-1)[0] >
+                            1.1*plan.runtime(len(plan.intersections()))[0])
+
+    def test_run_plan_report(self):
+        """
+        RunPlan: generates report
+        """
+        plan = RunPlan(self.genes,self.peak_sets,self.cluster_sizes,
+                       self.distances,tads=self.tads)
+        report = plan.report(max_jobs=2,max_cores=8).split('\n')
+        self.assertTrue("  Peak sets:       3 (1000 to 1000000 peaks, "
+                        "1101000 in total)" in report)
+        self.assertTrue("  bedtools runs:   15" in report)
+        self.assertTrue("Estimates for 2 jobs (unsorted inputs):" in report)
+        self.assertTrue(report[-1].startswith("Recommended:       --jobs "))
+
+class TestSummariseBedFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dirn = tempfile.mkdtemp(suffix='TestSummariseBedFile')
+        self.bed_file = os.path.join(self.dirn,"peaks.bed")
+        with io.open(self.bed_file,'wt') as fp:
+            fp.write(u"""track name=peaks
+chr1	100	200	peak1	A
+chr2	500	900	peak2	B
+chr1	1000	1100	peak3	A
+
+chr2	100	200	peak4	A""")
+
+    def tearDown(self):
+        shutil.rmtree(self.dirn)
+
+    def test_count_lines(self):
+        """
+        count_lines: counts lines (including final line without newline)
+        """
+        self.assertEqual(count_lines(self.bed_file),6)
+
+    def test_summarise_bed_file(self):
+        """
+        summarise_bed_file: summarises all intervals
+        """
+        summary = summarise_bed_file(self.bed_file)
+        self.assertEqual(summary.n_intervals,4)
+        self.assertEqual(summary.n_bytes,os.path.getsize(self.bed_file))
+        self.assertEqual(summary.mean_width,175.0)
+        self.assertEqual(dict(summary.chroms),{ "chr1": 1100,
+                                                "chr2": 900 })
+
+    def test_summarise_bed_file_sample(self):
+        """
+        summarise_bed_file: estimates from sample of intervals
+        """
+        summary = summarise_bed_file(self.bed_file,sample_size=2)
+        self.assertEqual(summary.n_intervals,6)
+        self.assertEqual(summary.mean_width,250.0)
+        self.assertEqual(dict(summary.chroms),{ "chr1": 200,
+                                                "chr2": 900 })
+
+    def test_summarise_peak_groups(self):
+        """
+        summarise_peak_groups: summarises each group
+        """
+        groups = summarise_peak_groups([self.bed_file],5)
+        self.assertEqual([g[0] for g in groups],["A","B"])
+        self.assertEqual(groups[0][1].n_intervals,3)
+        self.assertEqual(groups[0][1].mean_width,100.0)
+        self.assertEqual(groups[1][1].n_intervals,1)
+        self.assertEqual(groups[1][1].mean_width,400.0)
+
+    def test_summarise_peak_groups_missing_column(self):
+        """
+        summarise_peak_groups: raises exception for missing column
+        """
+        self.assertRaises(ValueError,
+                          summarise_peak_groups,
+                          [self.bed_file],6)
+
+    def test_count_cluster_genes(self):
+        """
+        count_cluster_genes: counts genes in cluster file
+        """
+        cluster_file = os.path.join(self.dirn,"cluster.txt")
+        with io.open(cluster_file,'wt') as fp:
+            fp.write(u"Gene1\nGene2\n\nGene3\n")
+        self.assertEqual(count_cluster_genes(cluster_file),3)
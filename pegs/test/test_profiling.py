@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import json
+import os
+from pegs.profiling import Profiler
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_profiler_records_stages(self):
+        """
+        Profiler: records calls for stages and peak sets
+        """
+        profiler = Profiler()
+        for peak_set in ("peaks1.bed","peaks2.bed"):
+            with profiler.stage("bedtools_intersect",peak_set=peak_set):
+                pass
+        with profiler.stage("heatmap"):
+            pass
+        self.assertEqual(profiler.ordered_stages(),
+                         ["bedtools_intersect","heatmap"])
+        self.assertEqual(profiler.stages["bedtools_intersect"].calls,2)
+        self.assertEqual(profiler.stages["heatmap"].calls,1)
+        self.assertEqual(list(profiler.peak_sets),
+                         ["peaks1.bed","peaks2.bed"])
+        self.assertEqual(
+            profiler.peak_sets["peaks1.bed"]["bedtools_intersect"].calls,1)
+        self.assertTrue("heatmap" in profiler.report())
+
+    def test_profiler_disabled(self):
+        """
+        Profiler: nothing is recorded when disabled
+        """
+        profiler = Profiler(enabled=False)
+        with profiler.stage("heatmap"):
+            pass
+        self.assertEqual(profiler.stages,{})
+
+    def test_profiler_write_json(self):
+        """
+        Profiler: write profile data to JSON file
+        """
+        profiler = Profiler()
+        with profiler.stage("xlsx",peak_set="peaks1.bed"):
+            pass
+        json_file = os.path.join(self.test_dir,"profile.json")
+        profiler.write_json(json_file)
+        with open(json_file,'rt') as fp:
+            data = json.load(fp)
+        self.assertEqual(data["stages"]["xlsx"]["calls"],1)
+        self.assertEqual(data["peak_sets"]["peaks1.bed"]["xlsx"]["calls"],1)
+        self.assertTrue("total_wall" in data)
+
+    def test_profiler_dump_cprofile(self):
+        """
+        Profiler: write cProfile data for a stage
+        """
+        profiler = Profiler(cprofile_stage="heatmap")
+        prof_file = os.path.join(self.test_dir,"heatmap.prof")
+        # No data collected yet
+        self.assertEqual(profiler.dump_cprofile(prof_file),None)
+        with profiler.stage("heatmap"):
+            sum(range(1000))
+        self.assertEqual(profiler.dump_cprofile(prof_file),prof_file)
+        self.assertTrue(os.path.exists(prof_file))
+
+    def test_profiler_cprofile_call(self):
+        """
+        Profiler: collect cProfile data for a function call
+        """
+        profiler = Profiler(cprofile_stage="bedtools_intersect")
+        prof_file = os.path.join(self.test_dir,"intersect.prof")
+        # Not the profiled stage
+        self.assertEqual(profiler.cprofile_call("tads_subset",sum,[1,2]),3)
+        self.assertEqual(profiler.dump_cprofile(prof_file),None)
+        # Profiled stage
+        self.assertEqual(profiler.cprofile_call("bedtools_intersect",
+                                                sum,[1,2]),3)
+        self.assertEqual(profiler.dump_cprofile(prof_file),prof_file)
+        self.assertTrue(os.path.exists(prof_file))
+        # No timings are recorded
+        self.assertEqual(list(profiler.stages),[])
+
+    def test_profiler_add_cprofile(self):
+        """
+        Profiler: add cProfile data from another profiler
+        """
+        profiler = Profiler(cprofile_stage="hypergeometric")
+        prof_file = os.path.join(self.test_dir,"hypergeometric.prof")
+        task_profiler = Profiler(cprofile_stage="hypergeometric")
+        with task_profiler.stage("hypergeometric"):
+            sum(range(1000))
+        profiler.add_cprofile(Profiler())
+        self.assertEqual(profiler.dump_cprofile(prof_file),None)
+        profiler.add_cprofile(task_profiler)
+        self.assertEqual(profiler.dump_cprofile(prof_file),prof_file)
+        self.assertTrue(os.path.exists(prof_file))
+
+    def test_profiler_track_memory(self):
+        """
+        Profiler: record memory usage for stages
+        """
+        profiler = Profiler(track_memory=True)
+        try:
+            with profiler.stage("peak_set",peak_set="peaks1.bed"):
+                with profiler.stage("load_clusters",
+                                    peak_set="peaks1.bed"):
+                    data = [str(i) for i in range(10000)]
+                del(data)
+        finally:
+            profiler.stop()
+        self.assertEqual(list(profiler.memory),
+                         ["load_clusters","peak_set"])
+        # Peak allocations in the inner stage should also be
+        # reflected in the enclosing stage
+        self.assertTrue(profiler.memory["load_clusters"].traced_peak > 0)
+        self.assertTrue(profiler.memory["peak_set"].traced_peak >=
+                        profiler.memory["load_clusters"].traced_peak)
+        # Snapshot only taken for coarse-grained stages
+        self.assertEqual(profiler.memory["load_clusters"].top_allocations,
+                         None)
+        self.assertNotEqual(profiler.memory["peak_set"].top_allocations,
+                            None)
+        self.assertEqual(
+            profiler.peak_sets_memory["peaks1.bed"]["peak_set"].calls,1)
+        self.assertTrue("load_clusters" in profiler.memory_report())
+
+    def test_profiler_add_memory(self):
+        """
+        Profiler: record memory usage at the end of a stage
+        """
+        profiler = Profiler(track_memory=True)
+        try:
+            data = [str(i) for i in range(10000)]
+            del(data)
+            profiler.add_memory("peak_set",peak_set="peaks1.bed")
+            profiler.add_memory("tads",peak_set="peaks1.bed")
+        finally:
+            profiler.stop()
+        self.assertEqual(list(profiler.memory),["peak_set","tads"])
+        self.assertTrue(profiler.memory["peak_set"].traced_peak > 0)
+        self.assertNotEqual(profiler.memory["peak_set"].top_allocations,
+                            None)
+        self.assertEqual(list(profiler.peak_sets_memory["peaks1.bed"]),
+                         ["peak_set","tads"])
+        # Nothing recorded if memory isn't being tracked
+        profiler = Profiler()
+        profiler.add_memory("peak_set",peak_set="peaks1.bed")
+        self.assertEqual(profiler.memory,{})
+
+    def test_profiler_write_memory_json(self):
+        """
+        Profiler: write memory usage data to JSON file
+        """
+        profiler = Profiler(track_memory=True)
+        try:
+            with profiler.stage("heatmap"):
+                pass
+        finally:
+            profiler.stop()
+        json_file = os.path.join(self.test_dir,"memory.json")
+        profiler.write_memory_json(json_file)
+        with open(json_file,'rt') as fp:
+            data = json.load(fp)
+        self.assertEqual(data["stages"]["heatmap"]["calls"],1)
+        self.assertTrue("rss_peak" in data)
+
+    def test_profiler_no_memory_tracking_by_default(self):
+        """
+        Profiler: memory usage not recorded by default
+        """
+        profiler = Profiler()
+        with profiler.stage("heatmap"):
+            pass
+        self.assertEqual(profiler.memory,{})
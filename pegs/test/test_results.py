@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from pegs.results import EnrichmentResults
+from pegs.results import get_shard
+from pegs.results import save_results
+from pegs.results import load_results
+from pegs.results import merge_results
+from pegs.results import read_raw_data
+from pegs.outputs import write_raw_data
+
+class TestEnrichmentResults(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestEnrichmentResults')
+        # Test data
+        self.results = EnrichmentResults(
+            ["/data/peaks/PeakSet1.bed",
+             "/data/peaks/PeakSet2.bed",
+             "/data/peaks/PeakSet3.bed"],
+            ["/data/clusters/cluster_1.txt",
+             "/data/clusters/cluster_2.txt"],
+            [5000,25000],
+            include_tads=True,
+            cluster_sizes=[10,20],
+            n_genes=100)
+        for i in range(3):
+            for j in range(2):
+                self.results.set(("peaks",i,j),
+                                 [0.1*(i+1),0.01*(j+1)],
+                                 [i,j+1],
+                                 n_overlapping=10*i+j)
+            self.results.set(("tads",i),[0.5,0.05*(i+1)],[i+1,0],
+                             n_overlapping=i)
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_enrichment_results(self):
+        """
+        EnrichmentResults: store results using compact types
+        """
+        self.assertEqual(self.results.pvalues.dtype,np.float64)
+        self.assertEqual(self.results.counts.dtype,np.uint32)
+        self.assertEqual(self.results.tads_counts.dtype,np.uint32)
+        self.assertTrue(self.results.include_tads)
+        self.assertEqual(self.results.peak_set_names,
+                         ["PeakSet1","PeakSet2","PeakSet3"])
+        self.assertEqual(self.results.cluster_names,
+                         ["cluster_1","cluster_2"])
+        self.assertEqual(self.results.pvalues[1,1,0],0.2)
+        self.assertEqual(self.results.counts[2,0,1],1)
+        self.assertEqual(self.results.n_overlapping[2,1],21)
+        self.assertEqual(self.results.tads_n_overlapping[2],2)
+        self.assertEqual(list(self.results.cluster_sizes),[10,20])
+        self.assertEqual(self.results.n_genes,100)
+        self.assertEqual(self.results.nbytes,
+                         3*2*2*(8+4) + 3*2*4 + 3*2*(8+4) + 3*4 + 2*4)
+        self.assertRaises(AttributeError,setattr,self.results,"x",1)
+
+    def test_enrichment_results_unpack(self):
+        """
+        EnrichmentResults: unpack as tuple of arrays
+        """
+        pvalues,counts,tads_pvalues,tads_counts = self.results
+        self.assertTrue(pvalues is self.results.pvalues)
+        self.assertTrue(counts is self.results.counts)
+        self.assertTrue(tads_pvalues is self.results.tads_pvalues)
+        self.assertTrue(tads_counts is self.results.tads_counts)
+        pvalues,counts,tads_pvalues,tads_counts = \
+            EnrichmentResults(["peaks.bed"],["cluster.txt"],[5000])
+        self.assertEqual(pvalues.shape,(1,1,1))
+        self.assertEqual(tads_pvalues,None)
+        self.assertEqual(tads_counts,None)
+
+    def test_enrichment_results_select(self):
+        """
+        EnrichmentResults: select subsets of the results
+        """
+        for peak_sets,clusters in ((slice(1,3),[1]),
+                                   ([1,2],slice(1,2)),
+                                   (["PeakSet2.bed","PeakSet3"],
+                                    ["cluster_2"])):
+            subset = self.results.select(peak_sets=peak_sets,
+                                         clusters=clusters)
+            self.assertEqual(subset.peak_set_names,["PeakSet2","PeakSet3"])
+            self.assertEqual(subset.cluster_names,["cluster_2"])
+            self.assertEqual(subset.distances,[5000,25000])
+            self.assertTrue(np.array_equal(subset.pvalues,
+                                           self.results.pvalues[1:3,:,1:2]))
+            self.assertTrue(np.array_equal(subset.counts,
+                                           self.results.counts[1:3,:,1:2]))
+            self.assertTrue(np.array_equal(subset.n_overlapping,
+                                           self.results.n_overlapping[1:3]))
+            self.assertTrue(np.array_equal(subset.tads_pvalues,
+                                           self.results.tads_pvalues[1:3,1:2]))
+            self.assertTrue(np.array_equal(subset.tads_counts,
+                                           self.results.tads_counts[1:3,1:2]))
+            self.assertEqual(list(subset.cluster_sizes),[20])
+
+    def test_enrichment_results_save_and_load(self):
+        """
+        EnrichmentResults: save and reload via dictionary
+        """
+        results_file = os.path.join(self.dirn,"results.npz")
+        self.assertEqual(self.results.save(results_file),results_file)
+        results = EnrichmentResults.from_dict(load_results(results_file))
+        self.assertEqual(results.peaks,
+                         ["PeakSet1.bed","PeakSet2.bed","PeakSet3.bed"])
+        self.assertEqual(results.clusters,["cluster_1.txt","cluster_2.txt"])
+        self.assertEqual(results.distances,[5000,25000])
+        for name in ('pvalues','counts','n_overlapping',
+                     'tads_pvalues','tads_counts','tads_n_overlapping',
+                     'cluster_sizes'):
+            self.assertTrue(np.array_equal(getattr(results,name),
+                                           getattr(self.results,name)))
+        self.assertEqual(results.n_genes,100)
+        self.assertEqual(results.counts.dtype,np.uint32)
+        self.assertEqual(self.results.as_dict()['peaks'],results.peaks)
+
+class TestGetShard(unittest.TestCase):
+
+    def test_get_shard(self):
+        """
+        get_shard: divide peak sets into contiguous slices
+        """
+        self.assertEqual([get_shard(10,i,3) for i in (1,2,3)],
+                         [(0,3),(3,6),(6,10)])
+        self.assertEqual([get_shard(2,i,3) for i in (1,2,3)],
+                         [(0,0),(0,1),(1,2)])
+        self.assertEqual(get_shard(5,1,1),(0,5))
+
+    def test_get_shard_invalid_shard(self):
+        """
+        get_shard: raise exception for invalid shard
+        """
+        self.assertRaises(ValueError,get_shard,10,0,3)
+        self.assertRaises(ValueError,get_shard,10,4,3)
+
+class TestSaveAndLoadResults(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestSaveAndLoadResults')
+        # Test data
+        self.peaks = ["/data/peaks/PeakSet1.bed",
+                      "/data/peaks/PeakSet2.bed",
+                      "/data/peaks/PeakSet3.bed"]
+        self.clusters = ["/data/clusters/cluster_1.txt",
+                         "/data/clusters/cluster_2.txt"]
+        self.distances = [5000,25000]
+        self.pvalues = np.random.random_sample([3,2,2])
+        self.counts = np.random.randint(0,100,[3,2,2]).astype(float)
+        self.tads_pvalues = np.random.random_sample([3,2])
+        self.tads_counts = np.random.randint(0,100,[3,2]).astype(float)
+        self.n_overlapping = np.random.randint(0,100,[3,2])
+        self.tads_n_overlapping = np.random.randint(0,100,3)
+        self.cluster_sizes = np.array([10,20])
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def test_save_and_load_results(self):
+        """
+        save_results/load_results: results are preserved
+        """
+        results_file = os.path.join(self.dirn,"results.npz")
+        save_results(results_file,self.peaks,self.clusters,
+                     self.distances,self.pvalues,self.counts,
+                     tads_pvalues=self.tads_pvalues,
+                     tads_counts=self.tads_counts,
+                     n_overlapping=self.n_overlapping,
+                     tads_n_overlapping=self.tads_n_overlapping,
+                     cluster_sizes=self.cluster_sizes,
+                     n_genes=100)
+        results = load_results(results_file)
+        self.assertEqual(results['peaks'],
+                         ["PeakSet1.bed","PeakSet2.bed","PeakSet3.bed"])
+        self.assertEqual(results['clusters'],
+                         ["cluster_1.txt","cluster_2.txt"])
+        self.assertEqual(results['distances'],[5000,25000])
+        self.assertTrue((results['pvalues'] == self.pvalues).all())
+        self.assertTrue((results['counts'] == self.counts).all())
+        self.assertTrue((results['tads_pvalues'] ==
+                         self.tads_pvalues).all())
+        self.assertTrue((results['tads_counts'] ==
+                         self.tads_counts).all())
+        self.assertTrue((results['n_overlapping'] ==
+                         self.n_overlapping).all())
+        self.assertTrue((results['tads_n_overlapping'] ==
+                         self.tads_n_overlapping).all())
+        self.assertTrue((results['cluster_sizes'] ==
+                         self.cluster_sizes).all())
+        self.assertEqual(results['n_genes'],100)
+        self.assertEqual(results['first_peak_set'],0)
+        self.assertEqual(results['n_peak_sets'],3)
+
+    def test_save_and_load_results_no_tads(self):
+        """
+        save_results/load_results: handle results without TADs
+        """
+        results_file = os.path.join(self.dirn,"results.npz")
+        save_results(results_file,self.peaks,self.clusters,
+                     self.distances,self.pvalues,self.counts)
+        results = load_results(results_file)
+        self.assertEqual(results['tads_pvalues'],None)
+        self.assertEqual(results['tads_counts'],None)
+        self.assertEqual(results['tads_n_overlapping'],None)
+        # Optional data not saved
+        self.assertTrue((results['n_overlapping'] == -1).all())
+        self.assertEqual(results['cluster_sizes'],None)
+        self.assertEqual(results['n_genes'],None)
+
+    def test_merge_results(self):
+        """
+        merge_results: combine partial results in original order
+        """
+        results_files = []
+        for i,(start,end) in enumerate(((2,3),(0,0),(0,2))):
+            results_file = os.path.join(self.dirn,"shard%d.npz" % i)
+            save_results(results_file,
+                         self.peaks[start:end],
+                         self.clusters,
+                         self.distances,
+                         self.pvalues[start:end],
+                         self.counts[start:end],
+                         tads_pvalues=self.tads_pvalues[start:end],
+                         tads_counts=self.tads_counts[start:end],
+                         n_overlapping=self.n_overlapping[start:end],
+                         tads_n_overlapping=
+                         self.tads_n_overlapping[start:end],
+                         cluster_sizes=self.cluster_sizes,
+                         n_genes=100,
+                         first_peak_set=start,
+                         n_peak_sets=3)
+            results_files.append(results_file)
+        results = merge_results(results_files)
+        self.assertEqual(results['peaks'],
+                         ["PeakSet1.bed","PeakSet2.bed","PeakSet3.bed"])
+        self.assertTrue((results['pvalues'] == self.pvalues).all())
+        self.assertTrue((results['counts'] == self.counts).all())
+        self.assertTrue((results['tads_pvalues'] ==
+                         self.tads_pvalues).all())
+        self.assertTrue((results['tads_counts'] ==
+                         self.tads_counts).all())
+        self.assertTrue((results['n_overlapping'] ==
+                         self.n_overlapping).all())
+        self.assertTrue((results['tads_n_overlapping'] ==
+                         self.tads_n_overlapping).all())
+        self.assertTrue((results['cluster_sizes'] ==
+                         self.cluster_sizes).all())
+        self.assertEqual(results['n_genes'],100)
+
+    def test_merge_results_missing_peak_sets(self):
+        """
+        merge_results: raise exception for missing peak sets
+        """
+        results_file = os.path.join(self.dirn,"shard.npz")
+        save_results(results_file,
+                     self.peaks[:2],
+                     self.clusters,
+                     self.distances,
+                     self.pvalues[:2],
+                     self.counts[:2],
+                     n_peak_sets=3)
+        self.assertRaises(ValueError,merge_results,[results_file])
+
+    def test_merge_results_inconsistent_distances(self):
+        """
+        merge_results: raise exception for inconsistent distances
+        """
+        results_files = []
+        for i,(start,end) in enumerate(((0,1),(1,3))):
+            results_file = os.path.join(self.dirn,"shard%d.npz" % i)
+            save_results(results_file,
+                         self.peaks[start:end],
+                         self.clusters,
+                         self.distances[:i+1],
+                         self.pvalues[start:end,:i+1],
+                         self.counts[start:end,:i+1],
+                         first_peak_set=start,
+                         n_peak_sets=3)
+            results_files.append(results_file)
+        self.assertRaises(ValueError,merge_results,results_files)
+
+    def test_merge_results_inconsistent_cluster_sizes(self):
+        """
+        merge_results: raise exception for inconsistent cluster sizes
+        """
+        for cluster_sizes,n_genes in (([10,20],200),
+                                      ([10,30],100),
+                                      (None,100)):
+            results_files = []
+            for i,(start,end) in enumerate(((0,1),(1,3))):
+                results_file = os.path.join(self.dirn,"shard%d.npz" % i)
+                save_results(results_file,
+                             self.peaks[start:end],
+                             self.clusters,
+                             self.distances,
+                             self.pvalues[start:end],
+                             self.counts[start:end],
+                             cluster_sizes=(self.cluster_sizes if i == 0
+                                            else cluster_sizes),
+                             n_genes=(100 if i == 0 else n_genes),
+                             first_peak_set=start,
+                             n_peak_sets=3)
+                results_files.append(results_file)
+            self.assertRaises(ValueError,merge_results,results_files)
+
+class TestReadRawData(unittest.TestCase):
+
+    def setUp(self):
+        # Create test directory
+        self.dirn = tempfile.mkdtemp(suffix='TestReadRawData')
+        # Test data
+        self.peaks = ["PeakSet1.bed","PeakSet2.bed","PeakSet3.bed"]
+        self.clusters = ["cluster_1.txt","cluster_2.txt"]
+        self.distances = [5000,25000]
+        self.pvalues = np.random.random_sample([3,2,2])
+        self.counts = np.random.randint(0,100,[3,2,2]).astype(float)
+        self.tads_pvalues = np.random.random_sample([3,2])
+        self.tads_counts = np.random.randint(0,100,[3,2]).astype(float)
+
+    def tearDown(self):
+        # Remove the temporary test directory
+        shutil.rmtree(self.dirn)
+
+    def _raw_data_file(self,name):
+        return os.path.join(self.dirn,name)
+
+    def test_read_raw_data(self):
+        """
+        read_raw_data: read data written by write_raw_data
+        """
+        write_raw_data("test",self.peaks,self.clusters,self.distances,
+                       self.pvalues,self.counts,
+                       tads_pvalues=self.tads_pvalues,
+                       tads_counts=self.tads_counts,
+                       output_directory=self.dirn)
+        results = read_raw_data(self._raw_data_file("test_pval.tsv"),
+                                self._raw_data_file("test_count.tsv"),
+                                self._raw_data_file("test_tads_pval.tsv"),
+                                self._raw_data_file("test_tads_count.tsv"),
+                                clusters=self.clusters)
+        self.assertEqual(results['peaks'],self.peaks)
+        self.assertEqual(results['clusters'],self.clusters)
+        self.assertEqual(results['distances'],self.distances)
+        self.assertTrue(np.array_equal(results['pvalues'],self.pvalues))
+        self.assertTrue(np.array_equal(results['counts'],self.counts))
+        self.assertTrue(np.array_equal(results['tads_pvalues'],
+                                       self.tads_pvalues))
+        self.assertTrue(np.array_equal(results['tads_counts'],
+                                       self.tads_counts))
+        self.assertEqual(results['first_peak_set'],0)
+        self.assertEqual(results['n_peak_sets'],3)
+
+    def test_read_raw_data_no_tads_or_cluster_names(self):
+        """
+        read_raw_data: read data without TADs or cluster names
+        """
+        write_raw_data("test",self.peaks,self.clusters,self.distances,
+                       self.pvalues,self.counts,
+                       output_directory=self.dirn)
+        results = read_raw_data(self._raw_data_file("test_pval.tsv"),
+                                self._raw_data_file("test_count.tsv"))
+        self.assertEqual(results['clusters'],["cluster_1","cluster_2"])
+        self.assertTrue(np.array_equal(results['pvalues'],self.pvalues))
+        self.assertTrue(np.array_equal(results['counts'],self.counts))
+        self.assertEqual(results['tads_pvalues'],None)
+        self.assertEqual(results['tads_counts'],None)
+
+    def test_read_raw_data_inconsistent_data(self):
+        """
+        read_raw_data: raise exception for inconsistent data
+        """
+        write_raw_data("test",self.peaks,self.clusters,self.distances,
+                       self.pvalues,self.counts,
+                       output_directory=self.dirn)
+        write_raw_data("other",self.peaks[:2],self.clusters,self.distances,
+                       self.pvalues[:2],self.counts[:2],
+                       output_directory=self.dirn)
+        # Peak sets don't match
+        self.assertRaises(ValueError,
+                          read_raw_data,
+                          self._raw_data_file("test_pval.tsv"),
+                          self._raw_data_file("other_count.tsv"))
+        # Wrong number of cluster names
+        self.assertRaises(ValueError,
+                          read_raw_data,
+                          self._raw_data_file("test_pval.tsv"),
+                          self._raw_data_file("test_count.tsv"),
+                          clusters=["cluster_1.txt"])
+        # No data
+        empty_file = self._raw_data_file("empty_pval.tsv")
+        with open(empty_file,'wt') as fp:
+            fp.write("")
+        self.assertRaises(ValueError,
+                          read_raw_data,
+                          empty_file,
+                          self._raw_data_file("test_count.tsv"))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import unittest
+import operator
+from pegs.taskgraph import TaskGraph
+from pegs.taskgraph import TaskRef
+from pegs.taskgraph import SerialExecutor
+from pegs.taskgraph import get_executor
+from pegs.taskgraph import EXECUTORS
+
+def fail(msg):
+    raise ValueError(msg)
+
+class TestTaskGraph(unittest.TestCase):
+
+    def test_taskgraph_substitutes_results(self):
+        """
+        TaskGraph: results of dependencies are substituted
+        """
+        graph = TaskGraph()
+        a = graph.add("a",operator.add,args=(1,2))
+        b = graph.add("b",divmod,args=(17,5))
+        c = graph.add("c",operator.mul,args=(a,b[0]))
+        graph.add("d",sorted,args=([c,b[1],a],))
+        results = graph.run()
+        self.assertEqual(results["c"],9)
+        self.assertEqual(results["d"],[2,3,9])
+        self.assertEqual(graph.tasks["c"].deps,["a","b"])
+        self.assertEqual(graph.tasks["d"].deps,["c","b","a"])
+
+    def test_taskgraph_deduplicates_tasks(self):
+        """
+        TaskGraph: tasks with the same key are only run once
+        """
+        calls = []
+        def task(x):
+            calls.append(x)
+            return x
+        graph = TaskGraph()
+        a1 = graph.add(("task",1),task,args=(1,))
+        a2 = graph.add(("task",1),task,args=(2,))
+        self.assertEqual(a1.key,a2.key)
+        graph.add(("task",2),task,args=(a2,))
+        self.assertEqual(len(graph),2)
+        self.assertEqual(graph.n_shared,1)
+        self.assertTrue(("task",1) in graph)
+        graph.run()
+        self.assertEqual(calls,[1,1])
+
+    def test_taskgraph_dependency_order(self):
+        """
+        TaskGraph: tasks only run after their dependencies
+        """
+        order = []
+        graph = TaskGraph()
+        graph.add("first",order.append,args=("first",))
+        graph.add("second",order.append,args=("second",),deps=["first"])
+        graph.add("third",order.append,args=("third",),
+                  deps=[TaskRef("second")])
+        completed = []
+        graph.run(on_complete=lambda task,result: completed.append(task))
+        self.assertEqual(order,["first","second","third"])
+        self.assertEqual([t.key for t in completed],
+                         ["first","second","third"])
+        for task in completed:
+            self.assertTrue(task.wall >= 0.0)
+            self.assertTrue(task.cpu >= 0.0)
+
+    def test_taskgraph_unknown_dependency(self):
+        """
+        TaskGraph: raise exception for unknown dependency
+        """
+        graph = TaskGraph()
+        self.assertRaises(KeyError,
+                          graph.add,
+                          "a",abs,args=(TaskRef("missing"),))
+
+    def test_taskgraph_executors(self):
+        """
+        TaskGraph: same results from all executors
+        """
+        for executor in EXECUTORS:
+            graph = TaskGraph()
+            refs = [graph.add(("pow",i),pow,args=(i,2)) for i in range(8)]
+            graph.add("sum",sum,args=(refs,))
+            polls = []
+            with get_executor(executor,max_workers=3) as pool:
+                results = graph.run(pool,on_poll=lambda: polls.append(1),
+                                    poll_interval=0.01)
+            self.assertEqual(results["sum"],140)
+            self.assertTrue(len(polls) > 0)
+
+    def test_taskgraph_raises_exception_on_failure(self):
+        """
+        TaskGraph: raise exception if a task fails
+        """
+        for executor in EXECUTORS:
+            graph = TaskGraph()
+            a = graph.add("a",fail,args=("failed",))
+            graph.add("b",abs,args=(a,))
+            with get_executor(executor,max_workers=2) as pool:
+                self.assertRaises(ValueError,graph.run,pool)
+
+class TestGetExecutor(unittest.TestCase):
+
+    def test_get_executor(self):
+        """
+        get_executor: return executors by name
+        """
+        self.assertTrue(isinstance(get_executor("serial"),SerialExecutor))
+        with get_executor("threads",2) as executor:
+            self.assertEqual(executor.submit(abs,-1).result(),1)
+        self.assertRaises(ValueError,get_executor,"cluster")
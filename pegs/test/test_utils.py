@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import unittest
+import io
 import tempfile
 import os
 import shutil
@@ -11,6 +12,10 @@ from pegs.utils import collect_files
 from pegs.utils import sort_files
 from pegs.utils import split_file_name_for_sort
 from pegs.utils import intersection_file_basename
+from pegs.utils import reference_file_name
+from pegs.utils import copy_stream
+from pegs.utils import file_checksum
+from pegs.utils import input_fingerprint
 
 class TestFindExe(unittest.TestCase):
     def setUp(self):
@@ -154,3 +159,79 @@ class TestIntersectionFileBasename(unittest.TestCase):
                 "/data/peaks/Peaks-E1234-merged.bed",
                 None),
             "refGene_mm10.Peaks-E1234-merged")
+
+class TestCopyStream(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+    def test_copy_stream(self):
+        """
+        copy_stream: copies stream contents to file
+        """
+        data = b"chr1\t100\t200\nchr2\t300\t400\n"
+        test_file = os.path.join(self.test_dir,"stdin.bed")
+        self.assertEqual(copy_stream(io.BytesIO(data),test_file,
+                                     blocksize=5),len(data))
+        with open(test_file,'rb') as fp:
+            self.assertEqual(fp.read(),data)
+
+class TestReferenceFileName(unittest.TestCase):
+    def test_reference_file_name(self):
+        """
+        reference_file_name: inserts reference before extension
+        """
+        self.assertEqual(reference_file_name("pegs_heatmap.png","refGene"),
+                         "pegs_heatmap_refGene.png")
+        self.assertEqual(reference_file_name("/data/pegs.xlsx","mm10"),
+                         "/data/pegs_mm10.xlsx")
+        self.assertEqual(reference_file_name("pegs","mm10"),
+                         "pegs_mm10")
+
+class TestFileChecksum(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+    def test_file_checksum(self):
+        """
+        file_checksum: get MD5 checksum for file contents
+        """
+        test_file = os.path.join(self.test_dir,"test.txt")
+        with open(test_file,'wt') as fp:
+            fp.write("hello world\n")
+        self.assertEqual(file_checksum(test_file),
+                         "6f5902ac237024bdd0c176cb93063dc4")
+        self.assertEqual(file_checksum(test_file,blocksize=3),
+                         "6f5902ac237024bdd0c176cb93063dc4")
+
+class TestInputFingerprint(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+    def test_input_fingerprint(self):
+        """
+        input_fingerprint: changes when inputs or parameters change
+        """
+        files = []
+        for i in range(2):
+            test_file = os.path.join(self.test_dir,"test%d.txt" % i)
+            with open(test_file,'wt') as fp:
+                fp.write("file %d\n" % i)
+            files.append(test_file)
+        fingerprint = input_fingerprint(files,params=dict(x=1))
+        self.assertEqual(input_fingerprint(files,params=dict(x=1)),
+                         fingerprint)
+        self.assertNotEqual(input_fingerprint(files[::-1],
+                                              params=dict(x=1)),
+                            fingerprint)
+        self.assertNotEqual(input_fingerprint(files,params=dict(x=2)),
+                            fingerprint)
+        with open(files[1],'wt') as fp:
+            fp.write("changed\n")
+        self.assertNotEqual(input_fingerprint(files,params=dict(x=1)),
+                            fingerprint)
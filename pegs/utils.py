@@ -10,6 +10,8 @@
 
 import os
 import io
+import json
+import hashlib
 from os import listdir
 from os.path import isfile
 from os.path import join
@@ -142,3 +144,90 @@ def intersection_file_basename(interval_file,peak_file,distance=None):
     return "%s.%s%s" % (splitext(basename(interval_file))[0],
                         splitext(basename(peak_file))[0],
                         (".%s" % distance if distance is not None else ""))
+
+def copy_stream(fp,filen,blocksize=1048576):
+    """
+    Copy the contents of a stream (e.g. stdin) to a file
+
+    The stream is read once, from its current position to
+    the end.
+
+    Arguments:
+      fp (File): binary file-like object to read from
+      filen (str): path to the file to write to
+      blocksize (int): number of bytes to read at a time
+
+    Returns:
+      Integer: number of bytes copied.
+    """
+    nbytes = 0
+    with io.open(filen,'wb') as fpp:
+        while True:
+            data = fp.read(blocksize)
+            if not data:
+                break
+            fpp.write(data)
+            nbytes += len(data)
+    return nbytes
+
+def reference_file_name(filen,reference):
+    """
+    Generate a name for an output file for a gene reference
+
+    The name of the reference is inserted before the file
+    extension, for example 'pegs_heatmap.png' becomes
+    'pegs_heatmap_refGene.png' for the reference 'refGene'.
+
+    Arguments:
+      filen (str): file name (or path)
+      reference (str): name of the gene reference
+    """
+    name,ext = splitext(filen)
+    return "%s_%s%s" % (name,reference,ext)
+
+def file_checksum(filen,algorithm="md5",blocksize=1048576):
+    """
+    Return the checksum for the contents of a file
+
+    Arguments:
+      filen (str): path to the file
+      algorithm (str): name of the 'hashlib' algorithm to
+        use (default: 'md5')
+      blocksize (int): number of bytes to read at a time
+
+    Returns:
+      String: the checksum as a hex digest.
+    """
+    chksum = hashlib.new(algorithm)
+    with io.open(filen,'rb') as fp:
+        while True:
+            data = fp.read(blocksize)
+            if not data:
+                break
+            chksum.update(data)
+    return chksum.hexdigest()
+
+def input_fingerprint(files,params=None):
+    """
+    Return a fingerprint for a set of input files and parameters
+
+    The fingerprint is a checksum generated from the names and
+    contents of the files (in the order supplied) along with
+    any additional parameters, and so will change if any of
+    these are changed.
+
+    Arguments:
+      files (list): list of paths to input files
+      params (dict): optional, additional parameters to
+        include (must be serialisable as JSON)
+
+    Returns:
+      String: the fingerprint as a hex digest.
+    """
+    fingerprint = hashlib.md5()
+    for f in files:
+        fingerprint.update(("%s\t%s\n" % (basename(f),
+                                            file_checksum(f))).encode())
+    if params:
+        fingerprint.update(json.dumps(params,sort_keys=True).encode())
+    return fingerprint.hexdigest()